@@ -1,5 +1,6 @@
 import click
 import os
+import sqlite3
 from scripts.kml_parser import load_kml_file, extract_placemark_geometries_recursive, get_kml_document_name
 # Импортируем датаклассы, которые теперь возвращает kml_parser
 from scripts.data_structures import (
@@ -9,16 +10,40 @@ from scripts.data_structures import (
 # Импортируем функции конвертации и вычислений
 from scripts.geometry_processing import (
     kml_placemark_to_shapely, DEFAULT_PRECISION, 
-    calculate_area, calculate_length, calculate_perimeter,
-    create_geojson_feature, save_geojson_feature_collection,
+    calculate_metrics, METRIC_MODES, METRIC_MODE_PLANAR, METRIC_MODE_GEODESIC, METRIC_MODE_UTM, GEODESIC_ELLIPSOID,
+    apply_precision, check_validity, reproject_geometries, create_geojson_feature, save_geojson_feature_collection,
+    coordinate_precision_for_crs,
     GEOGRAPHIC_CRS_WGS84, DEFAULT_PLANAR_CRS
 )
 # Импорты для новой команды
 from scripts.pkk_api_client import search_cadastral_data_by_text, parse_nspd_feature
 from scripts.geometry_processing import nspd_geometry_to_shapely
+from scripts.spatial_index import DEFAULT_NODE_SIZE, build_spatial_index, query_datasets
+from scripts.cadastral_index import CAD_NUM_PATTERN, build_cadastral_index, find_parcels
+from scripts.dissolve import dissolve_geometries, nspd_option_value
+from scripts.topology_qa import find_topology_issues, topology_issues_to_features, DEFAULT_GAP_TOLERANCE, DEFAULT_MIN_ISSUE_AREA
+from scripts.overlay import OVERLAY_CRS, load_kml_zones, load_nspd_parcels, buffer_in_metres, overlay_zones_with_parcels, overlay_results_to_features
+from scripts.geojson_io import (
+    OUTPUT_FORMATS, OUTPUT_FORMAT_GEOJSON, OUTPUT_FORMAT_SQLITE, OUTPUT_FORMAT_GEOPARQUET, APPENDABLE_OUTPUT_FORMATS,
+    INCREMENTAL_OUTPUT_FORMATS, OUTPUT_FORMAT_EXTENSIONS, OUTPUT_FORMAT_GEOJSONSEQ,
+    FEATURE_READ_ERRORS, create_feature_writer, is_feature_input_path, iter_feature_collection, load_geojson_placemarks,
+    output_paths_for_formats
+)
+from scripts.sqlite_store import SQLITE_LAYER_PARCELS, SQLITE_LAYER_PLACEMARKS
+from scripts.csv_export import CSV_GEOMETRY_MODES, CSV_GEOMETRY_WKT, CSV_PLACEMARK_COLUMNS, CSVFeatureWriter
+from scripts.geoparquet_io import DEFAULT_ROW_GROUP_SIZE, GeoParquetFeatureWriter, geoparquet_available
+from scripts.flatgeobuf_io import FlatGeobufFeatureWriter
+from scripts.feature_batch import FanOutFeatureWriter
+from scripts.parcel_catalog import DEFAULT_RUN_CHARS, DEFAULT_STAGE_PATTERN, build_parcel_catalog, find_stage_files
+from scripts.dataset_diff import diff_datasets
+from scripts.quarter_harvest import DEFAULT_HARVEST_WORKERS, find_zone_quarters, harvest_quarters
+from scripts.vector_tiles import (
+    DEFAULT_MAX_ZOOM, DEFAULT_MIN_ZOOM, create_tile_writer, features_to_tile_layer, generate_vector_tiles, placemarks_to_tile_layer
+)
+from scripts.json_encoding import dumps_json, round_feature_coordinates
 # _version должен быть в корне проекта или доступен в PYTHONPATH
 from _version import __version__
-import json
+from shapely.geometry import mapping
 
 @click.group(help="Кадастровый инструмент для обработки геоданных.")
 @click.version_option(version=__version__, message='%(prog)s version %(version)s')
@@ -26,19 +51,67 @@ def cli():
     """Основная группа команд для кадастрового инструмента."""
     pass
 
+def _create_output_writer(output_path, output_formats, parallel, **writer_kwargs):
+    # Один формат - обычный писатель; несколько - общий поток features через FanOutFeatureWriter
+    paths = output_paths_for_formats(output_path, output_formats)
+    writers = [create_feature_writer(path, output_format=fmt, **writer_kwargs) for path, fmt in zip(paths, output_formats)]
+    if len(writers) == 1:
+        return writers[0], paths
+    return FanOutFeatureWriter(writers, threaded=parallel), paths
+
+def _iter_input_features(input_file):
+    # Features файла по одному; ошибка чтения сообщается, а уже выданные features остаются у потребителя
+    try:
+        yield from iter_feature_collection(input_file)
+    except FEATURE_READ_ERRORS as e:
+        click.secho(f"{input_file}: не удалось прочитать файл: {e}", fg="red")
+
+def _incremental_summary(stats):
+    return (f"Добавлено: {stats.inserted}, изменено: {stats.updated}, без изменений: {stats.unchanged},"
+            f" удалено: {stats.deleted}")
+
 @cli.command("process-kmls")
 @click.option('-k', '--kml-files', 'kml_files', 
               type=click.Path(dir_okay=False, readable=True),
-              multiple=True, required=True, help='Path to one or more KML files to process.')
+              multiple=True, required=True,
+              help='Path to one or more KML files to process. GeoJSON FeatureCollections (including files with the'
+                   u' legacy "crs" member, e.g. EPSG:3857), GeoJSON sequences, GeoParquet and FlatGeobuf files'
+                   u' are accepted as well and go through the same metrics and output pipeline.')
 @click.option('--output-geojson', 'output_geojson_path',
               type=click.Path(dir_okay=False, writable=True, resolve_path=True),
               default=None, help='Optional: Path to save the output as a GeoJSON file.'
               u' If not provided, defaults to <kml_filename>.geojson in the same directory as the KML file.')
 @click.option('--geojson-indent', type=int, default=2, show_default=True,
               help='Indentation level for the output GeoJSON file. Use None for compact output.')
-def process_kmls(kml_files, output_geojson_path, geojson_indent):
+@click.option('--metric-mode', type=click.Choice(METRIC_MODES), default=METRIC_MODE_PLANAR, show_default=True,
+              help=f'How to compute area/length/perimeter: in {DEFAULT_PLANAR_CRS} (planar), on the {GEODESIC_ELLIPSOID} ellipsoid (geodesic),'
+                   u' in the UTM zone of each feature (utm) or in an Albers equal-area CRS fitted to the file extent (albers).')
+@click.option('--repair-invalid', is_flag=True,
+              help='Repair invalid geometries with make_valid before computing metrics and saving to GeoJSON.')
+@click.option('--output-format', 'output_formats', type=click.Choice(OUTPUT_FORMATS), multiple=True,
+              default=[OUTPUT_FORMAT_GEOJSON], show_default=True,
+              help='Output format: a FeatureCollection (geojson), a GeoJSON Text Sequence with one'
+                   u' RS-prefixed feature per line (geojsonseq, RFC 8142), newline-delimited features (ndjson)'
+                   u', the "placemarks" layer of a SQLite file with WKB geometry and an R*Tree index (sqlite)'
+                   u', CSV with one column per property (csv), GeoParquet (geoparquet, requires pyarrow)'
+                   u' or FlatGeobuf with a packed Hilbert R-tree (flatgeobuf).'
+                   u' Repeat the option to write several formats in one pass; each file gets its format\'s extension.')
+@click.option('--parallel-output', is_flag=True,
+              help='With several --output-format values, run each format writer in its own thread.')
+@click.option('--append', is_flag=True,
+              help='Append features to an existing output file instead of overwriting it (geojsonseq, ndjson, sqlite and csv only).')
+@click.option('--csv-geometry', type=click.Choice(CSV_GEOMETRY_MODES), default=CSV_GEOMETRY_WKT, show_default=True,
+              help='Geometry column(s) for CSV output: WKT, hex-encoded WKB or centroid X/Y only.')
+def process_kmls(kml_files, output_geojson_path, geojson_indent, metric_mode, repair_invalid, output_formats, parallel_output,
+                 append, csv_geometry):
     """Processes one or more KML files, extracts geometric data, and saves it to GeoJSON."""
+    output_formats = list(dict.fromkeys(output_formats))
+    if append and any(fmt not in APPENDABLE_OUTPUT_FORMATS for fmt in output_formats):
+        raise click.UsageError("--append requires --output-format geojsonseq, ndjson, sqlite or csv.")
+    if OUTPUT_FORMAT_GEOPARQUET in output_formats and not geoparquet_available():
+        raise click.UsageError("--output-format geoparquet requires pyarrow: pip install pyarrow")
     click.echo(f"Received {len(kml_files)} KML file(s) to process.")
+    metric_label = "geodesic" if metric_mode == METRIC_MODE_GEODESIC else "projected"
 
     for kml_file_path in kml_files:
         # Ручная проверка существования файла
@@ -48,27 +121,36 @@ def process_kmls(kml_files, output_geojson_path, geojson_indent):
 
         click.echo(click.style(f"\n--- Processing KML file: {kml_file_path} ---", fg='cyan'))
         
-        kml_root = load_kml_file(kml_file_path)
+        source_geoms = None # Геометрии входа GeoJSON (уже в WGS84); для KML строятся из Placemark ниже
+        if is_feature_input_path(kml_file_path):
+            # GeoJSON (и другие форматы features) проходят тот же конвейер, что и Placemark из KML
+            loaded = load_geojson_placemarks(kml_file_path)
+            if loaded is None:
+                click.echo(click.style(f"  Error: Could not load or parse GeoJSON file: {kml_file_path}", fg='red'))
+                continue
+            geometries, source_geoms = loaded
+        else:
+            kml_root = load_kml_file(kml_file_path)
         
-        if not kml_root:
-            click.echo(click.style(f"  Error: Could not load or parse KML file: {kml_file_path}", fg='red'))
-            continue
+            if not kml_root:
+                click.echo(click.style(f"  Error: Could not load or parse KML file: {kml_file_path}", fg='red'))
+                continue
 
-        doc_name = get_kml_document_name(kml_root)
-        click.echo(f"  KML Document Name: {doc_name}")
+            doc_name = get_kml_document_name(kml_root)
+            click.echo(f"  KML Document Name: {doc_name}")
 
-        start_node_for_extraction = None
-        if hasattr(kml_root, 'Document') and kml_root.Document is not None:
-            start_node_for_extraction = kml_root.Document
-        elif hasattr(kml_root, 'Folder') or hasattr(kml_root, 'Placemark'):
-            start_node_for_extraction = kml_root
+            start_node_for_extraction = None
+            if hasattr(kml_root, 'Document') and kml_root.Document is not None:
+                start_node_for_extraction = kml_root.Document
+            elif hasattr(kml_root, 'Folder') or hasattr(kml_root, 'Placemark'):
+                start_node_for_extraction = kml_root
         
-        if not start_node_for_extraction:
-            click.echo(click.style(f"  Error: No suitable starting node (Document/Folder) found in KML: {kml_file_path}", fg='red'))
-            continue
+            if not start_node_for_extraction:
+                click.echo(click.style(f"  Error: No suitable starting node (Document/Folder) found in KML: {kml_file_path}", fg='red'))
+                continue
             
-        geometries = extract_placemark_geometries_recursive(start_node_for_extraction)
-        
+            geometries = extract_placemark_geometries_recursive(start_node_for_extraction)
+
         if not geometries:
             click.echo(click.style("  No geometries found in this KML.", fg='yellow'))
             click.echo(click.style("--- End of KML file processing ---", fg='cyan'))
@@ -76,36 +158,86 @@ def process_kmls(kml_files, output_geojson_path, geojson_indent):
 
         click.echo(click.style(f"  Found {len(geometries)} geometries:", fg='green'))
         
-        geojson_features_list = [] # Список для хранения GeoJSON features
+        current_output_path = output_geojson_path
+        if not current_output_path: # Если путь не задан, используем имя KML файла
+            base, _ = os.path.splitext(kml_file_path)
+            current_output_path = base + OUTPUT_FORMAT_EXTENSIONS[output_formats[0]][0]
+            if os.path.abspath(current_output_path) == os.path.abspath(kml_file_path):
+                # Вход GeoJSON не перезаписывается результатом
+                current_output_path = base + "_processed" + OUTPUT_FORMAT_EXTENSIONS[output_formats[0]][0]
 
-        for idx, geom_placemark in enumerate(geometries):
+        # Используем indent None для компактного вывода, если geojson_indent это строка "None" или число < 0
+        actual_indent = geojson_indent
+        if isinstance(geojson_indent, str) and geojson_indent.lower() == 'none':
+            actual_indent = None
+        elif isinstance(geojson_indent, int) and geojson_indent < 0:
+             actual_indent = None
+
+        # Features пишутся в выходные форматы по мере обработки, не накапливаясь в памяти
+        if len(output_formats) == 1 and not current_output_path.lower().endswith(OUTPUT_FORMAT_EXTENSIONS[output_formats[0]]):
+            click.echo(click.style(f"  Warning: Output filepath '{current_output_path}' does not end with"
+                                   f" {OUTPUT_FORMAT_EXTENSIONS[output_formats[0]][0]}. Saving anyway.", fg='yellow'))
+        geojson_writer, output_paths = _create_output_writer(
+            current_output_path, output_formats, parallel_output,
+            indent=actual_indent, append=append, layer=SQLITE_LAYER_PLACEMARKS,
+            csv_columns=CSV_PLACEMARK_COLUMNS, csv_geometry_mode=csv_geometry
+        )
+        for output_format, output_path in zip(output_formats, output_paths):
+            click.echo(click.style(f"  Streaming features to {output_format}: {output_path}", fg='blue'))
+        try:
+            geojson_writer.open()
+        except IOError as e:
+            click.echo(click.style(f"  Error opening output for writing: {e}", fg='red'))
+            geojson_writer = None
+
+        # Конвертируем все геометрии файла и считаем метрики одним пакетом
+        # (в режимах utm/albers CRS подбирается по всему набору)
+        # Координаты не округляются при парсинге: вся сетка точности задается одним вызовом apply_precision
+        if source_geoms is None:
+            shapely_geoms = [kml_placemark_to_shapely(pm, precision=None) for pm in geometries]
+        else:
+            shapely_geoms = list(source_geoms)
+        shapely_geoms = list(apply_precision(shapely_geoms, GEOGRAPHIC_CRS_WGS84))
+        # Валидность проверяется один раз для всего файла; результат передается в метрики и GeoJSON
+        validity_list = check_validity(shapely_geoms, repair=repair_invalid)
+        metric_geoms = [
+            validity.repaired_geometry if validity is not None and validity.repaired_geometry is not None else geom
+            for geom, validity in zip(shapely_geoms, validity_list)
+        ]
+        valid_mask = [
+            validity is not None and (validity.is_valid or validity.repaired_geometry is not None)
+            for validity in validity_list
+        ]
+        metrics_list = calculate_metrics(metric_geoms, metric_mode=metric_mode, valid_mask=valid_mask)
+
+        for idx, (geom_placemark, shapely_geom, validity, metrics) in enumerate(zip(geometries, shapely_geoms, validity_list, metrics_list)):
             click.echo(f"    Geometry {idx + 1}:")
             click.echo(f"      Name: {geom_placemark.name if geom_placemark.name else 'N/A'}")
             click.echo(f"      ID: {geom_placemark.id if geom_placemark.id else 'N/A'}")
             click.echo(f"      Type: {geom_placemark.geometry_type}")
             
-            shapely_geom = kml_placemark_to_shapely(geom_placemark, precision=DEFAULT_PRECISION)
-            
             area = None
             length = None
             perimeter = None
 
             if shapely_geom:
                 click.echo(click.style(f"      Shapely WKT: {shapely_geom.wkt}", fg='yellow'))
-                if not shapely_geom.is_valid:
-                    click.echo(click.style(f"        WARNING: Shapely geometry is not valid!", fg='red'))
+                if not validity.is_valid:
+                    click.echo(click.style(f"        WARNING: Shapely geometry is not valid! ({validity.reason})", fg='red'))
+                    if validity.repaired_geometry is not None:
+                        click.echo(click.style(f"        Repaired with make_valid: {validity.repaired_geometry.geom_type}", fg='yellow'))
                     # Причина невалидности будет в GeoJSON properties
                 
-                area = calculate_area(shapely_geom)
-                length = calculate_length(shapely_geom)
-                perimeter = calculate_perimeter(shapely_geom)
+                area = metrics.area
+                length = metrics.length
+                perimeter = metrics.perimeter
 
                 if area is not None:
-                    click.echo(click.style(f"      Area: {area:.2f} sq. units (projected)", fg='magenta'))
+                    click.echo(click.style(f"      Area: {area:.2f} sq. units ({metric_label})", fg='magenta'))
                 if length is not None and length > 1e-9: # Используем малый порог
-                    click.echo(click.style(f"      Length: {length:.2f} units (projected)", fg='magenta'))
+                    click.echo(click.style(f"      Length: {length:.2f} units ({metric_label})", fg='magenta'))
                 if perimeter is not None and perimeter > 1e-9:
-                    click.echo(click.style(f"      Perimeter: {perimeter:.2f} units (projected)", fg='magenta'))
+                    click.echo(click.style(f"      Perimeter: {perimeter:.2f} units ({metric_label})", fg='magenta'))
                 
                 # Создаем GeoJSON feature
                 feature = create_geojson_feature(
@@ -114,34 +246,43 @@ def process_kmls(kml_files, output_geojson_path, geojson_indent):
                     area=area, 
                     length=length, 
                     perimeter=perimeter,
-                    precision=DEFAULT_PRECISION # Используем ту же точность, что и для расчетов
+                    precision=DEFAULT_PRECISION, # Используем ту же точность, что и для расчетов
+                    validity=validity
                 )
-                geojson_features_list.append(feature)
 
             elif geom_placemark.geometry_type and geom_placemark.geometry_type != 'Unknown':
                 click.echo(click.style("      Could not convert to Shapely geometry. Will not be included in GeoJSON.", fg='red'))
                 # Создаем "пустой" feature или feature с Null геометрией, если нужно отметить его в GeoJSON
                 # Пока просто пропускаем, если не удалось создать Shapely геометрию
-                feature_empty = create_geojson_feature(
+                feature = create_geojson_feature(
                     placemark_data=geom_placemark, 
                     shapely_geom=None, 
                     area=None, 
                     length=None, 
                     perimeter=None
                 )
-                geojson_features_list.append(feature_empty) # Добавляем с None геометрией
             else:
                 click.echo(click.style("      No displayable geometry data or Unknown geometry type.", fg='yellow'))
                 # Также добавляем с None геометрией, чтобы зафиксировать имя/id если есть
-                feature_empty = create_geojson_feature(
+                feature = create_geojson_feature(
                     placemark_data=geom_placemark, 
                     shapely_geom=None, 
                     area=None, 
                     length=None, 
                     perimeter=None
                 )
-                geojson_features_list.append(feature_empty)
-            
+
+            source_feature = geom_placemark.raw_kml_placemark_obj
+            if isinstance(source_feature, dict):
+                # Вход GeoJSON: исходные id и properties сохраняются, вычисленные поля дописываются к ним
+                feature["properties"] = {**(source_feature.get("properties") or {}), **feature["properties"]}
+                if source_feature.get("id") is not None:
+                    feature["id"] = source_feature["id"]
+
+            # Feature сразу дописывается в файл
+            if geojson_writer is not None:
+                geojson_writer.write(feature)
+
             coords_data = geom_placemark.geometry_data # Это один из Geom датаклассов или None
             
             if isinstance(coords_data, PointGeom):
@@ -167,33 +308,19 @@ def process_kmls(kml_files, output_geojson_path, geojson_indent):
                                  click.echo(f"          Inner {i_sub+1}: {i_ring_sub}")
                     else: # Point, LineString, LinearRing string coordinates
                          click.echo(f"          Coords: {sub_geom_data.coordinates}")
+            elif isinstance(coords_data, dict): # Геометрия входа GeoJSON (в исходной CRS)
+                click.echo(f"      Coordinates: {coords_data.get('coordinates')}")
             elif coords_data is None and geom_placemark.geometry_type == 'Unknown':
                  click.echo(f"      Coordinates: Not applicable (Unknown geometry type)")
             else:
                 click.echo(click.style(f"      Coordinates: (Unhandled geometry data type: {type(coords_data)}) {coords_data}", fg='red'))
 
-        # Сохранение в GeoJSON
-        if geojson_features_list: # Сохраняем, только если есть что сохранять
-            current_output_path = output_geojson_path
-            if not current_output_path: # Если путь не задан, используем имя KML файла
-                base, _ = os.path.splitext(kml_file_path)
-                current_output_path = base + ".geojson"
-            
-            click.echo(click.style(f"  Saving {len(geojson_features_list)} features to GeoJSON: {current_output_path}", fg='blue'))
-            
-            # Используем indent None для компактного вывода, если geojson_indent это строка "None" или число < 0
-            actual_indent = geojson_indent
-            if isinstance(geojson_indent, str) and geojson_indent.lower() == 'none':
-                actual_indent = None
-            elif isinstance(geojson_indent, int) and geojson_indent < 0:
-                 actual_indent = None
-
-            if save_geojson_feature_collection(geojson_features_list, current_output_path, indent=actual_indent):
-                click.echo(click.style("  GeoJSON successfully saved.", fg='green'))
-            else:
-                click.echo(click.style("  Failed to save GeoJSON.", fg='red'))
-        else:
-            click.echo(click.style("  No processable geometries found to save to GeoJSON.", fg='yellow'))
+        if geojson_writer is not None:
+            try:
+                geojson_writer.close()
+                click.echo(click.style(f"  Output successfully saved ({geojson_writer.count} features).", fg='green'))
+            except IOError as e:
+                click.echo(click.style(f"  Failed to save output: {e}", fg='red'))
 
         click.echo(click.style("--- End of KML file processing ---", fg='cyan'))
 
@@ -207,11 +334,58 @@ def process_kmls(kml_files, output_geojson_path, geojson_indent):
 @click.option("--raw-output", is_flag=True, help="Вывести полный сырой JSON ответ от API (если применимо к этапу).")
 @click.option("--shapely-wkt", is_flag=True, help="Вывести геометрию в формате WKT (если доступно).")
 @click.option("--no-metrics", is_flag=True, help="Не рассчитывать и не выводить геометрические метрики (площадь, периметр).")
-def search_pkk(query_text: str, raw_output: bool, shapely_wkt: bool, no_metrics: bool):
+@click.option("--metric-mode", type=click.Choice(METRIC_MODES), default=METRIC_MODE_PLANAR, show_default=True,
+              help=f"Способ расчета метрик: в {DEFAULT_PLANAR_CRS} (planar), на эллипсоиде {GEODESIC_ELLIPSOID} (geodesic),"
+                   " в зоне UTM объекта (utm) или в равновеликой проекции Альберса (albers).")
+@click.option("--output", "output_path", type=click.Path(dir_okay=False, writable=True, resolve_path=True), default=None,
+              help="Сохранить найденные объекты (features НСПД) в файл.")
+@click.option("--output-format", "output_formats", type=click.Choice(OUTPUT_FORMATS), multiple=True,
+              default=[OUTPUT_FORMAT_GEOJSON], show_default=True,
+              help="Формат файла --output: FeatureCollection (geojson), GeoJSON Text Sequence (geojsonseq, RFC 8142),"
+                   " по объекту в строке (ndjson), слой parcels файла SQLite (sqlite), CSV (csv),"
+                   " GeoParquet (geoparquet, нужен pyarrow) или FlatGeobuf с индексом (flatgeobuf)."
+                   " Можно указать несколько раз: форматы пишутся за один проход, у каждого файла - свое расширение.")
+@click.option("--parallel-output", is_flag=True, help="При нескольких --output-format писать каждый формат в своем потоке.")
+@click.option("--append", is_flag=True, help="Дописывать объекты в существующий файл --output (только geojsonseq, ndjson, sqlite и csv).")
+@click.option("--incremental", is_flag=True,
+              help="Записать в существующий файл --output только новые и измененные объекты и отметить удаленные"
+                   " (только geojsonseq, ndjson и sqlite).")
+@click.option("--csv-geometry", type=click.Choice(CSV_GEOMETRY_MODES), default=CSV_GEOMETRY_WKT, show_default=True,
+              help="Геометрия в CSV: WKT, шестнадцатеричный WKB или только центроид (X/Y).")
+@click.option("-l", "--local", "local_datasets", type=click.Path(exists=True, dir_okay=False), multiple=True,
+              help="GeoJSON-файл(ы) участков: кадастровый номер, квартал или район сначала ищутся в них"
+                   " по индексу номеров, API запрашивается, только если локально ничего не найдено.")
+def search_pkk(query_text: str, raw_output: bool, shapely_wkt: bool, no_metrics: bool, metric_mode: str,
+               output_path: str, output_formats: tuple, parallel_output: bool, append: bool, incremental: bool,
+               csv_geometry: str, local_datasets: tuple):
     """Поиск объектов на Публичной Кадастровой Карте (через API НСПД)."""
+    output_formats = list(dict.fromkeys(output_formats))
+    if append and any(fmt not in APPENDABLE_OUTPUT_FORMATS for fmt in output_formats):
+        raise click.UsageError("--append возможен только с --output-format geojsonseq, ndjson, sqlite или csv.")
+    if incremental and (append or any(fmt not in INCREMENTAL_OUTPUT_FORMATS for fmt in output_formats)):
+        raise click.UsageError("--incremental возможен только без --append и с --output-format geojsonseq, ndjson или sqlite.")
+    if OUTPUT_FORMAT_GEOPARQUET in output_formats and not geoparquet_available():
+        raise click.UsageError("Для --output-format geoparquet нужен pyarrow: pip install pyarrow")
     click.echo(f"Выполняется поиск по запросу: '{query_text}'...")
+    metric_label = {
+        METRIC_MODE_PLANAR: f"в CRS: {DEFAULT_PLANAR_CRS}",
+        METRIC_MODE_GEODESIC: f"на эллипсоиде {GEODESIC_ELLIPSOID}",
+        METRIC_MODE_UTM: "в зоне UTM объекта",
+    }.get(metric_mode, "в равновеликой проекции Альберса")
 
-    parsed_features, error = search_cadastral_data_by_text(query_text)
+    parsed_features, error = None, None
+    if local_datasets and CAD_NUM_PATTERN.match(query_text.strip()):
+        # Полный номер - точный поиск, начало номера - все участки квартала или района
+        query_key = query_text.strip()
+        if query_key.count(":") == 3:
+            found = find_parcels(local_datasets, cad_num=query_key)
+        else:
+            found = find_parcels(local_datasets, prefix=query_key)
+        parsed_features = [parsed for parsed in (parse_nspd_feature(feature) for _, feature in found) if parsed]
+        if parsed_features:
+            click.echo("Объекты найдены в локальных наборах данных, запрос к API не выполнялся.")
+    if not parsed_features:
+        parsed_features, error = search_cadastral_data_by_text(query_text)
 
     if error:
         click.secho(f"Ошибка при выполнении запроса: {error}", fg="red")
@@ -223,20 +397,44 @@ def search_pkk(query_text: str, raw_output: bool, shapely_wkt: bool, no_metrics:
 
     click.secho(f"Найдено объектов: {len(parsed_features)}", fg="green")
 
+    # parsed_features это список датаклассов, для raw вывода и файла лучше использовать их raw_feature_dict
+    # Координаты выводятся с фиксированной точностью для CRS объекта (метры НСПД - до 1 см)
+    raw_dicts = [
+        round_feature_coordinates(
+            feat.raw_feature_dict,
+            coordinate_precision_for_crs(feat.geometry.crs.name if feat.geometry and feat.geometry.crs and feat.geometry.crs.name else DEFAULT_PLANAR_CRS)
+        )
+        for feat in parsed_features if feat and feat.raw_feature_dict
+    ]
+
+    if output_path:
+        try:
+            # Координаты уже округлены по CRS каждого объекта
+            writer, output_paths = _create_output_writer(output_path, output_formats, parallel_output, append=append,
+                                                         coordinate_precision=None, csv_geometry_mode=csv_geometry,
+                                                         incremental=incremental)
+            with writer:
+                for raw_dict in raw_dicts:
+                    writer.write(raw_dict)
+            for output_format, path, format_writer in zip(output_formats, output_paths, getattr(writer, "writers", [writer])):
+                click.secho(f"Сохранено объектов: {writer.count} ({output_format}) в {path}", fg="green")
+                if incremental:
+                    click.echo(_incremental_summary(format_writer.stats))
+        except (IOError, TypeError) as e:
+            click.secho(f"Ошибка сохранения в '{output_path}': {e}", fg="red")
+
     if raw_output:
         click.echo("--- Сырой ответ (распарсенные features) ---")
-        # parsed_features это список датаклассов, для raw вывода лучше использовать их raw_feature_dict
-        raw_dicts = [feat.raw_feature_dict for feat in parsed_features if feat and feat.raw_feature_dict]
         if raw_dicts:
             try:
-                click.echo(json.dumps(raw_dicts, indent=2, ensure_ascii=False))
+                click.echo(dumps_json(raw_dicts, indent=2))
             except TypeError as e:
                 click.secho(f"Ошибка сериализации сырых данных: {e}", fg="red")
                 click.echo("Попытка вывода каждого объекта отдельно:")
                 for i, raw_dict in enumerate(raw_dicts):
                     try:
                         click.echo(f"Объект {i+1}:")
-                        click.echo(json.dumps(raw_dict, indent=2, ensure_ascii=False))
+                        click.echo(dumps_json(raw_dict, indent=2))
                     except TypeError:
                         click.echo(f"  Не удалось сериализовать объект {i+1}")
         else:
@@ -277,7 +475,7 @@ def search_pkk(query_text: str, raw_output: bool, shapely_wkt: bool, no_metrics:
             source_crs = feature.geometry.crs.name if feature.geometry.crs else DEFAULT_PLANAR_CRS
             click.echo(f"  Тип геометрии (НСПД): {feature.geometry.type}, CRS: {source_crs}")
             
-            shapely_object = nspd_geometry_to_shapely(feature.geometry)
+            shapely_object = apply_precision(nspd_geometry_to_shapely(feature.geometry), source_crs)
             if shapely_object:
                 click.echo(f"  Конвертировано в Shapely: {shapely_object.geom_type}, Валидность: {shapely_object.is_valid}")
                 if shapely_wkt:
@@ -287,21 +485,474 @@ def search_pkk(query_text: str, raw_output: bool, shapely_wkt: bool, no_metrics:
                         click.secho(f"    Ошибка при генерации WKT: {e}", fg="red")
 
                 if not no_metrics:
-                    area_calc = calculate_area(shapely_object, source_crs_str=source_crs, target_planar_crs_str=DEFAULT_PLANAR_CRS)
-                    # length_calc = calculate_length(shapely_object, source_crs_str=source_crs, target_planar_crs_str=DEFAULT_PLANAR_CRS)
-                    perimeter_calc = calculate_perimeter(shapely_object, source_crs_str=source_crs, target_planar_crs_str=DEFAULT_PLANAR_CRS)
+                    metrics = calculate_metrics(shapely_object, source_crs_str=source_crs, target_planar_crs_str=DEFAULT_PLANAR_CRS, metric_mode=metric_mode)
+                    area_calc = metrics.area
+                    # length_calc = metrics.length
+                    perimeter_calc = metrics.perimeter
                     
                     if area_calc is not None:
-                        click.echo(f"    Расчетная площадь: {area_calc:.2f} кв.м (в CRS: {DEFAULT_PLANAR_CRS})")
+                        click.echo(f"    Расчетная площадь: {area_calc:.2f} кв.м ({metric_label})")
                     # Длина имеет смысл в основном для линий, для полигонов есть периметр
                     # if length_calc is not None and shapely_object.geom_type not in ["Polygon", "MultiPolygon"]:
-                    #    click.echo(f"    Расчетная длина: {length_calc:.2f} м. (в CRS: {DEFAULT_PLANAR_CRS})")
+                    #    click.echo(f"    Расчетная длина: {length_calc:.2f} м. ({metric_label})")
                     if perimeter_calc is not None: # and shapely_object.geom_type in ["Polygon", "MultiPolygon"]:
-                        click.echo(f"    Расчетный периметр: {perimeter_calc:.2f} м. (в CRS: {DEFAULT_PLANAR_CRS})")
+                        click.echo(f"    Расчетный периметр: {perimeter_calc:.2f} м. ({metric_label})")
             else:
                 click.secho("  Не удалось конвертировать геометрию в Shapely.", fg="yellow")
         else:
             click.echo("  Геометрия отсутствует в данных объекта.")
 
+@cli.command("overlay")
+@click.option("-k", "--kml-files", "kml_files", type=click.Path(exists=True, dir_okay=False), multiple=True, required=True,
+              help="KML-файл(ы) с зонами (этапами трассы).")
+@click.option("-p", "--parcels", "parcel_files", type=click.Path(exists=True, dir_okay=False), multiple=True, required=True,
+              help="GeoJSON-файл(ы) с участками в формате НСПД (например, \"От Зеленограда/Этап 7.2.geojson\").")
+@click.option("--buffer", "buffer_m", type=float, default=None,
+              help="Ширина буфера зоны в метрах (например, полоса отвода вокруг оси трассы).")
+@click.option("--metric-mode", type=click.Choice(METRIC_MODES), default=METRIC_MODE_UTM, show_default=True,
+              help="Способ расчета площадей и длин пересечений (см. process-kmls).")
+@click.option("--output-geojson", "output_geojson_path", type=click.Path(dir_okay=False, writable=True, resolve_path=True),
+              default=None, help="Сохранить пересечения (зона x участок) в GeoJSON.")
+@click.option("--geojson-indent", type=int, default=2, show_default=True,
+              help="Отступ в выходном GeoJSON (отрицательное значение - компактный вывод).")
+def overlay(kml_files, parcel_files, buffer_m, metric_mode, output_geojson_path, geojson_indent):
+    """Определяет участки, которые пересекает каждая зона, и площадь/длину пересечения."""
+    placemarks, zone_geoms = load_kml_zones(kml_files)
+    click.echo(f"Загружено зон: {len(placemarks)} из {len(kml_files)} KML-файл(ов).")
+    features, parcel_geoms = load_nspd_parcels(parcel_files)
+    click.echo(f"Загружено участков: {len(features)} из {len(parcel_files)} GeoJSON-файл(ов).")
+    if not placemarks or not features:
+        click.secho("Нет данных для наложения.", fg="yellow")
+        return
+
+    if buffer_m:
+        zone_geoms = buffer_in_metres(zone_geoms, buffer_m)
+
+    results = overlay_zones_with_parcels(
+        zone_geoms, parcel_geoms, metric_mode=metric_mode,
+        zone_names=[pm.name for pm in placemarks],
+        parcel_cad_nums=[f.options_properties.cad_num if f.options_properties else None for f in features]
+    )
+
+    results_by_zone = {}
+    for result in results:
+        results_by_zone.setdefault(result.zone_index, []).append(result)
+
+    for zone_index, placemark in enumerate(placemarks):
+        zone_results = results_by_zone.get(zone_index)
+        if not zone_results:
+            continue
+        total_area = sum(r.intersection_area or 0.0 for r in zone_results)
+        total_length = sum(r.intersection_length or 0.0 for r in zone_results)
+        click.secho(f"\nЗона {zone_index + 1} '{placemark.name or 'N/A'}': участков - {len(zone_results)}", fg="cyan")
+        if total_area > 0:
+            click.echo(f"  Площадь пересечения: {total_area:.2f} кв.м ({metric_mode})")
+        if total_length > 0:
+            click.echo(f"  Длина по участкам: {total_length:.2f} м ({metric_mode})")
+    click.secho(f"\nВсего пар зона-участок: {len(results)}", fg="green")
+
+    if output_geojson_path:
+        actual_indent = geojson_indent if geojson_indent is not None and geojson_indent >= 0 else None
+        if save_geojson_feature_collection(overlay_results_to_features(results), output_geojson_path, indent=actual_indent):
+            click.secho(f"Пересечения сохранены: {output_geojson_path}", fg="green")
+        else:
+            click.secho("Не удалось сохранить GeoJSON.", fg="red")
+
+@cli.command("build-index")
+@click.option("-d", "--datasets", "dataset_files", type=click.Path(exists=True, dir_okay=False), multiple=True, required=True,
+              help="GeoJSON-файл(ы), для которых строится пространственный индекс (<файл>.hrtree рядом с ним).")
+def build_index(dataset_files):
+    """Строит упакованные R-деревья Гильберта и индексы кадастровых номеров для локальных наборов участков."""
+    for dataset_path in dataset_files:
+        try:
+            index_paths = [build_spatial_index(dataset_path), build_cadastral_index(dataset_path)]
+        except (IOError, ValueError) as e:
+            click.secho(f"Ошибка построения индекса для {dataset_path}: {e}", fg="red")
+            continue
+        for index_path in index_paths:
+            click.echo(f"Индекс построен: {index_path}")
+
+@cli.command("spatial-query")
+@click.option("-d", "--datasets", "dataset_files", type=click.Path(exists=True, dir_okay=False), multiple=True, required=True,
+              help="GeoJSON-файл(ы) для поиска; отсутствующие или устаревшие индексы строятся автоматически.")
+@click.option("--bbox", type=float, nargs=4, default=None, help="Прямоугольник поиска: minx miny maxx maxy.")
+@click.option("--point", type=float, nargs=2, default=None, help="Точка поиска: x y.")
+@click.option("--crs", "query_crs", default=GEOGRAPHIC_CRS_WGS84, show_default=True, help="CRS координат запроса.")
+@click.option("--exact", is_flag=True, help="Проверять пересечение с самой геометрией, а не только с ее прямоугольником.")
+def spatial_query(dataset_files, bbox, point, query_crs, exact):
+    """Ищет участки по точке или прямоугольнику без загрузки GeoJSON целиком."""
+    if bool(bbox) == bool(point):
+        raise click.UsageError("Укажите ровно один из параметров --bbox или --point.")
+    query_bbox = bbox if bbox else (point[0], point[1], point[0], point[1])
+
+    found = 0
+    for dataset_path, feature in query_datasets(dataset_files, query_bbox, bbox_crs=query_crs, exact=exact):
+        properties = feature.get("properties") or {}
+        cad_num = (properties.get("options") or {}).get("cad_num") or properties.get("label") or feature.get("id")
+        click.echo(f"{os.path.basename(dataset_path)}: {cad_num}")
+        found += 1
+    click.secho(f"Найдено объектов: {found}", fg="green" if found else "yellow")
+
+@cli.command("cad-query")
+@click.option("-d", "--datasets", "dataset_files", type=click.Path(exists=True, dir_okay=False), multiple=True, required=True,
+              help="GeoJSON-файл(ы) для поиска; отсутствующие или устаревшие индексы номеров строятся автоматически.")
+@click.option("--cad-num", default=None, help="Точный кадастровый номер.")
+@click.option("--prefix", default=None, help="Начало номера по целым частям: квартал (50:03:0060111) или район (50:03).")
+@click.option("--range", "cad_range", nargs=2, default=None, help="Диапазон номеров: от до (включительно).")
+def cad_query(dataset_files, cad_num, prefix, cad_range):
+    """Ищет участки по кадастровому номеру, кварталу или диапазону номеров без запросов к API."""
+    if sum(value is not None for value in (cad_num, prefix, cad_range)) != 1:
+        raise click.UsageError("Укажите ровно один из параметров --cad-num, --prefix или --range.")
+
+    found = 0
+    for dataset_path, feature in find_parcels(dataset_files, cad_num=cad_num, prefix=prefix, cad_range=cad_range):
+        properties = feature.get("properties") or {}
+        label = (properties.get("options") or {}).get("cad_num") or properties.get("cad_num") or feature.get("id")
+        click.echo(f"{os.path.basename(dataset_path)}: {label}")
+        found += 1
+    click.secho(f"Найдено объектов: {found}", fg="green" if found else "yellow")
+
+@cli.command("dissolve")
+@click.option("-p", "--parcels", "parcel_files", type=click.Path(exists=True, dir_okay=False), multiple=True, required=True,
+              help="GeoJSON-файл(ы) с участками в формате НСПД; каждый файл (этап) объединяется отдельно.")
+@click.option("--by", "field_name", default="land_record_category_type", show_default=True,
+              help="Поле properties.options, по которому группируются участки (например, permitted_use_established_by_document).")
+@click.option("--workers", type=int, default=None, help="Число процессов (по умолчанию - число CPU).")
+@click.option("--output-geojson", "output_geojson_path", type=click.Path(dir_okay=False, writable=True, resolve_path=True),
+              default=None, help="Сохранить объединенные геометрии в GeoJSON (WGS84).")
+@click.option("--geojson-indent", type=int, default=2, show_default=True,
+              help="Отступ в выходном GeoJSON (отрицательное значение - компактный вывод).")
+def dissolve(parcel_files, field_name, workers, output_geojson_path, geojson_indent):
+    """Объединяет участки каждого этапа в мультиполигоны по значению атрибута."""
+    output_features = []
+    for parcel_file in parcel_files:
+        features, parcel_geoms = load_nspd_parcels([parcel_file])
+        if not features:
+            click.secho(f"{parcel_file}: нет участков с геометрией.", fg="yellow")
+            continue
+        keys = [nspd_option_value(f, field_name) for f in features]
+        dissolved = dissolve_geometries(parcel_geoms, keys, workers=workers)
+        counts = {}
+        for key in keys:
+            counts[key] = counts.get(key, 0) + 1
+
+        stage = os.path.splitext(os.path.basename(parcel_file))[0]
+        click.secho(f"\n{stage}: участков - {len(features)}, групп - {len(dissolved)}", fg="cyan")
+        geoms = list(dissolved.values())
+        metrics_list = calculate_metrics(geoms, source_crs_str=OVERLAY_CRS, metric_mode=METRIC_MODE_UTM)
+        wgs84_geoms = apply_precision(reproject_geometries(geoms, OVERLAY_CRS, GEOGRAPHIC_CRS_WGS84), GEOGRAPHIC_CRS_WGS84)
+        for key, metrics, geom in zip(dissolved, metrics_list, wgs84_geoms):
+            click.echo(f"  {key or 'N/A'}: участков - {counts[key]}, площадь {metrics.area:.2f} кв.м")
+            output_features.append({
+                "type": "Feature",
+                "geometry": mapping(geom),
+                "properties": {
+                    "stage": stage,
+                    field_name: key,
+                    "parcel_count": counts[key],
+                    "area_sq_m": round(metrics.area, 2),
+                },
+            })
+
+    if output_geojson_path:
+        actual_indent = geojson_indent if geojson_indent is not None and geojson_indent >= 0 else None
+        if save_geojson_feature_collection(output_features, output_geojson_path, indent=actual_indent):
+            click.secho(f"\nРезультат сохранен: {output_geojson_path}", fg="green")
+        else:
+            click.secho("Не удалось сохранить GeoJSON.", fg="red")
+
+@cli.command("qa-topology")
+@click.option("-p", "--parcels", "parcel_files", type=click.Path(exists=True, dir_okay=False), multiple=True, required=True,
+              help="GeoJSON-файл(ы) с участками в формате НСПД; проверяются вместе как один набор.")
+@click.option("--gap-tolerance", type=float, default=DEFAULT_GAP_TOLERANCE, show_default=True,
+              help="Максимальная ширина разрыва между соседними участками, м.")
+@click.option("--min-area", type=float, default=DEFAULT_MIN_ISSUE_AREA, show_default=True,
+              help="Минимальная площадь перекрытия или разрыва, кв.м.")
+@click.option("--output-geojson", "output_geojson_path", type=click.Path(dir_okay=False, writable=True, resolve_path=True),
+              default=None, help="Сохранить проблемные области в GeoJSON (WGS84).")
+@click.option("--geojson-indent", type=int, default=2, show_default=True,
+              help="Отступ в выходном GeoJSON (отрицательное значение - компактный вывод).")
+def qa_topology(parcel_files, gap_tolerance, min_area, output_geojson_path, geojson_indent):
+    """Ищет перекрытия, узкие разрывы и невалидные геометрии в наборе участков."""
+    features, parcel_geoms = load_nspd_parcels(parcel_files)
+    # Этапы пересекаются по охвату: один и тот же участок из разных файлов - не перекрытие
+    seen, unique_idx = set(), []
+    for i, feature in enumerate(features):
+        cad_num = feature.options_properties.cad_num if feature.options_properties else None
+        if cad_num is None or cad_num not in seen:
+            seen.add(cad_num)
+            unique_idx.append(i)
+    click.echo(f"Загружено участков: {len(features)}, уникальных: {len(unique_idx)}.")
+    features = [features[i] for i in unique_idx]
+    cad_nums = [f.options_properties.cad_num if f.options_properties else None for f in features]
+
+    issues = find_topology_issues(parcel_geoms[unique_idx], cad_nums=cad_nums,
+                                  gap_tolerance=gap_tolerance, min_area=min_area)
+    for issue_type, label in (("overlap", "Перекрытия"), ("gap", "Разрывы"), ("invalid", "Невалидные геометрии"),
+                             ("error", "Пары, не проверенные из-за ошибки GEOS")):
+        typed = [issue for issue in issues if issue.issue_type == issue_type]
+        total_area = sum(issue.area or 0.0 for issue in typed)
+        line = f"{label}: {len(typed)}"
+        if issue_type in ("overlap", "gap"):
+            line += f", суммарная площадь {total_area:.2f} кв.м"
+        click.secho(line, fg="yellow" if typed else "green")
+
+    if output_geojson_path:
+        actual_indent = geojson_indent if geojson_indent is not None and geojson_indent >= 0 else None
+        if save_geojson_feature_collection(topology_issues_to_features(issues), output_geojson_path, indent=actual_indent):
+            click.secho(f"Проблемные области сохранены: {output_geojson_path}", fg="green")
+        else:
+            click.secho("Не удалось сохранить GeoJSON.", fg="red")
+
+@cli.command("export-sqlite")
+@click.option("-p", "--parcels", "parcel_files", type=click.Path(exists=True, dir_okay=False), multiple=True, required=True,
+              help="GeoJSON-файл(ы) или последовательности GeoJSON с участками в формате НСПД.")
+@click.option("-o", "--output", "output_path", type=click.Path(dir_okay=False, writable=True, resolve_path=True), required=True,
+              help="Файл SQLite проекта.")
+@click.option("--layer", default=SQLITE_LAYER_PARCELS, show_default=True, help="Слой (таблица) в файле SQLite.")
+@click.option("--append", is_flag=True, help="Дописать в существующий слой, а не перезаписать его.")
+@click.option("--incremental", is_flag=True,
+              help="Обновить слой до переданного набора участков: записать только новые и измененные,"
+                   " удалить отсутствующие (с записью в tombstones_<слой>).")
+def export_sqlite(parcel_files, output_path, layer, append, incremental):
+    """Сохраняет участки в один файл SQLite: геометрия WKB, индекс R*Tree, индексы по cad_num и кварталу."""
+    try:
+        with create_feature_writer(output_path, output_format=OUTPUT_FORMAT_SQLITE, append=append, layer=layer,
+                                   incremental=incremental) as writer:
+            for parcel_file in parcel_files:
+                written = 0
+                for feature in _iter_input_features(parcel_file):
+                    writer.write(feature)
+                    written += 1
+                click.echo(f"{parcel_file}: участков - {written}")
+    except (sqlite3.Error, ValueError) as e:
+        click.secho(f"Ошибка записи SQLite '{output_path}': {e}", fg="red")
+        return
+    click.secho(f"Сохранено участков: {writer.count} в слой '{layer}' файла {output_path}", fg="green")
+    if incremental:
+        click.echo(_incremental_summary(writer.stats))
+
+@cli.command("build-catalog")
+@click.option("-d", "--directory", "stage_dir", type=click.Path(exists=True, file_okay=False), required=True,
+              help="Каталог с файлами этапов (например, \"От Зеленограда\").")
+@click.option("--pattern", default=DEFAULT_STAGE_PATTERN, show_default=True, help="Шаблон имен файлов этапов.")
+@click.option("-o", "--output", "output_path", type=click.Path(dir_okay=False, writable=True, resolve_path=True), required=True,
+              help="Файл SQLite каталога.")
+@click.option("--layer", default=SQLITE_LAYER_PARCELS, show_default=True, help="Слой (таблица) каталога в файле SQLite.")
+@click.option("--workers", type=int, default=None, help="Число процессов чтения (по умолчанию - число CPU).")
+@click.option("--run-size-mb", type=float, default=DEFAULT_RUN_CHARS / (1024 * 1024), show_default=True,
+              help="Объем JSON (млн символов) в памяти процесса, после которого отсортированная часть сбрасывается на диск.")
+def build_catalog(stage_dir, pattern, output_path, layer, workers, run_size_mb):
+    """Собирает участки всех этапов в один каталог SQLite без повторов, с отметкой этапов каждого участка."""
+    stage_paths = find_stage_files(stage_dir, pattern)
+    if not stage_paths:
+        click.secho(f"В '{stage_dir}' нет файлов по шаблону '{pattern}'.", fg="yellow")
+        return
+    click.echo(f"Файлов этапов: {len(stage_paths)}")
+    try:
+        stats = build_parcel_catalog(stage_paths, output_path, layer=layer, workers=workers,
+                                     run_chars=max(1, int(run_size_mb * 1024 * 1024)))
+    except (sqlite3.Error, ValueError, IOError) as e:
+        click.secho(f"Ошибка записи каталога '{output_path}': {e}", fg="red")
+        return
+    for stage in stats.failed_stages:
+        click.secho(f"{stage}: не удалось прочитать файл, этап пропущен.", fg="red")
+    click.echo(f"Прочитано участков: {stats.features_read}, повторов в других этапах: {stats.duplicates},"
+               f" частей сортировки на диске: {stats.spill_runs}")
+    click.secho(f"В каталоге участков: {stats.parcels} (слой '{layer}' и таблица '{layer}_stages' файла {output_path})",
+                fg="green")
+
+@cli.command("harvest-quarters")
+@click.option("-k", "--kml-files", "kml_files", type=click.Path(exists=True, dir_okay=False), multiple=True,
+              help="KML- или GeoJSON-файл(ы) с зоной, участки которой собираются.")
+@click.option("-d", "--datasets", "dataset_files", type=click.Path(exists=True, dir_okay=False), multiple=True,
+              help="Локальные GeoJSON-файлы участков: по ним находятся кварталы, пересекающие зону.")
+@click.option("-q", "--quarter", "extra_quarters", multiple=True, help="Кадастровый квартал, собираемый дополнительно.")
+@click.option("--buffer", "buffer_m", type=float, default=None, help="Ширина буфера зоны в метрах.")
+@click.option("-o", "--output", "output_path", type=click.Path(dir_okay=False, writable=True, resolve_path=True), required=True,
+              help="Файл SQLite хранилища; собранные кварталы отмечаются в нем.")
+@click.option("--layer", default=SQLITE_LAYER_PARCELS, show_default=True, help="Слой (таблица) участков в файле SQLite.")
+@click.option("--workers", type=click.IntRange(min=1), default=DEFAULT_HARVEST_WORKERS, show_default=True,
+              help="Число одновременных запросов к API.")
+@click.option("--page-limit", type=click.IntRange(min=1), default=None,
+              help="Наибольшее число объектов в ответе API: ответ такого размера считается обрезанным.")
+@click.option("--refresh", is_flag=True, help="Запросить заново и кварталы, уже собранные полностью.")
+def harvest_by_quarters(kml_files, dataset_files, extra_quarters, buffer_m, output_path, layer, workers, page_limit, refresh):
+    """Собирает участки зоны по кадастровым кварталам: кварталы зоны запрашиваются параллельно, собранные пропускаются."""
+    if not extra_quarters and not (kml_files and dataset_files):
+        raise click.UsageError("Укажите зону (-k) и локальные участки (-d) или кварталы (-q).")
+    quarters = {}
+    if kml_files and dataset_files:
+        placemarks, zone_geoms = load_kml_zones(kml_files)
+        if buffer_m:
+            zone_geoms = buffer_in_metres(zone_geoms, buffer_m)
+        quarters = find_zone_quarters(zone_geoms, dataset_files, OVERLAY_CRS)
+        click.echo(f"Зон: {len(placemarks)}, кварталов в зоне: {len(quarters)}")
+    for quarter in extra_quarters:
+        quarters.setdefault(quarter.strip(), set())
+    if not quarters:
+        click.secho("Кварталы для сбора не найдены.", fg="yellow")
+        return
+    try:
+        stats = harvest_quarters(quarters, output_path, layer=layer, workers=workers, page_limit=page_limit, refresh=refresh)
+    except (sqlite3.Error, ValueError) as e:
+        click.secho(f"Ошибка записи SQLite '{output_path}': {e}", fg="red")
+        return
+    click.echo(f"Пропущено (уже собраны): {len(stats.skipped)}")
+    click.echo(f"Собрано полностью: {len(stats.complete)}, участков записано: {stats.parcels}")
+    if stats.incomplete:
+        click.secho(f"Собрано не полностью (будут запрошены снова): {', '.join(stats.incomplete)}", fg="yellow")
+    if stats.failed:
+        click.secho(f"Ошибка запроса: {', '.join(stats.failed)}", fg="red")
+
+@cli.command("diff")
+@click.option("-a", "--old", "old_path", type=click.Path(exists=True, dir_okay=False), required=True,
+              help="Прежний набор участков (выгрузка или версия файла этапа).")
+@click.option("-b", "--new", "new_path", type=click.Path(exists=True, dir_okay=False), required=True,
+              help="Новый набор участков.")
+@click.option("-o", "--output", "output_path", type=click.Path(dir_okay=False, writable=True, resolve_path=True), default=None,
+              help="Сохранить набор изменений (участки со свойствами change_type и changed_fields).")
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default=OUTPUT_FORMAT_GEOJSONSEQ, show_default=True,
+              help="Формат файла --output.")
+@click.option("--workers", type=int, default=None, help="Число процессов сортировки (по умолчанию - число CPU; наборов два).")
+@click.option("--run-size-mb", type=float, default=DEFAULT_RUN_CHARS / (1024 * 1024), show_default=True,
+              help="Объем JSON (млн символов) в памяти процесса, после которого отсортированная часть сбрасывается на диск.")
+def diff(old_path, new_path, output_path, output_format, workers, run_size_mb):
+    """Сравнивает два набора участков: добавленные, удаленные, с измененной геометрией или атрибутами."""
+    if output_format == OUTPUT_FORMAT_GEOPARQUET and not geoparquet_available():
+        raise click.UsageError("Для --output-format geoparquet нужен pyarrow: pip install pyarrow")
+    run_chars = max(1, int(run_size_mb * 1024 * 1024))
+    try:
+        if output_path:
+            with create_feature_writer(output_path, output_format=output_format, coordinate_precision=None) as writer:
+                stats = diff_datasets(old_path, new_path, writer, workers=workers, run_chars=run_chars)
+        else:
+            # Без --output изменения только считаются
+            stats = diff_datasets(old_path, new_path, workers=workers, run_chars=run_chars)
+    except (IOError, sqlite3.Error, ValueError) as e:
+        click.secho(f"Ошибка сравнения: {e}", fg="red")
+        return
+    click.echo(f"Участков: было {stats.old_features}, стало {stats.new_features}")
+    click.echo(f"Добавлено: {stats.added}")
+    click.echo(f"Удалено: {stats.removed}")
+    click.echo(f"Изменена геометрия: {stats.geometry_changed}")
+    click.echo(f"Изменены атрибуты: {stats.attributes_changed}")
+    click.echo(f"Без изменений: {stats.unchanged}")
+    if stats.duplicate_keys:
+        click.secho(f"Повторы участков в наборах (сравнивалась первая запись): {stats.duplicate_keys}", fg="yellow")
+    if output_path:
+        click.secho(f"Набор изменений ({writer.count}) сохранен: {output_path}", fg="green")
+
+@cli.command("export-csv")
+@click.option("-p", "--parcels", "parcel_files", type=click.Path(exists=True, dir_okay=False), multiple=True, required=True,
+              help="GeoJSON-файл(ы) или последовательности GeoJSON с участками в формате НСПД.")
+@click.option("-o", "--output", "output_path", type=click.Path(dir_okay=False, writable=True, resolve_path=True), required=True,
+              help="Выходной CSV-файл.")
+@click.option("--geometry", "geometry_mode", type=click.Choice(CSV_GEOMETRY_MODES), default=CSV_GEOMETRY_WKT, show_default=True,
+              help="Геометрия: WKT, шестнадцатеричный WKB или только центроид (X/Y).")
+@click.option("--delimiter", default=",", show_default=True, help="Разделитель полей (например, ';' для Excel с русской локалью).")
+@click.option("--append", is_flag=True, help="Дописать строки в существующий CSV (заголовок не повторяется).")
+def export_csv(parcel_files, output_path, geometry_mode, delimiter, append):
+    """Выгружает участки в CSV: поля NSPDCadastralObjectOptions - отдельными колонками."""
+    try:
+        with CSVFeatureWriter(output_path, geometry_mode=geometry_mode, append=append, delimiter=delimiter) as writer:
+            for parcel_file in parcel_files:
+                written = 0
+                for feature in _iter_input_features(parcel_file):
+                    writer.write(feature)
+                    written += 1
+                click.echo(f"{parcel_file}: участков - {written}")
+    except (IOError, ValueError) as e:
+        click.secho(f"Ошибка записи CSV '{output_path}': {e}", fg="red")
+        return
+    click.secho(f"Выгружено участков: {writer.count} в {output_path}", fg="green")
+
+@cli.command("export-parquet")
+@click.option("-p", "--parcels", "parcel_files", type=click.Path(exists=True, dir_okay=False), multiple=True, required=True,
+              help="GeoJSON-файл(ы) или последовательности GeoJSON с участками в формате НСПД.")
+@click.option("-o", "--output", "output_path", type=click.Path(dir_okay=False, writable=True, resolve_path=True), required=True,
+              help="Выходной файл GeoParquet (.parquet).")
+@click.option("--row-group-size", type=click.IntRange(min=1), default=DEFAULT_ROW_GROUP_SIZE, show_default=True,
+              help="Участков в группе строк: меньшие группы точнее отсекаются по bbox при чтении.")
+def export_parquet(parcel_files, output_path, row_group_size):
+    """Выгружает участки в GeoParquet: поля NSPDCadastralObjectOptions - типизированными колонками, геометрия - WKB."""
+    if not geoparquet_available():
+        raise click.UsageError("Для GeoParquet нужен pyarrow: pip install pyarrow")
+    try:
+        with GeoParquetFeatureWriter(output_path, row_group_size=row_group_size) as writer:
+            for parcel_file in parcel_files:
+                written = 0
+                for feature in _iter_input_features(parcel_file):
+                    writer.write(feature)
+                    written += 1
+                click.echo(f"{parcel_file}: участков - {written}")
+    except (IOError, ValueError) as e:
+        click.secho(f"Ошибка записи GeoParquet '{output_path}': {e}", fg="red")
+        return
+    click.secho(f"Выгружено участков: {writer.count} в {output_path}", fg="green")
+
+@cli.command("export-fgb")
+@click.option("-i", "--input", "input_files", type=click.Path(exists=True, dir_okay=False), multiple=True, required=True,
+              help="GeoJSON-файл(ы) или последовательности GeoJSON: участки НСПД или зоны (результаты dissolve, overlay).")
+@click.option("-o", "--output", "output_path", type=click.Path(dir_okay=False, writable=True, resolve_path=True), required=True,
+              help="Выходной файл FlatGeobuf (.fgb).")
+@click.option("--layer", "layer_name", default=None, help="Имя слоя в заголовке (по умолчанию - имя выходного файла).")
+@click.option("--node-size", type=click.IntRange(min=0, max=65535), default=DEFAULT_NODE_SIZE, show_default=True,
+              help="Число дочерних узлов R-дерева; 0 - без пространственного индекса.")
+def export_fgb(input_files, output_path, layer_name, node_size):
+    """Выгружает объекты в FlatGeobuf с упакованным R-деревом Гильберта для быстрых запросов по bbox."""
+    try:
+        with FlatGeobufFeatureWriter(output_path, name=layer_name, node_size=node_size) as writer:
+            for input_file in input_files:
+                written = 0
+                for feature in _iter_input_features(input_file):
+                    writer.write(feature)
+                    written += 1
+                click.echo(f"{input_file}: объектов - {written}")
+    except (IOError, ValueError) as e:
+        click.secho(f"Ошибка записи FlatGeobuf '{output_path}': {e}", fg="red")
+        return
+    click.secho(f"Выгружено объектов: {writer.count} в {output_path}", fg="green")
+
+@cli.command("build-tiles")
+@click.option("-p", "--parcels", "parcel_files", type=click.Path(exists=True, dir_okay=False), multiple=True,
+              help="GeoJSON-файл(ы) или последовательности GeoJSON с участками (слой \"parcels\").")
+@click.option("-k", "--kml-files", "kml_files", type=click.Path(exists=True, dir_okay=False), multiple=True,
+              help="KML-файл(ы) с зонами (слой \"zones\").")
+@click.option("-o", "--output", "output_path", type=click.Path(writable=True, resolve_path=True), required=True,
+              help="Файл .mbtiles или каталог для тайлов <z>/<x>/<y>.pbf.")
+@click.option("--min-zoom", type=click.IntRange(min=0, max=24), default=DEFAULT_MIN_ZOOM, show_default=True,
+              help="Минимальный уровень масштаба.")
+@click.option("--max-zoom", type=click.IntRange(min=0, max=24), default=DEFAULT_MAX_ZOOM, show_default=True,
+              help="Максимальный уровень масштаба.")
+@click.option("-a", "--attribute", "attributes", multiple=True,
+              help="Атрибут участка, попадающий в тайлы (можно несколько; по умолчанию - все).")
+def build_tiles(parcel_files, kml_files, output_path, min_zoom, max_zoom, attributes):
+    """Строит пирамиду векторных тайлов (MVT) из участков и зон для интерактивной карты."""
+    if not parcel_files and not kml_files:
+        raise click.UsageError("Укажите участки (-p) и/или KML-файлы с зонами (-k).")
+    if min_zoom > max_zoom:
+        raise click.UsageError("--min-zoom не может быть больше --max-zoom.")
+    layers = []
+    if parcel_files:
+        # Слой получает только геометрии и атрибуты: features всех файлов перебираются потоково
+        features = (feature for parcel_file in parcel_files for feature in _iter_input_features(parcel_file))
+        layers.append(features_to_tile_layer("parcels", features, attributes=attributes or None))
+        click.echo(f"Участков: {len(layers[-1].geometries)}")
+    if kml_files:
+        placemarks, zone_geoms = load_kml_zones(kml_files)
+        layers.append(placemarks_to_tile_layer("zones", placemarks, zone_geoms))
+        click.echo(f"Зон: {len(placemarks)}")
+
+    try:
+        with create_tile_writer(output_path) as tile_writer:
+            tiles_per_zoom = generate_vector_tiles(layers, tile_writer, min_zoom=min_zoom, max_zoom=max_zoom)
+    except (IOError, sqlite3.Error) as e:
+        click.secho(f"Ошибка записи тайлов '{output_path}': {e}", fg="red")
+        return
+    for zoom, count in tiles_per_zoom.items():
+        click.echo(f"  z{zoom}: тайлов - {count}")
+    click.secho(f"Записано тайлов: {sum(tiles_per_zoom.values())} в {output_path}", fg="green")
+
 if __name__ == '__main__':
     cli(prog_name="kadastr_cli.py") 
\ No newline at end of file
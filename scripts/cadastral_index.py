@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import re
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from scripts.feature_identity import feature_cad_fields
+from scripts.geojson_stream import read_geojson_feature_spans
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Индекс хранится рядом с набором данных: "Этап 7.2.geojson" -> "Этап 7.2.geojson.cadidx"
+SIDECAR_SUFFIX = ".cadidx"
+
+# Кадастровый номер или его начало по целым частям: "50", "50:03", "50:03:0060111", "50:03:0060111:367"
+CAD_NUM_PATTERN = re.compile(r"^\d+(:\d+){0,3}$")
+
+# Числовые части ключа дополняются нулями до одной ширины: строковый порядок
+# ключей совпадает с числовым ("...:41" < "...:400")
+_SEGMENT_WIDTH = 12
+# Следующий за ":" символ: диапазон [ключ + ":", ключ + ";") - все номера внутри ключа
+_CHILDREN_END = ";"
+
+# Заголовок файла индекса (little-endian, 56 байт): magic, версия, ширина ключа
+# номера и ключа квартала, число features в исходном файле, число ключей номеров
+# и кварталов, размер и mtime исходного файла
+_MAGIC = b"KCADIDX\x00"
+_VERSION = 1
+_HEADER = struct.Struct("<8sHHIQQQQq")
+_NO_RANK = np.iinfo(np.uint64).max
+
+def cad_sort_key(cad_num: str) -> str:
+    """
+    Ключ сортировки кадастрового номера ("district:area:quarter:parcel").
+
+    Числовые части дополняются нулями до одной ширины, поэтому ключи сравниваются
+    как строки, но в числовом порядке частей, а ключ квартала - начало ключей
+    всех его участков.
+    """
+    return ":".join(part.zfill(_SEGMENT_WIDTH) if part.isdigit() else part for part in cad_num.strip().strip(":").split(":"))
+
+def _sorted_keys(keys: List[str], rows: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    encoded = np.array([key.encode("utf-8") for key in keys], dtype=bytes)
+    if len(encoded) == 0:
+        return np.zeros(0, dtype="S1"), np.zeros(0, dtype=np.uint64)
+    order = np.argsort(encoded, kind="stable") # Повторы номера остаются в порядке файла
+    return encoded[order], np.array(rows, dtype=np.uint64)[order]
+
+def sidecar_path(dataset_path: str) -> str:
+    return dataset_path + SIDECAR_SUFFIX
+
+def build_cadastral_index(dataset_path: str, index_path: Optional[str] = None) -> str:
+    """
+    Строит индекс кадастровых номеров GeoJSON и сохраняет его рядом с файлом.
+
+    Индекс - отсортированный массив ключей cad_sort_key (фиксированной ширины,
+    поиск делением пополам) с номерами features, смещения features в исходном
+    файле и второй массив для участков, чей quarter_cad_number не совпадает с
+    кварталом из номера (участок перенесен в другой квартал).
+
+    Args:
+        dataset_path: Путь к GeoJSON FeatureCollection.
+        index_path: Путь к файлу индекса (по умолчанию <dataset>.cadidx).
+
+    Returns:
+        Путь к созданному файлу индекса.
+    """
+    index_path = index_path or sidecar_path(dataset_path)
+    stat = os.stat(dataset_path)
+    # Features читаются потоково: в памяти остаются только ключи и положения в файле
+    cad_keys, cad_rows, quarter_keys, quarter_rows, offsets, lengths = [], [], [], [], [], []
+    for row, (feature, offset, length) in enumerate(read_geojson_feature_spans(dataset_path)):
+        offsets.append(offset)
+        lengths.append(length)
+        cad_num, quarter = feature_cad_fields(feature)
+        if not isinstance(cad_num, str) or not cad_num.strip():
+            continue
+        cad_keys.append(cad_sort_key(cad_num))
+        cad_rows.append(row)
+        if isinstance(quarter, str) and quarter and cad_sort_key(quarter) != cad_sort_key(cad_num).rsplit(":", 1)[0]:
+            quarter_keys.append(cad_sort_key(quarter))
+            quarter_rows.append(row)
+    cad_keys, cad_rows = _sorted_keys(cad_keys, cad_rows)
+    quarter_keys, quarter_rows = _sorted_keys(quarter_keys, quarter_rows)
+    # Место feature в порядке номеров: результаты поиска сортируются по номеру
+    ranks = np.full(len(offsets), _NO_RANK, dtype=np.uint64)
+    ranks[cad_rows.astype(np.int64)] = np.arange(len(cad_rows), dtype=np.uint64)
+
+    header = _HEADER.pack(
+        _MAGIC, _VERSION, cad_keys.dtype.itemsize, quarter_keys.dtype.itemsize, len(offsets),
+        len(cad_keys), len(quarter_keys), stat.st_size, stat.st_mtime_ns
+    )
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        for array in (cad_keys, quarter_keys):
+            f.write(np.ascontiguousarray(array).tobytes())
+        for array in (cad_rows, quarter_rows, ranks, offsets, lengths):
+            f.write(np.ascontiguousarray(array, dtype='<u8').tobytes())
+    os.replace(tmp_path, index_path) # Читатели никогда не видят недописанный индекс
+    return index_path
+
+class CadastralNumberIndex:
+    """
+    Открытый индекс кадастровых номеров: массивы отображаются в память
+    (np.memmap), поиск делением пополам читает с диска только нужные страницы;
+    features загружаются из исходного GeoJSON по одному, по смещениям из индекса.
+    """
+
+    def __init__(self, index_path: str, dataset_path: Optional[str] = None):
+        self.index_path = index_path
+        self.dataset_path = dataset_path or index_path[:-len(SIDECAR_SUFFIX)]
+        with open(index_path, 'rb') as f:
+            fields = _HEADER.unpack(f.read(_HEADER.size))
+        (magic, version, cad_width, quarter_width, self.num_features, num_keys, num_quarter_keys,
+         self.source_size, self.source_mtime_ns) = fields
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"'{index_path}' is not a cadastral number index of version {_VERSION}")
+
+        offset = _HEADER.size
+        def _map(dtype: str, count: int) -> np.ndarray:
+            nonlocal offset
+            if count == 0:
+                return np.zeros(0, dtype=dtype)
+            array = np.memmap(index_path, dtype=dtype, mode='r', offset=offset, shape=(count,))
+            offset += count * np.dtype(dtype).itemsize
+            return array
+
+        self.keys = _map(f'S{cad_width}', num_keys)
+        self.quarter_keys = _map(f'S{quarter_width}', num_quarter_keys)
+        self.rows = _map('<u8', num_keys)
+        self.quarter_rows = _map('<u8', num_quarter_keys)
+        self.ranks = _map('<u8', self.num_features)
+        self.offsets = _map('<u8', self.num_features)
+        self.lengths = _map('<u8', self.num_features)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def is_stale(self) -> bool:
+        """True, если исходный GeoJSON изменился после построения индекса."""
+        try:
+            stat = os.stat(self.dataset_path)
+        except OSError:
+            return True
+        return stat.st_size != self.source_size or stat.st_mtime_ns != self.source_mtime_ns
+
+    @staticmethod
+    def _slice(keys: np.ndarray, low: str, high: str, high_side: str = 'left') -> slice:
+        start = int(np.searchsorted(keys, low.encode("utf-8"), side='left'))
+        end = int(np.searchsorted(keys, high.encode("utf-8"), side=high_side))
+        return slice(start, max(start, end))
+
+    def lookup(self, cad_num: str) -> List[int]:
+        """Номера features (в порядке исходного файла) с кадастровым номером cad_num."""
+        key = cad_sort_key(cad_num)
+        return sorted(self.rows[self._slice(self.keys, key, key, 'right')].tolist())
+
+    def prefix(self, prefix: str) -> List[int]:
+        """
+        Номера features, чей кадастровый номер начинается с prefix по целым частям
+        ("50:03:0060111" - участки квартала, "50:03" - района, но не "50:030..."),
+        по возрастанию номера. Участки, перенесенные в квартал из другого
+        (quarter_cad_number), тоже входят в результат.
+        """
+        key = cad_sort_key(prefix)
+        rows = self.rows[self._slice(self.keys, key, key, 'right')].tolist()
+        rows += self.rows[self._slice(self.keys, key + ":", key + _CHILDREN_END)].tolist()
+        for part in (self._slice(self.quarter_keys, key, key, 'right'),
+                     self._slice(self.quarter_keys, key + ":", key + _CHILDREN_END)):
+            rows += self.quarter_rows[part].tolist()
+        return self._by_number(rows)
+
+    def range(self, start: str, end: str) -> List[int]:
+        """
+        Номера features с кадастровыми номерами от start до end включительно (в
+        числовом порядке частей), по возрастанию номера. end, заданный началом
+        номера, включает все номера внутри него: ("50:03:0060111", "50:03:0060115")
+        - участки кварталов с 0060111 по 0060115.
+        """
+        end_key = cad_sort_key(end)
+        rows = self.rows[self._slice(self.keys, cad_sort_key(start), end_key + _CHILDREN_END)].tolist()
+        return self._by_number(rows)
+
+    def _by_number(self, rows: List[int]) -> List[int]:
+        unique = np.unique(np.array(rows, dtype=np.int64))
+        return unique[np.argsort(self.ranks[unique], kind="stable")].tolist()
+
+    def read_features(self, feature_ids: Sequence[int]) -> Iterator[Dict[str, Any]]:
+        """Лениво читает из исходного GeoJSON только указанные features."""
+        if not feature_ids:
+            return
+        with open(self.dataset_path, 'rb') as f:
+            for feature_id in feature_ids:
+                f.seek(int(self.offsets[feature_id]))
+                yield json.loads(f.read(int(self.lengths[feature_id])).decode('utf-8'))
+
+def open_cadastral_index(dataset_path: str, rebuild: bool = True) -> Optional[CadastralNumberIndex]:
+    """
+    Открывает индекс номеров набора данных; если его нет или он устарел -
+    перестраивает (при rebuild=True) или возвращает None.
+    """
+    index_path = sidecar_path(dataset_path)
+    index = None
+    if os.path.exists(index_path):
+        try:
+            index = CadastralNumberIndex(index_path, dataset_path)
+        except (ValueError, struct.error) as e:
+            logger.warning(f"Индекс '{index_path}' поврежден и будет перестроен: {e}")
+        if index is not None and index.is_stale():
+            logger.info(f"Индекс '{index_path}' устарел")
+            index = None
+    if index is None and rebuild:
+        try:
+            index = CadastralNumberIndex(build_cadastral_index(dataset_path), dataset_path)
+        except (IOError, ValueError) as e:
+            logger.error(f"Не удалось построить индекс номеров для '{dataset_path}': {e}")
+            return None
+    return index
+
+def find_parcels(
+    dataset_paths: Sequence[str],
+    cad_num: Optional[str] = None,
+    prefix: Optional[str] = None,
+    cad_range: Optional[Tuple[str, str]] = None
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Ищет участки по кадастровому номеру во всех наборах данных по их индексам.
+
+    Задается ровно один из параметров: точный номер, начало номера (квартал,
+    район) или диапазон номеров (start, end).
+
+    Yields:
+        Пары (путь к набору данных, словарь feature).
+    """
+    if sum(value is not None for value in (cad_num, prefix, cad_range)) != 1:
+        raise ValueError("Укажите ровно один из параметров cad_num, prefix или cad_range")
+    for dataset_path in dataset_paths:
+        index = open_cadastral_index(dataset_path)
+        if index is None:
+            continue
+        if cad_num is not None:
+            feature_ids = index.lookup(cad_num)
+        elif prefix is not None:
+            feature_ids = index.prefix(prefix)
+        else:
+            feature_ids = index.range(*cad_range)
+        for feature in index.read_features(feature_ids):
+            yield dataset_path, feature
@@ -0,0 +1,177 @@
+import csv
+from dataclasses import fields
+from typing import Any, Dict, List, Optional, Sequence, TextIO
+
+import numpy as np
+import shapely
+
+from scripts.data_structures import NSPDCadastralObjectOptions
+from scripts.feature_batch import FeatureBatch
+from scripts.geometry_processing import coordinate_precision_for_crs
+from scripts.json_encoding import dumps_json
+
+CSV_GEOMETRY_WKT = "wkt"
+CSV_GEOMETRY_WKB = "wkb" # Шестнадцатеричный WKB
+CSV_GEOMETRY_CENTROID = "centroid" # Только центроид: колонки centroid_x, centroid_y
+CSV_GEOMETRY_MODES = [CSV_GEOMETRY_WKT, CSV_GEOMETRY_WKB, CSV_GEOMETRY_CENTROID]
+
+DEFAULT_CSV_BATCH_SIZE = 1000 # Строк, для которых геометрия обрабатывается одним векторизованным вызовом
+
+# Колонки участков НСПД: id feature и поля NSPDCadastralObjectOptions в порядке
+# объявления; other_options записывается одной колонкой JSON
+CSV_NSPD_COLUMNS = ["id"] + [f.name for f in fields(NSPDCadastralObjectOptions)]
+
+# Колонки обработанных Placemark (свойства create_geojson_feature)
+CSV_PLACEMARK_COLUMNS = [
+    "kml_name", "kml_id", "kml_geometry_type", "shapely_geometry_type", "is_valid", "validity_reason", "repaired",
+    "calculated_area_sq_units", "calculated_length_units", "calculated_perimeter_units",
+]
+
+_GEOMETRY_COLUMNS = {
+    CSV_GEOMETRY_WKT: ["geometry_wkt"],
+    CSV_GEOMETRY_WKB: ["geometry_wkb"],
+    CSV_GEOMETRY_CENTROID: ["centroid_x", "centroid_y"],
+}
+
+def _cell(value: Any) -> Any:
+    # Списки и словари (например, floor или other_options) - компактный JSON в одной ячейке
+    if isinstance(value, (list, tuple, dict)):
+        return dumps_json(value)
+    return value
+
+class CSVFeatureWriter:
+    """
+    Потоково записывает GeoJSON Features в CSV с фиксированным набором колонок.
+
+    Значения колонок берутся из properties.options (формат НСПД), а при его
+    отсутствии - из самих properties; колонка other_options собирает остальные
+    поля options в JSON. Геометрия записывается в одном из режимов
+    CSV_GEOMETRY_MODES в своей CRS (колонка crs) с точностью
+    coordinate_precision_for_crs. Features копятся пакетами по batch_size,
+    поэтому память не зависит от их общего числа, а геометрия пакета
+    обрабатывается векторизованно. Интерфейс совпадает с GeoJSONFeatureWriter.
+    """
+
+    def __init__(
+        self,
+        output_filepath: str,
+        columns: Optional[Sequence[str]] = None,
+        geometry_mode: str = CSV_GEOMETRY_WKT,
+        append: bool = False,
+        delimiter: str = ",",
+        encoding: str = "utf-8-sig",
+        batch_size: int = DEFAULT_CSV_BATCH_SIZE
+    ):
+        if geometry_mode not in CSV_GEOMETRY_MODES:
+            raise ValueError(f"Неизвестный режим геометрии CSV: '{geometry_mode}'. Доступны: {', '.join(CSV_GEOMETRY_MODES)}")
+        self.output_filepath = output_filepath
+        self.columns = list(columns) if columns is not None else list(CSV_NSPD_COLUMNS)
+        self.geometry_mode = geometry_mode
+        self.append = append
+        self.delimiter = delimiter
+        # utf-8-sig: с BOM кириллицу правильно открывает Excel
+        self.encoding = encoding
+        self.batch_size = batch_size
+        self.count = 0
+        self._file: Optional[TextIO] = None
+        self._writer = None
+        self._batch: List[Dict[str, Any]] = []
+
+    @property
+    def header(self) -> List[str]:
+        """Заголовок CSV: колонки атрибутов, колонки геометрии и crs."""
+        return self.columns + _GEOMETRY_COLUMNS[self.geometry_mode] + ["crs"]
+
+    def open(self) -> "CSVFeatureWriter":
+        """Открывает файл и пишет заголовок (при дозаписи в непустой файл - не пишет)."""
+        self._file = open(self.output_filepath, 'a' if self.append else 'w', encoding=self.encoding, newline='')
+        self._writer = csv.writer(self._file, delimiter=self.delimiter)
+        if self._file.tell() == 0:
+            self._writer.writerow(self.header)
+        return self
+
+    def write(self, feature: Dict[str, Any]) -> None:
+        """Добавляет feature в текущий пакет; полный пакет записывается в файл."""
+        self._batch.append(feature)
+        self.count += 1
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def _attribute_row(self, feature: Dict[str, Any]) -> List[Any]:
+        properties = feature.get("properties") or {}
+        options = properties.get("options") if isinstance(properties.get("options"), dict) else None
+        # Колонка ищется сначала в options НСПД, затем в самих properties: у участков, прошедших
+        # process-kmls, поля placemark (kml_name, is_valid, ...) лежат рядом с options
+        row = []
+        for column in self.columns:
+            if column == "id":
+                row.append(feature.get("id"))
+            elif column == "other_options":
+                source = options if options is not None else properties
+                other = {k: v for k, v in source.items() if k not in self.columns}
+                row.append(dumps_json(other) if other else None)
+            elif options is not None and column in options:
+                row.append(_cell(options[column]))
+            else:
+                row.append(_cell(properties.get(column)))
+        return row
+
+    def write_batch(self, batch: FeatureBatch) -> None:
+        """Записывает пакет features (геометрия и WKB берутся из пакета, общего с другими писателями)."""
+        self._flush()
+        self._write_rows(batch)
+        self.count += len(batch)
+
+    def _flush(self) -> None:
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        self._write_rows(FeatureBatch(batch))
+
+    def _write_rows(self, batch: FeatureBatch) -> None:
+        # Геометрия записывается в своей CRS, без перепроецирования
+        crs_names = batch.crs_names.tolist()
+        geoms = batch.geometries()
+
+        if self.geometry_mode == CSV_GEOMETRY_CENTROID:
+            centroids = shapely.centroid(geoms)
+            xs, ys = shapely.get_x(centroids).tolist(), shapely.get_y(centroids).tolist()
+            geometry_cells = []
+            for x, y, crs_str in zip(xs, ys, crs_names):
+                precision = coordinate_precision_for_crs(crs_str)
+                geometry_cells.append([None, None] if np.isnan(x) else [round(x, precision), round(y, precision)])
+        elif self.geometry_mode == CSV_GEOMETRY_WKB:
+            # Тот же вывод, что shapely.to_wkb(hex=True), но из общего WKB пакета
+            geometry_cells = [[value.hex().upper() if value is not None else None] for value in batch.wkb()]
+        else:
+            # Точность WKT зависит от CRS: группируем, чтобы вызовов было по одному на CRS
+            wkt = np.empty(len(batch), dtype=object)
+            for crs_str in set(crs_names):
+                mask = batch.crs_names == crs_str
+                wkt[mask] = shapely.to_wkt(geoms[mask], rounding_precision=coordinate_precision_for_crs(crs_str), trim=True)
+            geometry_cells = [[value] for value in wkt]
+
+        self._writer.writerows(
+            self._attribute_row(feature) + geometry + [crs if raw is not None else None]
+            for feature, geometry, crs, raw in zip(batch.features, geometry_cells, crs_names, batch.raw_geometries)
+        )
+
+    def close(self) -> None:
+        """Записывает остаток пакета и закрывает файл."""
+        if self._file is None:
+            return
+        try:
+            self._flush()
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "CSVFeatureWriter":
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        elif self._file is not None:
+            self._file.close()
+            self._file = None
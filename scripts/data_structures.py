@@ -103,4 +103,108 @@ class NSPDCadastralFeature:
     geometry: Optional[NSPDCadastralObjectGeometry] = None
     main_properties: Optional[NSPDCadastralObjectPropertiesMain] = None # Из feature.properties
     options_properties: Optional[NSPDCadastralObjectOptions] = None # Из feature.properties.options
-    raw_feature_dict: Optional[Dict[str, Any]] = field(default=None, repr=False) # Исходный словарь для отладки 
\ No newline at end of file
+    raw_feature_dict: Optional[Dict[str, Any]] = field(default=None, repr=False) # Исходный словарь для отладки 
+
+# --- Результаты геометрических вычислений ---
+
+# Метрики одной геометрии, рассчитанные за одно перепроецирование
+@dataclass
+class GeometryMetrics:
+    area: Optional[float] = None # В квадратных единицах планарной CRS
+    length: Optional[float] = None # В единицах планарной CRS
+    perimeter: Optional[float] = None # В единицах планарной CRS
+    centroid: Optional[Tuple[float, float]] = None # (x, y) в исходной CRS
+    bbox: Optional[Tuple[float, float, float, float]] = None # (minx, miny, maxx, maxy) в исходной CRS
+
+# Результат проверки (и, опционально, исправления) валидности одной геометрии
+@dataclass
+class ValidityResult:
+    is_valid: bool
+    reason: Optional[str] = None # Причина невалидности (shapely.is_valid_reason), для валидных - None
+    repaired_geometry: Optional[Any] = field(default=None, repr=False) # Результат make_valid, если исправление запрошено
+
+# --- Результаты наложения зон на участки ---
+
+# Одна пара "зона - участок" с пересекающейся частью
+@dataclass
+class ZoneParcelOverlay:
+    zone_index: int # Индекс зоны во входном массиве
+    parcel_index: int # Индекс участка во входном массиве
+    zone_name: Optional[str] = None
+    cad_num: Optional[str] = None
+    intersection_area: Optional[float] = None # Площадь пересечения (кв. м)
+    intersection_length: Optional[float] = None # Длина линейной зоны внутри участка (м)
+    parcel_area: Optional[float] = None # Площадь участка (кв. м)
+    parcel_share_pct: Optional[float] = None # Доля площади участка, занятая зоной (%)
+    geometry: Optional[Any] = field(default=None, repr=False) # Геометрия пересечения в рабочей CRS
+
+# Проблема топологии, найденная проверкой качества набора участков
+@dataclass
+class TopologyIssue:
+    issue_type: str # "overlap", "gap", "invalid" или "error" (пара не проверена из-за ошибки GEOS)
+    index_a: int # Индекс первого (или единственного) участка во входном массиве
+    index_b: Optional[int] = None # Индекс второго участка пары (для overlap/gap)
+    cad_num_a: Optional[str] = None
+    cad_num_b: Optional[str] = None
+    area: Optional[float] = None # Площадь проблемной области (кв. м)
+    distance: Optional[float] = None # Ширина разрыва между участками (м), для gap
+    reason: Optional[str] = None # Причина невалидности (invalid) или сообщение GEOS (error)
+    geometry: Optional[Any] = field(default=None, repr=False) # Проблемная область в рабочей CRS
+
+# --- Векторные тайлы ---
+
+# Слой векторных тайлов: геометрии в EPSG:3857 и атрибуты features
+@dataclass
+class VectorTileLayer:
+    name: str # Имя слоя в тайле (например, "parcels", "zones")
+    geometries: Any = field(repr=False) # Массив numpy (dtype=object) геометрий shapely в EPSG:3857
+    properties: List[Dict[str, Any]] = field(default_factory=list, repr=False) # Атрибуты (скаляры) каждой геометрии
+    feature_ids: Optional[List[Optional[int]]] = field(default=None, repr=False) # Целочисленные id features (необязательно)
+
+# --- Инкрементальная запись ---
+
+# Итог инкрементальной записи слоя: сколько features добавлено, изменено, не изменилось и удалено
+@dataclass
+class IncrementalWriteStats:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0 # Записано tombstone (features, которых нет в новом наборе)
+
+# --- Каталог участков ---
+
+# Итог сборки каталога участков из файлов этапов
+@dataclass
+class ParcelCatalogStats:
+    stages: List[str] = field(default_factory=list) # Этапы (имена файлов без расширения) в порядке сортировки
+    failed_stages: List[str] = field(default_factory=list) # Этапы, файлы которых не удалось прочитать
+    features_read: int = 0 # Features во всех файлах, с повторами
+    parcels: int = 0 # Уникальных участков (id + хэш геометрии) в каталоге
+    duplicates: int = 0 # Повторы участков в других этапах (features_read - parcels)
+    spill_runs: int = 0 # Отсортированных частей, сброшенных на диск при внешней сортировке
+
+# --- Сбор участков по кварталам ---
+
+# Итог сбора участков зоны по кадастровым кварталам
+@dataclass
+class QuarterHarvestStats:
+    quarters: List[str] = field(default_factory=list) # Кварталы, пересекающие зону (или заданные явно)
+    skipped: List[str] = field(default_factory=list) # Уже собраны полностью (отмечены в хранилище)
+    complete: List[str] = field(default_factory=list) # Собраны в этом запуске, проверка полноты пройдена
+    incomplete: List[str] = field(default_factory=list) # Ответ мог быть обрезан или пропустил известные участки
+    failed: List[str] = field(default_factory=list) # Запрос к API завершился ошибкой
+    parcels: int = 0 # Участков записано в этом запуске
+
+# --- Сравнение наборов участков ---
+
+# Итог сравнения двух наборов участков (старого и нового)
+@dataclass
+class DatasetDiffStats:
+    old_features: int = 0
+    new_features: int = 0
+    added: int = 0
+    removed: int = 0
+    geometry_changed: int = 0 # Геометрия изменилась (атрибуты могли измениться тоже)
+    attributes_changed: int = 0 # Изменились только атрибуты
+    unchanged: int = 0
+    duplicate_keys: int = 0 # Повторы ключа внутри набора (сравнивается первая запись)
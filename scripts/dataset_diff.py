@@ -0,0 +1,162 @@
+import heapq
+import json
+import logging
+import shutil
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from scripts.data_structures import DatasetDiffStats
+from scripts.feature_identity import attributes_hash, feature_identity_key, geometry_hash
+from scripts.json_encoding import dumps_json
+from scripts.parcel_catalog import DEFAULT_RUN_CHARS, merge_runs, run_in_pool, scan_sorted_runs
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Классы изменений участка
+CHANGE_ADDED = "added"
+CHANGE_REMOVED = "removed"
+CHANGE_GEOMETRY = "geometry_changed"
+CHANGE_ATTRIBUTES = "attributes_changed"
+CHANGE_TYPES = [CHANGE_ADDED, CHANGE_REMOVED, CHANGE_GEOMETRY, CHANGE_ATTRIBUTES]
+
+CHANGE_TYPE_PROPERTY = "change_type" # Свойство feature набора изменений: класс изменения
+CHANGED_FIELDS_PROPERTY = "changed_fields" # Измененные атрибуты ("options.cost_value") у измененных участков
+
+# Управляющие символы в ключе заменяются пробелом: табуляция и перевод строки разделяют поля части
+_KEY_TRANSLATION = {code: " " for code in range(32)}
+
+def _diff_line(feature: Dict[str, Any], _: int) -> str:
+    key = feature_identity_key(feature).translate(_KEY_TRANSLATION)
+    return f"{key}\t{geometry_hash(feature.get('geometry'))}\t{attributes_hash(feature)}\t{dumps_json(feature)}\n"
+
+def _keyed_records(files: Sequence[TextIO], stats: DatasetDiffStats) -> Iterator[Tuple[str, str, str, str]]:
+    # Отсортированные записи набора по одной на ключ: (ключ, хэш геометрии, хэш атрибутов, JSON)
+    previous_key = None
+    for line in heapq.merge(*files):
+        key, geom_hash, attr_hash, feature_json = line.rstrip("\n").split("\t", 3)
+        if key == previous_key:
+            stats.duplicate_keys += 1
+            continue
+        previous_key = key
+        yield key, geom_hash, attr_hash, feature_json
+
+def changed_fields(old_properties: Optional[Dict[str, Any]], new_properties: Optional[Dict[str, Any]]) -> List[str]:
+    """
+    Имена измененных атрибутов; вложенные словари (options НСПД) сравниваются
+    по полям: "options.cost_value".
+    """
+    old_properties, new_properties = old_properties or {}, new_properties or {}
+    fields = []
+    for name in sorted(set(old_properties) | set(new_properties)):
+        old_value, new_value = old_properties.get(name), new_properties.get(name)
+        if old_value == new_value:
+            continue
+        if isinstance(old_value, dict) and isinstance(new_value, dict):
+            fields.extend(f"{name}.{nested}" for nested in changed_fields(old_value, new_value))
+        else:
+            fields.append(name)
+    return fields
+
+def _change_feature(feature_json: str, change_type: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    feature = json.loads(feature_json)
+    properties = dict(feature.get("properties") or {})
+    properties[CHANGE_TYPE_PROPERTY] = change_type
+    if fields is not None:
+        properties[CHANGED_FIELDS_PROPERTY] = fields
+    feature["properties"] = properties
+    return feature
+
+def diff_records(
+    old_records: Iterator[Tuple[str, str, str, str]],
+    new_records: Iterator[Tuple[str, str, str, str]],
+    stats: DatasetDiffStats
+) -> Iterator[Dict[str, Any]]:
+    """
+    Слияние двух отсортированных по ключу потоков записей (ключ, хэш геометрии,
+    хэш атрибутов, JSON feature) в набор изменений.
+
+    В памяти - по одной текущей записи каждого потока. Добавленный и измененный
+    участок выдается в новой версии, удаленный - в старой; свойство
+    change_type - класс изменения, changed_fields - измененные атрибуты.
+    Неизмененные участки только считаются.
+    """
+    old_record, new_record = next(old_records, None), next(new_records, None)
+    while old_record is not None or new_record is not None:
+        if new_record is None or (old_record is not None and old_record[0] < new_record[0]):
+            stats.removed += 1
+            yield _change_feature(old_record[3], CHANGE_REMOVED)
+            old_record = next(old_records, None)
+            continue
+        if old_record is None or new_record[0] < old_record[0]:
+            stats.added += 1
+            yield _change_feature(new_record[3], CHANGE_ADDED)
+            new_record = next(new_records, None)
+            continue
+        if old_record[1:3] == new_record[1:3]:
+            stats.unchanged += 1
+        else:
+            fields = []
+            if old_record[2] != new_record[2]:
+                fields = changed_fields(json.loads(old_record[3]).get("properties"),
+                                        json.loads(new_record[3]).get("properties"))
+            if old_record[1] != new_record[1]:
+                stats.geometry_changed += 1
+                yield _change_feature(new_record[3], CHANGE_GEOMETRY, fields)
+            else:
+                stats.attributes_changed += 1
+                yield _change_feature(new_record[3], CHANGE_ATTRIBUTES, fields)
+        old_record, new_record = next(old_records, None), next(new_records, None)
+
+def diff_datasets(
+    old_path: str,
+    new_path: str,
+    writer: Optional[Any] = None,
+    workers: Optional[int] = None,
+    run_chars: int = DEFAULT_RUN_CHARS,
+    spill_dir: Optional[str] = None
+) -> DatasetDiffStats:
+    """
+    Сравнивает два набора участков (две выгрузки или версии файла этапа) и
+    записывает набор изменений в writer (открытый писатель features; None -
+    изменения только считаются).
+
+    Участки сопоставляются по ключу feature_identity_key (id, затем
+    кадастровый номер); геометрия сравнивается по geometry_hash (координаты
+    округлены по CRS, 1 см для метровых), атрибуты - по хэшу properties.
+    Оба набора сортируются по ключу внешней сортировкой, как в каталоге
+    участков (части до run_chars символов сбрасываются на диск, наборы - в
+    двух процессах), затем слияние отсортированных потоков выдает изменения.
+    Память ограничена частями сортировки, поэтому наборы могут содержать
+    миллионы участков.
+
+    Returns:
+        DatasetDiffStats.
+
+    Raises:
+        IOError: Один из наборов не удалось прочитать.
+    """
+    stats = DatasetDiffStats()
+    work_dir = tempfile.mkdtemp(prefix="diff_", dir=spill_dir)
+    try:
+        tasks = [(index, path, work_dir, run_chars, _diff_line) for index, path in enumerate((old_path, new_path))]
+        sides = []
+        for path, (count, runs, error) in zip((old_path, new_path), run_in_pool(scan_sorted_runs, tasks, workers)):
+            if error is not None:
+                raise IOError(f"Не удалось прочитать '{path}': {error}")
+            sides.append((count, merge_runs(runs, work_dir)))
+        stats.old_features, stats.new_features = sides[0][0], sides[1][0]
+
+        files = [[open(run, encoding='utf-8') for run in runs] for _, runs in sides]
+        try:
+            changes = diff_records(_keyed_records(files[0], stats), _keyed_records(files[1], stats), stats)
+            for change in changes:
+                if writer is not None:
+                    writer.write(change)
+        finally:
+            for f in files[0] + files[1]:
+                f.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    logger.info(f"Изменений: {stats.added + stats.removed + stats.geometry_changed + stats.attributes_changed}")
+    return stats
@@ -0,0 +1,111 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import shapely
+from shapely.geometry.base import BaseGeometry
+
+from scripts.data_structures import NSPDCadastralFeature
+from scripts.geometry_processing import repair_geometries
+from scripts.spatial_index import hilbert_order
+
+# Число геометрий в одном пространственном блоке, объединяемом одной задачей
+DEFAULT_PARTITION_SIZE = 256
+
+def _union_wkb(wkb_parts: List[bytes]) -> bytes:
+    # Задача процесса: геометрии передаются как WKB - это дешевле pickle объектов shapely
+    return shapely.to_wkb(shapely.union_all(shapely.from_wkb(wkb_parts)))
+
+class _InlineExecutor:
+    """Выполняет задачи в текущем процессе (один воркер или маленький набор)."""
+
+    def map(self, func, *iterables):
+        return map(func, *iterables)
+
+def _cascaded_union(executor: Any, groups: Dict[Hashable, List[bytes]]) -> Dict[Hashable, bytes]:
+    """
+    Попарно объединяет частичные результаты каждой группы, уровень за уровнем.
+    Блоки идут в порядке кривой Гильберта, поэтому соседние пары соприкасаются
+    и промежуточные объединения остаются компактными.
+    """
+    while any(len(parts) > 1 for parts in groups.values()):
+        tasks, owners = [], []
+        for key, parts in groups.items():
+            for i in range(0, len(parts), 2):
+                tasks.append(parts[i:i + 2])
+                owners.append(key)
+        merged: Dict[Hashable, List[bytes]] = {key: [] for key in groups}
+        for key, wkb in zip(owners, executor.map(_union_wkb, tasks)):
+            merged[key].append(wkb)
+        groups = merged
+    return {key: parts[0] for key, parts in groups.items()}
+
+def _dissolve_partitions(executor: Any, partitions: Dict[Hashable, List[List[bytes]]]) -> Dict[Hashable, bytes]:
+    # Все блоки всех групп объединяются одной волной задач, затем - каскад по группам
+    tasks, owners = [], []
+    for key, parts in partitions.items():
+        tasks.extend(parts)
+        owners.extend([key] * len(parts))
+    partial: Dict[Hashable, List[bytes]] = {key: [] for key in partitions}
+    for key, wkb in zip(owners, executor.map(_union_wkb, tasks)):
+        partial[key].append(wkb)
+    return _cascaded_union(executor, partial)
+
+def dissolve_geometries(
+    geoms: Sequence[Optional[BaseGeometry]],
+    keys: Sequence[Hashable],
+    workers: Optional[int] = None,
+    partition_size: int = DEFAULT_PARTITION_SIZE
+) -> Dict[Hashable, BaseGeometry]:
+    """
+    Объединяет геометрии с одинаковым ключом (dissolve) в пуле процессов.
+
+    Геометрии каждой группы упорядочиваются по кривой Гильберта и режутся на
+    пространственно компактные блоки по partition_size штук; блоки объединяются
+    параллельно (shapely.union_all в отдельных процессах), затем частичные
+    результаты сливаются каскадом попарных объединений.
+
+    Args:
+        geoms: Геометрии (None пропускаются; невалидные исправляются make_valid).
+        keys: Ключ группы для каждой геометрии (например, категория земель).
+        workers: Число процессов (по умолчанию os.cpu_count()); 1 - без пула.
+        partition_size: Размер пространственного блока.
+
+    Returns:
+        Словарь {ключ: объединенная геометрия}.
+    """
+    geom_array = repair_geometries(geoms)
+    present = ~shapely.is_missing(geom_array) & ~shapely.is_empty(geom_array)
+
+    group_indices: Dict[Hashable, List[int]] = {}
+    for i, key in enumerate(keys):
+        if present[i]:
+            group_indices.setdefault(key, []).append(i)
+
+    partitions: Dict[Hashable, List[List[bytes]]] = {}
+    for key, indices in group_indices.items():
+        group = geom_array[indices]
+        group = group[hilbert_order(shapely.bounds(group))]
+        wkb = shapely.to_wkb(group).tolist()
+        partitions[key] = [wkb[i:i + partition_size] for i in range(0, len(wkb), partition_size)]
+
+    total_tasks = sum(len(parts) for parts in partitions.values())
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or total_tasks <= 1:
+        merged = _dissolve_partitions(_InlineExecutor(), partitions)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, total_tasks)) as executor:
+            merged = _dissolve_partitions(executor, partitions)
+    return {key: shapely.from_wkb(wkb) for key, wkb in merged.items()}
+
+def nspd_option_value(feature: NSPDCadastralFeature, field_name: str) -> Any:
+    """
+    Возвращает значение поля из feature.properties.options (известного поля
+    NSPDCadastralObjectOptions или из other_options).
+    """
+    options = feature.options_properties
+    if options is None:
+        return None
+    if field_name != "other_options" and hasattr(options, field_name):
+        return getattr(options, field_name)
+    return options.other_options.get(field_name)
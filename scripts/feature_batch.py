@@ -0,0 +1,224 @@
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from scripts.geometry_processing import GEOGRAPHIC_CRS_WGS84, geojson_geometry_crs, reproject_geometries
+from scripts.json_encoding import dumps_json, round_feature_coordinates
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+DEFAULT_FANOUT_BATCH_SIZE = 5000 # Совпадает с размером пакета SQLite и группы строк GeoParquet
+
+class FeatureBatch:
+    """
+    Пакет GeoJSON Features с общими производными данными для нескольких писателей.
+
+    Геометрии разбираются (shape) один раз на пакет, а перепроецированные
+    геометрии, WKB, прямоугольники и компактный JSON вычисляются при первом
+    запросе и кэшируются по CRS (и параметрам сериализации). Писатели разных
+    форматов, получившие один пакет через write_batch, не повторяют эту работу.
+    Каждое значение вычисляется ровно один раз, даже если его одновременно
+    запрашивают писатели из разных потоков.
+
+    Без члена "crs" геометрия считается WGS84 (RFC 7946).
+    """
+
+    def __init__(self, features: Sequence[Dict[str, Any]]):
+        self.features = list(features)
+        self.raw_geometries = [feature.get("geometry") for feature in self.features]
+        self.crs_names = np.array([geojson_geometry_crs(g) or GEOGRAPHIC_CRS_WGS84 for g in self.raw_geometries], dtype=object)
+        self._cache: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def _cached(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        if key in self._cache:
+            return self._cache[key]
+        # Отдельная блокировка на значение: разные значения считаются параллельно,
+        # одно и то же - один раз (остальные потоки ждут результат)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key not in self._cache:
+                self._cache[key] = compute()
+        return self._cache[key]
+
+    def _parse(self) -> np.ndarray:
+        geoms = np.empty(len(self.features), dtype=object)
+        geoms[:] = [shape(g) if g else None for g in self.raw_geometries]
+        return geoms
+
+    def _reproject(self, crs_str: str) -> np.ndarray:
+        geoms = self.geometries()
+        other_crs = set(self.crs_names.tolist()) - {crs_str}
+        if not other_crs:
+            return geoms
+        geoms = geoms.copy()
+        # Перепроецирование группами, по одному вызову на исходную CRS
+        for source_crs in other_crs:
+            mask = self.crs_names == source_crs
+            geoms[mask] = reproject_geometries(geoms[mask], source_crs, crs_str)
+        return geoms
+
+    def geometries(self, crs_str: Optional[str] = None) -> np.ndarray:
+        """
+        Геометрии shapely (массив numpy, dtype=object; None - feature без геометрии).
+
+        Args:
+            crs_str: CRS, в которую перепроецируются геометрии; None - каждая в своей исходной CRS.
+        """
+        if crs_str is None:
+            return self._cached(("geometries", None), self._parse)
+        return self._cached(("geometries", crs_str), lambda: self._reproject(crs_str))
+
+    def wkb(self, crs_str: Optional[str] = None) -> np.ndarray:
+        """WKB геометрий в crs_str (None - для features без геометрии)."""
+        return self._cached(("wkb", crs_str), lambda: shapely.to_wkb(self.geometries(crs_str)))
+
+    def bounds(self, crs_str: Optional[str] = None) -> np.ndarray:
+        """Прямоугольники (minx, miny, maxx, maxy) в crs_str; NaN - для пустых и отсутствующих геометрий."""
+        return self._cached(("bounds", crs_str), lambda: shapely.bounds(self.geometries(crs_str)))
+
+    def json_texts(self, coordinate_precision: Optional[int], json_backend: Optional[str] = None) -> List[str]:
+        """Компактный JSON каждого feature (как в GeoJSONSeqWriter) с округлением координат."""
+        return self._cached(
+            ("json", coordinate_precision, json_backend),
+            lambda: [dumps_json(round_feature_coordinates(feature, coordinate_precision), backend=json_backend)
+                     for feature in self.features]
+        )
+
+class FanOutFeatureWriter:
+    """
+    Записывает один поток features сразу в несколько писателей (форматов).
+
+    Features копятся пакетами по batch_size; каждый пакет оборачивается в
+    FeatureBatch и передается в write_batch всех писателей, поэтому разбор
+    геометрий, перепроецирование, WKB, прямоугольники и компактный JSON
+    считаются один раз на пакет, а не по разу на формат.
+
+    С threaded=True каждый писатель работает в своем потоке: пакеты одного
+    писателя обрабатываются по порядку, и у каждого писателя в работе не больше
+    одного пакета, пока основной поток собирает следующий. Операции shapely,
+    сжатие и запись в файлы отпускают GIL, так что форматы пишутся параллельно.
+    При ошибке любого писателя все писатели прерываются (__exit__ с ошибкой).
+    Интерфейс совпадает с GeoJSONFeatureWriter.
+    """
+
+    def __init__(self, writers: Sequence[Any], batch_size: int = DEFAULT_FANOUT_BATCH_SIZE, threaded: bool = False):
+        self.writers = list(writers)
+        self.batch_size = batch_size
+        self.threaded = threaded
+        self.count = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._opened: List[Any] = []
+        self._executors: List[ThreadPoolExecutor] = []
+        self._futures: List[Optional[Future]] = []
+
+    def open(self) -> "FanOutFeatureWriter":
+        """Открывает всех писателей; если один не открылся, уже открытые прерываются."""
+        try:
+            for writer in self.writers:
+                writer.open()
+                self._opened.append(writer)
+        except Exception as e:
+            self._abort(type(e), e, e.__traceback__)
+            raise
+        if self.threaded:
+            self._executors = [ThreadPoolExecutor(max_workers=1) for _ in self.writers]
+            self._futures = [None] * len(self.writers)
+        return self
+
+    def write(self, feature: Dict[str, Any]) -> None:
+        """Добавляет feature в текущий пакет; полный пакет передается всем писателям."""
+        self._pending.append(feature)
+        self.count += 1
+        if len(self._pending) >= self.batch_size:
+            self._dispatch()
+
+    def _dispatch(self) -> None:
+        if not self._pending:
+            return
+        batch = FeatureBatch(self._pending)
+        self._pending = []
+        if not self.threaded:
+            for writer in self.writers:
+                writer.write_batch(batch)
+            return
+        for index, (writer, executor) in enumerate(zip(self.writers, self._executors)):
+            if self._futures[index] is not None:
+                self._futures[index].result() # Ждем предыдущий пакет; ошибка писателя пробрасывается
+            self._futures[index] = executor.submit(writer.write_batch, batch)
+
+    def _wait(self) -> None:
+        # Дожидаемся всех писателей, затем пробрасываем первую ошибку
+        errors = []
+        for future in self._futures:
+            if future is not None:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def close(self) -> None:
+        """Передает остаток пакета, дожидается писателей и закрывает их (в потоках - параллельно)."""
+        self._dispatch()
+        if not self.threaded:
+            for writer in self.writers:
+                writer.close()
+                self._opened.remove(writer)
+            return
+        try:
+            self._wait()
+            # Закрытие бывает дорогим (сортировка FlatGeobuf, индексы SQLite) - тоже параллельно
+            closing = [(writer, executor.submit(writer.close)) for writer, executor in zip(self.writers, self._executors)]
+            error = None
+            for writer, future in closing:
+                try:
+                    future.result()
+                    self._opened.remove(writer)
+                except Exception as e:
+                    error = error or e
+            if error is not None:
+                raise error
+        finally:
+            self._shutdown()
+
+    def _shutdown(self) -> None:
+        # Еще не начатые пакеты отменяются, выполняющиеся - дожидаются
+        for executor in self._executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self._executors, self._futures = [], []
+
+    def _abort(self, exc_type, exc_value, traceback) -> None:
+        for writer in self._opened:
+            try:
+                writer.__exit__(exc_type, exc_value, traceback)
+            except Exception as e:
+                logger.error(f"Ошибка при прерывании записи {getattr(writer, 'output_filepath', writer)}: {e}")
+        self._opened = []
+
+    def __enter__(self) -> "FanOutFeatureWriter":
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            try:
+                self.close()
+            except Exception as e:
+                # Уже закрытые писатели исключены из _opened и остаются целыми
+                self._abort(type(e), e, e.__traceback__)
+                raise
+            return
+        self._shutdown()
+        self._abort(exc_type, exc_value, traceback)
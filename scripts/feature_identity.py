@@ -0,0 +1,105 @@
+import hashlib
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from scripts.geometry_processing import GEOGRAPHIC_CRS_WGS84, coordinate_precision_for_crs, geojson_geometry_crs
+from scripts.json_encoding import round_geometry_coordinates
+
+# Foreign members записей инкрементальной последовательности GeoJSON
+FEATURE_KEY_MEMBER = "feature_key" # Ключ feature: запись заменяет предыдущие записи с тем же ключом
+TOMBSTONE_MEMBER = "deleted" # true - feature с этим ключом удален
+
+def feature_cad_fields(feature: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Возвращает (cad_num, quarter_cad_number) GeoJSON Feature.
+
+    Поля берутся из properties.options (формат НСПД) или из самих properties;
+    если квартал не указан, он выводится из кадастрового номера
+    ("50:03:0060111:367" -> "50:03:0060111").
+    """
+    properties = feature.get("properties") or {}
+    options = properties.get("options") if isinstance(properties.get("options"), dict) else {}
+    cad_num = options.get("cad_num") or properties.get("cad_num")
+    quarter = options.get("quarter_cad_number") or properties.get("quarter_cad_number")
+    if not quarter and isinstance(cad_num, str) and cad_num.count(":") == 3:
+        quarter = cad_num.rsplit(":", 1)[0]
+    return cad_num, quarter
+
+def _canonical_hash(obj: Any) -> str:
+    # Канонический JSON (ключи отсортированы) не зависит от порядка ключей и кодировщика
+    canonical = json.dumps(
+        obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False,
+        default=lambda value: value.item() # Скаляры numpy, как в dumps_json
+    )
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+def feature_content_hash(feature: Dict[str, Any]) -> str:
+    """
+    Хэш содержимого feature: геометрии (вместе с членом "crs") и properties.
+
+    Считается по каноническому JSON, поэтому не зависит от порядка ключей
+    и кодировщика; id feature в хэш не входит.
+    """
+    return _canonical_hash({"geometry": feature.get("geometry"), "properties": feature.get("properties")})
+
+def attributes_hash(feature: Dict[str, Any]) -> str:
+    """Хэш properties feature по каноническому JSON (без геометрии и id)."""
+    return _canonical_hash(feature.get("properties"))
+
+def geometry_hash(geometry: Optional[Dict[str, Any]]) -> str:
+    """
+    Хэш GeoJSON-геометрии (вместе с членом "crs").
+
+    Координаты перед хэшированием округляются по CRS геометрии
+    (coordinate_precision_for_crs: 1 см для метровых CRS), поэтому одна и та же
+    граница из разных выгрузок дает один хэш, даже если координаты записаны
+    с разным числом знаков.
+    """
+    crs_str = geojson_geometry_crs(geometry) or GEOGRAPHIC_CRS_WGS84
+    return _canonical_hash(round_geometry_coordinates(geometry, coordinate_precision_for_crs(crs_str)))
+
+def identity_key(feature_id: Any = None, cad_num: Optional[str] = None, kml_id: Optional[str] = None) -> Optional[str]:
+    """Ключ по идентификаторам: id feature, затем кадастровый номер, затем id Placemark KML."""
+    if feature_id is not None:
+        return f"id:{feature_id}"
+    if cad_num:
+        return f"cad:{cad_num}"
+    if kml_id:
+        return f"kml:{kml_id}"
+    return None
+
+def feature_identity_key(feature: Dict[str, Any]) -> str:
+    """
+    Ключ, по которому инкрементальная запись сопоставляет feature с сохраненным.
+
+    Берется id feature (участки НСПД), иначе кадастровый номер, иначе kml_id
+    (обработанные Placemark). Feature без идентификаторов адресуется хэшем
+    содержимого: измененный такой feature - это удаление старого и добавление нового.
+    """
+    properties = feature.get("properties") or {}
+    key = identity_key(feature.get("id"), feature_cad_fields(feature)[0], properties.get("kml_id"))
+    return key if key is not None else f"hash:{feature_content_hash(feature)}"
+
+def resolve_incremental_records(records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Восстанавливает текущее состояние последовательности, дописанной инкрементально.
+
+    Запись с членом FEATURE_KEY_MEMBER заменяет все предыдущие записи с тем же
+    ключом (на месте первой из них), запись с TOMBSTONE_MEMBER удаляет их.
+    Записи без ключа (обычная дозапись) не заменяют друг друга; если в
+    последовательности нет ни одной записи с ключом, она возвращается как есть.
+    Члены FEATURE_KEY_MEMBER и TOMBSTONE_MEMBER из результата удаляются.
+    """
+    records = list(records)
+    if not any(FEATURE_KEY_MEMBER in record for record in records):
+        return records
+    live: Dict[str, List[Dict[str, Any]]] = {}
+    for record in records:
+        key = record.get(FEATURE_KEY_MEMBER)
+        if key is None:
+            live.setdefault(feature_identity_key(record), []).append(record)
+        elif record.get(TOMBSTONE_MEMBER):
+            live.pop(key, None)
+        else:
+            live[key] = [{k: v for k, v in record.items() if k != FEATURE_KEY_MEMBER}]
+    return [record for group in live.values() for record in group]
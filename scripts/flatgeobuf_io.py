@@ -0,0 +1,687 @@
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from pyproj import CRS
+from shapely.geometry import mapping, shape
+from shapely.geometry.base import BaseGeometry
+
+from scripts.feature_batch import FeatureBatch
+from scripts.geometry_processing import GEOGRAPHIC_CRS_WGS84, geojson_geometry_crs, reproject_geometries
+from scripts.json_encoding import dumps_json
+from scripts.spatial_index import DEFAULT_NODE_SIZE, hilbert_order, pack_hilbert_rtree
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Формат FlatGeobuf 3.x: magic, заголовок (FlatBuffer с префиксом длины),
+# упакованное R-дерево Гильберта (корень первым), features (FlatBuffers с префиксом длины)
+FLATGEOBUF_MAGIC = b"fgb\x03fgb\x00"
+
+# GeometryType в схеме FlatGeobuf; номера совпадают с WKB
+_GEOMETRY_TYPES = {
+    "Point": 1, "LineString": 2, "Polygon": 3, "MultiPoint": 4,
+    "MultiLineString": 5, "MultiPolygon": 6, "GeometryCollection": 7,
+}
+_GEOMETRY_TYPE_NAMES = {code: name for name, code in _GEOMETRY_TYPES.items()}
+
+# ColumnType в схеме FlatGeobuf (используемые)
+_COLUMN_BOOL = 2
+_COLUMN_LONG = 7
+_COLUMN_DOUBLE = 10
+_COLUMN_STRING = 11
+_COLUMN_JSON = 12
+
+# Узел R-дерева: прямоугольник и смещение (первого дочернего узла или feature в секции данных)
+_NODE_DTYPE = np.dtype([("minx", "<f8"), ("miny", "<f8"), ("maxx", "<f8"), ("maxy", "<f8"), ("offset", "<u8")])
+
+# Откуда берется значение колонки при восстановлении GeoJSON Feature
+_PARENT_FEATURE = "feature" # член id самого feature
+_PARENT_OPTIONS = "options" # properties.options (формат НСПД)
+
+class _FlatBufferBuilder:
+    """
+    Минимальный построитель FlatBuffers для схем FlatGeobuf.
+
+    В отличие от библиотеки flatbuffers, объекты пишутся от начала буфера к концу:
+    vtable, затем таблица, затем ее дочерние объекты. Ссылки uoffset при этом
+    направлены вперед, как требует формат, а выравнивание считается от начала буфера.
+    """
+
+    def __init__(self):
+        self.buf = bytearray(4) # uoffset корневой таблицы
+
+    def _pad(self, align: int, extra: int = 0) -> None:
+        self.buf.extend(b"\x00" * (-(len(self.buf) + extra) % align))
+
+    def finish(self, root: Callable[["_FlatBufferBuilder"], int]) -> bytes:
+        struct.pack_into("<I", self.buf, 0, root(self))
+        return bytes(self.buf)
+
+    def string(self, value: str) -> int:
+        data = value.encode("utf-8")
+        self._pad(4)
+        pos = len(self.buf)
+        self.buf += struct.pack("<I", len(data)) + data + b"\x00"
+        return pos
+
+    def vector(self, array: np.ndarray) -> int:
+        # Элементы выравниваются по своему размеру, длина вектора (uint32) - по 4
+        self._pad(max(array.dtype.itemsize, 4), 4)
+        pos = len(self.buf)
+        self.buf += struct.pack("<I", len(array)) + array.tobytes()
+        return pos
+
+    def table_vector(self, children: Sequence[Callable[["_FlatBufferBuilder"], int]]) -> int:
+        self._pad(4)
+        pos = len(self.buf)
+        self.buf += struct.pack("<I", len(children)) + bytes(4 * len(children))
+        for i, child in enumerate(children):
+            child_pos = child(self)
+            struct.pack_into("<I", self.buf, pos + 4 + 4 * i, child_pos - (pos + 4 + 4 * i))
+        return pos
+
+    def table(self, fields: Sequence[Tuple[int, str, Any]]) -> int:
+        """
+        Пишет таблицу. fields - (номер поля, формат struct или "offset", значение);
+        для "offset" значение - функция, которая пишет дочерний объект и возвращает
+        его позицию. Поля со значением None не пишутся (значение по умолчанию схемы).
+        """
+        present = [(slot, fmt, value) for slot, fmt, value in fields if value is not None]
+        size = lambda fmt: 4 if fmt == "offset" else struct.calcsize(fmt)
+        # Поля по убыванию размера: после выравнивания начала таблицы каждое выровнено само
+        present.sort(key=lambda f: -size(f[1]))
+        num_slots = max((slot for slot, _, _ in present), default=-1) + 1
+        field_offsets = {}
+        table_size = 4
+        for slot, fmt, _ in present:
+            field_offsets[slot] = table_size
+            table_size += size(fmt)
+
+        self._pad(2)
+        vtable_pos = len(self.buf)
+        self.buf += struct.pack(f"<{2 + num_slots}H", 4 + 2 * num_slots, table_size,
+                                *[field_offsets.get(slot, 0) for slot in range(num_slots)])
+        if any(size(fmt) == 8 for _, fmt, _ in present):
+            self._pad(8, 4)
+        else:
+            self._pad(4)
+        table_pos = len(self.buf)
+        self.buf += struct.pack("<i", table_pos - vtable_pos) + bytes(table_size - 4)
+        for slot, fmt, value in present:
+            field_pos = table_pos + field_offsets[slot]
+            if fmt != "offset":
+                struct.pack_into(fmt, self.buf, field_pos, value)
+        for slot, fmt, value in present:
+            if fmt == "offset":
+                field_pos = table_pos + field_offsets[slot]
+                struct.pack_into("<I", self.buf, field_pos, value(self) - field_pos)
+        return table_pos
+
+class _FlatBufferTable:
+    """Чтение полей таблицы FlatBuffers по номерам полей схемы."""
+
+    def __init__(self, buf: bytes, pos: int):
+        self.buf = buf
+        self.pos = pos
+        vtable_pos = pos - struct.unpack_from("<i", buf, pos)[0]
+        vtable_size = struct.unpack_from("<H", buf, vtable_pos)[0]
+        self._offsets = struct.unpack_from(f"<{(vtable_size - 4) // 2}H", buf, vtable_pos + 4)
+
+    def _field_pos(self, slot: int) -> Optional[int]:
+        if slot < len(self._offsets) and self._offsets[slot]:
+            return self.pos + self._offsets[slot]
+        return None
+
+    def scalar(self, slot: int, fmt: str, default: Any = None) -> Any:
+        pos = self._field_pos(slot)
+        return struct.unpack_from(fmt, self.buf, pos)[0] if pos is not None else default
+
+    def _target(self, slot: int) -> Optional[int]:
+        pos = self._field_pos(slot)
+        return pos + struct.unpack_from("<I", self.buf, pos)[0] if pos is not None else None
+
+    def string(self, slot: int) -> Optional[str]:
+        pos = self._target(slot)
+        if pos is None:
+            return None
+        length = struct.unpack_from("<I", self.buf, pos)[0]
+        return bytes(self.buf[pos + 4:pos + 4 + length]).decode("utf-8")
+
+    def vector(self, slot: int, dtype: str) -> Optional[np.ndarray]:
+        pos = self._target(slot)
+        if pos is None:
+            return None
+        length = struct.unpack_from("<I", self.buf, pos)[0]
+        return np.frombuffer(self.buf, dtype=dtype, count=length, offset=pos + 4)
+
+    def table(self, slot: int) -> Optional["_FlatBufferTable"]:
+        pos = self._target(slot)
+        return _FlatBufferTable(self.buf, pos) if pos is not None else None
+
+    def tables(self, slot: int) -> List["_FlatBufferTable"]:
+        pos = self._target(slot)
+        if pos is None:
+            return []
+        length = struct.unpack_from("<I", self.buf, pos)[0]
+        items = []
+        for i in range(length):
+            item_pos = pos + 4 + 4 * i
+            items.append(_FlatBufferTable(self.buf, item_pos + struct.unpack_from("<I", self.buf, item_pos)[0]))
+        return items
+
+def _geometry_table(geom: BaseGeometry) -> Callable[[_FlatBufferBuilder], int]:
+    # Таблица Geometry: ends (0), xy (1), type (6), parts (7); Z не записывается (2D)
+    def write(builder: _FlatBufferBuilder) -> int:
+        fields: List[Tuple[int, str, Any]] = [(6, "<B", _GEOMETRY_TYPES[geom.geom_type])]
+        if geom.geom_type in ("MultiPolygon", "GeometryCollection"):
+            parts = [_geometry_table(part) for part in geom.geoms]
+            fields.append((7, "offset", lambda b: b.table_vector(parts)))
+            return builder.table(fields)
+        if geom.geom_type == "Polygon" and not geom.is_empty:
+            rings = [geom.exterior, *geom.interiors]
+        elif geom.geom_type == "MultiLineString":
+            rings = list(geom.geoms)
+        else:
+            rings = []
+        xy = np.ascontiguousarray(shapely.get_coordinates(geom), dtype="<f8").ravel()
+        fields.append((1, "offset", lambda b: b.vector(xy)))
+        if len(rings) > 1:
+            # ends - номер точки, следующей за концом каждого кольца/линии
+            ends = np.cumsum(shapely.get_num_coordinates(rings)).astype("<u4")
+            fields.append((0, "offset", lambda b: b.vector(ends)))
+        return builder.table(fields)
+    return write
+
+def _split(xy: np.ndarray, ends: Optional[np.ndarray]) -> List[np.ndarray]:
+    if ends is None or len(ends) == 0:
+        return [xy]
+    return np.split(xy, ends[:-1].astype(np.int64))
+
+def _read_geometry(table: _FlatBufferTable, geometry_type: int) -> BaseGeometry:
+    geometry_type = table.scalar(6, "<B", 0) or geometry_type
+    name = _GEOMETRY_TYPE_NAMES.get(geometry_type)
+    if name in ("MultiPolygon", "GeometryCollection"):
+        part_type = _GEOMETRY_TYPES["Polygon"] if name == "MultiPolygon" else 0
+        parts = [_read_geometry(part, part_type) for part in table.tables(7)]
+        return shapely.MultiPolygon(parts) if name == "MultiPolygon" else shapely.GeometryCollection(parts)
+    xy = table.vector(1, "<f8")
+    if xy is None or len(xy) == 0:
+        return shapely.from_wkt(f"{(name or 'GeometryCollection').upper()} EMPTY")
+    xy = xy.reshape(-1, 2)
+    ends = table.vector(0, "<u4")
+    if name == "Point":
+        return shapely.Point(xy[0])
+    if name == "LineString":
+        return shapely.LineString(xy)
+    if name == "MultiPoint":
+        return shapely.MultiPoint(xy)
+    if name == "MultiLineString":
+        return shapely.MultiLineString(_split(xy, ends))
+    if name == "Polygon":
+        rings = _split(xy, ends)
+        return shapely.Polygon(rings[0], rings[1:])
+    raise ValueError(f"Неподдерживаемый тип геометрии FlatGeobuf: {geometry_type}")
+
+def _column_type(kinds: set) -> int:
+    if kinds == {"bool"}:
+        return _COLUMN_BOOL
+    if kinds == {"int"}:
+        return _COLUMN_LONG
+    if kinds <= {"int", "float"}:
+        return _COLUMN_DOUBLE
+    if kinds == {"str"}:
+        return _COLUMN_STRING
+    # Списки, словари и смешанные типы - текст JSON, из которого значения восстанавливаются как есть
+    return _COLUMN_JSON
+
+def _value_kind(value: Any) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, np.integer)):
+        return "int" if -2 ** 63 <= int(value) < 2 ** 63 else "json"
+    if isinstance(value, (float, np.floating)):
+        return "float"
+    if isinstance(value, str):
+        return "str"
+    return "json"
+
+def _crs_table(crs_str: str) -> Callable[[_FlatBufferBuilder], int]:
+    # Таблица Crs: org (0), code (1), wkt (4)
+    def write(builder: _FlatBufferBuilder) -> int:
+        authority = CRS(crs_str).to_authority()
+        if authority and authority[1].isdigit():
+            return builder.table([(0, "offset", lambda b: b.string(authority[0])), (1, "<i", int(authority[1]))])
+        wkt = CRS(crs_str).to_wkt()
+        return builder.table([(4, "offset", lambda b: b.string(wkt))])
+    return write
+
+class FlatGeobufFeatureWriter:
+    """
+    Записывает GeoJSON Features в FlatGeobuf с упакованным R-деревом Гильберта.
+
+    FlatGeobuf требует, чтобы схема колонок и индекс стояли перед features,
+    а features шли в порядке кривой Гильберта. Поэтому write() складывает
+    геометрию (WKB) и свойства во временный файл, собирая схему и прямоугольники,
+    а close() сортирует features, кодирует их в FlatBuffers, строит индекс
+    и атомарно заменяет выходной файл. В памяти остаются только прямоугольники
+    и смещения - память не зависит от объема геометрий.
+
+    Свойства из properties.options (формат НСПД) и id feature становятся
+    отдельными колонками; откуда взята колонка, записано в ее metadata,
+    поэтому read_flatgeobuf восстанавливает исходную вложенность.
+    Все геометрии хранятся в одной CRS (первого feature), как в SQLiteFeatureWriter.
+    Интерфейс совпадает с GeoJSONFeatureWriter; дозапись не поддерживается.
+    """
+
+    def __init__(
+        self,
+        output_filepath: str,
+        name: Optional[str] = None,
+        crs_str: Optional[str] = None,
+        node_size: int = DEFAULT_NODE_SIZE,
+        json_backend: Optional[str] = None
+    ):
+        if node_size == 1:
+            raise ValueError("Размер узла R-дерева должен быть 0 (без индекса) или не меньше 2")
+        self.output_filepath = output_filepath
+        self.name = name if name is not None else os.path.splitext(os.path.basename(output_filepath))[0]
+        self.crs_str = crs_str # None - CRS первого записанного feature
+        self.node_size = node_size # 0 - без индекса
+        self.json_backend = json_backend
+        self.count = 0
+        self._records: Optional[BinaryIO] = None
+        self._record_offsets: List[int] = []
+        self._bounds: List[Tuple[float, float, float, float]] = []
+        self._geometry_types = set()
+        # Колонки: (родитель, ключ) -> номер; имя, множество типов значений
+        self._column_index: Dict[Tuple[Optional[str], str], int] = {}
+        self._columns: List[Dict[str, Any]] = []
+
+    def open(self) -> "FlatGeobufFeatureWriter":
+        """Открывает временный файл для features."""
+        self._records = tempfile.TemporaryFile()
+        return self
+
+    def _column(self, parent: Optional[str], key: str, value: Any) -> int:
+        index = self._column_index.get((parent, key))
+        if index is None:
+            names = {column["name"] for column in self._columns}
+            # При совпадении имен (например, "id" в properties и у feature) колонка получает префикс
+            name = key if key not in names else f"{parent or 'properties'}.{key}"
+            index = len(self._columns)
+            self._column_index[(parent, key)] = index
+            self._columns.append({"name": name, "parent": parent, "key": key, "kinds": set()})
+        self._columns[index]["kinds"].add(_value_kind(value))
+        return index
+
+    def write(self, feature: Dict[str, Any]) -> None:
+        """Добавляет feature во временный файл; запись в выходной файл - при close()."""
+        raw_geometry = feature.get("geometry")
+        geom = shape(raw_geometry) if raw_geometry else None
+        if geom is not None:
+            source_crs = geojson_geometry_crs(raw_geometry) or GEOGRAPHIC_CRS_WGS84
+            if self.crs_str is None:
+                self.crs_str = source_crs
+            elif source_crs != self.crs_str:
+                geom = reproject_geometries(geom, source_crs, self.crs_str)
+            self._geometry_types.add(geom.geom_type)
+        geometry_wkb = shapely.to_wkb(geom) if geom is not None else b""
+        bounds = geom.bounds if geom is not None and not geom.is_empty else (np.nan,) * 4
+        self._append(feature, geometry_wkb, bounds)
+
+    def write_batch(self, batch: FeatureBatch) -> None:
+        """Добавляет пакет features во временный файл (геометрия, WKB и прямоугольники берутся из пакета)."""
+        if self.crs_str is None:
+            first = next((i for i, raw in enumerate(batch.raw_geometries) if raw), None)
+            if first is not None:
+                self.crs_str = batch.crs_names[first]
+        geoms = batch.geometries(self.crs_str)
+        wkb, bounds = batch.wkb(self.crs_str), batch.bounds(self.crs_str).tolist()
+        for feature, geom, geometry_wkb, box in zip(batch.features, geoms, wkb, bounds):
+            if geom is not None:
+                self._geometry_types.add(geom.geom_type)
+            self._append(feature, geometry_wkb if geometry_wkb is not None else b"", tuple(box))
+
+    def _append(self, feature: Dict[str, Any], geometry_wkb: bytes, bounds: Tuple[float, float, float, float]) -> None:
+        values: Dict[int, Any] = {}
+        if feature.get("id") is not None:
+            values[self._column(_PARENT_FEATURE, "id", feature["id"])] = feature["id"]
+        properties = dict(feature.get("properties") or {})
+        options = properties.pop("options") if isinstance(properties.get("options"), dict) else {}
+        for parent, source in ((None, properties), (_PARENT_OPTIONS, options)):
+            for key, value in source.items():
+                if value is not None:
+                    values[self._column(parent, key, value)] = value
+
+        properties_json = dumps_json({str(k): v for k, v in values.items()}, backend=self.json_backend).encode("utf-8")
+        self._record_offsets.append(self._records.tell())
+        self._records.write(struct.pack("<II", len(geometry_wkb), len(properties_json)) + geometry_wkb + properties_json)
+        self._bounds.append(bounds)
+        self.count += 1
+
+    def _encode_properties(self, values: Dict[str, Any], column_types: List[int]) -> bytes:
+        # Свойства feature: (uint16 номер колонки, значение) по порядку колонок
+        parts = []
+        for index in sorted(values, key=int):
+            value = values[index]
+            column_type = column_types[int(index)]
+            parts.append(struct.pack("<H", int(index)))
+            if column_type == _COLUMN_BOOL:
+                parts.append(struct.pack("<B", bool(value)))
+            elif column_type == _COLUMN_LONG:
+                parts.append(struct.pack("<q", int(value)))
+            elif column_type == _COLUMN_DOUBLE:
+                parts.append(struct.pack("<d", float(value)))
+            else:
+                text = value if column_type == _COLUMN_STRING else dumps_json(value, backend=self.json_backend)
+                data = text.encode("utf-8")
+                parts.append(struct.pack("<I", len(data)) + data)
+        return b"".join(parts)
+
+    def _header(self, envelope: Optional[np.ndarray], column_types: List[int]) -> bytes:
+        # Таблица Header: name (0), envelope (1), geometry_type (2), columns (7),
+        # features_count (8), index_node_size (9), crs (10)
+        geometry_type = _GEOMETRY_TYPES[next(iter(self._geometry_types))] if len(self._geometry_types) == 1 else 0
+
+        def column_table(column: Dict[str, Any], column_type: int) -> Callable[[_FlatBufferBuilder], int]:
+            # Таблица Column: name (0), type (1), metadata (10)
+            metadata = None
+            if column["parent"] is not None or column["name"] != column["key"]:
+                metadata = json.dumps({"parent": column["parent"], "key": column["key"]})
+            return lambda b: b.table([
+                (0, "offset", lambda b: b.string(column["name"])),
+                (1, "<B", column_type),
+                (10, "offset", (lambda b: b.string(metadata)) if metadata else None),
+            ])
+
+        columns = [column_table(column, column_type) for column, column_type in zip(self._columns, column_types)]
+        fields = [
+            (0, "offset", lambda b: b.string(self.name)),
+            (1, "offset", (lambda b: b.vector(envelope)) if envelope is not None else None),
+            (2, "<B", geometry_type),
+            (7, "offset", (lambda b: b.table_vector(columns)) if columns else None),
+            (8, "<Q", self.count),
+            (9, "<H", self.node_size),
+            (10, "offset", _crs_table(self.crs_str) if self.crs_str else None),
+        ]
+        return _FlatBufferBuilder().finish(lambda b: b.table(fields))
+
+    def _index(self, bounds: np.ndarray, offsets: np.ndarray) -> bytes:
+        # Дерево строится листьями вперед (pack_hilbert_rtree), а FlatGeobuf хранит его
+        # корнем вперед: уровни переставляются, ссылки на дочерние узлы пересчитываются
+        level_ends, boxes, indices = pack_hilbert_rtree(bounds, offsets, self.node_size, order=np.arange(len(bounds)))
+        level_ends = level_ends.astype(np.int64)
+        level_starts = np.concatenate(([0], level_ends[:-1]))
+        total = int(level_ends[-1])
+        nodes = np.empty(total, dtype=_NODE_DTYPE)
+        for level, (start, end) in enumerate(zip(level_starts, level_ends)):
+            new_start = total - end
+            level_nodes = nodes[new_start:new_start + (end - start)]
+            level_nodes["minx"], level_nodes["miny"] = boxes[start:end, 0], boxes[start:end, 1]
+            level_nodes["maxx"], level_nodes["maxy"] = boxes[start:end, 2], boxes[start:end, 3]
+            if level == 0:
+                level_nodes["offset"] = indices[start:end]
+            else:
+                # Позиция первого дочернего узла на уровне level - 1 в новом порядке
+                child_start, child_end = level_starts[level - 1], level_ends[level - 1]
+                level_nodes["offset"] = indices[start:end].astype(np.int64) - child_start + (total - child_end)
+        return nodes.tobytes()
+
+    def close(self) -> None:
+        """Сортирует features по кривой Гильберта и записывает файл FlatGeobuf."""
+        if self._records is None:
+            return
+        tmp_path = self.output_filepath + ".tmp"
+        try:
+            bounds = np.array(self._bounds, dtype=float).reshape(-1, 4)
+            present = ~np.isnan(bounds).any(axis=1)
+            # Features без геометрии - в конце, с прямоугольником, который не пересекает ничего
+            order = np.concatenate((np.flatnonzero(present)[hilbert_order(bounds[present])] if present.any() else [],
+                                    np.flatnonzero(~present))).astype(np.int64)
+            bounds[~present] = (np.inf, np.inf, -np.inf, -np.inf)
+            column_types = [_column_type(column["kinds"]) for column in self._columns]
+
+            record_offsets = np.array(self._record_offsets, dtype=np.int64)
+            self._records.flush()
+            feature_offsets = np.zeros(self.count, dtype=np.uint64)
+            with tempfile.TemporaryFile() as features_file:
+                if self.count:
+                    with mmap.mmap(self._records.fileno(), 0, access=mmap.ACCESS_READ) as records:
+                        position = 0
+                        for rank, record_index in enumerate(order.tolist()):
+                            start = int(record_offsets[record_index])
+                            wkb_length, json_length = struct.unpack_from("<II", records, start)
+                            geometry_wkb = records[start + 8:start + 8 + wkb_length]
+                            values = json.loads(records[start + 8 + wkb_length:start + 8 + wkb_length + json_length])
+                            geom = shapely.from_wkb(geometry_wkb) if wkb_length else None
+                            fields = [
+                                (0, "offset", _geometry_table(geom) if geom is not None else None),
+                                (1, "offset", (lambda b, data=self._encode_properties(values, column_types):
+                                               b.vector(np.frombuffer(data, dtype=np.uint8))) if values else None),
+                            ]
+                            data = _FlatBufferBuilder().finish(lambda b: b.table(fields))
+                            features_file.write(struct.pack("<I", len(data)) + data)
+                            feature_offsets[rank] = position
+                            position += 4 + len(data)
+
+                envelope = None
+                if present.any():
+                    envelope = np.array([bounds[present, 0].min(), bounds[present, 1].min(),
+                                         bounds[present, 2].max(), bounds[present, 3].max()], dtype="<f8")
+                header = self._header(envelope, column_types)
+                with open(tmp_path, "wb") as f:
+                    f.write(FLATGEOBUF_MAGIC)
+                    f.write(struct.pack("<I", len(header)) + header)
+                    if self.node_size and self.count:
+                        f.write(self._index(bounds[order], feature_offsets))
+                    features_file.seek(0)
+                    shutil.copyfileobj(features_file, f)
+            os.replace(tmp_path, self.output_filepath) # Читатели никогда не видят недописанный файл
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._records.close()
+            self._records = None
+
+    def __enter__(self) -> "FlatGeobufFeatureWriter":
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        elif self._records is not None:
+            # При ошибке выходной файл не создается и не изменяется
+            self._records.close()
+            self._records = None
+
+def _level_ranges(num_items: int, node_size: int) -> List[Tuple[int, int]]:
+    # Диапазоны узлов каждого уровня в порядке FlatGeobuf: от корня к листьям
+    counts = [num_items]
+    while counts[-1] > 1:
+        counts.append(-(-counts[-1] // node_size))
+    ranges, start = [], 0
+    for count in reversed(counts):
+        ranges.append((start, start + count))
+        start += count
+    return ranges
+
+class FlatGeobufReader:
+    """
+    Открытый файл FlatGeobuf: файл отображается в память (mmap), при запросе по
+    прямоугольнику читаются только пройденные узлы индекса и найденные features.
+    """
+
+    def __init__(self, fgb_path: str):
+        self.fgb_path = fgb_path
+        self._file = open(fgb_path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Пустой файл
+            self._file.close()
+            raise ValueError(f"'{fgb_path}' is not a FlatGeobuf file")
+        if self._mmap[:3] != FLATGEOBUF_MAGIC[:3] or self._mmap[4:7] != FLATGEOBUF_MAGIC[4:7]:
+            self.close()
+            raise ValueError(f"'{fgb_path}' is not a FlatGeobuf file")
+
+        header_size = struct.unpack_from("<I", self._mmap, 8)[0]
+        header_bytes = self._mmap[12:12 + header_size]
+        header = _FlatBufferTable(header_bytes, struct.unpack_from("<I", header_bytes, 0)[0])
+        self.name = header.string(0)
+        envelope = header.vector(1, "<f8")
+        self.envelope = tuple(envelope.tolist()) if envelope is not None and len(envelope) == 4 else None
+        self.geometry_type = header.scalar(2, "<B", 0)
+        self.features_count = header.scalar(8, "<Q", 0)
+        self.node_size = header.scalar(9, "<H", DEFAULT_NODE_SIZE)
+        self.crs = None
+        crs = header.table(10)
+        if crs is not None:
+            org, code, wkt = crs.string(0), crs.scalar(1, "<i", 0), crs.string(4)
+            if code:
+                self.crs = f"{org or 'EPSG'}:{code}"
+            elif wkt:
+                self.crs = CRS.from_wkt(wkt).to_string()
+        self.columns = []
+        for column in header.tables(7):
+            metadata = json.loads(column.string(10) or "{}")
+            name = column.string(0)
+            self.columns.append((name, column.scalar(1, "<B", 0), metadata.get("parent"), metadata.get("key", name)))
+
+        index_start = 12 + header_size
+        self._level_ranges: List[Tuple[int, int]] = []
+        self._nodes = None
+        index_size = 0
+        if self.node_size and self.features_count:
+            self._level_ranges = _level_ranges(self.features_count, self.node_size)
+            num_nodes = self._level_ranges[-1][1]
+            self._nodes = np.frombuffer(self._mmap, dtype=_NODE_DTYPE, count=num_nodes, offset=index_start)
+            index_size = num_nodes * _NODE_DTYPE.itemsize
+        self._data_start = index_start + index_size
+
+    def query(self, bbox: Sequence[float]) -> List[int]:
+        """
+        Возвращает смещения features (в секции данных), чьи прямоугольники
+        пересекают bbox = (minx, miny, maxx, maxy) в CRS файла, в порядке файла.
+        """
+        if self._nodes is None:
+            raise ValueError(f"'{self.fgb_path}' has no spatial index")
+        minx, miny, maxx, maxy = bbox
+        results = []
+        leaf_level = len(self._level_ranges) - 1
+        stack = [(0, 0)] # (номер первого узла группы, уровень от корня)
+        while stack:
+            node_pos, level = stack.pop()
+            end = min(node_pos + self.node_size, self._level_ranges[level][1])
+            nodes = self._nodes[node_pos:end]
+            hits = np.flatnonzero(
+                (nodes["minx"] <= maxx) & (nodes["miny"] <= maxy) & (nodes["maxx"] >= minx) & (nodes["maxy"] >= miny)
+            )
+            if len(hits) == 0:
+                continue
+            offsets = nodes["offset"][hits].tolist()
+            if level == leaf_level:
+                results.extend(offsets)
+            else:
+                stack.extend((offset, level + 1) for offset in offsets)
+        return sorted(results)
+
+    def _read_feature(self, offset: int) -> Tuple[Dict[str, Any], int]:
+        start = self._data_start + offset
+        size = struct.unpack_from("<I", self._mmap, start)[0]
+        data = self._mmap[start + 4:start + 4 + size] # Копия одного feature: mmap можно закрыть в любой момент
+        table = _FlatBufferTable(data, struct.unpack_from("<I", data, 0)[0])
+        geometry_table = table.table(0)
+        geometry = None
+        if geometry_table is not None:
+            geometry = mapping(_read_geometry(geometry_table, self.geometry_type))
+            if self.crs and self.crs != GEOGRAPHIC_CRS_WGS84:
+                geometry["crs"] = {"type": "name", "properties": {"name": self.crs}}
+
+        feature: Dict[str, Any] = {"type": "Feature"}
+        properties: Dict[str, Any] = {}
+        options: Dict[str, Any] = {}
+        raw = table.vector(1, "<u1")
+        if raw is not None:
+            raw = raw.tobytes()
+            pos = 0
+            while pos < len(raw):
+                index = struct.unpack_from("<H", raw, pos)[0]
+                name, column_type, parent, key = self.columns[index]
+                pos += 2
+                if column_type == _COLUMN_BOOL:
+                    value, pos = bool(raw[pos]), pos + 1
+                elif column_type == _COLUMN_LONG:
+                    value, pos = struct.unpack_from("<q", raw, pos)[0], pos + 8
+                elif column_type == _COLUMN_DOUBLE:
+                    value, pos = struct.unpack_from("<d", raw, pos)[0], pos + 8
+                else:
+                    length = struct.unpack_from("<I", raw, pos)[0]
+                    text = raw[pos + 4:pos + 4 + length].decode("utf-8")
+                    value, pos = (json.loads(text) if column_type == _COLUMN_JSON else text), pos + 4 + length
+                if parent == _PARENT_FEATURE:
+                    feature["id"] = value
+                elif parent == _PARENT_OPTIONS:
+                    options[key] = value
+                else:
+                    properties[key] = value
+        if any(parent == _PARENT_OPTIONS for _, _, parent, _ in self.columns):
+            properties["options"] = options
+        feature["geometry"] = geometry
+        feature["properties"] = properties
+        return feature, start + 4 + size - self._data_start
+
+    def features(self, bbox: Optional[Sequence[float]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Читает features; с bbox - только найденные по индексу (без индекса - полным
+        проходом с проверкой прямоугольника геометрии).
+        """
+        if bbox is not None and self._nodes is not None:
+            for offset in self.query(bbox):
+                yield self._read_feature(offset)[0]
+            return
+        offset = 0
+        for _ in range(self.features_count):
+            feature, offset = self._read_feature(offset)
+            if bbox is not None:
+                if feature["geometry"] is None:
+                    continue
+                minx, miny, maxx, maxy = shape(feature["geometry"]).bounds
+                if minx > bbox[2] or miny > bbox[3] or maxx < bbox[0] or maxy < bbox[1]:
+                    continue
+            yield feature
+
+    def close(self) -> None:
+        self._nodes = None # Массив индекса ссылается на mmap и должен быть освобожден первым
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def __enter__(self) -> "FlatGeobufReader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+def read_flatgeobuf(fgb_path: str, bbox: Optional[Sequence[float]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Читает features файла FlatGeobuf как GeoJSON Features.
+
+    Args:
+        fgb_path: Путь к файлу .fgb.
+        bbox: (minx, miny, maxx, maxy) в CRS файла; если указан, по индексу
+            читаются только features, чьи прямоугольники его пересекают.
+
+    Yields:
+        GeoJSON Features; свойства из properties.options и id восстанавливаются
+        на свои места, геометрия - в CRS файла, указанной членом "crs" (как в ответах НСПД).
+    """
+    with FlatGeobufReader(fgb_path) as reader:
+        yield from reader.features(bbox)
@@ -0,0 +1,566 @@
+import json
+import logging
+import os
+import struct
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, TextIO, Tuple, Union
+
+import numpy as np
+from shapely.geometry import shape
+
+from scripts.csv_export import CSV_GEOMETRY_WKT, CSVFeatureWriter
+from scripts.data_structures import ExtractedPlacemark, IncrementalWriteStats, NSPDCadastralFeature
+from scripts.feature_batch import FeatureBatch
+from scripts.feature_identity import (
+    FEATURE_KEY_MEMBER, TOMBSTONE_MEMBER, feature_content_hash, feature_identity_key, resolve_incremental_records
+)
+from scripts.flatgeobuf_io import FlatGeobufFeatureWriter, read_flatgeobuf
+from scripts.geometry_processing import DEFAULT_PRECISION, GEOGRAPHIC_CRS_WGS84, geojson_geometry_crs, reproject_geometries
+from scripts.geojson_stream import read_geojson_features
+from scripts.geoparquet_io import GeoParquetFeatureWriter, read_geoparquet_features
+from scripts.json_encoding import dumps_json, round_feature_coordinates
+from scripts.pkk_api_client import parse_nspd_feature
+from scripts.sqlite_store import SQLITE_LAYER_PARCELS, SQLiteFeatureWriter
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Форматы вывода features
+OUTPUT_FORMAT_GEOJSON = "geojson" # FeatureCollection (RFC 7946)
+OUTPUT_FORMAT_GEOJSONSEQ = "geojsonseq" # GeoJSON Text Sequence (RFC 8142): RS + feature + LF
+OUTPUT_FORMAT_NDJSON = "ndjson" # Newline-delimited: один feature в строке, без RS
+OUTPUT_FORMAT_SQLITE = "sqlite" # Слой SQLite: WKB + R*Tree (scripts.sqlite_store)
+OUTPUT_FORMAT_CSV = "csv" # Фиксированные колонки + WKT/WKB/центроид (scripts.csv_export)
+OUTPUT_FORMAT_GEOPARQUET = "geoparquet" # Типизированные колонки + WKB, нужен pyarrow (scripts.geoparquet_io)
+OUTPUT_FORMAT_FLATGEOBUF = "flatgeobuf" # FlatBuffers + упакованное R-дерево Гильберта (scripts.flatgeobuf_io)
+OUTPUT_FORMATS = [OUTPUT_FORMAT_GEOJSON, OUTPUT_FORMAT_GEOJSONSEQ, OUTPUT_FORMAT_NDJSON, OUTPUT_FORMAT_SQLITE, OUTPUT_FORMAT_CSV,
+                  OUTPUT_FORMAT_GEOPARQUET, OUTPUT_FORMAT_FLATGEOBUF]
+SEQUENCE_OUTPUT_FORMATS = [OUTPUT_FORMAT_GEOJSONSEQ, OUTPUT_FORMAT_NDJSON]
+# Форматы, в которые можно дописывать (append=True)
+APPENDABLE_OUTPUT_FORMATS = SEQUENCE_OUTPUT_FORMATS + [OUTPUT_FORMAT_SQLITE, OUTPUT_FORMAT_CSV]
+# Форматы с инкрементальной записью (incremental=True)
+INCREMENTAL_OUTPUT_FORMATS = SEQUENCE_OUTPUT_FORMATS + [OUTPUT_FORMAT_SQLITE]
+# Форматы, которые читает iter_feature_collection (вход обработки наравне с KML)
+FEATURE_INPUT_FORMATS = [OUTPUT_FORMAT_GEOJSON] + SEQUENCE_OUTPUT_FORMATS + [OUTPUT_FORMAT_GEOPARQUET, OUTPUT_FORMAT_FLATGEOBUF]
+
+# Расширения файлов по формату; первое используется для путей по умолчанию
+OUTPUT_FORMAT_EXTENSIONS = {
+    OUTPUT_FORMAT_GEOJSON: (".geojson", ".json"),
+    OUTPUT_FORMAT_GEOJSONSEQ: (".geojsons",),
+    OUTPUT_FORMAT_NDJSON: (".geojsonl", ".ndjson", ".jsonl"),
+    OUTPUT_FORMAT_SQLITE: (".sqlite", ".db"),
+    OUTPUT_FORMAT_CSV: (".csv",),
+    OUTPUT_FORMAT_GEOPARQUET: (".parquet", ".geoparquet"),
+    OUTPUT_FORMAT_FLATGEOBUF: (".fgb",),
+}
+
+RECORD_SEPARATOR = "\x1e" # RS (RFC 8142)
+
+# Ошибки чтения входного файла features: нет файла, некорректное содержимое, нет pyarrow, обрезанный FlatGeobuf
+FEATURE_READ_ERRORS = (IOError, ValueError, ImportError, struct.error)
+
+def iter_feature_collection(geojson_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Лениво читает features файла по одному, выбирая читатель по расширению.
+
+    FeatureCollection разбирается потоково (read_geojson_features), последовательности
+    (.geojsons, .geojsonl, .ndjson, .jsonl) - через read_geojson_seq, GeoParquet
+    (.parquet) - через read_geoparquet_features, FlatGeobuf (.fgb) - через
+    read_flatgeobuf. Последовательность, дописанная инкрементально, выдается в
+    текущем состоянии (resolve_incremental_records) - для этого она читается целиком.
+
+    Args:
+        geojson_path: Путь к файлу .geojson, последовательности features, GeoParquet или FlatGeobuf.
+
+    Yields:
+        Словари features. Ошибки чтения (FEATURE_READ_ERRORS) пробрасываются при итерации.
+    """
+    extension = os.path.splitext(geojson_path)[1].lower()
+    if is_geojson_seq_path(geojson_path):
+        records = resolve_incremental_records(read_geojson_seq(geojson_path))
+        yield from (record for record in records if record.get("type") == "Feature")
+    elif extension in OUTPUT_FORMAT_EXTENSIONS[OUTPUT_FORMAT_GEOPARQUET]:
+        yield from read_geoparquet_features(geojson_path)
+    elif extension in OUTPUT_FORMAT_EXTENSIONS[OUTPUT_FORMAT_FLATGEOBUF]:
+        yield from read_flatgeobuf(geojson_path)
+    else:
+        # Потоковый разбор: заодно CRS устаревшего члена "crs" переносится в геометрии
+        yield from read_geojson_features(geojson_path)
+
+def load_feature_collection(geojson_path: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Загружает все features файла в список (iter_feature_collection).
+
+    Нужна только потребителям с произвольным доступом к features; тем, кто их
+    просто перебирает, достаточно iter_feature_collection.
+
+    Args:
+        geojson_path: Путь к файлу .geojson, последовательности features, GeoParquet или FlatGeobuf.
+
+    Returns:
+        Список features или None, если файл не удалось прочитать
+        или он не является FeatureCollection.
+    """
+    try:
+        return list(iter_feature_collection(geojson_path))
+    except FEATURE_READ_ERRORS as e:
+        logger.error(f"Не удалось прочитать '{geojson_path}': {e}")
+        return None
+
+def load_nspd_features(geojson_path: str) -> Optional[List[NSPDCadastralFeature]]:
+    """
+    Загружает сохраненную выгрузку НСПД (например, "От Зеленограда/Этап 7.*.geojson")
+    и разбирает каждый feature через parse_nspd_feature.
+
+    Args:
+        geojson_path: Путь к файлу .geojson в формате ответа НСПД.
+
+    Returns:
+        Список NSPDCadastralFeature (нераспарсенные features пропускаются)
+        или None, если файл не удалось прочитать.
+    """
+    parsed_features = []
+    try:
+        for feature_dict in iter_feature_collection(geojson_path):
+            parsed = parse_nspd_feature(feature_dict)
+            if parsed:
+                parsed_features.append(parsed)
+            else:
+                logger.warning(f"Не удалось распарсить feature из '{geojson_path}'")
+    except FEATURE_READ_ERRORS as e:
+        logger.error(f"Не удалось прочитать '{geojson_path}': {e}")
+        return None
+    return parsed_features
+
+def is_feature_input_path(path: str) -> bool:
+    """Проверяет по расширению, читается ли файл через iter_feature_collection (GeoJSON, последовательности, GeoParquet, FlatGeobuf)."""
+    extension = os.path.splitext(path)[1].lower()
+    return any(extension in OUTPUT_FORMAT_EXTENSIONS[fmt] for fmt in FEATURE_INPUT_FORMATS)
+
+def _placemark_name(properties: Dict[str, Any]) -> Optional[str]:
+    options = properties.get("options") if isinstance(properties.get("options"), dict) else {}
+    for name in (properties.get("name"), properties.get("kml_name"), properties.get("label"), options.get("cad_num")):
+        if name:
+            return str(name)
+    return None
+
+def load_geojson_placemarks(
+    geojson_path: str,
+    crs_str: str = GEOGRAPHIC_CRS_WGS84
+) -> Optional[Tuple[List[ExtractedPlacemark], np.ndarray]]:
+    """
+    Загружает features файла как Placemark - вход тех же обработки, метрик и наложения, что и KML.
+
+    Имя Placemark берется из properties (name, kml_name, label или кадастровый номер),
+    id - из id feature; geometry_data - исходный словарь геометрии, raw_kml_placemark_obj -
+    сам feature (его properties переносятся в результат обработки). Геометрии
+    переводятся в crs_str из CRS члена "crs" (без него - WGS84), группами по исходной CRS.
+
+    Args:
+        geojson_path: Путь к файлу, читаемому iter_feature_collection.
+        crs_str: CRS возвращаемых геометрий; для обработки KML-конвейером - WGS84.
+
+    Returns:
+        Кортеж (placemarks, geoms): Placemark всех features и массив numpy (dtype=object)
+        их геометрий в crs_str (None - нет геометрии или она не разобрана);
+        None, если файл не удалось прочитать.
+    """
+    placemarks: List[ExtractedPlacemark] = []
+    geom_list: List[Any] = []
+    source_crs_list: List[str] = []
+    try:
+        for index, feature in enumerate(iter_feature_collection(geojson_path)):
+            geometry = feature.get("geometry")
+            properties = feature.get("properties") or {}
+            placemarks.append(ExtractedPlacemark(
+                name=_placemark_name(properties),
+                id=str(feature["id"]) if feature.get("id") is not None else properties.get("kml_id"),
+                geometry_type=geometry.get("type", "Unknown") if isinstance(geometry, dict) else "Unknown",
+                geometry_data=geometry,
+                raw_kml_placemark_obj=feature
+            ))
+            source_crs_list.append(geojson_geometry_crs(geometry) or GEOGRAPHIC_CRS_WGS84)
+            try:
+                geom_list.append(shape(geometry) if geometry else None)
+            except (ValueError, TypeError, AttributeError, IndexError) as e:
+                logger.warning(f"Не удалось разобрать геометрию feature {index + 1} из '{geojson_path}': {e}")
+                geom_list.append(None)
+    except FEATURE_READ_ERRORS as e:
+        logger.error(f"Не удалось прочитать '{geojson_path}': {e}")
+        return None
+
+    geoms = np.empty(len(geom_list), dtype=object)
+    geoms[:] = geom_list
+    source_crs = np.array(source_crs_list, dtype=object)
+    # Перепроецирование группами, по одному вызову на исходную CRS
+    for source_crs_str in set(source_crs_list) - {crs_str}:
+        mask = source_crs == source_crs_str
+        geoms[mask] = reproject_geometries(geoms[mask], source_crs_str, crs_str)
+    return placemarks, geoms
+
+class GeoJSONFeatureWriter:
+    """
+    Потоково записывает GeoJSON FeatureCollection: features сериализуются и пишутся
+    в файл по одному, поэтому память не зависит от их количества.
+
+    Вывод побайтно совпадает с save_geojson_feature_collection при тех же indent,
+    coordinate_precision и json_backend.
+
+    Пример:
+        with GeoJSONFeatureWriter("out.geojson", indent=2) as writer:
+            for feature in features:
+                writer.write(feature)
+    """
+
+    def __init__(
+        self,
+        output_filepath: str,
+        indent: Optional[Union[int, str]] = 2,
+        coordinate_precision: Optional[int] = DEFAULT_PRECISION,
+        json_backend: Optional[str] = None
+    ):
+        self.output_filepath = output_filepath
+        self.indent = indent
+        self.coordinate_precision = coordinate_precision
+        self.json_backend = json_backend
+        self.count = 0
+        self._file: Optional[TextIO] = None
+        # Префикс строк feature: уровень вложенности 2 (коллекция -> массив features)
+        indent_str = " " * indent if isinstance(indent, int) else indent
+        self._inner_prefix = indent_str
+        self._item_prefix = indent_str * 2 if indent_str is not None else None
+
+    def open(self) -> "GeoJSONFeatureWriter":
+        """Открывает файл и пишет начало FeatureCollection. Ошибки открытия (IOError) пробрасываются."""
+        self._file = open(self.output_filepath, 'w', encoding='utf-8')
+        if self.indent is None:
+            self._file.write('{"type":"FeatureCollection","features":[')
+        else:
+            self._file.write(f'{{\n{self._inner_prefix}"type": "FeatureCollection",\n{self._inner_prefix}"features": [')
+        return self
+
+    def write(self, feature: Dict[str, Any]) -> None:
+        """Дописывает один feature (разделитель ставится перед каждым, кроме первого)."""
+        self._write_text(dumps_json(round_feature_coordinates(feature, self.coordinate_precision),
+                                    indent=self.indent, backend=self.json_backend))
+
+    def write_batch(self, batch: FeatureBatch) -> None:
+        """Дописывает пакет features; компактный JSON берется из пакета (общий с GeoJSONSeqWriter)."""
+        if self.indent is not None:
+            for feature in batch.features:
+                self.write(feature)
+            return
+        for text in batch.json_texts(self.coordinate_precision, self.json_backend):
+            self._write_text(text)
+
+    def _write_text(self, text: str) -> None:
+        if self.indent is None:
+            self._file.write("," if self.count else "")
+            self._file.write(text)
+        else:
+            # Переводы строк внутри строковых значений JSON экранируются, поэтому
+            # каждый "\n" в выводе - граница строки, и отступ можно добавить заменой
+            self._file.write(",\n" if self.count else "\n")
+            self._file.write(self._item_prefix + text.replace("\n", "\n" + self._item_prefix))
+        self.count += 1
+
+    def close(self) -> None:
+        """Закрывает массив features и объект коллекции, затем файл."""
+        if self._file is None:
+            return
+        try:
+            if self.indent is None:
+                self._file.write("]}")
+            elif self.count:
+                self._file.write(f"\n{self._inner_prefix}]\n}}")
+            else:
+                self._file.write("]\n}") # Пустой массив записывается как "[]"
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "GeoJSONFeatureWriter":
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        elif self._file is not None:
+            # При ошибке коллекция не закрывается: незавершенный файл не примут за полный
+            self._file.close()
+            self._file = None
+
+def write_geojson_features(
+    features: Iterable[Dict[str, Any]],
+    output_filepath: str,
+    indent: Optional[Union[int, str]] = 2,
+    coordinate_precision: Optional[int] = DEFAULT_PRECISION,
+    json_backend: Optional[str] = None
+) -> int:
+    """
+    Потоково записывает итератор features как GeoJSON FeatureCollection.
+
+    Args:
+        features: Итератор словарей GeoJSON Feature (например, генератор).
+        output_filepath: Путь к выходному файлу .geojson.
+        indent: Отступ, как в json.dump; None - компактный вывод.
+        coordinate_precision: Знаков после запятой в координатах; None - без округления.
+        json_backend: Имя кодировщика JSON (см. scripts.json_encoding).
+
+    Returns:
+        Количество записанных features. Ошибки записи (IOError) пробрасываются.
+    """
+    with GeoJSONFeatureWriter(output_filepath, indent=indent, coordinate_precision=coordinate_precision,
+                              json_backend=json_backend) as writer:
+        for feature in features:
+            writer.write(feature)
+    return writer.count
+
+def is_geojson_seq_path(path: str) -> bool:
+    """Проверяет по расширению, является ли файл последовательностью GeoJSON (RFC 8142 или NDJSON)."""
+    extension = os.path.splitext(path)[1].lower()
+    return any(extension in OUTPUT_FORMAT_EXTENSIONS[fmt] for fmt in SEQUENCE_OUTPUT_FORMATS)
+
+class GeoJSONSeqWriter:
+    """
+    Записывает features последовательностью GeoJSON: по одному компактному
+    feature в строке. С record_separator=True - GeoJSON Text Sequence (RFC 8142,
+    каждая запись начинается с RS), иначе - NDJSON.
+
+    Каждая запись самодостаточна, поэтому файл можно дописывать (append=True)
+    по мере получения результатов, склеивать части из разных процессов и
+    просматривать head/grep без разбора всего файла. Интерфейс совпадает с
+    GeoJSONFeatureWriter.
+
+    С incremental=True файл становится журналом изменений: новый набор features
+    сравнивается с текущим состоянием файла по ключу (feature_identity_key) и
+    хэшу содержимого, дописываются только новые и измененные features (с членом
+    "feature_key"), а для отсутствующих в наборе - записи-tombstone
+    ("deleted": true). Текущее состояние восстанавливает iter_feature_collection;
+    итог записи - в атрибуте stats.
+    """
+
+    def __init__(
+        self,
+        output_filepath: str,
+        record_separator: bool = True,
+        append: bool = False,
+        coordinate_precision: Optional[int] = DEFAULT_PRECISION,
+        json_backend: Optional[str] = None,
+        incremental: bool = False
+    ):
+        if append and incremental:
+            raise ValueError("Дозапись (append) и инкрементальная запись (incremental) несовместимы")
+        self.output_filepath = output_filepath
+        self.record_separator = record_separator
+        self.append = append
+        self.incremental = incremental
+        self.coordinate_precision = coordinate_precision
+        self.json_backend = json_backend
+        self.count = 0
+        self.stats = IncrementalWriteStats()
+        self._file: Optional[TextIO] = None
+        self._prefix = RECORD_SEPARATOR if record_separator else ""
+        self._stored: Dict[str, str] = {} # Ключ -> хэш текущих features файла
+        self._seen: Set[str] = set()
+
+    def open(self) -> "GeoJSONSeqWriter":
+        """Открывает файл (на дозапись при append/incremental). Ошибки открытия (IOError) пробрасываются."""
+        if self.incremental and os.path.exists(self.output_filepath):
+            for record in resolve_incremental_records(read_geojson_seq(self.output_filepath)):
+                if record.get("type") == "Feature":
+                    self._stored[feature_identity_key(record)] = feature_content_hash(record)
+        self._file = open(self.output_filepath, 'a' if self.append or self.incremental else 'w', encoding='utf-8')
+        return self
+
+    def write(self, feature: Dict[str, Any]) -> None:
+        """Дописывает одну запись (с incremental=True - только если feature новый или изменился)."""
+        self.count += 1
+        feature = round_feature_coordinates(feature, self.coordinate_precision)
+        if self.incremental:
+            feature = self._changed_record(feature)
+            if feature is None:
+                return
+        self._file.write(self._prefix + dumps_json(feature, backend=self.json_backend) + "\n")
+
+    def _changed_record(self, feature: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # Хэш считается по округленным координатам - так же, как по записанному в файл feature
+        key = feature_identity_key(feature)
+        content_hash = feature_content_hash(feature)
+        self._seen.add(key)
+        stored = self._stored.get(key)
+        if stored == content_hash:
+            self.stats.unchanged += 1
+            return None
+        if stored is None:
+            self.stats.inserted += 1
+        else:
+            self.stats.updated += 1
+        self._stored[key] = content_hash
+        return {**feature, FEATURE_KEY_MEMBER: key}
+
+    def write_batch(self, batch: FeatureBatch) -> None:
+        """Дописывает пакет features одной записью в файл; JSON берется из пакета."""
+        if self.incremental:
+            for feature in batch.features:
+                self.write(feature)
+            return
+        texts = batch.json_texts(self.coordinate_precision, self.json_backend)
+        self._file.write("".join(self._prefix + text + "\n" for text in texts))
+        self.count += len(texts)
+
+    def close(self) -> None:
+        """Дописывает tombstone отсутствующих features (incremental) и закрывает файл."""
+        if self._file is None:
+            return
+        try:
+            if self.incremental:
+                removed = [key for key in self._stored if key not in self._seen]
+                self._file.write("".join(
+                    self._prefix + dumps_json({"type": "Feature", "geometry": None, "properties": None,
+                                               FEATURE_KEY_MEMBER: key, TOMBSTONE_MEMBER: True},
+                                              backend=self.json_backend) + "\n"
+                    for key in removed
+                ))
+                self.stats.deleted += len(removed)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "GeoJSONSeqWriter":
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # Записанные до ошибки записи остаются валидными - файл просто закрывается
+        self.close()
+
+def create_feature_writer(
+    output_filepath: str,
+    output_format: str = OUTPUT_FORMAT_GEOJSON,
+    indent: Optional[Union[int, str]] = 2,
+    append: bool = False,
+    coordinate_precision: Optional[int] = DEFAULT_PRECISION,
+    json_backend: Optional[str] = None,
+    layer: str = SQLITE_LAYER_PARCELS,
+    csv_columns: Optional[Sequence[str]] = None,
+    csv_geometry_mode: str = CSV_GEOMETRY_WKT,
+    incremental: bool = False
+) -> Union[GeoJSONFeatureWriter, GeoJSONSeqWriter, SQLiteFeatureWriter, CSVFeatureWriter, GeoParquetFeatureWriter,
+           FlatGeobufFeatureWriter]:
+    """
+    Создает (не открывая) потоковый писатель features для формата output_format.
+
+    Args:
+        output_filepath: Путь к выходному файлу.
+        output_format: Один из OUTPUT_FORMATS.
+        indent: Отступ FeatureCollection; для остальных форматов не используется.
+        append: Дописывать в существующий файл (APPENDABLE_OUTPUT_FORMATS);
+            для SQLite без append слой очищается, остальные слои файла сохраняются.
+        coordinate_precision: Знаков после запятой в координатах; None - без округления.
+            SQLite, GeoParquet и FlatGeobuf хранят двоичную геометрию и координаты не округляют,
+            CSV округляет по CRS геометрии.
+        json_backend: Имя кодировщика JSON (см. scripts.json_encoding).
+        layer: Слой (таблица) для формата SQLite; для FlatGeobuf - имя слоя в заголовке.
+        csv_columns: Колонки атрибутов CSV (по умолчанию - поля участка НСПД, CSV_NSPD_COLUMNS).
+        csv_geometry_mode: Режим геометрии CSV (CSV_GEOMETRY_MODES).
+        incremental: Записать только изменения относительно файла (INCREMENTAL_OUTPUT_FORMATS):
+            новые и измененные features и tombstone удаленных.
+
+    Returns:
+        GeoJSONFeatureWriter, GeoJSONSeqWriter, SQLiteFeatureWriter, CSVFeatureWriter,
+        GeoParquetFeatureWriter (без pyarrow - ImportError) или FlatGeobufFeatureWriter.
+    """
+    if append and output_format not in APPENDABLE_OUTPUT_FORMATS:
+        raise ValueError(f"Дозапись поддерживается только для форматов: {', '.join(APPENDABLE_OUTPUT_FORMATS)}")
+    if incremental and output_format not in INCREMENTAL_OUTPUT_FORMATS:
+        raise ValueError(f"Инкрементальная запись поддерживается только для форматов: {', '.join(INCREMENTAL_OUTPUT_FORMATS)}")
+    if output_format == OUTPUT_FORMAT_GEOJSON:
+        return GeoJSONFeatureWriter(output_filepath, indent=indent, coordinate_precision=coordinate_precision,
+                                    json_backend=json_backend)
+    if output_format in SEQUENCE_OUTPUT_FORMATS:
+        return GeoJSONSeqWriter(output_filepath, record_separator=output_format == OUTPUT_FORMAT_GEOJSONSEQ,
+                                append=append, coordinate_precision=coordinate_precision, json_backend=json_backend,
+                                incremental=incremental)
+    if output_format == OUTPUT_FORMAT_SQLITE:
+        return SQLiteFeatureWriter(output_filepath, layer=layer, append=append, json_backend=json_backend,
+                                   incremental=incremental)
+    if output_format == OUTPUT_FORMAT_CSV:
+        return CSVFeatureWriter(output_filepath, columns=csv_columns, geometry_mode=csv_geometry_mode, append=append)
+    if output_format == OUTPUT_FORMAT_GEOPARQUET:
+        return GeoParquetFeatureWriter(output_filepath, json_backend=json_backend)
+    if output_format == OUTPUT_FORMAT_FLATGEOBUF:
+        return FlatGeobufFeatureWriter(output_filepath, name=layer, json_backend=json_backend)
+    raise ValueError(f"Неизвестный формат вывода: '{output_format}'. Доступны: {', '.join(OUTPUT_FORMATS)}")
+
+def output_paths_for_formats(output_filepath: str, output_formats: Sequence[str]) -> List[str]:
+    """
+    Пути выходных файлов для записи одного потока features в несколько форматов.
+
+    Единственный формат пишется в output_filepath как есть. При нескольких
+    форматах путь сохраняется для формата, которому подходит его расширение,
+    а остальные файлы создаются рядом с расширением своего формата
+    ("out.geojson" + csv -> "out.geojson", "out.csv").
+    """
+    if len(output_formats) == 1:
+        return [output_filepath]
+    base, extension = os.path.splitext(output_filepath)
+    return [
+        output_filepath if extension.lower() in OUTPUT_FORMAT_EXTENSIONS[fmt] else base + OUTPUT_FORMAT_EXTENSIONS[fmt][0]
+        for fmt in output_formats
+    ]
+
+def _parse_seq_record(text: str, geojson_path: str, line_no: int) -> Optional[Dict[str, Any]]:
+    text = text.strip()
+    if not text:
+        return None
+    try:
+        record = json.loads(text)
+    except ValueError as e:
+        # RFC 8142: усеченная или поврежденная запись пропускается, чтение продолжается
+        logger.warning(f"Пропущена некорректная запись в '{geojson_path}' (строка {line_no}): {e}")
+        return None
+    if not isinstance(record, dict):
+        logger.warning(f"Пропущена запись, не являющаяся объектом GeoJSON, в '{geojson_path}' (строка {line_no})")
+        return None
+    return record
+
+def read_geojson_seq(geojson_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Потоково читает последовательность GeoJSON: RFC 8142 (записи с префиксом RS)
+    или NDJSON (по записи в строке). Режим определяется по первой непустой строке.
+
+    В режиме RFC 8142 запись продолжается до следующего RS, поэтому допускаются
+    записи на нескольких строках. Некорректные записи пропускаются с предупреждением.
+
+    Args:
+        geojson_path: Путь к файлу последовательности.
+
+    Yields:
+        Словари записей (обычно GeoJSON Feature). Ошибки открытия (IOError) пробрасываются.
+    """
+    with open(geojson_path, 'r', encoding='utf-8') as f:
+        rs_mode = None
+        record_lines: List[str] = []
+        record_line_no = 0
+        for line_no, line in enumerate(f, 1):
+            if rs_mode is None:
+                if not line.strip():
+                    continue
+                rs_mode = line.startswith(RECORD_SEPARATOR)
+            if not rs_mode:
+                record = _parse_seq_record(line, geojson_path, line_no)
+                if record is not None:
+                    yield record
+                continue
+            # Запись заканчивается перед следующим RS, где бы он ни стоял в строке
+            parts = line.split(RECORD_SEPARATOR)
+            record_lines.append(parts[0])
+            for part in parts[1:]:
+                record = _parse_seq_record("".join(record_lines), geojson_path, record_line_no)
+                if record is not None:
+                    yield record
+                record_lines = [part]
+                record_line_no = line_no
+        if rs_mode:
+            record = _parse_seq_record("".join(record_lines), geojson_path, record_line_no)
+            if record is not None:
+                yield record
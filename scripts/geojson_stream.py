@@ -0,0 +1,223 @@
+import codecs
+import json
+import logging
+from typing import Any, Dict, Iterator, Optional, TextIO, Tuple
+
+from scripts.geometry_processing import GEOGRAPHIC_CRS_WGS84, geojson_geometry_crs
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+DEFAULT_STREAM_CHUNK_SIZE = 1 << 16 # Символов, читаемых из файла за раз
+
+# Устаревшие (GeoJSON 2008) имена CRS в виде URN -> имена, принятые в проекте
+_LEGACY_CRS_PREFIX = "urn:ogc:def:crs:"
+_LEGACY_WGS84_NAMES = {"urn:ogc:def:crs:OGC:1.3:CRS84", "urn:ogc:def:crs:OGC::CRS84", "CRS84"}
+
+def legacy_crs_name(crs: Any) -> Optional[str]:
+    """
+    Имя CRS из устаревшего члена "crs" (GeoJSON 2008): {"type": "name", "properties": {"name": ...}}.
+
+    URN приводятся к виду "EPSG:<код>" ("urn:ogc:def:crs:EPSG::3857" -> "EPSG:3857"),
+    CRS84 - к GEOGRAPHIC_CRS_WGS84. Для отсутствующего члена и CRS по ссылке ("link") - None.
+    """
+    if not isinstance(crs, dict) or crs.get("type") != "name":
+        return None
+    name = (crs.get("properties") or {}).get("name")
+    if not isinstance(name, str):
+        return None
+    if name in _LEGACY_WGS84_NAMES:
+        return GEOGRAPHIC_CRS_WGS84
+    if name.startswith(_LEGACY_CRS_PREFIX):
+        # urn:ogc:def:crs:EPSG:<версия>:<код>
+        parts = name[len(_LEGACY_CRS_PREFIX):].split(":")
+        if len(parts) == 3 and parts[0] == "EPSG":
+            return f"EPSG:{parts[2]}"
+    return name
+
+def _with_geometry_crs(feature: Dict[str, Any], collection_crs: Optional[str]) -> Dict[str, Any]:
+    # CRS feature (член "crs" самого feature или коллекции) переносится в член "crs" геометрии,
+    # где ее ищут остальные модули (как в ответах НСПД); WGS84 - CRS по умолчанию, ее не указываем
+    geometry = feature.get("geometry")
+    if not isinstance(geometry, dict):
+        return feature
+    crs_str = legacy_crs_name(geometry.get("crs")) or legacy_crs_name(feature.get("crs")) or collection_crs
+    if crs_str is None or crs_str == geojson_geometry_crs(geometry):
+        return feature
+    geometry = {k: v for k, v in geometry.items() if k != "crs"}
+    if crs_str != GEOGRAPHIC_CRS_WGS84:
+        geometry["crs"] = {"type": "name", "properties": {"name": crs_str}}
+    return dict(feature, geometry=geometry)
+
+class _JSONStream:
+    """
+    Последовательное чтение значений JSON из текстового файла с буфером ограниченного размера.
+
+    Если задан start_bytes, поток считает смещение текущей позиции в байтах UTF-8
+    (start_bytes - байты до начала текста, например BOM) - см. byte_offset.
+    """
+
+    def __init__(self, file: TextIO, chunk_size: int, start_bytes: Optional[int] = None):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        self._track_bytes = start_bytes is not None
+        self._mark = 0 # Позиция в буфере, до которой байты уже посчитаны
+        self._mark_bytes = start_bytes or 0
+
+    def _read_more(self, size: int) -> bool:
+        if self._eof:
+            return False
+        chunk = self._file.read(size)
+        if not chunk:
+            self._eof = True
+            return False
+        if self._track_bytes:
+            self.byte_offset()
+        # Прочитанная часть буфера отбрасывается
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        self._mark = 0
+        return True
+
+    def byte_offset(self) -> int:
+        """Смещение текущей позиции от начала файла в байтах (кодируется только текст после прошлого вызова)."""
+        self._mark_bytes += len(self._buffer[self._mark:self._pos].encode('utf-8'))
+        self._mark = self._pos
+        return self._mark_bytes
+
+    def next_char(self) -> str:
+        """Возвращает и пропускает следующий непробельный символ ('' - конец файла)."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                self._pos += 1
+                return self._buffer[self._pos - 1]
+            if not self._read_more(self._chunk_size):
+                return ""
+
+    def peek_char(self) -> str:
+        char = self.next_char()
+        if char:
+            self._pos -= 1
+        return char
+
+    def expect(self, expected: str) -> None:
+        char = self.next_char()
+        if char != expected:
+            raise ValueError(f"Ожидался символ '{expected}', получен '{char or 'конец файла'}'")
+
+    def value(self) -> Any:
+        """Разбирает следующее значение JSON целиком."""
+        self.peek_char()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # Значение у конца буфера может быть неполным (число "12" из "125")
+                if end < len(self._buffer) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # Буфер растет не меньше чем вдвое: большой feature разбирается за линейное время;
+            # в конце файла следующая попытка вернет значение или ошибку
+            self._read_more(max(self._chunk_size, len(self._buffer) - self._pos))
+
+def read_geojson_features(geojson_path: str, chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Потоково читает features из GeoJSON FeatureCollection, не загружая файл целиком.
+
+    В памяти держится только текущий feature и буфер чтения, поэтому большие
+    выгрузки (файлы этапов, 1.geojson) обрабатываются по одному feature.
+    Поддерживается устаревший член "crs" (GeoJSON 2008) у коллекции или feature:
+    его CRS переносится в член "crs" геометрии, как в ответах НСПД (см.
+    geojson_geometry_crs), URN приводятся к виду "EPSG:<код>" (legacy_crs_name).
+    Член "crs" коллекции действует на features после него; обычно он стоит перед "features".
+
+    Args:
+        geojson_path: Путь к файлу FeatureCollection.
+        chunk_size: Символов, читаемых из файла за раз.
+
+    Yields:
+        Словари GeoJSON Feature. Ошибки открытия (IOError) пробрасываются;
+        некорректный JSON и файл, не являющийся FeatureCollection, - ValueError.
+    """
+    for feature, _, _ in _read_feature_collection(geojson_path, chunk_size, spans=False):
+        yield feature
+
+def read_geojson_feature_spans(
+    geojson_path: str,
+    chunk_size: int = DEFAULT_STREAM_CHUNK_SIZE
+) -> Iterator[Tuple[Dict[str, Any], int, int]]:
+    """
+    Потоково читает features, как read_geojson_features, и для каждого выдает его
+    положение в файле: смещение и длину исходного текста feature в байтах. По ним
+    индексы (spatial_index, cadastral_index) потом читают один feature с диска.
+
+    Yields:
+        (feature, смещение, длина); CRS перенесена в геометрию, как в read_geojson_features.
+    """
+    return _read_feature_collection(geojson_path, chunk_size, spans=True)
+
+def _read_feature_collection(
+    geojson_path: str,
+    chunk_size: int,
+    spans: bool
+) -> Iterator[Tuple[Dict[str, Any], Optional[int], Optional[int]]]:
+    start_bytes = None
+    if spans:
+        with open(geojson_path, 'rb') as f:
+            start_bytes = len(codecs.BOM_UTF8) if f.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8 else 0
+    with open(geojson_path, 'r', encoding='utf-8-sig') as f:
+        stream = _JSONStream(f, chunk_size, start_bytes)
+        stream.expect("{")
+        collection_type = None
+        collection_crs = None
+        yielded = 0
+        while stream.peek_char() != "}":
+            key = stream.value()
+            stream.expect(":")
+            if key == "features":
+                stream.expect("[")
+                if stream.peek_char() == "]":
+                    stream.next_char()
+                else:
+                    while True:
+                        if spans:
+                            stream.peek_char()
+                            start = stream.byte_offset()
+                        feature = stream.value()
+                        if isinstance(feature, dict):
+                            feature = _with_geometry_crs(feature, collection_crs)
+                            if spans:
+                                yield feature, start, stream.byte_offset() - start
+                            else:
+                                yield feature, None, None
+                            yielded += 1
+                        separator = stream.next_char()
+                        if separator == "]":
+                            break
+                        if separator != ",":
+                            raise ValueError(f"Ожидался символ ',' или ']' в массиве features, получен '{separator or 'конец файла'}'")
+            else:
+                value = stream.value()
+                if key == "type":
+                    collection_type = value
+                    if value != "FeatureCollection":
+                        raise ValueError(f"Файл '{geojson_path}' не является GeoJSON FeatureCollection")
+                elif key == "crs":
+                    collection_crs = legacy_crs_name(value)
+                    if yielded and collection_crs:
+                        logger.warning(f"Член crs в '{geojson_path}' стоит после features и к ним не применен")
+            separator = stream.next_char()
+            if separator == "}":
+                break
+            if separator != ",":
+                raise ValueError(f"Ожидался символ ',' или '}}' в FeatureCollection, получен '{separator or 'конец файла'}'")
+        if collection_type != "FeatureCollection":
+            raise ValueError(f"Файл '{geojson_path}' не является GeoJSON FeatureCollection")
@@ -1,10 +1,11 @@
-from typing import List, Tuple, Optional, Union, Any, Dict
+from typing import List, Tuple, Optional, Union, Any, Dict, Sequence
+from functools import lru_cache
+import numpy as np
+import shapely
 from shapely.geometry import Point, LineString, LinearRing, Polygon, MultiPoint, MultiLineString, MultiPolygon, GeometryCollection
 from shapely.geometry.base import BaseGeometry
-from shapely.ops import transform as shapely_transform
 from shapely.geometry import mapping
-from pyproj import CRS, Transformer
-import json
+from pyproj import CRS, Transformer, Geod
 
 # Изменяем на абсолютный импорт от корня проекта
 from scripts.data_structures import (
@@ -12,12 +13,15 @@ from scripts.data_structures import (
     PolygonGeom as KmlPolygon, MultiGeometryGeom as KmlMultiGeometry, ExtractedPlacemark, 
     SubGeometryData,
     # Добавляем датакласс для геометрии НСПД
-    NSPDCadastralObjectGeometry 
+    NSPDCadastralObjectGeometry,
+    GeometryMetrics,
+    ValidityResult
 )
+from scripts.json_encoding import dumps_json, round_feature_coordinates
 
 DEFAULT_PRECISION = 6 # Количество знаков после запятой для округления координат
 
-def parse_coordinate_string(coord_str: str, precision: int = DEFAULT_PRECISION) -> List[Tuple[float, ...]]:
+def parse_coordinate_string(coord_str: str, precision: Optional[int] = DEFAULT_PRECISION) -> List[Tuple[float, ...]]:
     """
     Парсит строку координат KML в список кортежей чисел (float).
     Поддерживает 2D (x,y) и 3D (x,y,z) координаты.
@@ -31,6 +35,8 @@ def parse_coordinate_string(coord_str: str, precision: int = DEFAULT_PRECISION)
         coord_str: Строка с координатами, разделенными пробелами.
                      Каждая координата - это x,y[,z], разделенные запятыми.
         precision: Количество знаков после запятой для округления.
+                   None - без округления (точность затем задается для всего
+                   массива геометрий через apply_precision).
 
     Returns:
         Список кортежей с числовыми координатами.
@@ -41,6 +47,8 @@ def parse_coordinate_string(coord_str: str, precision: int = DEFAULT_PRECISION)
 
     numeric_coords_list = []
     parts = coord_str.strip().split()
+    # round(x, None) вернул бы int, поэтому без округления используем тождественную функцию
+    rnd = (lambda v: round(v, precision)) if precision is not None else (lambda v: v)
 
     for part in parts:
         if not part.strip(): # Пропускаем пустые части, если они есть (например, из-за двойных пробелов)
@@ -48,16 +56,16 @@ def parse_coordinate_string(coord_str: str, precision: int = DEFAULT_PRECISION)
         coords = part.split(',')
         try:
             if len(coords) == 2:
-                x = round(float(coords[0]), precision)
-                y = round(float(coords[1]), precision)
+                x = rnd(float(coords[0]))
+                y = rnd(float(coords[1]))
                 numeric_coords_list.append((x, y))
             elif len(coords) == 3:
-                x = round(float(coords[0]), precision)
-                y = round(float(coords[1]), precision)
+                x = rnd(float(coords[0]))
+                y = rnd(float(coords[1]))
                 z_str = coords[2].strip()
                 # Обработка случая, когда z может быть пустой строкой (например, "x,y,")
                 # или содержать нечисловое значение после попытки парсинга в float
-                z = round(float(z_str), precision) if z_str else 0.0 # или None, если предпочтительнее
+                z = rnd(float(z_str)) if z_str else 0.0 # или None, если предпочтительнее
                 numeric_coords_list.append((x, y, z))
             else:
                 # Некорректное количество компонентов в координате
@@ -71,14 +79,14 @@ def parse_coordinate_string(coord_str: str, precision: int = DEFAULT_PRECISION)
             
     return numeric_coords_list
 
-def kml_placemark_to_shapely(kml_placemark: ExtractedPlacemark, precision: int = DEFAULT_PRECISION) -> Optional[Union[Point, LineString, Polygon, MultiPoint, MultiLineString, MultiPolygon, GeometryCollection]]:
+def kml_placemark_to_shapely(kml_placemark: ExtractedPlacemark, precision: Optional[int] = DEFAULT_PRECISION) -> Optional[Union[Point, LineString, Polygon, MultiPoint, MultiLineString, MultiPolygon, GeometryCollection]]:
     """
     Конвертирует объект ExtractedPlacemark (содержащий геометрию KML) 
     в соответствующий объект Shapely.
 
     Args:
         kml_placemark: Объект ExtractedPlacemark.
-        precision: Точность для парсинга координат.
+        precision: Точность для парсинга координат (None - без округления).
 
     Returns:
         Объект Shapely или None, если геометрия отсутствует или не может быть сконвертирована.
@@ -165,6 +173,16 @@ def kml_placemark_to_shapely(kml_placemark: ExtractedPlacemark, precision: int =
         # traceback.print_exc()
         return None
 
+def geojson_geometry_crs(geometry: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Возвращает имя CRS из члена "crs" словаря GeoJSON-геометрии, как в ответах НСПД:
+    {"type": "name", "properties": {"name": "EPSG:3857"}}. None, если член не задан.
+    """
+    crs = (geometry or {}).get("crs")
+    if isinstance(crs, dict):
+        return (crs.get("properties") or {}).get("name")
+    return None
+
 def nspd_geometry_to_shapely(nspd_geom_data: Optional[NSPDCadastralObjectGeometry]) -> Optional[BaseGeometry]:
     """
     Конвертирует объект NSPDCadastralObjectGeometry (из ответа API НСПД)
@@ -303,6 +321,127 @@ def nspd_geometry_to_shapely(nspd_geom_data: Optional[NSPDCadastralObjectGeometr
 GEOGRAPHIC_CRS_WGS84 = "EPSG:4326"
 DEFAULT_PLANAR_CRS = "EPSG:3857" # Web Mercator
 
+# Шаг сетки точности координат (см. apply_precision)
+GEOGRAPHIC_GRID_SIZE = 10 ** -DEFAULT_PRECISION # Градусы: 1e-6° ≈ 0.1 м
+PROJECTED_PRECISION = 2 # Знаков после запятой для проекционных координат (метры)
+PROJECTED_GRID_SIZE = 10 ** -PROJECTED_PRECISION # Метры (единицы планарной CRS): 1 см
+
+# Идентификаторы типов геометрий shapely.get_type_id
+_POINT_TYPE_IDS = (0, 4) # Point, MultiPoint
+_LINEAR_TYPE_IDS = (1, 5) # LineString, MultiLineString
+_POLYGONAL_TYPE_IDS = (3, 6) # Polygon, MultiPolygon
+_COLLECTION_TYPE_ID = 7 # GeometryCollection
+
+@lru_cache(maxsize=64)
+def get_transformer(source_crs_str: str, target_crs_str: str) -> Transformer:
+    """
+    Возвращает Transformer между двумя CRS (always_xy=True).
+    Результат кэшируется: создание Transformer заметно дороже самого преобразования.
+    """
+    return Transformer.from_crs(CRS.from_string(source_crs_str), CRS.from_string(target_crs_str), always_xy=True)
+
+def reproject_geometries(
+    geoms: Union[Optional[BaseGeometry], Sequence[Optional[BaseGeometry]]],
+    source_crs_str: str,
+    target_crs_str: str
+) -> Union[Optional[BaseGeometry], np.ndarray]:
+    """
+    Перепроецирует одну геометрию или массив геометрий одним вызовом pyproj.
+
+    Координаты всех геометрий (вместе с Z) извлекаются shapely.get_coordinates в один массив,
+    преобразуются одним векторизованным вызовом Transformer.transform и
+    возвращаются в геометрии через shapely.set_coordinates. В отличие от
+    shapely.ops.transform, здесь нет обратных вызовов Python для каждой части.
+
+    Args:
+        geoms: Геометрия Shapely (или None) либо последовательность геометрий.
+        source_crs_str: Строка исходной CRS (например, "EPSG:3857").
+        target_crs_str: Строка целевой CRS (например, "EPSG:4326").
+
+    Returns:
+        Перепроецированная геометрия для одиночного входа или массив numpy
+        (dtype=object) того же размера для последовательности. None сохраняются.
+    """
+    single = geoms is None or isinstance(geoms, BaseGeometry)
+    geom_array = np.empty(1 if single else len(geoms), dtype=object)
+    geom_array[:] = [geoms] if single else list(geoms)
+
+    # Z сохраняется: у 2D-геометрий третья колонка - NaN, set_coordinates оставляет их 2D
+    coords = shapely.get_coordinates(geom_array, include_z=True)
+    if len(coords):
+        transformer = get_transformer(source_crs_str, target_crs_str)
+        has_z = ~np.isnan(coords[:, 2])
+        # NaN в z дает NaN и в x/y, поэтому координаты с Z и без Z преобразуются отдельно
+        if has_z.any():
+            coords[has_z, 0], coords[has_z, 1], coords[has_z, 2] = transformer.transform(
+                coords[has_z, 0], coords[has_z, 1], coords[has_z, 2]
+            )
+        if not has_z.all():
+            coords[~has_z, 0], coords[~has_z, 1] = transformer.transform(coords[~has_z, 0], coords[~has_z, 1])
+        # set_coordinates заменяет элементы массива новыми геометриями
+        geom_array = shapely.set_coordinates(geom_array, coords)
+
+    return geom_array[0] if single else geom_array
+
+@lru_cache(maxsize=64)
+def _is_geographic_crs(crs_str: str) -> bool:
+    return CRS.from_user_input(crs_str).is_geographic
+
+def grid_size_for_crs(crs_str: str) -> float:
+    """
+    Возвращает шаг сетки точности для CRS: GEOGRAPHIC_GRID_SIZE для географических
+    (координаты в градусах) и PROJECTED_GRID_SIZE для проекционных (в метрах).
+    """
+    return GEOGRAPHIC_GRID_SIZE if _is_geographic_crs(crs_str) else PROJECTED_GRID_SIZE
+
+def coordinate_precision_for_crs(crs_str: str) -> int:
+    """
+    Возвращает количество знаков после запятой при записи координат в JSON,
+    согласованное с сеткой grid_size_for_crs.
+    """
+    return DEFAULT_PRECISION if _is_geographic_crs(crs_str) else PROJECTED_PRECISION
+
+def apply_precision(
+    geoms: Union[Optional[BaseGeometry], Sequence[Optional[BaseGeometry]]],
+    crs_str: str = GEOGRAPHIC_CRS_WGS84,
+    grid_size: Optional[float] = None
+) -> Union[Optional[BaseGeometry], np.ndarray]:
+    """
+    Привязывает координаты одной геометрии или массива геометрий к сетке точности.
+
+    X/Y округляются одним вызовом shapely.set_precision (mode="pointwise": только
+    округление вершин, топология и валидность не исправляются - это делает
+    check_validity). Сетка сохраняется в геометриях, и GEOS использует ее в
+    последующих операциях наложения. Z, если есть, округляется на ту же сетку
+    векторизованно через массив координат.
+
+    Args:
+        geoms: Геометрия Shapely (или None) либо последовательность геометрий.
+        crs_str: CRS координат; определяет шаг сетки, если grid_size не задан.
+        grid_size: Явный шаг сетки (в единицах CRS).
+
+    Returns:
+        Геометрия для одиночного входа или массив numpy (dtype=object) того же
+        размера для последовательности. None сохраняются.
+    """
+    if grid_size is None:
+        grid_size = grid_size_for_crs(crs_str)
+
+    single = geoms is None or isinstance(geoms, BaseGeometry)
+    geom_array = np.empty(1 if single else len(geoms), dtype=object)
+    geom_array[:] = [geoms] if single else list(geoms)
+
+    has_z = shapely.has_z(geom_array)
+    if has_z.any():
+        # Масштаб вместо деления на шаг - так же, как в GEOS, без артефактов вида 0.30000000000000004
+        scale = 1.0 / grid_size
+        coords = shapely.get_coordinates(geom_array[has_z], include_z=True)
+        coords[:, 2] = np.round(coords[:, 2] * scale) / scale
+        geom_array[has_z] = shapely.set_coordinates(geom_array[has_z], coords)
+
+    geom_array = shapely.set_precision(geom_array, grid_size, mode="pointwise")
+    return geom_array[0] if single else geom_array
+
 def calculate_area(
     shapely_geom: Optional[BaseGeometry],
     source_crs_str: str = GEOGRAPHIC_CRS_WGS84, # Предполагаем, что исходные KML данные в WGS84
@@ -340,13 +479,11 @@ def calculate_area(
             # (Например, если исходная CRS уже планарная и совпадает с целевой)
             # Однако, CRS.equals() может быть строгим. Проще проверить, является ли исходная географической.
             if source_crs.is_geographic:
-                transformer = Transformer.from_crs(source_crs, target_crs, always_xy=True)
-                geom_to_calculate = shapely_transform(transformer.transform, shapely_geom)
+                geom_to_calculate = reproject_geometries(shapely_geom, source_crs_str, target_planar_crs_str)
             elif source_crs.is_projected and not source_crs.equals(target_crs):
                 # Если исходная уже планарная, но не совпадает с целевой
                 print(f"Warning: Source CRS '{source_crs_str}' is projected but does not match target '{target_planar_crs_str}'. Reprojecting.")
-                transformer = Transformer.from_crs(source_crs, target_crs, always_xy=True)
-                geom_to_calculate = shapely_transform(transformer.transform, shapely_geom)
+                geom_to_calculate = reproject_geometries(shapely_geom, source_crs_str, target_planar_crs_str)
             # else: исходная CRS либо уже целевая планарная, либо не географическая и не проекционная (что странно)
             # в этом случае, или если project_to_planar=False, просто используем .area
 
@@ -410,12 +547,10 @@ def calculate_length(
             target_crs = CRS.from_string(target_planar_crs_str)
 
             if source_crs.is_geographic:
-                transformer = Transformer.from_crs(source_crs, target_crs, always_xy=True)
-                geom_to_calculate = shapely_transform(transformer.transform, shapely_geom)
+                geom_to_calculate = reproject_geometries(shapely_geom, source_crs_str, target_planar_crs_str)
             elif source_crs.is_projected and not source_crs.equals(target_crs):
                 print(f"Warning: Source CRS '{source_crs_str}' is projected but does not match target '{target_planar_crs_str}' for length. Reprojecting.")
-                transformer = Transformer.from_crs(source_crs, target_crs, always_xy=True)
-                geom_to_calculate = shapely_transform(transformer.transform, shapely_geom)
+                geom_to_calculate = reproject_geometries(shapely_geom, source_crs_str, target_planar_crs_str)
         except Exception as e:
             print(f"Error during CRS transformation for length calculation: {e}")
             print(f"Calculating length in original CRS '{source_crs_str}' due to transformation error.")
@@ -471,8 +606,7 @@ def calculate_perimeter(
             source_crs = CRS.from_string(source_crs_str)
             target_crs = CRS.from_string(target_planar_crs_str)
             if source_crs != target_crs:
-                transformer = Transformer.from_crs(source_crs, target_crs, always_xy=True)
-                geom_to_calculate = shapely_transform(transformer.transform, shapely_geom)
+                geom_to_calculate = reproject_geometries(shapely_geom, source_crs_str, target_planar_crs_str)
         except Exception as e:
             # print(f"Error transforming geometry for perimeter calculation: {e}")
             return None # Ошибка трансформации
@@ -497,13 +631,351 @@ def calculate_perimeter(
         # print(f"Error calculating perimeter: {e}")
         return None
 
+# Режимы расчета метрик
+METRIC_MODE_PLANAR = "planar" # В планарной CRS (по умолчанию DEFAULT_PLANAR_CRS)
+METRIC_MODE_GEODESIC = "geodesic" # На эллипсоиде GEODESIC_ELLIPSOID
+METRIC_MODE_UTM = "utm" # В зоне UTM, выбранной по центроиду каждой геометрии
+METRIC_MODE_ALBERS = "albers" # В равновеликой проекции Альберса по охвату всего набора
+METRIC_MODES = (METRIC_MODE_PLANAR, METRIC_MODE_GEODESIC, METRIC_MODE_UTM, METRIC_MODE_ALBERS)
+LOCAL_CRS_STRATEGIES = (METRIC_MODE_UTM, METRIC_MODE_ALBERS)
+GEODESIC_ELLIPSOID = "WGS84"
+
+@lru_cache(maxsize=8)
+def _get_geod(ellps: str = GEODESIC_ELLIPSOID) -> Geod:
+    return Geod(ellps=ellps)
+
+def _planar_metric_arrays(geom_array: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Векторизованно считает площади, длины и периметры массива геометрий
+    в их текущей (планарной) CRS. Для None возвращается NaN.
+    """
+    type_ids = shapely.get_type_id(geom_array)
+    areas = shapely.area(geom_array)
+    lengths = shapely.length(geom_array)
+
+    is_polygonal = np.isin(type_ids, _POLYGONAL_TYPE_IDS)
+    perimeters = np.where(is_polygonal, lengths, 0.0)
+    areas = np.where(np.isin(type_ids, _POINT_TYPE_IDS + _LINEAR_TYPE_IDS), 0.0, areas)
+    lengths = np.where(np.isin(type_ids, _POINT_TYPE_IDS) | is_polygonal, 0.0, lengths)
+
+    # Для GeometryCollection учитываем только компоненты подходящего типа
+    # (площадь точек и линий и так равна нулю)
+    for i in np.flatnonzero(type_ids == _COLLECTION_TYPE_ID):
+        parts = shapely.get_parts(geom_array[i])
+        part_types = shapely.get_type_id(parts)
+        part_lengths = shapely.length(parts)
+        lengths[i] = part_lengths[np.isin(part_types, _LINEAR_TYPE_IDS)].sum()
+        perimeters[i] = part_lengths[np.isin(part_types, _POLYGONAL_TYPE_IDS)].sum()
+
+    perimeters[type_ids < 0] = np.nan
+    return areas, lengths, perimeters
+
+def _geodesic_path_lengths(geod: Geod, paths: np.ndarray) -> np.ndarray:
+    """Геодезические длины массива линий/колец в WGS84 одним вызовом Geod.line_lengths."""
+    coords, path_idx = shapely.get_coordinates(paths, return_index=True)
+    if len(coords) < 2:
+        return np.zeros(len(paths))
+    segment_lengths = np.asarray(geod.line_lengths(coords[:, 0], coords[:, 1]))
+    # Отбрасываем "сегменты" между последней точкой одной линии и первой точкой следующей
+    same_path = path_idx[1:] == path_idx[:-1]
+    return np.bincount(path_idx[:-1][same_path], weights=segment_lengths[same_path], minlength=len(paths))
+
+def _ellipsoidal_ring_metrics(geod: Geod, rings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Площади (без знака) и периметры массива колец в WGS84 на эллипсоиде geod.
+
+    Площадь кольца считается Geod.polygon_area_perimeter (геодезические ребра,
+    точная формула на эллипсоиде) - погрешность не растет с размером зоны.
+    Цикл по кольцам здесь необходим: в pyproj нет пакетного аналога
+    Geod.line_lengths для площадей (polygon_area_perimeter принимает один
+    полигон и возвращает только его итог), а точная площадь не раскладывается
+    на независимые величины по ребрам, которые дает Geod.inv. Основное время
+    уходит на сам расчет в PROJ (вызов на всех координатах сразу почти так же
+    долог), поэтому цикл лишь собирает границы колец, посчитанные одним
+    вызовом shapely.get_coordinates, а периметры берутся из того же вызова.
+    """
+    coords, ring_idx = shapely.get_coordinates(rings, return_index=True)
+    areas = np.zeros(len(rings))
+    perimeters = np.zeros(len(rings))
+    # Границы колец в общем массиве координат (ring_idx отсортирован)
+    bounds = np.searchsorted(ring_idx, np.arange(len(rings) + 1)).tolist()
+    for i, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        if end - start >= 3:
+            areas[i], perimeters[i] = geod.polygon_area_perimeter(coords[start:end, 0], coords[start:end, 1])
+    return np.abs(areas), perimeters
+
+def _geodesic_metric_arrays(geom_array: np.ndarray, ellps: str = GEODESIC_ELLIPSOID) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Векторизованно считает площади (кв. м), длины и периметры (м) массива
+    геометрий в WGS84 на эллипсоиде. Все кольца и линии всех геометрий
+    обрабатываются пакетно, без цикла Python по объектам.
+    """
+    geod = _get_geod(ellps)
+    n = len(geom_array)
+    type_ids = shapely.get_type_id(geom_array)
+
+    # Раскладываем Multi* и GeometryCollection (в т.ч. содержащие Multi*) на простые части
+    parts, part_owner = shapely.get_parts(geom_array, return_index=True)
+    parts, sub_owner = shapely.get_parts(parts, return_index=True)
+    part_owner = part_owner[sub_owner]
+    part_types = shapely.get_type_id(parts)
+
+    is_polygon_part = part_types == 3
+    polygons = parts[is_polygon_part]
+    rings, ring_polygon = shapely.get_rings(polygons, return_index=True)
+    ring_owner = part_owner[is_polygon_part][ring_polygon]
+    # Первое кольцо каждого полигона - внешнее, остальные - дырки
+    is_exterior = np.r_[True, ring_polygon[1:] != ring_polygon[:-1]] if len(rings) else np.zeros(0, dtype=bool)
+    ring_areas, ring_lengths = _ellipsoidal_ring_metrics(geod, rings)
+    areas = np.bincount(ring_owner, weights=np.where(is_exterior, ring_areas, -ring_areas), minlength=n).astype(float)
+    perimeters = np.bincount(ring_owner, weights=ring_lengths, minlength=n).astype(float)
+
+    is_line_part = np.isin(part_types, (1, 2)) # LineString, LinearRing
+    line_lengths = _geodesic_path_lengths(geod, parts[is_line_part])
+    lengths = np.bincount(part_owner[is_line_part], weights=line_lengths, minlength=n).astype(float)
+
+    missing = type_ids < 0
+    areas[missing] = lengths[missing] = perimeters[missing] = np.nan
+    return areas, lengths, perimeters
+
+def utm_crs_for_lonlat(lons: Any, lats: Any) -> np.ndarray:
+    """
+    Возвращает строки CRS зон UTM (WGS84, "EPSG:326xx"/"EPSG:327xx")
+    для массивов долгот и широт. Для NaN возвращается None.
+    """
+    lons = np.atleast_1d(np.asarray(lons, dtype=float))
+    lats = np.atleast_1d(np.asarray(lats, dtype=float))
+    result = np.full(len(lons), None, dtype=object)
+    known = ~(np.isnan(lons) | np.isnan(lats))
+    zones = np.clip(np.floor((lons[known] + 180) / 6).astype(int) + 1, 1, 60)
+    codes = np.where(lats[known] >= 0, 32600, 32700) + zones
+    result[known] = [f"EPSG:{code}" for code in codes]
+    return result
+
+def albers_crs_for_bounds(bounds: Tuple[float, float, float, float]) -> str:
+    """
+    Строит равновеликую коническую проекцию Альберса (PROJ-строку) для охвата
+    (min_lon, min_lat, max_lon, max_lat) в WGS84. Стандартные параллели
+    берутся на 1/6 и 5/6 диапазона широт, как принято для таких проекций.
+    """
+    min_lon, min_lat, max_lon, max_lat = bounds
+    lat_span = max_lat - min_lat
+    return (f"+proj=aea +lat_0={(min_lat + max_lat) / 2:.6f} +lon_0={(min_lon + max_lon) / 2:.6f}"
+            f" +lat_1={min_lat + lat_span / 6:.6f} +lat_2={max_lat - lat_span / 6:.6f}"
+            f" +x_0=0 +y_0=0 +ellps=WGS84 +units=m +no_defs")
+
+def select_local_crs(
+    geoms: Sequence[Optional[BaseGeometry]],
+    source_crs_str: str = GEOGRAPHIC_CRS_WGS84,
+    strategy: str = METRIC_MODE_UTM
+) -> np.ndarray:
+    """
+    Подбирает локальную планарную CRS для каждой геометрии массива.
+
+    METRIC_MODE_UTM - зона UTM по центроиду геометрии (соседние объекты обычно
+    попадают в одну зону, что позволяет перепроецировать их одной группой).
+    METRIC_MODE_ALBERS - одна проекция Альберса на охват всего набора.
+
+    Args:
+        geoms: Последовательность геометрий Shapely (допускаются None).
+        source_crs_str: Строка CRS исходных геометрий.
+        strategy: METRIC_MODE_UTM или METRIC_MODE_ALBERS.
+
+    Returns:
+        Массив numpy (dtype=object) строк CRS той же длины; None для пустых геометрий.
+    """
+    if strategy not in LOCAL_CRS_STRATEGIES:
+        raise ValueError(f"Unknown local CRS strategy '{strategy}'. Expected one of: {', '.join(LOCAL_CRS_STRATEGIES)}")
+    geom_array = np.empty(len(geoms), dtype=object)
+    geom_array[:] = list(geoms)
+    is_wgs84 = CRS.from_string(source_crs_str).equals(CRS.from_string(GEOGRAPHIC_CRS_WGS84))
+
+    if strategy == METRIC_MODE_UTM:
+        centroids = shapely.centroid(geom_array)
+        if not is_wgs84:
+            centroids = reproject_geometries(centroids, source_crs_str, GEOGRAPHIC_CRS_WGS84)
+        return utm_crs_for_lonlat(shapely.get_x(centroids), shapely.get_y(centroids))
+
+    result = np.full(len(geom_array), None, dtype=object)
+    present = ~shapely.is_missing(geom_array) & ~shapely.is_empty(geom_array)
+    if not present.any():
+        return result
+    bounds = shapely.total_bounds(geom_array[present])
+    if not is_wgs84:
+        bounds = get_transformer(source_crs_str, GEOGRAPHIC_CRS_WGS84).transform_bounds(*bounds)
+    result[present] = albers_crs_for_bounds(tuple(bounds))
+    return result
+
+def _local_crs_metric_arrays(
+    source_geoms: np.ndarray,
+    source_crs_str: str,
+    strategy: str
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Планарные метрики в локальных CRS: геометрии группируются по выбранной CRS,
+    и каждая группа перепроецируется одним вызовом (Transformer кэшируется).
+    """
+    local_crs = select_local_crs(source_geoms, source_crs_str, strategy)
+    areas = np.full(len(source_geoms), np.nan)
+    lengths = np.full(len(source_geoms), np.nan)
+    perimeters = np.full(len(source_geoms), np.nan)
+    for crs_str in {c for c in local_crs.tolist() if c is not None}:
+        group = local_crs == crs_str
+        planar_geoms = reproject_geometries(source_geoms[group], source_crs_str, crs_str)
+        areas[group], lengths[group], perimeters[group] = _planar_metric_arrays(planar_geoms)
+    return areas, lengths, perimeters
+
+def _nan_to_none(value: float) -> Optional[float]:
+    return None if value != value else value
+
+def calculate_metrics(
+    geoms: Union[Optional[BaseGeometry], Sequence[Optional[BaseGeometry]]],
+    source_crs_str: str = GEOGRAPHIC_CRS_WGS84,
+    project_to_planar: bool = True,
+    target_planar_crs_str: str = DEFAULT_PLANAR_CRS,
+    metric_mode: str = METRIC_MODE_PLANAR,
+    valid_mask: Optional[Any] = None
+) -> Union[GeometryMetrics, List[GeometryMetrics]]:
+    """
+    Вычисляет площадь, длину, периметр, центроид и bbox за одно перепроецирование.
+
+    В отличие от последовательных вызовов calculate_area, calculate_length и
+    calculate_perimeter, каждая геометрия перепроецируется ровно один раз, а метрики
+    для массива геометрий считаются векторизованными функциями Shapely.
+    Правила для отдельных типов геометрий совпадают с этими тремя функциями.
+
+    В режиме METRIC_MODE_GEODESIC геометрии переводятся в WGS84 (если нужно),
+    а площади и длины считаются на эллипсоиде GEODESIC_ELLIPSOID пакетно для всего
+    массива; project_to_planar и target_planar_crs_str при этом не используются.
+    Это устраняет искажение Web Mercator (на широте Москвы площади завышены ~3.2 раза).
+    Режимы METRIC_MODE_UTM и METRIC_MODE_ALBERS дают близкую точность без
+    геодезических вычислений: CRS подбирается функцией select_local_crs.
+
+    Args:
+        geoms: Геометрия Shapely (или None) либо последовательность геометрий.
+        source_crs_str: Строка CRS для исходных геометрий.
+        project_to_planar: Если True, геометрии будут перепроецированы в target_planar_crs_str.
+        target_planar_crs_str: Целевая планарная CRS для вычисления метрик.
+        metric_mode: Один из METRIC_MODES.
+        valid_mask: Заранее известная валидность геометрий (bool или последовательность
+            bool, например из check_validity), чтобы не проверять ее повторно.
+
+    Returns:
+        GeometryMetrics для одиночной геометрии или список GeometryMetrics
+        (в том же порядке) для последовательности. Центроид и bbox возвращаются
+        в исходной CRS; для None все поля равны None.
+    """
+    if metric_mode not in METRIC_MODES:
+        raise ValueError(f"Unknown metric mode '{metric_mode}'. Expected one of: {', '.join(METRIC_MODES)}")
+
+    single = geoms is None or isinstance(geoms, BaseGeometry)
+    source_geoms = np.empty(1 if single else len(geoms), dtype=object)
+    source_geoms[:] = [geoms] if single else list(geoms)
+
+    if metric_mode == METRIC_MODE_GEODESIC:
+        lonlat_geoms = source_geoms
+        if not CRS.from_string(source_crs_str).equals(CRS.from_string(GEOGRAPHIC_CRS_WGS84)):
+            lonlat_geoms = reproject_geometries(source_geoms, source_crs_str, GEOGRAPHIC_CRS_WGS84)
+        areas, lengths, perimeters = _geodesic_metric_arrays(lonlat_geoms)
+    elif metric_mode in LOCAL_CRS_STRATEGIES:
+        areas, lengths, perimeters = _local_crs_metric_arrays(source_geoms, source_crs_str, metric_mode)
+    else:
+        planar_geoms = source_geoms
+        if project_to_planar:
+            try:
+                source_crs = CRS.from_string(source_crs_str)
+                target_crs = CRS.from_string(target_planar_crs_str)
+                if source_crs.is_geographic or not source_crs.equals(target_crs):
+                    planar_geoms = reproject_geometries(source_geoms, source_crs_str, target_planar_crs_str)
+            except Exception as e:
+                print(f"Error during CRS transformation: {e}")
+                print(f"Calculating metrics in original CRS '{source_crs_str}' due to transformation error.")
+                planar_geoms = source_geoms
+        areas, lengths, perimeters = _planar_metric_arrays(planar_geoms)
+
+    # Как и calculate_perimeter, для невалидных геометрий периметр не определен
+    if valid_mask is None:
+        valid_mask = shapely.is_valid(source_geoms)
+    perimeters[~np.atleast_1d(np.asarray(valid_mask, dtype=bool))] = np.nan
+    bounds = shapely.bounds(source_geoms).tolist()
+    centroids = shapely.centroid(source_geoms)
+    centroid_x = shapely.get_x(centroids).tolist()
+    centroid_y = shapely.get_y(centroids).tolist()
+
+    results = []
+    for geom, area, length, perimeter, bbox, cx, cy in zip(
+            source_geoms, areas.tolist(), lengths.tolist(), perimeters.tolist(), bounds, centroid_x, centroid_y):
+        if geom is None:
+            results.append(GeometryMetrics())
+            continue
+        results.append(GeometryMetrics(
+            area=_nan_to_none(area),
+            length=_nan_to_none(length),
+            perimeter=_nan_to_none(perimeter),
+            centroid=None if cx != cx or cy != cy else (cx, cy),
+            bbox=None if bbox[0] != bbox[0] else tuple(bbox)
+        ))
+
+    return results[0] if single else results
+
+def check_validity(
+    geoms: Union[Optional[BaseGeometry], Sequence[Optional[BaseGeometry]]],
+    repair: bool = False
+) -> Union[Optional[ValidityResult], List[Optional[ValidityResult]]]:
+    """
+    Проверяет валидность одной геометрии или массива геометрий за один проход GEOS.
+
+    Валидность всего массива определяется векторизованным shapely.is_valid,
+    причина (shapely.is_valid_reason) запрашивается только для невалидных
+    геометрий, а при repair=True они же исправляются одним вызовом shapely.make_valid.
+    Результат передается дальше (в calculate_metrics и create_geojson_feature),
+    чтобы валидность одной и той же геометрии не проверялась повторно.
+
+    Args:
+        geoms: Геометрия Shapely (или None) либо последовательность геометрий.
+        repair: Если True, невалидные геометрии исправляются через make_valid.
+
+    Returns:
+        ValidityResult (или None для None) для одиночной геометрии либо список
+        таких результатов в том же порядке для последовательности.
+    """
+    single = geoms is None or isinstance(geoms, BaseGeometry)
+    geom_array = np.empty(1 if single else len(geoms), dtype=object)
+    geom_array[:] = [geoms] if single else list(geoms)
+
+    is_valid = shapely.is_valid(geom_array)
+    invalid_idx = np.flatnonzero(~is_valid & ~shapely.is_missing(geom_array))
+    reasons = shapely.is_valid_reason(geom_array[invalid_idx]).tolist()
+    repaired = shapely.make_valid(geom_array[invalid_idx]).tolist() if repair else [None] * len(invalid_idx)
+
+    results: List[Optional[ValidityResult]] = [
+        ValidityResult(is_valid=True) if geom is not None else None for geom in geom_array
+    ]
+    for i, reason, repaired_geom in zip(invalid_idx.tolist(), reasons, repaired):
+        results[i] = ValidityResult(is_valid=False, reason=reason, repaired_geometry=repaired_geom)
+
+    return results[0] if single else results
+
+def repair_geometries(geoms: Sequence[Optional[BaseGeometry]]) -> np.ndarray:
+    """
+    Возвращает массив геометрий, где невалидные заменены результатом make_valid.
+    Нужен перед операциями наложения: GEOS завершает их ошибкой на невалидных входах.
+    """
+    geom_array = np.empty(len(geoms), dtype=object)
+    geom_array[:] = list(geoms)
+    for i, validity in enumerate(check_validity(geom_array, repair=True)):
+        if validity is not None and validity.repaired_geometry is not None:
+            geom_array[i] = validity.repaired_geometry
+    return geom_array
+
 def create_geojson_feature(
     placemark_data: ExtractedPlacemark, 
     shapely_geom: Optional[BaseGeometry], 
     area: Optional[float], 
     length: Optional[float], 
     perimeter: Optional[float],
-    precision: int = DEFAULT_PRECISION 
+    precision: int = DEFAULT_PRECISION,
+    validity: Optional[ValidityResult] = None
 ) -> Dict:
     """
     Converts an ExtractedPlacemark and its associated Shapely geometry
@@ -516,27 +988,32 @@ def create_geojson_feature(
         length: Calculated length (in projected units).
         perimeter: Calculated perimeter (in projected units).
         precision: Number of decimal places to round calculated metrics.
+        validity: Precomputed result of check_validity for shapely_geom.
+                  If omitted, validity is checked here. If it carries a repaired
+                  geometry, that geometry is written and marked as "repaired".
 
     Returns:
         A dictionary representing a GeoJSON Feature.
     """
+    if validity is None and shapely_geom is not None:
+        validity = check_validity(shapely_geom)
+
+    output_geom = shapely_geom
+    if validity is not None and validity.repaired_geometry is not None:
+        output_geom = validity.repaired_geometry
+
     properties = {
         "kml_name": placemark_data.name if placemark_data.name else None,
         "kml_id": placemark_data.id if placemark_data.id else None,
         "kml_geometry_type": placemark_data.geometry_type,
-        "shapely_geometry_type": shapely_geom.geom_type if shapely_geom else None,
-        "is_valid": shapely_geom.is_valid if shapely_geom else None,
+        "shapely_geometry_type": output_geom.geom_type if output_geom is not None else None,
+        "is_valid": validity.is_valid if validity is not None else None,
     }
 
-    if shapely_geom and not shapely_geom.is_valid:
-        # Пытаемся получить причину невалидности, если доступно
-        try:
-            from shapely.validation import explain_validity
-            properties["validity_reason"] = explain_validity(shapely_geom)
-        except ImportError: # Для старых версий Shapely, где explain_validity может отсутствовать
-            properties["validity_reason"] = "N/A (explain_validity not available)"
-        except Exception: # На случай других ошибок при вызове explain_validity
-            properties["validity_reason"] = "Error explaining validity"
+    if validity is not None and not validity.is_valid:
+        properties["validity_reason"] = validity.reason
+        if validity.repaired_geometry is not None:
+            properties["repaired"] = True
 
     # Сохраняем метрики, только если они не None и больше 0 (или просто не None для is_valid)
     # Округляем до указанной точности
@@ -560,13 +1037,19 @@ def create_geojson_feature(
 
     feature = {
         "type": "Feature",
-        "geometry": mapping(shapely_geom) if shapely_geom else None,
+        "geometry": mapping(output_geom) if output_geom is not None else None,
         "properties": properties,
     }
     
     return feature
 
-def save_geojson_feature_collection(features: List[Dict], output_filepath: str, indent: Optional[int] = 2) -> bool:
+def save_geojson_feature_collection(
+    features: List[Dict],
+    output_filepath: str,
+    indent: Optional[int] = 2,
+    coordinate_precision: Optional[int] = DEFAULT_PRECISION,
+    json_backend: Optional[str] = None
+) -> bool:
     """
     Saves a list of GeoJSON Feature dictionaries as a FeatureCollection to a .geojson file.
 
@@ -575,6 +1058,11 @@ def save_geojson_feature_collection(features: List[Dict], output_filepath: str,
         output_filepath: The path to the output .geojson file.
         indent: Indentation level for pretty-printing the JSON. 
                 Set to None for a compact output.
+        coordinate_precision: Number of decimal places for geometry coordinates
+                (RFC 7946 output is WGS84, so DEFAULT_PRECISION by default).
+                Set to None to write coordinates as is.
+        json_backend: Name of the JSON encoder (see scripts.json_encoding);
+                orjson is used by default when installed.
 
     Returns:
         True if saving was successful, False otherwise.
@@ -585,14 +1073,14 @@ def save_geojson_feature_collection(features: List[Dict], output_filepath: str,
         # if not output_filepath.lower().endswith(('.geojson', '.json')):
         #     output_filepath += '.geojson'
 
-    feature_collection = {
-        "type": "FeatureCollection",
-        "features": features
-    }
-
     try:
+        feature_collection = {
+            "type": "FeatureCollection",
+            "features": [round_feature_coordinates(feature, coordinate_precision) for feature in features]
+        }
+        text = dumps_json(feature_collection, indent=indent, backend=json_backend)
         with open(output_filepath, 'w', encoding='utf-8') as f:
-            json.dump(feature_collection, f, ensure_ascii=False, indent=indent)
+            f.write(text)
         # print(f"Successfully saved GeoJSON FeatureCollection to: {output_filepath}") # Убрал принт, CLI будет сам сообщать
         return True
     except IOError as e:
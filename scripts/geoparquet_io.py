@@ -0,0 +1,336 @@
+import json
+import logging
+import os
+import typing
+from dataclasses import fields
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import shapely
+from pyproj import CRS
+from shapely.geometry import mapping
+
+from scripts.data_structures import NSPDCadastralObjectOptions
+from scripts.feature_batch import FeatureBatch
+from scripts.geometry_processing import GEOGRAPHIC_CRS_WGS84
+from scripts.json_encoding import dumps_json
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError: # pyarrow - необязательная зависимость, нужна только для GeoParquet
+    pa = ds = pq = None
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+GEOPARQUET_VERSION = "1.1.0"
+DEFAULT_ROW_GROUP_SIZE = 5000 # Строк в группе; по каждой группе Parquet хранит min/max колонок, в т.ч. bbox
+
+def geoparquet_available() -> bool:
+    """Проверяет, установлен ли pyarrow (нужен для записи и чтения GeoParquet)."""
+    return pa is not None
+
+def _require_pyarrow() -> None:
+    if not geoparquet_available():
+        raise ImportError("Для GeoParquet требуется pyarrow: pip install pyarrow")
+
+def _option_arrow_type(field_type: Any) -> "pa.DataType":
+    # Optional[Union[float, str]] - число (строки НСПД приводятся к числу),
+    # Optional[Union[str, List[str]]] - список строк, остальное - строка
+    args = typing.get_args(field_type)
+    if float in args:
+        return pa.float64()
+    if any(typing.get_origin(arg) is list for arg in args):
+        return pa.list_(pa.string())
+    return pa.string()
+
+# Поля NSPDCadastralObjectOptions, которые становятся типизированными колонками
+_OPTION_FIELDS = [f for f in fields(NSPDCadastralObjectOptions) if f.name != "other_options"]
+_OPTION_NAMES = [f.name for f in _OPTION_FIELDS]
+
+def geoparquet_schema() -> "pa.Schema":
+    """
+    Схема таблицы участков: id, типизированные поля NSPDCadastralObjectOptions,
+    other_options и остальные properties (JSON), геометрия (WKB) и bbox.
+    """
+    _require_pyarrow()
+    return pa.schema(
+        [pa.field("id", pa.string())]
+        + [pa.field(f.name, _option_arrow_type(f.type)) for f in _OPTION_FIELDS]
+        + [
+            pa.field("other_options", pa.string()), # JSON полей options, не вошедших в колонки
+            pa.field("properties", pa.string()), # JSON properties без options (label, descr, ...)
+            pa.field("geometry", pa.binary()),
+            # Колонка-покрытие GeoParquet 1.1: статистика min/max ее полей по группам
+            # строк позволяет пропускать группы при отборе по прямоугольнику
+            pa.field("bbox", pa.struct([(name, pa.float64()) for name in ("xmin", "ymin", "xmax", "ymax")])),
+        ]
+    )
+
+def _to_float(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(",", ".").replace(" ", ""))
+    except ValueError:
+        return None
+
+def _option_value(value: Any, arrow_type: "pa.DataType") -> Any:
+    if value is None:
+        return None
+    if arrow_type == pa.float64():
+        return _to_float(value)
+    if pa.types.is_list(arrow_type):
+        return [str(v) for v in value] if isinstance(value, (list, tuple)) else [str(value)]
+    return str(value)
+
+def _crs_projjson(crs_str: str) -> Dict[str, Any]:
+    # Для WGS84 GeoParquet ожидает OGC:CRS84 (порядок осей долгота, широта, как в GeoJSON)
+    return CRS("OGC:CRS84" if crs_str == GEOGRAPHIC_CRS_WGS84 else crs_str).to_json_dict()
+
+class GeoParquetFeatureWriter:
+    """
+    Записывает участки НСПД (GeoJSON Features) в файл GeoParquet.
+
+    Поля NSPDCadastralObjectOptions становятся типизированными колонками, поэтому
+    аналитик может читать только нужные колонки (cad_num, area, ...) и отбирать
+    строки по ним без разбора JSON. Геометрия хранится как WKB в одной CRS
+    (первого feature, остальные перепроецируются), рядом - колонка bbox: по ее
+    статистике читатель пропускает группы строк вне запрошенного прямоугольника.
+    Features копятся до row_group_size и записываются одной группой строк.
+    Интерфейс совпадает с GeoJSONFeatureWriter; дозапись Parquet не поддерживает.
+    """
+
+    def __init__(
+        self,
+        output_filepath: str,
+        crs_str: Optional[str] = None,
+        row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+        json_backend: Optional[str] = None
+    ):
+        _require_pyarrow()
+        self.output_filepath = output_filepath
+        self.crs_str = crs_str # None - CRS первого записанного feature
+        self.row_group_size = row_group_size
+        self.json_backend = json_backend
+        self.count = 0
+        self._schema = geoparquet_schema()
+        self._writer = None
+        self._batch: List[Dict[str, Any]] = []
+        self._geometry_types = set()
+        self._extent = [np.inf, np.inf, -np.inf, -np.inf]
+
+    def open(self) -> "GeoParquetFeatureWriter":
+        """Начинает запись; файл создается при записи первой группы строк."""
+        return self
+
+    def write(self, feature: Dict[str, Any]) -> None:
+        """Добавляет feature в текущую группу строк; полная группа записывается в файл."""
+        self._batch.append(feature)
+        self.count += 1
+        if len(self._batch) >= self.row_group_size:
+            self._flush()
+
+    def write_batch(self, batch: FeatureBatch) -> None:
+        """Записывает пакет features группой строк (геометрия, WKB и прямоугольники берутся из пакета)."""
+        self._flush()
+        self._write_rows(batch)
+        self.count += len(batch)
+
+    def _flush(self) -> None:
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        self._write_rows(FeatureBatch(batch))
+
+    def _write_rows(self, batch: FeatureBatch) -> None:
+        if not len(batch):
+            return
+        if self.crs_str is None:
+            self.crs_str = batch.crs_names[0]
+        geoms = batch.geometries(self.crs_str)
+
+        columns: Dict[str, List[Any]] = {name: [] for name in self._schema.names}
+        for feature in batch.features:
+            properties = feature.get("properties") or {}
+            options = properties.get("options") if isinstance(properties.get("options"), dict) else {}
+            columns["id"].append(str(feature["id"]) if feature.get("id") is not None else None)
+            for option_field in _OPTION_FIELDS:
+                arrow_type = self._schema.field(option_field.name).type
+                columns[option_field.name].append(_option_value(options.get(option_field.name), arrow_type))
+            other = {k: v for k, v in options.items() if k not in _OPTION_NAMES}
+            columns["other_options"].append(dumps_json(other, backend=self.json_backend) if other else None)
+            rest = {k: v for k, v in properties.items() if k != "options"}
+            columns["properties"].append(dumps_json(rest, backend=self.json_backend) if rest else None)
+
+        present = ~shapely.is_missing(geoms)
+        bounds = batch.bounds(self.crs_str)
+        columns["geometry"] = batch.wkb(self.crs_str).tolist()
+        columns["bbox"] = [
+            dict(zip(("xmin", "ymin", "xmax", "ymax"), box)) if keep and not np.isnan(box[0]) else None
+            for box, keep in zip(bounds.tolist(), present.tolist())
+        ]
+        if present.any():
+            self._geometry_types.update(shapely.get_type_id(geoms[present]).tolist())
+            self._extent = [
+                min(self._extent[0], np.nanmin(bounds[:, 0])), min(self._extent[1], np.nanmin(bounds[:, 1])),
+                max(self._extent[2], np.nanmax(bounds[:, 2])), max(self._extent[3], np.nanmax(bounds[:, 3])),
+            ]
+
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.output_filepath, self._schema, compression="zstd")
+        self._writer.write_table(pa.table(columns, schema=self._schema), row_group_size=self.row_group_size)
+
+    def _geo_metadata(self) -> Dict[str, Any]:
+        # Метаданные "geo" по спецификации GeoParquet: кодировка, CRS (PROJJSON), типы и охват
+        type_names = ["Point", "LineString", "LinearRing", "Polygon", "MultiPoint", "MultiLineString",
+                      "MultiPolygon", "GeometryCollection"]
+        column = {
+            "encoding": "WKB",
+            "geometry_types": sorted(type_names[t] for t in self._geometry_types),
+            "crs": _crs_projjson(self.crs_str or GEOGRAPHIC_CRS_WGS84),
+            "covering": {"bbox": {key: ["bbox", key] for key in ("xmin", "ymin", "xmax", "ymax")}},
+        }
+        if np.isfinite(self._extent).all():
+            column["bbox"] = [float(v) for v in self._extent]
+        return {"version": GEOPARQUET_VERSION, "primary_column": "geometry", "columns": {"geometry": column}}
+
+    def close(self) -> None:
+        """Записывает остаток группы строк и метаданные GeoParquet, закрывает файл."""
+        self._flush()
+        if self._writer is None:
+            # Пустой набор - файл только со схемой
+            self._writer = pq.ParquetWriter(self.output_filepath, self._schema, compression="zstd")
+        self._writer.add_key_value_metadata({"geo": json.dumps(self._geo_metadata())})
+        self._writer.close()
+        self._writer = None
+
+    def __enter__(self) -> "GeoParquetFeatureWriter":
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+            return
+        # Без футера файл Parquet нечитаем - при ошибке недописанный файл удаляется
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self.output_filepath):
+            os.remove(self.output_filepath)
+
+def read_geoparquet_metadata(parquet_path: str) -> Optional[Dict[str, Any]]:
+    """Возвращает метаданные "geo" файла GeoParquet или None, если их нет."""
+    _require_pyarrow()
+    # "geo" хранится в метаданных файла (футере), а не в сериализованной схеме Arrow
+    metadata = pq.ParquetFile(parquet_path).metadata.metadata or {}
+    return json.loads(metadata[b"geo"]) if b"geo" in metadata else None
+
+def _geoparquet_filter(
+    bbox: Optional[Sequence[float]],
+    cad_num: Optional[str],
+    quarter_cad_number: Optional[str],
+    filters: Optional["ds.Expression"]
+) -> Optional["ds.Expression"]:
+    conditions = []
+    if bbox is not None:
+        # Условия на поля bbox проверяются и по статистике групп строк (пропуск групп), и по строкам
+        conditions += [
+            ds.field("bbox", "xmax") >= bbox[0], ds.field("bbox", "xmin") <= bbox[2],
+            ds.field("bbox", "ymax") >= bbox[1], ds.field("bbox", "ymin") <= bbox[3],
+        ]
+    if cad_num is not None:
+        conditions.append(ds.field("cad_num") == cad_num)
+    if quarter_cad_number is not None:
+        conditions.append(ds.field("quarter_cad_number") == quarter_cad_number)
+    if filters is not None:
+        conditions.append(filters)
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def read_geoparquet_table(
+    parquet_path: str,
+    columns: Optional[Sequence[str]] = None,
+    bbox: Optional[Sequence[float]] = None,
+    cad_num: Optional[str] = None,
+    quarter_cad_number: Optional[str] = None,
+    filters: Optional["ds.Expression"] = None
+) -> "pa.Table":
+    """
+    Читает таблицу участков GeoParquet с отбором колонок и строк.
+
+    Читаются только перечисленные колонки; условия (объединяются через AND)
+    передаются в pyarrow.dataset, поэтому группы строк, которые по статистике
+    им не удовлетворяют, не читаются с диска.
+
+    Args:
+        parquet_path: Путь к файлу GeoParquet.
+        columns: Имена колонок (по умолчанию - все).
+        bbox: (minx, miny, maxx, maxy) в CRS файла; отбор по пересечению прямоугольников.
+        cad_num: Кадастровый номер.
+        quarter_cad_number: Кадастровый квартал.
+        filters: Дополнительное выражение pyarrow.dataset, например
+            ds.field("land_record_category_type") == "Земли населенных пунктов".
+
+    Returns:
+        pyarrow.Table (для pandas - .to_pandas()).
+    """
+    _require_pyarrow()
+    dataset = ds.dataset(parquet_path, format="parquet")
+    return dataset.to_table(
+        columns=list(columns) if columns is not None else None,
+        filter=_geoparquet_filter(bbox, cad_num, quarter_cad_number, filters)
+    )
+
+def read_geoparquet_features(
+    parquet_path: str,
+    bbox: Optional[Sequence[float]] = None,
+    cad_num: Optional[str] = None,
+    quarter_cad_number: Optional[str] = None,
+    filters: Optional["ds.Expression"] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Читает участки GeoParquet как GeoJSON Features в формате НСПД (по группам строк).
+
+    Пустые (null) поля options не восстанавливаются; числовые поля возвращаются
+    как float. Условия отбора - как в read_geoparquet_table.
+
+    Yields:
+        GeoJSON Features; геометрия - в CRS файла, указанной членом "crs" (как в ответах НСПД).
+    """
+    _require_pyarrow()
+    geo = read_geoparquet_metadata(parquet_path) or {}
+    crs_json = geo.get("columns", {}).get("geometry", {}).get("crs")
+    crs_str = None
+    if crs_json:
+        authority = CRS.from_json_dict(crs_json).to_authority()
+        crs_str = f"{authority[0]}:{authority[1]}" if authority else None
+    dataset = ds.dataset(parquet_path, format="parquet")
+    expression = _geoparquet_filter(bbox, cad_num, quarter_cad_number, filters)
+    for record_batch in dataset.to_batches(filter=expression):
+        records = record_batch.to_pydict()
+        geoms = shapely.from_wkb(np.array(records["geometry"], dtype=object))
+        for i, geom in enumerate(geoms):
+            properties = json.loads(records["properties"][i]) if records["properties"][i] else {}
+            options = {name: records[name][i] for name in _OPTION_NAMES if records[name][i] is not None}
+            if records["other_options"][i]:
+                options.update(json.loads(records["other_options"][i]))
+            if options:
+                properties["options"] = options
+            geometry = None
+            if geom is not None:
+                geometry = mapping(geom)
+                if crs_str and crs_str not in (GEOGRAPHIC_CRS_WGS84, "OGC:CRS84"):
+                    geometry["crs"] = {"type": "name", "properties": {"name": crs_str}}
+            feature = {"type": "Feature", "geometry": geometry, "properties": properties}
+            feature_id = records["id"][i]
+            if feature_id is not None:
+                # Числовые id НСПД хранятся строкой (колонка одного типа) и восстанавливаются числом
+                feature["id"] = int(feature_id) if feature_id.isdigit() else feature_id
+            yield feature
@@ -0,0 +1,123 @@
+import json
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError: # orjson - необязательная зависимость, без нее используется json из стандартной библиотеки
+    orjson = None
+
+JSON_BACKEND_ORJSON = "orjson"
+JSON_BACKEND_STDLIB = "json"
+
+def _to_builtin(obj: Any) -> Any:
+    # Скаляры numpy (np.float64 из метрик, np.int64 из индексов) приводятся к типам Python
+    if hasattr(obj, "item") and callable(obj.item):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _dumps_stdlib(obj: Any, indent: Optional[int]) -> str:
+    # Компактный вывод - без пробелов после разделителей, как у orjson
+    separators = (",", ":") if indent is None else None
+    return json.dumps(obj, ensure_ascii=False, indent=indent, separators=separators, default=_to_builtin)
+
+def _dumps_orjson(obj: Any, indent: Optional[int]) -> str:
+    if indent not in (None, 2):
+        # orjson умеет только отступ 2; прочие отступы сериализует стандартная библиотека
+        return _dumps_stdlib(obj, indent)
+    option = orjson.OPT_INDENT_2 if indent == 2 else 0
+    try:
+        return orjson.dumps(obj, default=_to_builtin, option=option).decode("utf-8")
+    except orjson.JSONEncodeError:
+        # Целые шире 64 бит orjson не кодирует - такой объект сериализует стандартная библиотека
+        # (она же выбросит TypeError для действительно несериализуемых объектов)
+        return _dumps_stdlib(obj, indent)
+
+# Реестр кодировщиков: имя -> функция (obj, indent) -> str
+_JSON_ENCODERS: Dict[str, Callable[[Any, Optional[int]], str]] = {JSON_BACKEND_STDLIB: _dumps_stdlib}
+if orjson is not None:
+    _JSON_ENCODERS[JSON_BACKEND_ORJSON] = _dumps_orjson
+
+def register_json_encoder(name: str, encoder: Callable[[Any, Optional[int]], str]) -> None:
+    """
+    Регистрирует кодировщик JSON под именем name.
+
+    Кодировщик получает объект и отступ (None - компактный вывод) и возвращает
+    строку без экранирования не-ASCII символов (как json.dumps(ensure_ascii=False)).
+    """
+    _JSON_ENCODERS[name] = encoder
+
+def available_json_backends() -> List[str]:
+    """Возвращает имена зарегистрированных кодировщиков."""
+    return list(_JSON_ENCODERS)
+
+def default_json_backend() -> str:
+    """Возвращает кодировщик по умолчанию: orjson, если установлен, иначе json."""
+    return JSON_BACKEND_ORJSON if JSON_BACKEND_ORJSON in _JSON_ENCODERS else JSON_BACKEND_STDLIB
+
+def dumps_json(obj: Any, indent: Optional[int] = None, backend: Optional[str] = None) -> str:
+    """
+    Сериализует объект в строку JSON выбранным кодировщиком.
+
+    orjson и json дают одинаковые байты для строк, целых, а также для чисел с плавающей
+    точкой в обычной записи (координаты, площади). Отличия orjson:
+    - экспоненциальная запись чисел короче ("1e-7", "1e16" вместо "1e-07", "1e+16"),
+      а числа вроде 1.5e-05 пишутся без экспоненты ("0.000015") - значение то же;
+    - NaN и бесконечности записываются как null (json пишет NaN/Infinity - это не JSON
+      по RFC 8259, многие читатели такой файл не принимают).
+    Целые шире 64 бит orjson не поддерживает - такие объекты сериализует json.
+
+    Args:
+        obj: Сериализуемый объект (dict, list, кортежи, скаляры numpy).
+        indent: Отступ; None - компактный вывод без пробелов.
+        backend: Имя кодировщика (по умолчанию default_json_backend()).
+
+    Returns:
+        Строка JSON (не-ASCII символы не экранируются).
+    """
+    name = backend or default_json_backend()
+    if name not in _JSON_ENCODERS:
+        raise ValueError(f"Неизвестный кодировщик JSON: '{name}'. Доступны: {', '.join(_JSON_ENCODERS)}")
+    return _JSON_ENCODERS[name](obj, indent)
+
+def _round_coordinates(coords: Any, precision: int) -> Any:
+    if isinstance(coords, (int, float)):
+        return round(coords, precision)
+    if coords and isinstance(coords[0], (list, tuple)) and coords[0] and isinstance(coords[0][0], (int, float)):
+        # Список позиций (кольцо, линия) округляется одним вызовом numpy; позиции
+        # разной размерности (2D и 3D вперемешку) - поэлементно
+        try:
+            return np.round(np.asarray(coords, dtype=float), precision).tolist()
+        except ValueError:
+            pass
+    return [_round_coordinates(c, precision) for c in coords]
+
+def round_geometry_coordinates(geometry: Optional[Dict[str, Any]], precision: Optional[int]) -> Optional[Dict[str, Any]]:
+    """
+    Возвращает копию GeoJSON-геометрии с координатами, округленными до precision знаков.
+
+    Округленные значения сериализуются кратчайшим представлением (37.61 вместо
+    37.610000000000006), что сокращает размер файла. Остальные члены геометрии
+    (например, "crs" в ответах НСПД) сохраняются. GeometryCollection обрабатывается рекурсивно.
+
+    Args:
+        geometry: Словарь GeoJSON-геометрии или None.
+        precision: Количество знаков после запятой; None - без округления.
+    """
+    if geometry is None or precision is None:
+        return geometry
+    rounded = dict(geometry)
+    if "coordinates" in rounded and rounded["coordinates"] is not None:
+        rounded["coordinates"] = _round_coordinates(rounded["coordinates"], precision)
+    if rounded.get("geometries"):
+        rounded["geometries"] = [round_geometry_coordinates(g, precision) for g in rounded["geometries"]]
+    return rounded
+
+def round_feature_coordinates(feature: Dict[str, Any], precision: Optional[int]) -> Dict[str, Any]:
+    """Возвращает копию GeoJSON Feature с координатами геометрии, округленными до precision знаков."""
+    if precision is None or not isinstance(feature.get("geometry"), dict):
+        return feature
+    rounded = dict(feature)
+    rounded["geometry"] = round_geometry_coordinates(feature["geometry"], precision)
+    return rounded
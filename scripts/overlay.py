@@ -0,0 +1,237 @@
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely import STRtree
+from shapely.geometry import mapping
+from shapely.geometry.base import BaseGeometry
+
+from scripts.data_structures import ExtractedPlacemark, NSPDCadastralFeature, ZoneParcelOverlay
+from scripts.geometry_processing import (
+    GEOGRAPHIC_CRS_WGS84, DEFAULT_PLANAR_CRS, METRIC_MODE_UTM,
+    kml_placemark_to_shapely, nspd_geometry_to_shapely,
+    apply_precision, repair_geometries, reproject_geometries, select_local_crs, calculate_metrics
+)
+from scripts.kml_parser import load_kml_file, extract_placemark_geometries_recursive
+from scripts.geojson_io import is_feature_input_path, load_geojson_placemarks, load_nspd_features
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Рабочая CRS наложения: в ней НСПД отдает участки, поэтому перепроецировать
+# приходится только зоны из KML (их единицы, участков - сотни тысяч)
+OVERLAY_CRS = DEFAULT_PLANAR_CRS
+
+def _to_object_array(geoms: Sequence[Optional[BaseGeometry]]) -> np.ndarray:
+    geom_array = np.empty(len(geoms), dtype=object)
+    geom_array[:] = list(geoms)
+    return geom_array
+
+def load_kml_zones(kml_paths: Sequence[str], crs_str: str = OVERLAY_CRS) -> Tuple[List[ExtractedPlacemark], np.ndarray]:
+    """
+    Загружает зоны (Placemark) из KML-файлов и переводит их в рабочую CRS.
+
+    Файлы GeoJSON (и другие, читаемые iter_feature_collection) загружаются
+    через load_geojson_placemarks: каждый feature становится зоной, CRS берется
+    из члена "crs" геометрии или коллекции.
+
+    Args:
+        kml_paths: Пути к KML-файлам (или файлам GeoJSON).
+        crs_str: CRS, в которую перепроецируются геометрии зон.
+
+    Returns:
+        Кортеж (placemarks, geoms): Placemark с непустой геометрией и
+        массив numpy (dtype=object) их геометрий в crs_str.
+    """
+    placemarks: List[ExtractedPlacemark] = []
+    zone_geoms: List[Optional[BaseGeometry]] = []
+    for kml_path in kml_paths:
+        if is_feature_input_path(kml_path):
+            loaded = load_geojson_placemarks(kml_path, crs_str)
+            if loaded is None:
+                logger.error(f"Не удалось загрузить файл зон: {kml_path}")
+                continue
+            placemarks.extend(loaded[0])
+            zone_geoms.extend(loaded[1])
+            continue
+        kml_root = load_kml_file(kml_path)
+        if kml_root is None:
+            logger.error(f"Не удалось загрузить KML-файл зон: {kml_path}")
+            continue
+        start_node = kml_root.Document if hasattr(kml_root, 'Document') and kml_root.Document is not None else kml_root
+        kml_placemarks = extract_placemark_geometries_recursive(start_node)
+        # Зоны KML перепроецируются одним вызовом на файл; зоны GeoJSON уже в crs_str
+        placemarks.extend(kml_placemarks)
+        zone_geoms.extend(reproject_geometries(
+            [kml_placemark_to_shapely(pm, precision=None) for pm in kml_placemarks], GEOGRAPHIC_CRS_WGS84, crs_str
+        ))
+
+    kept = [i for i, geom in enumerate(zone_geoms) if geom is not None]
+    return [placemarks[i] for i in kept], apply_precision(_to_object_array([zone_geoms[i] for i in kept]), crs_str)
+
+def load_nspd_parcels(geojson_paths: Sequence[str], crs_str: str = OVERLAY_CRS) -> Tuple[List[NSPDCadastralFeature], np.ndarray]:
+    """
+    Загружает участки из выгрузок НСПД (GeoJSON) и переводит их в рабочую CRS.
+
+    CRS каждого участка берется из члена "crs" его геометрии (как в ответах НСПД),
+    при его отсутствии - DEFAULT_PLANAR_CRS. Участки в другой CRS перепроецируются
+    группами, по одному вызову на CRS.
+
+    Args:
+        geojson_paths: Пути к файлам GeoJSON (например, "От Зеленограда/Этап 7.*.geojson").
+        crs_str: Рабочая CRS.
+
+    Returns:
+        Кортеж (features, geoms): участки с геометрией и массив numpy (dtype=object)
+        их геометрий в crs_str.
+    """
+    features: List[NSPDCadastralFeature] = []
+    for geojson_path in geojson_paths:
+        loaded = load_nspd_features(geojson_path)
+        if loaded is None:
+            continue
+        features.extend(loaded)
+
+    geoms = _to_object_array([nspd_geometry_to_shapely(f.geometry) for f in features])
+    kept = ~shapely.is_missing(geoms)
+    features = [f for f, keep in zip(features, kept) if keep]
+    geoms = geoms[kept]
+
+    source_crs = np.array([
+        f.geometry.crs.name if f.geometry.crs and f.geometry.crs.name else DEFAULT_PLANAR_CRS
+        for f in features
+    ], dtype=object)
+    for source_crs_str in set(source_crs.tolist()) - {crs_str}:
+        mask = source_crs == source_crs_str
+        geoms[mask] = reproject_geometries(geoms[mask], source_crs_str, crs_str)
+
+    return features, apply_precision(geoms, crs_str)
+
+def buffer_in_metres(geoms: Sequence[Optional[BaseGeometry]], distance: float, crs_str: str = OVERLAY_CRS) -> np.ndarray:
+    """
+    Строит буфер заданной ширины в метрах независимо от единиц crs_str.
+
+    Геометрии группами перепроецируются в свою зону UTM (select_local_crs),
+    буферизуются там и возвращаются обратно: в Web Mercator буфер "в единицах CRS"
+    на широте Москвы был бы почти вдвое уже заданного.
+    """
+    geom_array = _to_object_array(geoms)
+    local_crs = select_local_crs(geom_array, crs_str, METRIC_MODE_UTM)
+    result = geom_array.copy()
+    for local_crs_str in {c for c in local_crs.tolist() if c is not None}:
+        mask = local_crs == local_crs_str
+        local_geoms = reproject_geometries(geom_array[mask], crs_str, local_crs_str)
+        result[mask] = reproject_geometries(shapely.buffer(local_geoms, distance), local_crs_str, crs_str)
+    return apply_precision(result, crs_str)
+
+def overlay_zones_with_parcels(
+    zone_geoms: Sequence[Optional[BaseGeometry]],
+    parcel_geoms: Sequence[Optional[BaseGeometry]],
+    crs_str: str = OVERLAY_CRS,
+    metric_mode: str = METRIC_MODE_UTM,
+    zone_names: Optional[Sequence[Optional[str]]] = None,
+    parcel_cad_nums: Optional[Sequence[Optional[str]]] = None
+) -> List[ZoneParcelOverlay]:
+    """
+    Находит участки, которые пересекает каждая зона, и считает размер пересечения.
+
+    По участкам строится STRtree, зоны подготавливаются (shapely.prepare), и все
+    пары-кандидаты находятся одним запросом tree.query(..., predicate="intersects").
+    Пересечения и их метрики считаются векторизованно для всех пар сразу.
+    Пары, касающиеся только границей (размерность пересечения меньше размерности
+    зоны или участка), отбрасываются.
+
+    Args:
+        zone_geoms: Геометрии зон (полигоны или линии) в crs_str.
+        parcel_geoms: Геометрии участков в crs_str.
+        crs_str: CRS обоих наборов.
+        metric_mode: Режим расчета метрик (см. calculate_metrics).
+        zone_names: Имена зон для результата (необязательно).
+        parcel_cad_nums: Кадастровые номера участков для результата (необязательно).
+
+    Returns:
+        Список ZoneParcelOverlay, упорядоченный по зоне, затем по участку.
+    """
+    # Пересечение с невалидной геометрией завершается ошибкой GEOS, поэтому исправляем заранее
+    zones = repair_geometries(zone_geoms)
+    parcels = repair_geometries(parcel_geoms)
+    if len(zones) == 0 or len(parcels) == 0:
+        return []
+
+    shapely.prepare(zones)
+    tree = STRtree(parcels)
+    zone_idx, parcel_idx = tree.query(zones, predicate="intersects")
+    order = np.lexsort((parcel_idx, zone_idx))
+    zone_idx, parcel_idx = zone_idx[order], parcel_idx[order]
+
+    # grid_size не задан: GEOS использует сетку, заданную apply_precision
+    intersections = shapely.intersection(zones[zone_idx], parcels[parcel_idx])
+    expected_dims = np.minimum(shapely.get_dimensions(zones[zone_idx]), shapely.get_dimensions(parcels[parcel_idx]))
+    keep = ~shapely.is_empty(intersections) & (shapely.get_dimensions(intersections) >= expected_dims)
+    zone_idx, parcel_idx, intersections = zone_idx[keep], parcel_idx[keep], intersections[keep]
+    if len(intersections) == 0:
+        return []
+
+    intersection_metrics = calculate_metrics(list(intersections), source_crs_str=crs_str, metric_mode=metric_mode)
+    unique_parcels, parcel_pos = np.unique(parcel_idx, return_inverse=True)
+    parcel_metrics = calculate_metrics(list(parcels[unique_parcels]), source_crs_str=crs_str, metric_mode=metric_mode)
+
+    results = []
+    for zi, pi, pos, geom, metrics in zip(zone_idx.tolist(), parcel_idx.tolist(), parcel_pos.tolist(), intersections, intersection_metrics):
+        parcel_area = parcel_metrics[pos].area
+        share = None
+        if metrics.area and parcel_area:
+            share = metrics.area / parcel_area * 100.0
+        results.append(ZoneParcelOverlay(
+            zone_index=zi,
+            parcel_index=pi,
+            zone_name=zone_names[zi] if zone_names is not None else None,
+            cad_num=parcel_cad_nums[pi] if parcel_cad_nums is not None else None,
+            intersection_area=metrics.area,
+            intersection_length=metrics.length,
+            parcel_area=parcel_area,
+            parcel_share_pct=share,
+            geometry=geom
+        ))
+    return results
+
+def overlay_results_to_features(
+    results: Sequence[ZoneParcelOverlay],
+    crs_str: str = OVERLAY_CRS,
+    precision: int = 2
+) -> List[Dict[str, Any]]:
+    """
+    Преобразует результаты наложения в GeoJSON Features (геометрия в WGS84, RFC 7946).
+
+    Args:
+        results: Результаты overlay_zones_with_parcels.
+        crs_str: CRS геометрий пересечений.
+        precision: Количество знаков после запятой для метрик.
+
+    Returns:
+        Список словарей GeoJSON Feature.
+    """
+    geoms = reproject_geometries([r.geometry for r in results], crs_str, GEOGRAPHIC_CRS_WGS84)
+    geoms = apply_precision(geoms, GEOGRAPHIC_CRS_WGS84)
+    features = []
+    for result, geom in zip(results, geoms):
+        properties = {
+            "zone_index": result.zone_index,
+            "zone_name": result.zone_name,
+            "cad_num": result.cad_num,
+            "intersection_area_sq_m": result.intersection_area,
+            "intersection_length_m": result.intersection_length,
+            "parcel_area_sq_m": result.parcel_area,
+            "parcel_share_pct": result.parcel_share_pct,
+        }
+        properties = {
+            k: round(v, precision) if isinstance(v, float) else v
+            for k, v in properties.items() if v is not None
+        }
+        features.append({
+            "type": "Feature",
+            "geometry": mapping(geom) if geom is not None else None,
+            "properties": properties,
+        })
+    return features
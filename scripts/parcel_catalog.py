@@ -0,0 +1,241 @@
+import glob
+import heapq
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from scripts.data_structures import ParcelCatalogStats
+from scripts.feature_identity import geometry_hash
+from scripts.geojson_io import FEATURE_READ_ERRORS, iter_feature_collection
+from scripts.json_encoding import dumps_json
+from scripts.sqlite_store import SQLITE_LAYER_PARCELS, SQLiteFeatureWriter, _check_layer_name
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+DEFAULT_STAGE_PATTERN = "*.geojson" # Файлы этапов в каталоге ("Этап 7.*.geojson")
+DEFAULT_RUN_CHARS = 32 * 1024 * 1024 # Символов JSON в памяти процесса до сброса отсортированной части на диск
+MAX_MERGE_FANIN = 128 # Частей, сливаемых за один проход (ограничивает число открытых файлов)
+CATALOG_STAGES_PROPERTY = "stages" # Свойство feature каталога со списком его этапов
+
+_DIGITS_RE = re.compile(r"(\d+)")
+
+def stage_sort_key(stage: str) -> List[Any]:
+    """Ключ естественной сортировки этапов: "Этап 7.2" < "Этап 7.10"."""
+    return [int(part) if part.isdigit() else part for part in _DIGITS_RE.split(stage)]
+
+def find_stage_files(directory: str, pattern: str = DEFAULT_STAGE_PATTERN) -> List[str]:
+    """Файлы этапов в directory по шаблону glob, в естественном порядке имен."""
+    paths = [path for path in glob.glob(os.path.join(directory, pattern)) if os.path.isfile(path)]
+    return sorted(paths, key=lambda path: stage_sort_key(os.path.basename(path)))
+
+def catalog_key(feature: Dict[str, Any]) -> str:
+    """
+    Ключ дедупликации участка: id feature и хэш геометрии.
+
+    Один участок в соседних этапах дает один ключ; участки с одним id, но разной
+    геометрией (участок изменился между выгрузками) остаются разными записями.
+    """
+    feature_id = feature.get("id")
+    return f"{'' if feature_id is None else feature_id}|{geometry_hash(feature.get('geometry'))}"
+
+def _catalog_line(feature: Dict[str, Any], stage_index: int) -> str:
+    # Ключ не содержит табуляции: id - число или строка НСПД, хэш - hex
+    return f"{catalog_key(feature)}\t{stage_index:06d}\t{dumps_json(feature)}\n"
+
+def _write_run(lines: List[str], spill_dir: str) -> str:
+    lines.sort()
+    fd, path = tempfile.mkstemp(suffix=".run", dir=spill_dir)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    return path
+
+def scan_sorted_runs(
+    task: Tuple[int, str, str, int, Callable[[Dict[str, Any], int], str]]
+) -> Tuple[int, List[str], Optional[str]]:
+    """
+    Задача процесса: читает файл features и пишет отсортированные части (runs).
+
+    Строка части строится функцией задачи (line_func(feature, номер файла));
+    она начинается с ключа сортировки, за которым через табуляцию идут
+    остальные поля (в каталоге - номер этапа с ведущими нулями и компактный JSON
+    feature), поэтому сортировка строк дает порядок по ключу. Табуляция меньше
+    любого печатного символа, поэтому ключ-префикс идет раньше более длинного ключа.
+    Функция должна быть доступна по имени модуля (передается в процесс пула).
+
+    Returns:
+        (прочитано features, пути частей, ошибка или None).
+    """
+    file_index, path, spill_dir, run_chars, line_func = task
+    lines: List[str] = []
+    size, count, runs = 0, 0, []
+    try:
+        for feature in iter_feature_collection(path):
+            line = line_func(feature, file_index)
+            lines.append(line)
+            size += len(line)
+            count += 1
+            if size >= run_chars:
+                runs.append(_write_run(lines, spill_dir))
+                lines, size = [], 0
+        if lines:
+            runs.append(_write_run(lines, spill_dir))
+    except FEATURE_READ_ERRORS as e:
+        # Файл с ошибкой не попадает в результат целиком
+        for run in runs:
+            os.remove(run)
+        return 0, [], str(e)
+    return count, runs, None
+
+class _InlineExecutor:
+    """Выполняет задачи в текущем процессе (один воркер или один файл)."""
+
+    def map(self, func, *iterables):
+        return map(func, *iterables)
+
+def run_in_pool(func: Callable[[Any], Any], tasks: Sequence[Any], workers: Optional[int] = None) -> List[Any]:
+    """Выполняет задачи в пуле процессов (workers<=1 или одна задача - в текущем процессе)."""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(tasks) <= 1:
+        return list(_InlineExecutor().map(func, tasks))
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+        return list(executor.map(func, tasks))
+
+def merge_runs(runs: List[str], spill_dir: str) -> List[str]:
+    """
+    Сливает отсортированные части, пока их не станет не больше MAX_MERGE_FANIN.
+
+    Returns:
+        Пути оставшихся частей; их строки сливаются окончательно через heapq.merge.
+    """
+    while len(runs) > MAX_MERGE_FANIN:
+        merged = []
+        for i in range(0, len(runs), MAX_MERGE_FANIN):
+            group = runs[i:i + MAX_MERGE_FANIN]
+            fd, path = tempfile.mkstemp(suffix=".run", dir=spill_dir)
+            files = [open(run, encoding='utf-8') for run in group]
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as out:
+                    out.writelines(heapq.merge(*files))
+            finally:
+                for f in files:
+                    f.close()
+            for run in group:
+                os.remove(run)
+            merged.append(path)
+        runs = merged
+    return runs
+
+def _grouped_records(files: Sequence[TextIO]) -> Iterator[Tuple[str, List[int], str]]:
+    # Слияние отсортированных частей: в памяти только текущая группа одного ключа
+    current_key, stage_indices, first_json = None, [], None
+    for line in heapq.merge(*files):
+        key, stage_index, feature_json = line.rstrip("\n").split("\t", 2)
+        if key != current_key:
+            if current_key is not None:
+                yield current_key, stage_indices, first_json
+            current_key, stage_indices, first_json = key, [], feature_json
+        stage_index = int(stage_index)
+        if not stage_indices or stage_indices[-1] != stage_index:
+            stage_indices.append(stage_index)
+    if current_key is not None:
+        yield current_key, stage_indices, first_json
+
+def build_parcel_catalog(
+    stage_paths: Sequence[str],
+    output_filepath: str,
+    layer: str = SQLITE_LAYER_PARCELS,
+    workers: Optional[int] = None,
+    run_chars: int = DEFAULT_RUN_CHARS,
+    spill_dir: Optional[str] = None
+) -> ParcelCatalogStats:
+    """
+    Собирает каталог участков из файлов этапов: объединяет, убирает повторы, отмечает этапы.
+
+    Файлы читаются параллельно (пул процессов, по задаче на файл, FeatureCollection -
+    потоково). Каждая задача копит строки (ключ, этап, JSON feature) до run_chars
+    символов, сортирует и сбрасывает их на диск; затем отсортированные части
+    сливаются (heapq.merge), и повторы одного участка (ключ catalog_key: id +
+    хэш геометрии) оказываются рядом. Память ограничена run_chars на процесс и
+    одной группой повторов при слиянии, поэтому набор может превышать ОЗУ.
+
+    В каталог пишется feature из первого (в естественном порядке) этапа, где
+    встретился участок, со списком всех его этапов в свойстве "stages". Каталог -
+    слой SQLite (SQLiteFeatureWriter: R*Tree, индексы по cad_num и кварталу) и
+    таблица принадлежности <слой>_stages (fid, stage) с индексом по этапу.
+
+    Args:
+        stage_paths: Файлы этапов (имя этапа - имя файла без расширения).
+        output_filepath: Файл SQLite; слой перезаписывается, остальные слои сохраняются.
+        layer: Имя слоя каталога.
+        workers: Число процессов (по умолчанию os.cpu_count()); 1 - без пула.
+        run_chars: Размер части внешней сортировки (символов JSON на процесс).
+        spill_dir: Каталог для временных частей (по умолчанию - системный временный).
+
+    Returns:
+        ParcelCatalogStats.
+    """
+    layer = _check_layer_name(layer)
+    stage_paths = sorted(stage_paths, key=lambda path: stage_sort_key(os.path.basename(path)))
+    stages = [os.path.splitext(os.path.basename(path))[0] for path in stage_paths]
+    stats = ParcelCatalogStats(stages=stages)
+    work_dir = tempfile.mkdtemp(prefix="catalog_", dir=spill_dir)
+    try:
+        tasks = [(index, path, work_dir, run_chars, _catalog_line) for index, path in enumerate(stage_paths)]
+        results = run_in_pool(scan_sorted_runs, tasks, workers)
+        runs: List[str] = []
+        for stage, (count, stage_runs, error) in zip(stages, results):
+            if error is not None:
+                logger.error(f"Этап '{stage}' пропущен: {error}")
+                stats.failed_stages.append(stage)
+                continue
+            stats.features_read += count
+            runs.extend(stage_runs)
+        stats.spill_runs = len(runs)
+        runs = merge_runs(runs, work_dir)
+
+        # Принадлежность к этапам копится во временном файле: таблица пишется после слоя
+        memberships_path = os.path.join(work_dir, "memberships.tsv")
+        files = [open(run, encoding='utf-8') for run in runs]
+        try:
+            with SQLiteFeatureWriter(output_filepath, layer=layer) as writer, \
+                    open(memberships_path, 'w', encoding='utf-8') as memberships:
+                for _, stage_indices, feature_json in _grouped_records(files):
+                    feature = json.loads(feature_json)
+                    properties = dict(feature.get("properties") or {})
+                    properties[CATALOG_STAGES_PROPERTY] = [stages[i] for i in stage_indices]
+                    feature["properties"] = properties
+                    writer.write(feature)
+                    # Слой перезаписывается, поэтому fid - порядковый номер записанного feature
+                    memberships.writelines(f"{writer.count}\t{i}\n" for i in stage_indices)
+        finally:
+            for f in files:
+                f.close()
+        stats.parcels = writer.count
+        stats.duplicates = stats.features_read - stats.parcels
+        _write_memberships(output_filepath, layer, stages, memberships_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return stats
+
+def _write_memberships(output_filepath: str, layer: str, stages: Sequence[str], memberships_path: str) -> None:
+    connection = sqlite3.connect(output_filepath, isolation_level=None)
+    try:
+        connection.execute("BEGIN")
+        connection.execute(f'CREATE TABLE IF NOT EXISTS "{layer}_stages" (fid INTEGER NOT NULL, stage TEXT NOT NULL)')
+        connection.execute(f'DELETE FROM "{layer}_stages"')
+        with open(memberships_path, encoding='utf-8') as f:
+            rows = (line.rstrip("\n").split("\t") for line in f)
+            connection.executemany(f'INSERT INTO "{layer}_stages" VALUES (?, ?)',
+                                   ((int(fid), stages[int(index)]) for fid, index in rows))
+        connection.execute(f'CREATE INDEX IF NOT EXISTS "idx_{layer}_stages_stage" ON "{layer}_stages" (stage)')
+        connection.execute(f'CREATE INDEX IF NOT EXISTS "idx_{layer}_stages_fid" ON "{layer}_stages" (fid)')
+        connection.execute("COMMIT")
+    finally:
+        connection.close()
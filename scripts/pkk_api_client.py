@@ -17,9 +17,7 @@ from scripts.data_structures import (
 from scripts.geometry_processing import (
     nspd_geometry_to_shapely, 
     DEFAULT_PLANAR_CRS,
-    calculate_area,
-    calculate_length,
-    calculate_perimeter
+    calculate_metrics
 )
 
 # Подавляем InsecureRequestWarning глобально, если SSL проверка отключена где-либо
@@ -341,9 +339,8 @@ def test_nspd_geoportal_search():
                     # --- ДОБАВЛЕНО: Расчет метрик ---
                     source_crs_from_data = first_parsed.geometry.crs.name if first_parsed.geometry.crs else DEFAULT_PLANAR_CRS # EPSG:3857
                     
-                    area = calculate_area(shapely_geom, source_crs_str=source_crs_from_data, project_to_planar=True, target_planar_crs_str=DEFAULT_PLANAR_CRS)
-                    length = calculate_length(shapely_geom, source_crs_str=source_crs_from_data, project_to_planar=True, target_planar_crs_str=DEFAULT_PLANAR_CRS)
-                    perimeter = calculate_perimeter(shapely_geom, source_crs_str=source_crs_from_data, project_to_planar=True, target_planar_crs_str=DEFAULT_PLANAR_CRS)
+                    metrics = calculate_metrics(shapely_geom, source_crs_str=source_crs_from_data, project_to_planar=True, target_planar_crs_str=DEFAULT_PLANAR_CRS)
+                    area, length, perimeter = metrics.area, metrics.length, metrics.perimeter
                     
                     if area is not None:
                         print(f"    Расчетная площадь: {area:.2f} кв.м. (в CRS: {DEFAULT_PLANAR_CRS})")
@@ -0,0 +1,202 @@
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import shapely
+
+from scripts.data_structures import QuarterHarvestStats
+from scripts.feature_batch import FeatureBatch
+from scripts.feature_identity import feature_cad_fields
+from scripts.geometry_processing import DEFAULT_PLANAR_CRS, coordinate_precision_for_crs, geojson_geometry_crs
+from scripts.json_encoding import round_feature_coordinates
+from scripts.pkk_api_client import search_cadastral_data_by_text
+from scripts.spatial_index import query_datasets
+from scripts.sqlite_store import SQLITE_LAYER_PARCELS, SQLiteFeatureWriter, _check_layer_name
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+DEFAULT_HARVEST_WORKERS = 4 # Одновременных запросов к API (запросы ждут сеть, поэтому - потоки)
+
+# (features НСПД или None, ошибка или None) - как у search_cadastral_data_by_text
+QuarterFetch = Callable[[str], Tuple[Optional[List[Any]], Optional[str]]]
+
+def find_zone_quarters(
+    zone_geoms: Sequence[Any],
+    dataset_paths: Sequence[str],
+    zone_crs: str
+) -> Dict[str, Set[str]]:
+    """
+    Находит кадастровые кварталы, пересекающие зону, по локальным наборам участков.
+
+    Кандидаты выбираются по прямоугольнику зоны через пространственные индексы
+    наборов (query_datasets), затем проверяется пересечение самих геометрий
+    участков с зоной. Квартал участка - quarter_cad_number или начало его номера.
+
+    Args:
+        zone_geoms: Геометрии зоны (shapely) в zone_crs.
+        dataset_paths: GeoJSON-файлы участков (индексы строятся при первом обращении).
+        zone_crs: CRS геометрий зоны.
+
+    Returns:
+        Словарь {квартал: кадастровые номера известных участков квартала в зоне},
+        отсортированный по кварталам. Номера используются для проверки полноты.
+    """
+    zone = shapely.union_all(np.asarray([g for g in zone_geoms if g is not None], dtype=object))
+    if zone.is_empty or not dataset_paths:
+        return {}
+    candidates = [feature for _, feature in query_datasets(dataset_paths, zone.bounds, bbox_crs=zone_crs)]
+    if not candidates:
+        return {}
+    # Участки в разных CRS перепроецируются в CRS зоны группами (FeatureBatch)
+    geoms = FeatureBatch(candidates).geometries(zone_crs)
+    shapely.prepare(zone)
+    hits = shapely.intersects(zone, geoms)
+
+    quarters: Dict[str, Set[str]] = {}
+    for feature, hit in zip(candidates, hits.tolist()):
+        if not hit:
+            continue
+        cad_num, quarter = feature_cad_fields(feature)
+        if quarter:
+            known = quarters.setdefault(quarter, set())
+            if cad_num:
+                known.add(cad_num)
+    return dict(sorted(quarters.items()))
+
+def load_quarter_status(store_path: str, layer: str = SQLITE_LAYER_PARCELS) -> Dict[str, bool]:
+    """Кварталы, уже собранные в хранилище: {квартал: собран ли полностью}."""
+    layer = _check_layer_name(layer)
+    if not os.path.exists(store_path):
+        return {}
+    connection = sqlite3.connect(store_path)
+    try:
+        table = connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (f"harvested_quarters_{layer}",)
+        ).fetchone()
+        if table is None:
+            return {}
+        rows = connection.execute(f'SELECT quarter_cad_number, complete FROM "harvested_quarters_{layer}"')
+        return {quarter: bool(complete) for quarter, complete in rows}
+    finally:
+        connection.close()
+
+def _mark_quarter(store_path: str, layer: str, quarter: str, parcels: int, complete: bool) -> None:
+    connection = sqlite3.connect(store_path, isolation_level=None)
+    try:
+        connection.execute(
+            f'CREATE TABLE IF NOT EXISTS "harvested_quarters_{layer}" ('
+            "quarter_cad_number TEXT PRIMARY KEY, parcels INTEGER, complete INTEGER, harvested_at TEXT)"
+        )
+        connection.execute(
+            f'INSERT OR REPLACE INTO "harvested_quarters_{layer}" VALUES (?, ?, ?, ?)',
+            (quarter, parcels, int(complete), datetime.now(timezone.utc).isoformat(timespec="seconds"))
+        )
+    finally:
+        connection.close()
+
+def _fetch_quarter(quarter: str, fetch: QuarterFetch) -> Tuple[List[Dict[str, Any]], int, Optional[str]]:
+    """
+    Задача потока: запрашивает участки квартала.
+
+    Returns:
+        (участки квартала, число объектов в ответе API, ошибка или None).
+    """
+    parsed_features, error = fetch(quarter)
+    if error:
+        return [], 0, error
+    parcels = []
+    for parsed in parsed_features or []:
+        feature = getattr(parsed, "raw_feature_dict", None)
+        if not feature:
+            continue
+        cad_num, feature_quarter = feature_cad_fields(feature)
+        # Поиск по тексту возвращает и сам квартал, и объекты соседних кварталов
+        if feature_quarter != quarter or not isinstance(cad_num, str) or cad_num.count(":") != 3:
+            continue
+        # Координаты округляются по CRS объекта, как в search-pkk
+        crs_str = geojson_geometry_crs(feature.get("geometry")) or DEFAULT_PLANAR_CRS
+        parcels.append(round_feature_coordinates(feature, coordinate_precision_for_crs(crs_str)))
+    return parcels, len(parsed_features or []), None
+
+def harvest_quarters(
+    quarters: Dict[str, Set[str]],
+    store_path: str,
+    layer: str = SQLITE_LAYER_PARCELS,
+    workers: int = DEFAULT_HARVEST_WORKERS,
+    page_limit: Optional[int] = None,
+    refresh: bool = False,
+    fetch: Optional[QuarterFetch] = None
+) -> QuarterHarvestStats:
+    """
+    Собирает участки по кадастровым кварталам в слой SQLite.
+
+    Кварталы запрашиваются параллельно (пул потоков, по запросу на квартал);
+    участки каждого квартала записываются сразу после его ответа, отдельной
+    транзакцией: прежние строки квартала заменяются, а квартал отмечается в
+    таблице harvested_quarters_<слой>. Прерванный сбор продолжается с
+    несобранных кварталов; кварталы, отмеченные как полные, не запрашиваются
+    повторно (кроме refresh=True).
+
+    Квартал считается собранным полностью, если запрос прошел без ошибки, ответ
+    не заполнил страницу API (page_limit объектов - список мог быть обрезан) и
+    в нем есть все известные участки квартала из локальных наборов. Неполные
+    кварталы тоже записываются, но запрашиваются снова при следующем запуске.
+
+    Args:
+        quarters: {квартал: известные кадастровые номера} (find_zone_quarters).
+        store_path: Файл SQLite хранилища.
+        layer: Слой участков.
+        workers: Число одновременных запросов.
+        page_limit: Наибольшее число объектов в одном ответе API (None - не проверяется).
+        refresh: Запрашивать и кварталы, уже собранные полностью.
+        fetch: Запрос участков квартала (None - текстовый поиск НСПД).
+
+    Returns:
+        QuarterHarvestStats.
+    """
+    layer = _check_layer_name(layer)
+    fetch = fetch or search_cadastral_data_by_text
+    stats = QuarterHarvestStats(quarters=list(quarters))
+    status = {} if refresh else load_quarter_status(store_path, layer)
+    pending = []
+    for quarter in quarters:
+        if status.get(quarter):
+            stats.skipped.append(quarter)
+        else:
+            pending.append(quarter)
+    if not pending:
+        return stats
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(_fetch_quarter, quarter, fetch): quarter for quarter in pending}
+        # Записывает только основной поток, в порядке готовности ответов
+        for future in as_completed(futures):
+            quarter = futures[future]
+            parcels, returned, error = future.result()
+            if error:
+                logger.error(f"Квартал {quarter} не собран: {error}")
+                stats.failed.append(quarter)
+                continue
+            missing = quarters[quarter] - {feature_cad_fields(feature)[0] for feature in parcels}
+            truncated = page_limit is not None and returned >= page_limit
+            if missing:
+                logger.warning(f"Квартал {quarter}: в ответе нет известных участков ({len(missing)}), например {min(missing)}")
+            if truncated:
+                logger.warning(f"Квартал {quarter}: ответ API заполнил страницу ({returned}), список мог быть обрезан")
+            with SQLiteFeatureWriter(store_path, layer=layer, append=True) as writer:
+                writer.delete_quarter(quarter)
+                for feature in parcels:
+                    writer.write(feature)
+            complete = not missing and not truncated
+            # Отметка после фиксации участков: при сбое между ними квартал просто соберется заново
+            _mark_quarter(store_path, layer, quarter, len(parcels), complete)
+            (stats.complete if complete else stats.incomplete).append(quarter)
+            stats.parcels += len(parcels)
+    for collected in (stats.complete, stats.incomplete, stats.failed):
+        collected.sort()
+    return stats
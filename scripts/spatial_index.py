@@ -0,0 +1,321 @@
+import json
+import logging
+import os
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from scripts.geojson_stream import read_geojson_feature_spans
+from scripts.geometry_processing import GEOGRAPHIC_CRS_WGS84, geojson_geometry_crs, get_transformer
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+# Индекс хранится рядом с набором данных: "Этап 7.2.geojson" -> "Этап 7.2.geojson.hrtree"
+SIDECAR_SUFFIX = ".hrtree"
+DEFAULT_NODE_SIZE = 16
+
+# Заголовок файла индекса (little-endian, 64 байта, выравнивание по 8):
+# magic, версия, размер узла, число уровней, число features в исходном файле,
+# число проиндексированных features, число узлов, размер и mtime исходного файла,
+# длина имени CRS в байтах. За ним - имя CRS (UTF-8, дополнено нулями до кратного 8)
+_MAGIC = b"KHRTREE\x00"
+_VERSION = 2
+_HEADER = struct.Struct("<8sHHIQQQQqQ")
+_HILBERT_MAX = (1 << 16) - 1
+_NO_BOUNDS = (np.nan,) * 4
+
+def _padded(size: int) -> int:
+    # Массивы индекса начинаются с границы 8 байт
+    return (size + 7) // 8 * 8
+
+def _hilbert(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Векторизованно вычисляет индекс на кривой Гильберта для координат сетки 2^16 x 2^16
+    (алгоритм без ветвлений, как в flatbush).
+    """
+    x = x.astype(np.uint32)
+    y = y.astype(np.uint32)
+    a = x ^ y
+    b = 0xFFFF ^ a
+    c = 0xFFFF ^ (x | y)
+    d = x & (y ^ 0xFFFF)
+
+    A = a | (b >> 1)
+    B = (a >> 1) ^ a
+    C = ((c >> 1) ^ (b & (d >> 1))) ^ c
+    D = ((a & (c >> 1)) ^ (d >> 1)) ^ d
+
+    for shift in (2, 4):
+        a, b, c, d = A, B, C, D
+        A = (a & (a >> shift)) ^ (b & (b >> shift))
+        B = (a & (b >> shift)) ^ (b & ((a ^ b) >> shift))
+        C = C ^ ((a & (c >> shift)) ^ (b & (d >> shift)))
+        D = D ^ ((b & (c >> shift)) ^ ((a ^ b) & (d >> shift)))
+
+    a, b, c, d = A, B, C, D
+    C = C ^ ((a & (c >> 8)) ^ (b & (d >> 8)))
+    D = D ^ ((b & (c >> 8)) ^ ((a ^ b) & (d >> 8)))
+
+    a = C ^ (C >> 1)
+    b = D ^ (D >> 1)
+
+    i0 = x ^ y
+    i1 = b | (0xFFFF ^ (i0 | a))
+    for shift, mask in ((8, 0x00FF00FF), (4, 0x0F0F0F0F), (2, 0x33333333), (1, 0x55555555)):
+        i0 = (i0 | (i0 << shift)) & mask
+        i1 = (i1 | (i1 << shift)) & mask
+    return (i1 << 1) | i0
+
+def hilbert_order(bounds: np.ndarray) -> np.ndarray:
+    """
+    Возвращает порядок прямоугольников (minx, miny, maxx, maxy) вдоль кривой Гильберта
+    по их центрам: соседние в этом порядке объекты близки и в пространстве.
+    """
+    extent = np.array([bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()])
+    width = max(extent[2] - extent[0], 1e-12)
+    height = max(extent[3] - extent[1], 1e-12)
+    cx = np.floor(_HILBERT_MAX * ((bounds[:, 0] + bounds[:, 2]) / 2 - extent[0]) / width)
+    cy = np.floor(_HILBERT_MAX * ((bounds[:, 1] + bounds[:, 3]) / 2 - extent[1]) / height)
+    return np.argsort(_hilbert(cx, cy), kind="stable")
+
+def pack_hilbert_rtree(
+    bounds: np.ndarray,
+    ids: np.ndarray,
+    node_size: int,
+    order: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Строит упакованное R-дерево: листья отсортированы по кривой Гильберта,
+    каждый следующий уровень - прямоугольники групп по node_size узлов.
+
+    order - готовый порядок листьев (по умолчанию hilbert_order(bounds)), если
+    features уже записаны в этом порядке, как в FlatGeobuf.
+
+    Returns:
+        (level_bounds, boxes, indices): конец каждого уровня в массиве узлов,
+        прямоугольники всех узлов (листья первыми) и для каждого узла номер
+        feature (лист) либо позиция первого дочернего узла.
+    """
+    num_items = len(bounds)
+    if order is None:
+        order = hilbert_order(bounds)
+
+    level_boxes = [bounds[order]]
+    level_indices = [ids[order].astype(np.uint64)]
+    level_bounds = [num_items]
+    num_nodes = num_items
+    while len(level_boxes[-1]) > 1:
+        child_boxes = level_boxes[-1]
+        starts = np.arange(0, len(child_boxes), node_size)
+        parent_boxes = np.column_stack((
+            np.minimum.reduceat(child_boxes[:, 0], starts),
+            np.minimum.reduceat(child_boxes[:, 1], starts),
+            np.maximum.reduceat(child_boxes[:, 2], starts),
+            np.maximum.reduceat(child_boxes[:, 3], starts),
+        ))
+        level_indices.append((starts + level_bounds[-1] - len(child_boxes)).astype(np.uint64))
+        level_boxes.append(parent_boxes)
+        num_nodes += len(parent_boxes)
+        level_bounds.append(num_nodes)
+
+    return np.array(level_bounds, dtype=np.uint64), np.concatenate(level_boxes), np.concatenate(level_indices)
+
+def sidecar_path(dataset_path: str) -> str:
+    return dataset_path + SIDECAR_SUFFIX
+
+def build_spatial_index(dataset_path: str, index_path: Optional[str] = None, node_size: int = DEFAULT_NODE_SIZE) -> str:
+    """
+    Строит упакованное R-дерево Гильберта для GeoJSON и сохраняет его рядом с файлом.
+
+    Args:
+        dataset_path: Путь к GeoJSON FeatureCollection.
+        index_path: Путь к файлу индекса (по умолчанию <dataset>.hrtree).
+        node_size: Число дочерних узлов на узел дерева.
+
+    Returns:
+        Путь к созданному файлу индекса.
+    """
+    index_path = index_path or sidecar_path(dataset_path)
+    stat = os.stat(dataset_path)
+    # Features читаются потоково: в памяти остаются только прямоугольники и положения в файле
+    bounds, offsets, lengths = [], [], []
+    crs_name = None
+    for feature, offset, length in read_geojson_feature_spans(dataset_path):
+        geometry = feature.get("geometry")
+        bounds.append(shape(geometry).bounds if geometry else _NO_BOUNDS)
+        offsets.append(offset)
+        lengths.append(length)
+        if crs_name is None and geometry:
+            # Имя CRS уже приведено читателем (URN -> "EPSG:<код>"); WGS84 в геометрии не указывается
+            crs_name = geojson_geometry_crs(geometry) or GEOGRAPHIC_CRS_WGS84
+    crs_bytes = (crs_name or GEOGRAPHIC_CRS_WGS84).encode('utf-8')
+
+    bounds = np.array(bounds, dtype=np.float64).reshape(-1, 4)
+    # Features без геометрии и с пустой геометрией (прямоугольник из NaN) в дерево не попадают
+    indexed = np.isfinite(bounds).all(axis=1)
+    ids = np.flatnonzero(indexed)
+
+    if len(ids):
+        level_bounds, boxes, indices = pack_hilbert_rtree(bounds[indexed], ids, node_size)
+    else:
+        level_bounds, boxes, indices = np.zeros(0, np.uint64), np.zeros((0, 4)), np.zeros(0, np.uint64)
+
+    header = _HEADER.pack(
+        _MAGIC, _VERSION, node_size, len(level_bounds), len(offsets), len(ids), len(boxes),
+        stat.st_size, stat.st_mtime_ns, len(crs_bytes)
+    )
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(crs_bytes.ljust(_padded(len(crs_bytes)), b"\x00"))
+        for array, dtype in ((level_bounds, '<u8'), (boxes, '<f8'), (indices, '<u8'), (offsets, '<u8'), (lengths, '<u8')):
+            f.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+    os.replace(tmp_path, index_path) # Читатели никогда не видят недописанный индекс
+    return index_path
+
+class PackedHilbertRTree:
+    """
+    Открытый индекс: массивы узлов отображаются в память (np.memmap) и читаются
+    с диска только по мере обхода дерева; features загружаются из исходного
+    GeoJSON по одному, по смещениям из индекса.
+    """
+
+    def __init__(self, index_path: str, dataset_path: Optional[str] = None):
+        self.index_path = index_path
+        self.dataset_path = dataset_path or index_path[:-len(SIDECAR_SUFFIX)]
+        with open(index_path, 'rb') as f:
+            fields = _HEADER.unpack(f.read(_HEADER.size))
+            (magic, version, self.node_size, num_levels, self.num_features, self.num_items, num_nodes,
+             self.source_size, self.source_mtime_ns, crs_length) = fields
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"'{index_path}' is not a spatial index of version {_VERSION}")
+            crs_bytes = f.read(crs_length)
+        if len(crs_bytes) != crs_length:
+            raise ValueError(f"'{index_path}' is truncated")
+        self.crs = crs_bytes.decode('utf-8')
+
+        offset = _HEADER.size + _padded(crs_length)
+        def _map(dtype: str, shape: Tuple[int, ...]) -> np.ndarray:
+            nonlocal offset
+            count = int(np.prod(shape))
+            if count == 0:
+                return np.zeros(shape, dtype=dtype)
+            array = np.memmap(index_path, dtype=dtype, mode='r', offset=offset, shape=shape)
+            offset += count * np.dtype(dtype).itemsize
+            return array
+
+        self.level_bounds = np.array(_map('<u8', (num_levels,)), dtype=np.int64)
+        self.boxes = _map('<f8', (num_nodes, 4))
+        self.indices = _map('<u8', (num_nodes,))
+        self.offsets = _map('<u8', (self.num_features,))
+        self.lengths = _map('<u8', (self.num_features,))
+
+    def is_stale(self) -> bool:
+        """True, если исходный GeoJSON изменился после построения индекса."""
+        try:
+            stat = os.stat(self.dataset_path)
+        except OSError:
+            return True
+        return stat.st_size != self.source_size or stat.st_mtime_ns != self.source_mtime_ns
+
+    def query(self, bbox: Sequence[float]) -> List[int]:
+        """
+        Возвращает номера features (в порядке исходного файла), чьи прямоугольники
+        пересекают bbox = (minx, miny, maxx, maxy) в CRS индекса.
+        """
+        if self.num_items == 0:
+            return []
+        minx, miny, maxx, maxy = bbox
+        results = []
+        # Стек (позиция первого узла группы, уровень); начинаем с корня
+        stack = [(len(self.boxes) - 1, len(self.level_bounds) - 1)]
+        while stack:
+            node_pos, level = stack.pop()
+            end = min(node_pos + self.node_size, int(self.level_bounds[level]))
+            boxes = self.boxes[node_pos:end]
+            hits = np.flatnonzero(
+                (boxes[:, 0] <= maxx) & (boxes[:, 1] <= maxy) & (boxes[:, 2] >= minx) & (boxes[:, 3] >= miny)
+            )
+            if len(hits) == 0:
+                continue
+            children = self.indices[node_pos:end][hits].tolist()
+            if level == 0:
+                results.extend(children)
+            else:
+                stack.extend((child, level - 1) for child in children)
+        return sorted(results)
+
+    def read_feature(self, feature_id: int) -> Dict[str, Any]:
+        """Читает из исходного GeoJSON только один feature."""
+        with open(self.dataset_path, 'rb') as f:
+            f.seek(int(self.offsets[feature_id]))
+            return json.loads(f.read(int(self.lengths[feature_id])).decode('utf-8'))
+
+    def query_features(self, bbox: Sequence[float]) -> Iterator[Dict[str, Any]]:
+        """Лениво загружает features, найденные query(bbox)."""
+        feature_ids = self.query(bbox)
+        if not feature_ids:
+            return
+        with open(self.dataset_path, 'rb') as f:
+            for feature_id in feature_ids:
+                f.seek(int(self.offsets[feature_id]))
+                yield json.loads(f.read(int(self.lengths[feature_id])).decode('utf-8'))
+
+def open_spatial_index(dataset_path: str, rebuild: bool = True) -> Optional[PackedHilbertRTree]:
+    """
+    Открывает индекс набора данных; если его нет или он устарел - перестраивает
+    (при rebuild=True) или возвращает None.
+    """
+    index_path = sidecar_path(dataset_path)
+    index = None
+    if os.path.exists(index_path):
+        try:
+            index = PackedHilbertRTree(index_path, dataset_path)
+        except (ValueError, struct.error) as e:
+            logger.warning(f"Индекс '{index_path}' поврежден и будет перестроен: {e}")
+        if index is not None and index.is_stale():
+            logger.info(f"Индекс '{index_path}' устарел")
+            index = None
+    if index is None and rebuild:
+        try:
+            index = PackedHilbertRTree(build_spatial_index(dataset_path), dataset_path)
+        except (IOError, ValueError) as e:
+            logger.error(f"Не удалось построить индекс для '{dataset_path}': {e}")
+            return None
+    return index
+
+def query_datasets(
+    dataset_paths: Sequence[str],
+    bbox: Sequence[float],
+    bbox_crs: str = GEOGRAPHIC_CRS_WGS84,
+    exact: bool = False
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Ищет features, пересекающие bbox, во всех наборах данных по их индексам.
+
+    Args:
+        dataset_paths: Пути к GeoJSON (индексы строятся при первом обращении).
+        bbox: (minx, miny, maxx, maxy); для поиска по точке minx == maxx, miny == maxy.
+        bbox_crs: CRS прямоугольника запроса; он перепроецируется в CRS каждого индекса.
+        exact: Если True, features дополнительно проверяются на пересечение
+               самой геометрии (а не только ее прямоугольника) с bbox.
+
+    Yields:
+        Пары (путь к набору данных, словарь feature).
+    """
+    for dataset_path in dataset_paths:
+        index = open_spatial_index(dataset_path)
+        if index is None:
+            continue
+        query_bbox = bbox
+        if index.crs != bbox_crs:
+            query_bbox = get_transformer(bbox_crs, index.crs).transform_bounds(*bbox)
+        query_geom = shapely.box(*query_bbox)
+        for feature in index.query_features(query_bbox):
+            if exact and not shape(feature["geometry"]).intersects(query_geom):
+                continue
+            yield dataset_path, feature
@@ -0,0 +1,363 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+from urllib.request import pathname2url
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping
+
+from scripts.data_structures import IncrementalWriteStats
+from scripts.feature_batch import FeatureBatch
+from scripts.feature_identity import feature_cad_fields, feature_content_hash, feature_identity_key, identity_key
+from scripts.geometry_processing import GEOGRAPHIC_CRS_WGS84
+from scripts.json_encoding import dumps_json
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+SQLITE_LAYER_PARCELS = "parcels" # Участки НСПД (выгрузки этапов, search-pkk)
+SQLITE_LAYER_PLACEMARKS = "placemarks" # Обработанные Placemark из KML (process-kmls)
+DEFAULT_SQLITE_BATCH_SIZE = 5000 # Строк на один executemany
+
+_LAYER_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def _check_layer_name(layer: str) -> str:
+    # Имя слоя подставляется в SQL как идентификатор, поэтому допускаются только простые имена
+    if not _LAYER_NAME_RE.match(layer):
+        raise ValueError(f"Недопустимое имя слоя SQLite: '{layer}'")
+    return layer
+
+class SQLiteFeatureWriter:
+    """
+    Записывает GeoJSON Features в слой (таблицу) файла SQLite.
+
+    Геометрия хранится как WKB, прямоугольники - в виртуальной таблице R*Tree
+    rtree_<слой>, по cad_num и кварталу строятся индексы. Вся запись идет одной
+    транзакцией в режиме WAL, строки вставляются пакетами через executemany;
+    индексы создаются при закрытии, чтобы не перестраивать их на каждой вставке.
+    Интерфейс совпадает с GeoJSONFeatureWriter (open/write/close, контекстный менеджер).
+
+    Все геометрии слоя хранятся в одной CRS (таблица geometry_columns): features,
+    у геометрии которых член "crs" указывает другую CRS, перепроецируются при записи.
+    Без члена "crs" геометрия считается WGS84 (RFC 7946).
+
+    Для каждой строки хранятся ключ feature (feature_identity_key) и хэш
+    содержимого. С incremental=True слой не очищается: новый набор features
+    сравнивается с сохраненным по ключу и хэшу, записываются только новые и
+    измененные строки, а строки, которых нет в новом наборе, удаляются при
+    закрытии с записью в таблицу tombstones_<слой>. Итог - в атрибуте stats.
+    """
+
+    def __init__(
+        self,
+        output_filepath: str,
+        layer: str = SQLITE_LAYER_PARCELS,
+        crs_str: Optional[str] = None,
+        append: bool = False,
+        batch_size: int = DEFAULT_SQLITE_BATCH_SIZE,
+        json_backend: Optional[str] = None,
+        incremental: bool = False
+    ):
+        if append and incremental:
+            raise ValueError("Дозапись (append) и инкрементальная запись (incremental) несовместимы")
+        self.output_filepath = output_filepath
+        self.layer = _check_layer_name(layer)
+        self.crs_str = crs_str # None - CRS первого записанного feature (или уже записанная в файле)
+        self.append = append
+        self.incremental = incremental
+        self.batch_size = batch_size
+        self.json_backend = json_backend
+        self.count = 0
+        self.stats = IncrementalWriteStats()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._batch: List[Dict[str, Any]] = []
+        self._next_fid = 1
+        self._stored: Dict[str, Tuple[int, Optional[str]]] = {} # Ключ -> (fid, хэш) сохраненных строк
+        self._stale_fids: List[int] = [] # Лишние строки слоя (повторы ключа, строки без ключа)
+        self._seen: Set[str] = set()
+
+    def open(self) -> "SQLiteFeatureWriter":
+        """Открывает (создает) файл, схему слоя и начинает транзакцию."""
+        # isolation_level=None: транзакцией управляем сами (BEGIN/COMMIT).
+        # check_same_thread=False: FanOutFeatureWriter может писать из рабочего потока
+        # (обращения к соединению при этом последовательны)
+        self._connection = sqlite3.connect(self.output_filepath, isolation_level=None, check_same_thread=False)
+        cursor = self._connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("BEGIN")
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS geometry_columns ("
+            "table_name TEXT PRIMARY KEY, geometry_column TEXT NOT NULL, "
+            "geometry_format TEXT NOT NULL, crs TEXT NOT NULL)"
+        )
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self.layer}" ('
+            "fid INTEGER PRIMARY KEY, feature_id, cad_num TEXT, quarter_cad_number TEXT, "
+            "geometry_type TEXT, properties TEXT, geometry BLOB, feature_key TEXT, content_hash TEXT)"
+        )
+        # Файлы, записанные до появления ключей и хэшей, дополняются колонками
+        columns = {row[1] for row in cursor.execute(f'PRAGMA table_info("{self.layer}")')}
+        for column in ("feature_key", "content_hash"):
+            if column not in columns:
+                cursor.execute(f'ALTER TABLE "{self.layer}" ADD COLUMN {column} TEXT')
+        cursor.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS "rtree_{self.layer}" USING rtree(fid, minx, maxx, miny, maxy)')
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS "tombstones_{self.layer}" ('
+            "feature_key TEXT PRIMARY KEY, feature_id, cad_num TEXT, content_hash TEXT, deleted_at TEXT)"
+        )
+        if not self.append and not self.incremental:
+            cursor.execute(f'DELETE FROM "{self.layer}"')
+            cursor.execute(f'DELETE FROM "rtree_{self.layer}"')
+            cursor.execute(f'DELETE FROM "tombstones_{self.layer}"')
+            cursor.execute("DELETE FROM geometry_columns WHERE table_name = ?", (self.layer,))
+
+        stored = cursor.execute("SELECT crs FROM geometry_columns WHERE table_name = ?", (self.layer,)).fetchone()
+        if stored is not None:
+            if self.crs_str is not None and self.crs_str != stored[0]:
+                logger.warning(f"Слой '{self.layer}' хранится в {stored[0]}; новые геометрии перепроецируются в нее, а не в {self.crs_str}")
+            self.crs_str = stored[0]
+        elif self.crs_str is not None:
+            cursor.execute("INSERT INTO geometry_columns VALUES (?, 'geometry', 'WKB', ?)", (self.layer, self.crs_str))
+        self._next_fid = cursor.execute(f'SELECT COALESCE(MAX(fid), 0) + 1 FROM "{self.layer}"').fetchone()[0]
+        if self.incremental:
+            self._load_stored(cursor)
+        return self
+
+    def _load_stored(self, cursor: sqlite3.Cursor) -> None:
+        # properties нужны только строкам без ключа (записанным до появления колонки feature_key)
+        rows = cursor.execute(
+            f'SELECT fid, feature_key, feature_id, cad_num, content_hash, '
+            f'CASE WHEN feature_key IS NULL THEN properties END FROM "{self.layer}" ORDER BY fid'
+        )
+        for fid, key, feature_id, cad_num, content_hash, properties in rows:
+            if key is None:
+                kml_id = (json.loads(properties) or {}).get("kml_id") if properties else None
+                key = identity_key(feature_id, cad_num, kml_id)
+            if key is None or key in self._stored:
+                # Без идентификаторов строку не сопоставить; повтор ключа заменяется первой строкой
+                self._stale_fids.append(fid)
+            else:
+                self._stored[key] = (fid, content_hash)
+
+    def write(self, feature: Dict[str, Any]) -> None:
+        """Добавляет feature в текущий пакет; полный пакет записывается в базу."""
+        self._batch.append(feature)
+        self.count += 1
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def write_batch(self, batch: FeatureBatch) -> None:
+        """Записывает пакет features (геометрия, WKB и прямоугольники берутся из пакета)."""
+        self._flush()
+        self._write_rows(batch)
+        self.count += len(batch)
+
+    def _flush(self) -> None:
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, []
+        self._write_rows(FeatureBatch(batch))
+
+    def _write_rows(self, batch: FeatureBatch) -> None:
+        if not len(batch):
+            return
+        keys = [feature_identity_key(feature) for feature in batch.features]
+        hashes = [feature_content_hash(feature) for feature in batch.features]
+        if not self.incremental:
+            fids = list(range(self._next_fid, self._next_fid + len(batch)))
+            self._next_fid += len(batch)
+            self.stats.inserted += len(batch)
+            self._insert_rows(batch, fids, keys, hashes)
+            return
+
+        # Индекс feature в пакете по fid: повтор ключа в пакете перезаписывает ту же строку
+        changed: Dict[int, int] = {}
+        new_keys = []
+        for index, (key, content_hash) in enumerate(zip(keys, hashes)):
+            self._seen.add(key)
+            stored = self._stored.get(key)
+            if stored is not None and stored[1] == content_hash:
+                self.stats.unchanged += 1
+                continue
+            if stored is None:
+                fid = self._next_fid
+                self._next_fid += 1
+                new_keys.append((key,))
+                self.stats.inserted += 1
+            else:
+                fid = stored[0]
+                if fid not in changed:
+                    self.stats.updated += 1
+            changed[fid] = index
+            self._stored[key] = (fid, content_hash)
+        if not changed:
+            return
+        indices = list(changed.values())
+        # Перепроецирование и WKB - только для измененных features
+        self._insert_rows(
+            FeatureBatch([batch.features[i] for i in indices]), list(changed),
+            [keys[i] for i in indices], [hashes[i] for i in indices], replace=True
+        )
+        # Feature, удаленный раньше, снова появился
+        self._connection.executemany(f'DELETE FROM "tombstones_{self.layer}" WHERE feature_key = ?', new_keys)
+
+    def _insert_rows(
+        self,
+        batch: FeatureBatch,
+        fids: List[int],
+        keys: List[str],
+        hashes: List[str],
+        replace: bool = False
+    ) -> None:
+        if self.crs_str is None:
+            self.crs_str = batch.crs_names[0]
+            self._connection.execute(
+                "INSERT INTO geometry_columns VALUES (?, 'geometry', 'WKB', ?)", (self.layer, self.crs_str)
+            )
+
+        # Перепроецирование в CRS слоя - в пакете, по одному вызову на исходную CRS
+        geoms = batch.geometries(self.crs_str)
+        wkb = batch.wkb(self.crs_str)
+        bounds = batch.bounds(self.crs_str)
+        geometry_types = shapely.get_type_id(geoms)
+
+        rows = []
+        for fid, feature, geom, geom_wkb, key, content_hash in zip(fids, batch.features, geoms, wkb, keys, hashes):
+            cad_num, quarter = feature_cad_fields(feature)
+            rows.append((
+                fid, feature.get("id"), cad_num, quarter,
+                geom.geom_type if geom is not None else None,
+                dumps_json(feature.get("properties"), backend=self.json_backend),
+                geom_wkb, key, content_hash
+            ))
+        present = (geometry_types >= 0) & ~np.isnan(bounds).any(axis=1)
+        rtree_rows = [
+            (fid, box[0], box[2], box[1], box[3])
+            for fid, box, keep in zip(fids, bounds.tolist(), present.tolist()) if keep
+        ]
+        # INSERT OR REPLACE по fid заменяет измененную строку целиком
+        insert = "INSERT OR REPLACE" if replace else "INSERT"
+        self._connection.executemany(f'{insert} INTO "{self.layer}" VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        if replace:
+            self._connection.executemany(f'DELETE FROM "rtree_{self.layer}" WHERE fid = ?', [(fid,) for fid in fids])
+        self._connection.executemany(f'INSERT INTO "rtree_{self.layer}" VALUES (?, ?, ?, ?, ?)', rtree_rows)
+
+    def delete_quarter(self, quarter_cad_number: str) -> int:
+        """
+        Удаляет из слоя строки квартала в текущей транзакции (перед повторной
+        записью его участков при дозаписи) и возвращает их число.
+        """
+        self._flush()
+        fids = self._connection.execute(
+            f'SELECT fid FROM "{self.layer}" WHERE quarter_cad_number = ?', (quarter_cad_number,)
+        ).fetchall()
+        self._connection.executemany(f'DELETE FROM "{self.layer}" WHERE fid = ?', fids)
+        self._connection.executemany(f'DELETE FROM "rtree_{self.layer}" WHERE fid = ?', fids)
+        return len(fids)
+
+    def _delete_unseen(self) -> None:
+        # Строки, которых нет в новом наборе: tombstone с ключом и последним хэшем, затем удаление
+        removed = [(key, fid) for key, (fid, _) in self._stored.items() if key not in self._seen]
+        deleted_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self._connection.executemany(
+            f'INSERT OR REPLACE INTO "tombstones_{self.layer}" '
+            f'SELECT ?, feature_id, cad_num, content_hash, ? FROM "{self.layer}" WHERE fid = ?',
+            [(key, deleted_at, fid) for key, fid in removed]
+        )
+        fids = [(fid,) for _, fid in removed] + [(fid,) for fid in self._stale_fids]
+        self._connection.executemany(f'DELETE FROM "{self.layer}" WHERE fid = ?', fids)
+        self._connection.executemany(f'DELETE FROM "rtree_{self.layer}" WHERE fid = ?', fids)
+        self.stats.deleted += len(removed)
+
+    def close(self) -> None:
+        """Записывает остаток пакета, удаляет отсутствующие строки (incremental), создает индексы и фиксирует транзакцию."""
+        if self._connection is None:
+            return
+        try:
+            self._flush()
+            if self.incremental:
+                self._delete_unseen()
+            self._connection.execute(f'CREATE INDEX IF NOT EXISTS "idx_{self.layer}_cad_num" ON "{self.layer}" (cad_num)')
+            self._connection.execute(
+                f'CREATE INDEX IF NOT EXISTS "idx_{self.layer}_quarter" ON "{self.layer}" (quarter_cad_number)'
+            )
+            self._connection.execute(
+                f'CREATE INDEX IF NOT EXISTS "idx_{self.layer}_feature_key" ON "{self.layer}" (feature_key)'
+            )
+            self._connection.execute("COMMIT")
+        finally:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self) -> "SQLiteFeatureWriter":
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        elif self._connection is not None:
+            # При ошибке транзакция откатывается целиком: в файле остается прежнее содержимое
+            self._connection.execute("ROLLBACK")
+            self._connection.close()
+            self._connection = None
+
+def query_sqlite_features(
+    sqlite_path: str,
+    layer: str = SQLITE_LAYER_PARCELS,
+    bbox: Optional[Sequence[float]] = None,
+    cad_num: Optional[str] = None,
+    quarter_cad_number: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Выбирает features слоя SQLite по прямоугольнику (R*Tree), кадастровому номеру
+    и/или кварталу (индексы). Условия объединяются через AND.
+
+    Args:
+        sqlite_path: Путь к файлу SQLite, записанному SQLiteFeatureWriter.
+        layer: Имя слоя.
+        bbox: (minx, miny, maxx, maxy) в CRS слоя; отбор по пересечению прямоугольников.
+        cad_num: Кадастровый номер.
+        quarter_cad_number: Кадастровый квартал.
+
+    Yields:
+        GeoJSON Features; геометрия - в CRS слоя, указанной членом "crs" (как в ответах НСПД).
+    """
+    layer = _check_layer_name(layer)
+    # Только чтение: отсутствующий файл - ошибка, а не новая пустая база
+    connection = sqlite3.connect(f"file:{pathname2url(os.path.abspath(sqlite_path))}?mode=ro", uri=True)
+    try:
+        crs_row = connection.execute("SELECT crs FROM geometry_columns WHERE table_name = ?", (layer,)).fetchone()
+        layer_crs = crs_row[0] if crs_row else None
+        sql = f'SELECT t.feature_id, t.properties, t.geometry FROM "{layer}" t'
+        conditions, params = [], []
+        if bbox is not None:
+            sql += f' JOIN "rtree_{layer}" r ON r.fid = t.fid'
+            conditions.append("r.maxx >= ? AND r.minx <= ? AND r.maxy >= ? AND r.miny <= ?")
+            params.extend([bbox[0], bbox[2], bbox[1], bbox[3]])
+        if cad_num is not None:
+            conditions.append("t.cad_num = ?")
+            params.append(cad_num)
+        if quarter_cad_number is not None:
+            conditions.append("t.quarter_cad_number = ?")
+            params.append(quarter_cad_number)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY t.fid"
+        for feature_id, properties, geometry_wkb in connection.execute(sql, params):
+            geometry = None
+            if geometry_wkb is not None:
+                geometry = mapping(shapely.from_wkb(geometry_wkb))
+                if layer_crs and layer_crs != GEOGRAPHIC_CRS_WGS84:
+                    geometry["crs"] = {"type": "name", "properties": {"name": layer_crs}}
+            feature = {"type": "Feature", "geometry": geometry, "properties": json.loads(properties) if properties else None}
+            if feature_id is not None:
+                feature["id"] = feature_id
+            yield feature
+    finally:
+        connection.close()
@@ -0,0 +1,274 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import shapely
+from shapely import STRtree
+from shapely.geometry import mapping
+from shapely.geometry.base import BaseGeometry
+
+from scripts.data_structures import TopologyIssue
+from scripts.geometry_processing import (
+    GEOGRAPHIC_CRS_WGS84, METRIC_MODE_ALBERS,
+    apply_precision, check_validity, grid_size_for_crs, repair_geometries, reproject_geometries, select_local_crs
+)
+from scripts.overlay import OVERLAY_CRS
+
+DEFAULT_GAP_TOLERANCE = 1.0 # м: промежутки между соседями уже этого расстояния - разрывы
+DEFAULT_MIN_ISSUE_AREA = 0.01 # кв. м: меньшие перекрытия и разрывы считаются шумом округления
+
+# Матрица DE-9IM "внутренности пересекаются по площади" - перекрытие участков,
+# а не касание по границе и не общая точка
+_INTERIORS_OVERLAP = "2********"
+
+# Клин между касающимися участками острее этого угла - разрыв; прямые и тупые
+# входящие углы на стыке участков - обычная граница
+_MAX_WEDGE_ANGLE = np.radians(45)
+
+# Сегментов на четверть окружности в буферах замыкания: дуги радиусом в полдопуска
+# не влияют на результат, а каждая лишняя вершина замедляет наложения по всем парам
+_CLOSING_QUAD_SEGS = 2
+
+def _wedge_fill_area(radius: float, angle: float) -> float:
+    """
+    Площадь, которую замыкание радиусом radius заполняет в клине с углом angle.
+
+    Заполнение - клин до дуги радиусом radius с центральным углом pi - angle; GEOS
+    строит дугу из round((pi - angle) / (pi / 2 / _CLOSING_QUAD_SEGS)) равных хорд.
+    """
+    arc = np.pi - angle
+    chords = max(1, int(arc / (np.pi / 2 / _CLOSING_QUAD_SEGS) + 0.5))
+    return radius ** 2 * (1 / np.tan(angle / 2) - chords / 2 * np.sin(arc / chords))
+
+def _erode_union(dilated_left: np.ndarray, dilated_right: np.ndarray, radius: float,
+                 grid_size: Optional[float] = None) -> np.ndarray:
+    """Замыкание пар: эрозия объединения расширенных на radius участков."""
+    return shapely.buffer(_polygonal(shapely.union(dilated_left, dilated_right, grid_size=grid_size)),
+                          -radius, quad_segs=_CLOSING_QUAD_SEGS)
+
+def _polygonal(geoms: np.ndarray) -> np.ndarray:
+    """
+    Оставляет в геометриях только полигоны: make_valid и clip_by_rect могут вернуть
+    GeometryCollection с линиями и точками, а наложения GEOS требуют одной размерности.
+    """
+    result = geoms.copy()
+    mixed = np.flatnonzero(shapely.get_type_id(geoms) == 7)
+    # Два уровня частей: GeometryCollection может содержать MultiPolygon
+    parts, owner = shapely.get_parts(geoms[mixed], return_index=True)
+    parts, sub_owner = shapely.get_parts(parts, return_index=True)
+    owner = owner[sub_owner]
+    is_polygon = shapely.get_type_id(parts) == 3
+    collected = np.empty(len(mixed), dtype=object)
+    if is_polygon.any():
+        shapely.multipolygons(parts[is_polygon], indices=owner[is_polygon], out=collected)
+    result[mixed] = collected
+    return result
+
+def _per_pair(errors: Dict[int, str], op: Callable[..., Any], grid_size: float, *pair_geoms: np.ndarray) -> np.ndarray:
+    """
+    Применяет op к массивам геометрий пар векторизованно. Если GEOS падает
+    (TopologyException на почти совпадающих вершинах), op повторяется по одной
+    паре с наложением по сетке grid_size; пара, упавшая и так, получает None,
+    а текст ошибки - в errors по индексу пары.
+    """
+    try:
+        return op(*pair_geoms)
+    except shapely.errors.GEOSException:
+        result = np.empty(len(pair_geoms[0]), dtype=object)
+        for i in range(len(result)):
+            try:
+                result[i] = op(*(geoms[i:i + 1] for geoms in pair_geoms), grid_size=grid_size)[0]
+            except shapely.errors.GEOSException as e:
+                errors[i] = str(e)
+        return result
+
+def _error_issues(errors: Dict[int, str], index_a: np.ndarray, index_b: np.ndarray,
+                  cad_num: Callable[[int], Optional[str]]) -> List[TopologyIssue]:
+    """Пары, которые GEOS не смог проверить, - в отчет, чтобы их проверили вручную."""
+    return [
+        TopologyIssue("error", int(index_a[i]), int(index_b[i]), cad_num(int(index_a[i])), cad_num(int(index_b[i])), reason=reason)
+        for i, reason in sorted(errors.items())
+    ]
+
+def find_topology_issues(
+    parcel_geoms: Sequence[Optional[BaseGeometry]],
+    crs_str: str = OVERLAY_CRS,
+    cad_nums: Optional[Sequence[Optional[str]]] = None,
+    gap_tolerance: float = DEFAULT_GAP_TOLERANCE,
+    min_area: float = DEFAULT_MIN_ISSUE_AREA
+) -> List[TopologyIssue]:
+    """
+    Ищет перекрытия и узкие разрывы между соседними участками, а также невалидные участки.
+
+    Набор перепроецируется в одну равновеликую проекцию Альберса на его охват,
+    чтобы допуски задавались в метрах. Пары-кандидаты берутся из STRtree
+    по прямоугольникам, расширенным на допуск, а проверки и построение проблемных областей выполняются векторизованно:
+    перекрытие - relate_pattern "2********" и intersection, разрыв - часть
+    морфологического замыкания пары участков, не покрытая ими самими (и
+    полоса между соседями, и острый клин у точки касания).
+
+    Args:
+        parcel_geoms: Геометрии участков в crs_str.
+        crs_str: CRS участков.
+        cad_nums: Кадастровые номера участков (необязательно).
+        gap_tolerance: Максимальная ширина разрыва между соседями (м).
+        min_area: Минимальная площадь перекрытия/разрыва (кв. м).
+
+    Returns:
+        Список TopologyIssue; геометрии проблемных областей - в crs_str.
+    """
+    geom_array = np.empty(len(parcel_geoms), dtype=object)
+    geom_array[:] = list(parcel_geoms)
+    issues: List[TopologyIssue] = []
+    cad_num = (lambda i: cad_nums[i]) if cad_nums is not None else (lambda i: None)
+
+    # Невалидные участки попадают в отчет и дальше проверяются в исправленном виде
+    for i, validity in enumerate(check_validity(geom_array, repair=True)):
+        if validity is not None and not validity.is_valid:
+            issues.append(TopologyIssue("invalid", i, cad_num_a=cad_num(i), reason=validity.reason, geometry=geom_array[i]))
+            geom_array[i] = validity.repaired_geometry
+
+    present = np.flatnonzero(~shapely.is_missing(geom_array) & ~shapely.is_empty(geom_array))
+    if len(present) < 2:
+        return issues
+    qa_crs = select_local_crs(geom_array[present], crs_str, METRIC_MODE_ALBERS)[0]
+    # Перепроецирование и привязка к сетке могут породить микросамопересечения - исправляем повторно
+    geoms = _polygonal(repair_geometries(apply_precision(reproject_geometries(geom_array[present], crs_str, qa_crs), qa_crs)))
+    grid_size = grid_size_for_crs(qa_crs)
+    tree = STRtree(geoms)
+    shapely.prepare(geoms)
+
+    # Один запрос кандидатов по прямоугольникам, расширенным на допуск: он покрывает
+    # и перекрытия, и разрывы. Предикаты затем считаются по одному разу на пару
+    # (left < right) векторизованно, с подготовленными геометриями.
+    bounds = shapely.bounds(geoms)
+    expanded = shapely.box(bounds[:, 0] - gap_tolerance, bounds[:, 1] - gap_tolerance,
+                           bounds[:, 2] + gap_tolerance, bounds[:, 3] + gap_tolerance)
+    right, left = tree.query(expanded)
+    keep = left < right # Каждая пара один раз, без пары участка с самим собой
+    left, right = left[keep], right[keep]
+    touching = shapely.intersects(geoms[left], geoms[right])
+    overlapping = np.zeros(len(left), dtype=bool)
+    overlapping[touching] = shapely.relate_pattern(geoms[left[touching]], geoms[right[touching]], _INTERIORS_OVERLAP)
+
+    # Перекрытия
+    overlap_left, overlap_right = left[overlapping], right[overlapping]
+    overlap_errors: Dict[int, str] = {}
+    overlaps = _per_pair(overlap_errors, shapely.intersection, grid_size, geoms[overlap_left], geoms[overlap_right])
+    overlap_areas = shapely.area(overlaps)
+    keep = overlap_areas >= min_area
+    for a, b, geom, area in zip(overlap_left[keep], overlap_right[keep], overlaps[keep], overlap_areas[keep]):
+        ia, ib = int(present[a]), int(present[b])
+        issues.append(TopologyIssue("overlap", ia, ib, cad_num(ia), cad_num(ib), area=float(area), geometry=geom))
+    issues.extend(_error_issues(overlap_errors, present[overlap_left], present[overlap_right], cad_num))
+
+    # Разрывы: неперекрывающиеся соседи в пределах допуска, в том числе касающиеся -
+    # между участками, касающимися углом или частью границы, может остаться клин
+    near = ~overlapping
+    apart = ~touching
+    near[apart] = shapely.dwithin(geoms[left[apart]], geoms[right[apart]], gap_tolerance)
+    gap_left, gap_right, gap_touching = left[near], right[near], touching[near]
+    if len(gap_left):
+        # Морфологическое замыкание пары (буфер наружу и обратно) заполняет промежутки
+        # уже gap_tolerance - и полосу между участками, и клин у точки касания. Замыкания
+        # каждого участка вычитаются: узкие вырезы одного участка - не разрыв между соседями.
+        # Буфер объединения равен объединению буферов, поэтому расширение и замыкание
+        # каждого участка считаются один раз, а не для каждой его пары
+        radius = gap_tolerance / 2
+        gap_parcels = np.unique(np.concatenate((gap_left, gap_right)))
+        dilated = np.empty(len(geoms), dtype=object)
+        closed = np.empty(len(geoms), dtype=object)
+        # Сетка точности, сохраненная в геометриях apply_precision, переводит наложения GEOS
+        # в режим snap-rounding: для буферов он заметно медленнее и на почти совпадающих
+        # вершинах дуг падает с TopologyException. Буферы строятся в плавающей точности,
+        # а сетка задается явно только при повторе упавшей пары
+        floating = shapely.set_precision(geoms[gap_parcels], 0.0, mode="pointwise")
+        dilated[gap_parcels] = shapely.buffer(floating, radius, quad_segs=_CLOSING_QUAD_SEGS)
+        closed[gap_parcels] = shapely.buffer(dilated[gap_parcels], -radius, quad_segs=_CLOSING_QUAD_SEGS)
+        # Разрыв лежит в пересечении расширенных прямоугольников пары, поэтому буферы
+        # сначала обрезаются по нему (с запасом на эрозию) - дальше GEOS работает с малыми кусками
+        margin = 2 * gap_tolerance
+        xmin = np.maximum(bounds[gap_left, 0], bounds[gap_right, 0]) - margin
+        ymin = np.maximum(bounds[gap_left, 1], bounds[gap_right, 1]) - margin
+        xmax = np.minimum(bounds[gap_left, 2], bounds[gap_right, 2]) + margin
+        ymax = np.minimum(bounds[gap_left, 3], bounds[gap_right, 3]) + margin
+        windows = np.column_stack((xmin, ymin, xmax, ymax)).tolist()
+        sources = np.concatenate((dilated[gap_left], dilated[gap_right], closed[gap_left], closed[gap_right]))
+        # clip_by_rect не векторизован по прямоугольникам, но без наложения он на порядок быстрее
+        # intersection. Его результат бывает невалидным - исправляем перед наложениями
+        clipped = np.empty(len(sources), dtype=object)
+        clipped[:] = [shapely.clip_by_rect(geom, *window) for geom, window in zip(sources, windows * 4)]
+        dilated_left, dilated_right, closed_left, closed_right = np.split(_polygonal(repair_geometries(clipped)), 4)
+        gap_errors: Dict[int, str] = {}
+        closing = _per_pair(gap_errors, lambda *pair, grid_size=None: _erode_union(*pair, radius=radius, grid_size=grid_size),
+                            grid_size, dilated_left, dilated_right)
+        closed_pair = _polygonal(_per_pair(gap_errors, shapely.union, grid_size, closed_left, closed_right))
+        # Замыкание заполняет и входящий угол на стыке касающихся участков (у клина с углом a -
+        # r^2 * (ctg(a/2) - (pi - a)/2) за вычетом хорд дуги). Разрывом у касающихся
+        # считаются только куски больше заполнения клина _MAX_WEDGE_ANGLE
+        thresholds = np.where(gap_touching, max(min_area, _wedge_fill_area(radius, _MAX_WEDGE_ANGLE)), min_area)
+        # Замыкание пары содержит замыкания участков, поэтому площадь всех разрывов пары -
+        # разность площадей внутри пересечения прямоугольников с допуском, куда попадает
+        # разрыв (у края окна эрозия срезает полосу). Дорогое вычитание с почти совпадающими
+        # границами нужно только парам, где эта площадь не меньше порога куска
+        inner = np.column_stack((xmin, ymin, xmax, ymax)) + np.array([1, 1, -1, -1]) * (margin - gap_tolerance)
+        inner_windows = inner.tolist()
+        fill_areas = (
+            np.array([shapely.area(shapely.clip_by_rect(geom, *window)) for geom, window in zip(closing, inner_windows)])
+            - np.array([shapely.area(shapely.clip_by_rect(geom, *window)) for geom, window in zip(closed_pair, inner_windows)])
+        )
+        candidates = np.flatnonzero(fill_areas >= thresholds)
+        difference_errors: Dict[int, str] = {}
+        gaps = np.empty(len(gap_left), dtype=object)
+        gaps[candidates] = _per_pair(difference_errors, shapely.difference, grid_size, closing[candidates], closed_pair[candidates])
+        gap_errors.update({int(candidates[i]): reason for i, reason in difference_errors.items()})
+        pieces, piece_pairs = shapely.get_parts(gaps, return_index=True)
+        piece_areas = shapely.area(pieces)
+        kept = piece_areas >= thresholds[piece_pairs]
+        gap_areas = np.bincount(piece_pairs[kept], weights=piece_areas[kept], minlength=len(gap_left))
+        found = np.unique(piece_pairs[kept])
+        distances = shapely.distance(geoms[gap_left[found]], geoms[gap_right[found]])
+        for i, distance in zip(found.tolist(), distances.tolist()):
+            ia, ib = int(present[gap_left[i]]), int(present[gap_right[i]])
+            geom = shapely.union_all(pieces[kept & (piece_pairs == i)])
+            issues.append(TopologyIssue("gap", ia, ib, cad_num(ia), cad_num(ib), area=float(gap_areas[i]),
+                                        distance=distance, geometry=geom))
+        issues.extend(_error_issues(gap_errors, present[gap_left], present[gap_right], cad_num))
+
+    # Геометрии перекрытий и разрывов возвращаем в исходную CRS одним вызовом
+    pair_issues = [issue for issue in issues if issue.issue_type in ("overlap", "gap")]
+    if pair_issues:
+        back = apply_precision(reproject_geometries([issue.geometry for issue in pair_issues], qa_crs, crs_str), crs_str)
+        for issue, geom in zip(pair_issues, back):
+            issue.geometry = geom
+    return issues
+
+def topology_issues_to_features(
+    issues: Sequence[TopologyIssue],
+    crs_str: str = OVERLAY_CRS,
+    precision: int = 2
+) -> List[Dict[str, Any]]:
+    """
+    Преобразует найденные проблемы в GeoJSON Features (геометрия в WGS84, RFC 7946).
+    """
+    geoms = reproject_geometries([issue.geometry for issue in issues], crs_str, GEOGRAPHIC_CRS_WGS84)
+    geoms = apply_precision(geoms, GEOGRAPHIC_CRS_WGS84)
+    features = []
+    for issue, geom in zip(issues, geoms):
+        properties = {
+            "issue_type": issue.issue_type,
+            "cad_num_a": issue.cad_num_a,
+            "cad_num_b": issue.cad_num_b,
+            "area_sq_m": issue.area,
+            "distance_m": issue.distance,
+            "reason": issue.reason,
+        }
+        properties = {
+            k: round(v, precision) if isinstance(v, float) else v
+            for k, v in properties.items() if v is not None
+        }
+        features.append({
+            "type": "Feature",
+            "geometry": mapping(geom) if geom is not None else None,
+            "properties": properties,
+        })
+    return features
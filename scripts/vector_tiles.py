@@ -0,0 +1,504 @@
+import gzip
+import logging
+import os
+import sqlite3
+import struct
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from shapely.geometry.base import BaseGeometry
+
+from scripts.data_structures import ExtractedPlacemark, VectorTileLayer
+from scripts.geometry_processing import (
+    DEFAULT_PLANAR_CRS, GEOGRAPHIC_CRS_WGS84, geojson_geometry_crs, get_transformer, reproject_geometries
+)
+from scripts.json_encoding import dumps_json
+
+# Настройка логирования
+logger = logging.getLogger(__name__)
+
+TILE_CRS = DEFAULT_PLANAR_CRS # Тайлы строятся в Web Mercator (EPSG:3857)
+WEB_MERCATOR_HALF_WORLD = 20037508.342789244 # Половина ширины мира в EPSG:3857 (м)
+
+DEFAULT_TILE_EXTENT = 4096 # Единиц координат на сторону тайла (спецификация MVT 2.1)
+DEFAULT_TILE_BUFFER = 64 # Запас вокруг тайла (в единицах тайла), чтобы не было швов на границах
+DEFAULT_MIN_ZOOM = 10
+DEFAULT_MAX_ZOOM = 16
+DEFAULT_SIMPLIFY_TOLERANCE = 1.0 # Допуск упрощения в единицах тайла своего уровня
+DEFAULT_MIN_FEATURE_SIZE = 8.0 # Features меньше этого размера (единиц тайла) не попадают на уровни ниже максимального
+
+MBTILES_EXTENSION = ".mbtiles"
+
+# GeomType в схеме MVT
+_MVT_POINT = 1
+_MVT_LINESTRING = 2
+_MVT_POLYGON = 3
+
+# Команды геометрии MVT
+_CMD_MOVE_TO = 1
+_CMD_LINE_TO = 2
+_CMD_CLOSE_PATH = 7
+
+# --- Кодирование protobuf ---
+
+_SMALL_VARINT_ARRAY = 64 # Короче этого массивы кодируются циклом Python: накладные расходы numpy больше
+
+def _encode_varints(values: np.ndarray) -> bytes:
+    """Векторизованно кодирует неотрицательные целые в последовательность varint protobuf."""
+    remaining = np.asarray(values, dtype=np.uint64)
+    if len(remaining) < _SMALL_VARINT_ARRAY:
+        return b"".join(_varint(value) for value in remaining.tolist())
+    groups = np.zeros((len(remaining), 10), dtype=np.uint8)
+    lengths = np.ones(len(remaining), dtype=np.int64)
+    for i in range(10):
+        low = (remaining & np.uint64(0x7F)).astype(np.uint8)
+        remaining = remaining >> np.uint64(7)
+        more = remaining > 0
+        groups[:, i] = low | (more.astype(np.uint8) << 7)
+        lengths += more
+        if not more.any():
+            break
+    # Построчная маска сохраняет порядок: байты каждого числа идут подряд
+    return groups[np.arange(10) < lengths[:, None]].tobytes()
+
+def _varint(value: int) -> bytes:
+    # Одиночные значения (теги, длины) дешевле кодировать без numpy
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _field(field_number: int, payload: bytes) -> bytes:
+    # Поле с длиной (wire type 2): строки, вложенные сообщения, упакованные массивы
+    return _varint((field_number << 3) | 2) + _varint(len(payload)) + payload
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+def _encode_value(value: Union[str, bool, int, float]) -> bytes:
+    # Сообщение Value: string (1), double (3), uint64 (5), sint64 (6), bool (7)
+    if isinstance(value, bool):
+        return _varint((7 << 3) | 0) + _varint(int(value))
+    if isinstance(value, int):
+        if value >= 0:
+            return _varint((5 << 3) | 0) + _varint(value)
+        return _varint((6 << 3) | 0) + _encode_varints(_zigzag(np.array([value])))
+    if isinstance(value, float):
+        return _varint((3 << 3) | 1) + struct.pack("<d", value)
+    return _field(1, str(value).encode("utf-8"))
+
+# --- Геометрия в координатах тайла ---
+
+def _ring_commands(coords: np.ndarray, cursor: np.ndarray, closed: bool) -> Tuple[List[np.ndarray], np.ndarray]:
+    if closed:
+        coords = coords[:-1] # Замыкающая точка заменяется командой ClosePath
+    if len(coords) == 0:
+        return [], cursor
+    # Подряд идущие совпадающие (после округления) точки не кодируются
+    keep = np.ones(len(coords), dtype=bool)
+    keep[1:] = (np.diff(coords, axis=0) != 0).any(axis=1)
+    coords = coords[keep]
+    if closed and len(coords) > 1 and (coords[0] == coords[-1]).all():
+        coords = coords[:-1]
+    if len(coords) < (3 if closed else 2):
+        return [], cursor
+    deltas = _zigzag(np.diff(np.vstack((cursor, coords)), axis=0)).ravel()
+    parts = [
+        np.array([_CMD_MOVE_TO | (1 << 3)], dtype=np.uint64), deltas[:2],
+        np.array([_CMD_LINE_TO | ((len(coords) - 1) << 3)], dtype=np.uint64), deltas[2:],
+    ]
+    if closed:
+        parts.append(np.array([_CMD_CLOSE_PATH | (1 << 3)], dtype=np.uint64))
+    return parts, coords[-1]
+
+def _signed_area(coords: np.ndarray) -> float:
+    # Формула площади Гаусса в координатах тайла (ось Y направлена вниз)
+    x, y = coords[:, 0], coords[:, 1]
+    return 0.5 * float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+
+def _encode_geometry(geom: BaseGeometry) -> Optional[Tuple[int, bytes]]:
+    """
+    Кодирует геометрию (уже в целых координатах тайла) в команды MVT.
+    Возвращает (GeomType, упакованные команды) или None, если после округления
+    от геометрии ничего не осталось.
+    """
+    cursor = np.zeros(2, dtype=np.int64)
+    parts: List[np.ndarray] = []
+    geom_type = geom.geom_type
+    if geom_type in ("Point", "MultiPoint"):
+        coords = shapely.get_coordinates(geom).astype(np.int64)
+        if len(coords) == 0:
+            return None
+        deltas = _zigzag(np.diff(np.vstack((cursor, coords)), axis=0)).ravel()
+        parts = [np.array([_CMD_MOVE_TO | (len(coords) << 3)], dtype=np.uint64), deltas]
+        return _MVT_POINT, _encode_varints(np.concatenate(parts))
+    if geom_type in ("LineString", "MultiLineString"):
+        for line in shapely.get_parts(geom):
+            line_parts, cursor = _ring_commands(shapely.get_coordinates(line).astype(np.int64), cursor, closed=False)
+            parts.extend(line_parts)
+        return (_MVT_LINESTRING, _encode_varints(np.concatenate(parts))) if parts else None
+    if geom_type in ("Polygon", "MultiPolygon"):
+        for polygon in shapely.get_parts(geom):
+            exterior = shapely.get_coordinates(polygon.exterior).astype(np.int64)
+            area = _signed_area(exterior) if len(exterior) >= 4 else 0
+            if area == 0:
+                continue
+            # MVT: внешнее кольцо - положительная площадь в координатах тайла, внутренние - отрицательная
+            rings = [exterior if area > 0 else exterior[::-1]]
+            for interior in polygon.interiors:
+                hole = shapely.get_coordinates(interior).astype(np.int64)
+                hole_area = _signed_area(hole) if len(hole) >= 4 else 0
+                if hole_area != 0:
+                    rings.append(hole if hole_area < 0 else hole[::-1])
+            for ring in rings:
+                ring_parts, cursor = _ring_commands(ring, cursor, closed=True)
+                parts.extend(ring_parts)
+        return (_MVT_POLYGON, _encode_varints(np.concatenate(parts))) if parts else None
+    return None
+
+# --- Математика тайлов ---
+
+def tile_size(zoom: int) -> float:
+    """Сторона тайла уровня zoom в метрах EPSG:3857."""
+    return 2 * WEB_MERCATOR_HALF_WORLD / (1 << zoom)
+
+def tile_bounds(zoom: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Прямоугольник тайла (minx, miny, maxx, maxy) в EPSG:3857; y отсчитывается сверху (XYZ)."""
+    size = tile_size(zoom)
+    minx = -WEB_MERCATOR_HALF_WORLD + x * size
+    maxy = WEB_MERCATOR_HALF_WORLD - y * size
+    return minx, maxy - size, minx + size, maxy
+
+def _tile_pairs(bounds: np.ndarray, zoom: int, margin: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Для каждого feature - все тайлы, которые задевает его прямоугольник, расширенный на margin
+    size = tile_size(zoom)
+    last = (1 << zoom) - 1
+    x0 = np.clip(np.floor((bounds[:, 0] - margin + WEB_MERCATOR_HALF_WORLD) / size), 0, last).astype(np.int64)
+    x1 = np.clip(np.floor((bounds[:, 2] + margin + WEB_MERCATOR_HALF_WORLD) / size), 0, last).astype(np.int64)
+    y0 = np.clip(np.floor((WEB_MERCATOR_HALF_WORLD - bounds[:, 3] - margin) / size), 0, last).astype(np.int64)
+    y1 = np.clip(np.floor((WEB_MERCATOR_HALF_WORLD - bounds[:, 1] + margin) / size), 0, last).astype(np.int64)
+    widths, heights = x1 - x0 + 1, y1 - y0 + 1
+    counts = widths * heights
+    feature_index = np.repeat(np.arange(len(bounds)), counts)
+    # Номер тайла внутри прямоугольника feature -> (dx, dy)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    xs = np.repeat(x0, counts) + local % np.repeat(widths, counts)
+    ys = np.repeat(y0, counts) + local // np.repeat(widths, counts)
+    return feature_index, xs, ys
+
+# --- Подготовка слоев ---
+
+def _tile_value(value: Any) -> Any:
+    # MVT хранит только скаляры: списки и словари (например, floor) - компактным JSON
+    if isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        return value.item()
+    return dumps_json(value)
+
+def features_to_tile_layer(
+    name: str,
+    features: Iterable[Dict[str, Any]],
+    attributes: Optional[Sequence[str]] = None
+) -> VectorTileLayer:
+    """
+    Готовит слой тайлов из GeoJSON Features (участки НСПД, результаты dissolve/overlay).
+
+    Геометрии перепроецируются в EPSG:3857 (CRS берется из члена "crs" геометрии,
+    без него - WGS84). Атрибуты - properties и properties.options (формат НСПД)
+    одним уровнем; None пропускается, списки и словари записываются JSON.
+
+    Args:
+        name: Имя слоя.
+        features: GeoJSON Features.
+        attributes: Оставляемые атрибуты (по умолчанию - все), например
+            ["cad_num", "land_record_category_type", "permitted_use_established_by_document"].
+    """
+    geoms, crs_names, properties, feature_ids = [], [], [], []
+    for feature in features:
+        raw_geometry = feature.get("geometry")
+        if not raw_geometry:
+            continue
+        geoms.append(shape(raw_geometry))
+        crs_names.append(geojson_geometry_crs(raw_geometry) or GEOGRAPHIC_CRS_WGS84)
+        source = dict(feature.get("properties") or {})
+        options = source.pop("options") if isinstance(source.get("options"), dict) else {}
+        source.update(options)
+        properties.append({
+            key: _tile_value(value) for key, value in source.items()
+            if value is not None and (attributes is None or key in attributes)
+        })
+        feature_id = feature.get("id")
+        feature_ids.append(feature_id if isinstance(feature_id, int) and feature_id >= 0 else None)
+
+    geom_array = np.empty(len(geoms), dtype=object)
+    geom_array[:] = geoms
+    crs_array = np.array(crs_names, dtype=object)
+    for crs_str in set(crs_names) - {TILE_CRS}:
+        mask = crs_array == crs_str
+        geom_array[mask] = reproject_geometries(geom_array[mask], crs_str, TILE_CRS)
+    return VectorTileLayer(name, geom_array, properties, feature_ids)
+
+def placemarks_to_tile_layer(name: str, placemarks: Sequence[ExtractedPlacemark], geoms: Sequence[BaseGeometry]) -> VectorTileLayer:
+    """Готовит слой тайлов из зон KML (результат load_kml_zones, геометрии в EPSG:3857)."""
+    geom_array = np.empty(len(geoms), dtype=object)
+    geom_array[:] = list(geoms)
+    properties = [
+        {key: value for key, value in (("name", pm.name), ("kml_id", pm.id), ("kml_geometry_type", pm.geometry_type)) if value}
+        for pm in placemarks
+    ]
+    return VectorTileLayer(name, geom_array, properties)
+
+# --- Запись тайлов ---
+
+class TileDirectoryWriter:
+    """Записывает тайлы в каталог <каталог>/<z>/<x>/<y>.pbf и metadata.json (описание слоев)."""
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.count = 0
+
+    def open(self) -> "TileDirectoryWriter":
+        os.makedirs(self.output_dir, exist_ok=True)
+        return self
+
+    def write_tile(self, zoom: int, x: int, y: int, data: bytes) -> None:
+        tile_dir = os.path.join(self.output_dir, str(zoom), str(x))
+        os.makedirs(tile_dir, exist_ok=True)
+        # Без сжатия: файлы отдаются статическим сервером без заголовка Content-Encoding
+        with open(os.path.join(tile_dir, f"{y}.pbf"), "wb") as f:
+            f.write(data)
+        self.count += 1
+
+    def close(self, metadata: Optional[Dict[str, Any]] = None) -> None:
+        if metadata is not None:
+            with open(os.path.join(self.output_dir, "metadata.json"), "w", encoding="utf-8") as f:
+                f.write(dumps_json(metadata, indent=2))
+
+    def __enter__(self) -> "TileDirectoryWriter":
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass # Метаданные пишет generate_vector_tiles через close(metadata)
+
+class MBTilesWriter:
+    """
+    Записывает тайлы в файл MBTiles 1.3 (SQLite): таблицы metadata и tiles.
+    Тайлы сжимаются gzip, строки хранятся в схеме TMS (нумерация снизу),
+    вся запись - одна транзакция; при ошибке файл остается прежним.
+    """
+
+    def __init__(self, output_filepath: str):
+        self.output_filepath = output_filepath
+        self.count = 0
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def open(self) -> "MBTilesWriter":
+        self._connection = sqlite3.connect(self.output_filepath, isolation_level=None)
+        self._connection.execute("BEGIN")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)"
+        )
+        self._connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)")
+        # Пирамида строится заново целиком
+        self._connection.execute("DELETE FROM metadata")
+        self._connection.execute("DELETE FROM tiles")
+        return self
+
+    def write_tile(self, zoom: int, x: int, y: int, data: bytes) -> None:
+        tms_row = (1 << zoom) - 1 - y
+        self._connection.execute("INSERT INTO tiles VALUES (?, ?, ?, ?)", (zoom, x, tms_row, gzip.compress(data, mtime=0)))
+        self.count += 1
+
+    def close(self, metadata: Optional[Dict[str, Any]] = None) -> None:
+        if self._connection is None:
+            return
+        try:
+            for key, value in (metadata or {}).items():
+                text = value if isinstance(value, str) else dumps_json(value) if isinstance(value, dict) else str(value)
+                self._connection.execute("INSERT INTO metadata VALUES (?, ?)", (key, text))
+            self._connection.execute("COMMIT")
+        finally:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self) -> "MBTilesWriter":
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None and self._connection is not None:
+            self._connection.execute("ROLLBACK")
+            self._connection.close()
+            self._connection = None
+
+def create_tile_writer(output_path: str) -> Union[TileDirectoryWriter, MBTilesWriter]:
+    """Файл .mbtiles - MBTilesWriter, иначе - каталог z/x/y.pbf."""
+    if output_path.lower().endswith(MBTILES_EXTENSION):
+        return MBTilesWriter(output_path)
+    return TileDirectoryWriter(output_path)
+
+# --- Построение пирамиды ---
+
+def _encode_layer(
+    name: str,
+    geoms: np.ndarray,
+    properties: Sequence[Dict[str, Any]],
+    feature_ids: Sequence[Optional[int]],
+    extent: int
+) -> Optional[bytes]:
+    # Сообщение Layer: name (1), features (2), keys (3), values (4), extent (5), version (15)
+    keys: Dict[str, int] = {}
+    values: Dict[Tuple[str, Any], int] = {}
+    features = []
+    for geom, props, feature_id in zip(geoms, properties, feature_ids):
+        if geom is None or geom.is_empty:
+            continue
+        encoded = _encode_geometry(geom)
+        if encoded is None:
+            continue
+        geom_type, commands = encoded
+        tags = []
+        for key, value in props.items():
+            tags.append(keys.setdefault(key, len(keys)))
+            # Тип входит в ключ словаря значений: True, 1 и 1.0 - разные значения
+            tags.append(values.setdefault((type(value).__name__, value), len(values)))
+        feature = b""
+        if feature_id is not None:
+            feature += _varint((1 << 3) | 0) + _varint(feature_id)
+        if tags:
+            feature += _field(2, _encode_varints(np.array(tags, dtype=np.uint64)))
+        feature += _varint((3 << 3) | 0) + _varint(geom_type) + _field(4, commands)
+        features.append(_field(2, feature))
+    if not features:
+        return None
+    return b"".join([
+        _varint((15 << 3) | 0), _varint(2),
+        _field(1, name.encode("utf-8")),
+        *features,
+        *[_field(3, key.encode("utf-8")) for key in keys],
+        *[_field(4, _encode_value(value)) for _, value in values],
+        _varint((5 << 3) | 0), _varint(extent),
+    ])
+
+def _vector_layers_metadata(layers: Sequence[VectorTileLayer], min_zoom: int, max_zoom: int) -> List[Dict[str, Any]]:
+    # Описание слоев для TileJSON/MBTiles: имена и типы атрибутов
+    described = []
+    for layer in layers:
+        fields = {}
+        for props in layer.properties:
+            for key, value in props.items():
+                fields.setdefault(key, "Boolean" if isinstance(value, bool) else "Number" if isinstance(value, (int, float)) else "String")
+        described.append({"id": layer.name, "fields": fields, "minzoom": min_zoom, "maxzoom": max_zoom})
+    return described
+
+def generate_vector_tiles(
+    layers: Sequence[VectorTileLayer],
+    tile_writer: Union[TileDirectoryWriter, MBTilesWriter],
+    min_zoom: int = DEFAULT_MIN_ZOOM,
+    max_zoom: int = DEFAULT_MAX_ZOOM,
+    extent: int = DEFAULT_TILE_EXTENT,
+    buffer: int = DEFAULT_TILE_BUFFER,
+    simplify_tolerance: float = DEFAULT_SIMPLIFY_TOLERANCE,
+    min_feature_size: float = DEFAULT_MIN_FEATURE_SIZE,
+    name: str = "kadastr"
+) -> Dict[int, int]:
+    """
+    Строит пирамиду векторных тайлов Mapbox Vector Tile (MVT 2.1) по слоям.
+
+    На каждом уровне геометрии упрощаются с допуском simplify_tolerance единиц
+    тайла этого уровня (векторизованно, от исходных геометрий), features меньше
+    min_feature_size единиц на уровнях ниже max_zoom отбрасываются, а каждая
+    геометрия обрезается по тайлу с запасом buffer (clip_by_rect, один вызов
+    на тайл и слой). Координаты округляются до целых единиц тайла. Пустые тайлы
+    не записываются, поэтому карта загружает только тайлы с данными в видимой области.
+
+    Args:
+        layers: Слои (features_to_tile_layer, placemarks_to_tile_layer).
+        tile_writer: Открытый TileDirectoryWriter или MBTilesWriter; закрывается с метаданными.
+        min_zoom, max_zoom: Диапазон уровней.
+        extent: Единиц координат на сторону тайла.
+        buffer: Запас вокруг тайла в единицах тайла.
+        simplify_tolerance: Допуск упрощения в единицах тайла (0 - без упрощения).
+        min_feature_size: Минимальный размер feature (единиц тайла) на уровнях ниже max_zoom.
+        name: Имя набора тайлов в метаданных.
+
+    Returns:
+        Число записанных тайлов по уровням.
+    """
+    if not 0 <= min_zoom <= max_zoom <= 24:
+        raise ValueError(f"Недопустимый диапазон уровней: {min_zoom}..{max_zoom}")
+    tiles_per_zoom: Dict[int, int] = {}
+    layer_bounds = [shapely.bounds(layer.geometries) if len(layer.geometries) else np.zeros((0, 4)) for layer in layers]
+
+    for zoom in range(min_zoom, max_zoom + 1):
+        scale = extent / tile_size(zoom) # Единиц тайла на метр
+        margin = buffer / scale
+        # (x, y) -> {номер слоя: (индексы features, упрощенные геометрии слоя)}
+        tiles: Dict[Tuple[int, int], Dict[int, List[int]]] = {}
+        simplified_layers = []
+        for layer_index, (layer, bounds) in enumerate(zip(layers, layer_bounds)):
+            keep = ~np.isnan(bounds).any(axis=1) if len(bounds) else np.zeros(0, dtype=bool)
+            if zoom < max_zoom and len(bounds):
+                sizes = np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1]) * scale
+                is_point = shapely.get_type_id(layer.geometries) == 0
+                keep &= (sizes >= min_feature_size) | is_point
+            simplified = layer.geometries.copy()
+            if simplify_tolerance > 0 and keep.any():
+                simplified[keep] = shapely.simplify(layer.geometries[keep], simplify_tolerance / scale, preserve_topology=True)
+            simplified_layers.append(simplified)
+            kept = np.flatnonzero(keep)
+            if len(kept) == 0:
+                continue
+            feature_index, xs, ys = _tile_pairs(bounds[kept], zoom, margin)
+            for index, x, y in zip(kept[feature_index].tolist(), xs.tolist(), ys.tolist()):
+                tiles.setdefault((x, y), {}).setdefault(layer_index, []).append(index)
+
+        written = 0
+        for (x, y), layer_features in sorted(tiles.items()):
+            minx, miny, maxx, maxy = tile_bounds(zoom, x, y)
+            encoded_layers = []
+            for layer_index, indices in sorted(layer_features.items()):
+                layer = layers[layer_index]
+                clipped = shapely.clip_by_rect(simplified_layers[layer_index][indices],
+                                               minx - margin, miny - margin, maxx + margin, maxy + margin)
+                # Координаты тайла: начало - левый верхний угол, ось Y вниз, целые единицы
+                local = shapely.transform(clipped, lambda c: np.round((c - (minx, maxy)) * (scale, -scale)))
+                feature_ids = layer.feature_ids or [None] * len(layer.geometries)
+                encoded = _encode_layer(layer.name, local, [layer.properties[i] for i in indices],
+                                        [feature_ids[i] for i in indices], extent)
+                if encoded is not None:
+                    encoded_layers.append(_field(3, encoded))
+            if encoded_layers:
+                tile_writer.write_tile(zoom, x, y, b"".join(encoded_layers))
+                written += 1
+        tiles_per_zoom[zoom] = written
+        logger.info(f"Уровень {zoom}: тайлов - {written}")
+
+    tile_writer.close(_tileset_metadata(layers, layer_bounds, min_zoom, max_zoom, name))
+    return tiles_per_zoom
+
+def _tileset_metadata(
+    layers: Sequence[VectorTileLayer],
+    layer_bounds: Sequence[np.ndarray],
+    min_zoom: int,
+    max_zoom: int,
+    name: str
+) -> Dict[str, Any]:
+    # Метаданные MBTiles 1.3: охват и центр - в градусах WGS84
+    metadata: Dict[str, Any] = {"name": name, "format": "pbf", "type": "overlay", "minzoom": min_zoom, "maxzoom": max_zoom}
+    all_bounds = np.vstack([b for b in layer_bounds if len(b)]) if any(len(b) for b in layer_bounds) else np.zeros((0, 4))
+    all_bounds = all_bounds[~np.isnan(all_bounds).any(axis=1)]
+    if len(all_bounds):
+        west, south, east, north = get_transformer(TILE_CRS, GEOGRAPHIC_CRS_WGS84).transform_bounds(
+            all_bounds[:, 0].min(), all_bounds[:, 1].min(), all_bounds[:, 2].max(), all_bounds[:, 3].max()
+        )
+        metadata["bounds"] = f"{west:.6f},{south:.6f},{east:.6f},{north:.6f}"
+        metadata["center"] = f"{(west + east) / 2:.6f},{(south + north) / 2:.6f},{min_zoom}"
+    metadata["json"] = {"vector_layers": _vector_layers_metadata(layers, min_zoom, max_zoom)}
+    return metadata
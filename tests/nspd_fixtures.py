@@ -0,0 +1,32 @@
+"""Общие тестовые данные: features участков в формате ответа НСПД."""
+
+# Квартал участков по умолчанию: номер участка - "<квартал>:<id>"
+DEFAULT_QUARTER = "50:03:0060111"
+
+def nspd_feature(nspd_id, x=0.0, y=0.0, cad_num=None, quarter=None, label=None, crs="EPSG:3857",
+                 geometry=None, options=None):
+    """
+    Feature участка НСПД: квадрат 10 x 10 с углом (x, y) в crs (метры EPSG:3857 по умолчанию).
+
+    Args:
+        nspd_id: id feature.
+        x, y: Нижний левый угол квадрата.
+        cad_num: Кадастровый номер (по умолчанию "50:03:0060111:<nspd_id>").
+        quarter: quarter_cad_number в options, если участок перенесен в другой квартал.
+        label: properties.label (по умолчанию - кадастровый номер).
+        crs: Имя CRS в члене "crs" геометрии; None - без члена (WGS84).
+        geometry: Геометрия GeoJSON вместо квадрата (член "crs" добавляется из crs).
+        options: Дополнительные поля options (cost_value, specified_area, ...).
+    """
+    cad_num = cad_num or f"{DEFAULT_QUARTER}:{nspd_id}"
+    feature_options = {"cad_num": cad_num}
+    if quarter:
+        feature_options["quarter_cad_number"] = quarter
+    feature_options.update(options or {})
+    if geometry is None:
+        geometry = {"type": "Polygon", "coordinates": [[[x, y], [x + 10, y], [x + 10, y + 10], [x, y + 10], [x, y]]]}
+    geometry = dict(geometry)
+    if crs:
+        geometry["crs"] = {"type": "name", "properties": {"name": crs}}
+    return {"id": nspd_id, "type": "Feature", "geometry": geometry,
+            "properties": {"label": label or cad_num, "options": feature_options}}
@@ -0,0 +1,75 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+import shutil
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.cadastral_index import (
+    build_cadastral_index, cad_sort_key, find_parcels, open_cadastral_index, sidecar_path
+)
+from tests.nspd_fixtures import nspd_feature
+
+# Точка в WGS84: индекс читает только номера, геометрия не важна
+POINT = {"type": "Point", "coordinates": [37.1, 56.0]}
+
+class TestCadastralIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.cad_nums = [
+            "50:03:0060111:400", "50:03:0060111:41", "50:03:0060111:5", "50:03:0060115:1",
+            "50:030:0000001:1", "69:27:0000021:400", "50:03:0060111:41",
+        ]
+        features = [nspd_feature(i, cad_num=cad_num, geometry=POINT, crs=None) for i, cad_num in enumerate(self.cad_nums)]
+        # Участок перенесен в квартал 0060115, номер остался прежним
+        features.append(nspd_feature(7, cad_num="50:03:0060112:9", quarter="50:03:0060115", geometry=POINT, crs=None))
+        features.append({"id": 8, "type": "Feature", "geometry": None, "properties": {"label": "без номера"}})
+        self.path = os.path.join(self.test_dir, "Этап.geojson")
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f, ensure_ascii=False, indent=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _cad_nums(self, index, feature_ids):
+        return [feature["properties"]["options"]["cad_num"] for feature in index.read_features(feature_ids)]
+
+    def test_sort_key_is_numeric(self):
+        self.assertLess(cad_sort_key("50:03:0060111:41"), cad_sort_key("50:03:0060111:400"))
+        self.assertLess(cad_sort_key("50:03:0060111:400"), cad_sort_key("50:030:0000001:1"))
+        self.assertTrue(cad_sort_key("50:03:0060111:41").startswith(cad_sort_key("50:03:0060111") + ":"))
+
+    def test_exact_prefix_and_range(self):
+        self.assertEqual(build_cadastral_index(self.path), sidecar_path(self.path))
+        index = open_cadastral_index(self.path, rebuild=False)
+        self.assertEqual(len(index), 8)
+        self.assertEqual(index.lookup("50:03:0060111:41"), [1, 6])
+        self.assertEqual(index.lookup("50:03:0060111:4"), [])
+
+        # Номера по возрастанию; "50:03" не захватывает район 50:030
+        self.assertEqual(self._cad_nums(index, index.prefix("50:03:0060111")),
+                         ["50:03:0060111:5", "50:03:0060111:41", "50:03:0060111:41", "50:03:0060111:400"])
+        self.assertEqual(len(index.prefix("50:03")), 6)
+        self.assertEqual(len(index.prefix("50")), 7)
+        self.assertEqual(self._cad_nums(index, index.prefix("50:03:0060115")), ["50:03:0060112:9", "50:03:0060115:1"])
+
+        self.assertEqual(self._cad_nums(index, index.range("50:03:0060111:6", "50:03:0060112")),
+                         ["50:03:0060111:41", "50:03:0060111:41", "50:03:0060111:400", "50:03:0060112:9"])
+        self.assertEqual(index.range("70", "80"), [])
+
+    def test_stale_index_is_rebuilt(self):
+        build_cadastral_index(self.path)
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"type": "FeatureCollection", "features": [nspd_feature(0, cad_num="77:01:0000001:1", geometry=POINT, crs=None)]}, f)
+        self.assertIsNone(open_cadastral_index(self.path, rebuild=False))
+        found = list(find_parcels([self.path], prefix="77:01"))
+        self.assertEqual([feature["id"] for _, feature in found], [0])
+        with self.assertRaises(ValueError):
+            list(find_parcels([self.path], cad_num="77:01:0000001:1", prefix="77"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import csv
+import os
+import sys
+import tempfile
+import shutil
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.csv_export import (
+    CSVFeatureWriter, CSV_NSPD_COLUMNS, CSV_PLACEMARK_COLUMNS,
+    CSV_GEOMETRY_WKB, CSV_GEOMETRY_CENTROID
+)
+
+NSPD_FEATURE = {
+    "id": 105174077,
+    "type": "Feature",
+    "geometry": {"type": "Polygon", "coordinates": [[[4130000.123, 7567000.0], [4130010.0, 7567000.0],
+                                                     [4130010.0, 7567010.0], [4130000.123, 7567000.0]]],
+                 "crs": {"type": "name", "properties": {"name": "EPSG:3857"}}},
+    "properties": {"label": "50:03:0060111:367", "options": {
+        "cad_num": "50:03:0060111:367", "land_record_category_type": "Земли населенных пунктов",
+        "specified_area": 350, "floor": ["1", "2"], "cost_index": 540.0,
+    }},
+}
+
+class TestCSVFeatureWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, "parcels.csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _read(self):
+        with open(self.path, encoding='utf-8-sig', newline='') as f:
+            return list(csv.DictReader(f))
+
+    def test_nspd_columns_and_wkt(self):
+        with CSVFeatureWriter(self.path, batch_size=1) as writer:
+            writer.write(NSPD_FEATURE)
+            writer.write({"type": "Feature", "geometry": None, "properties": {"options": {"cad_num": "50:03:0060111:1"}}})
+        rows = self._read()
+        self.assertEqual(list(rows[0].keys()), CSV_NSPD_COLUMNS + ["geometry_wkt", "crs"])
+        self.assertEqual(rows[0]["id"], "105174077")
+        self.assertEqual(rows[0]["land_record_category_type"], "Земли населенных пунктов")
+        self.assertEqual(rows[0]["specified_area"], "350")
+        self.assertEqual(rows[0]["floor"], '["1","2"]')
+        self.assertEqual(rows[0]["other_options"], '{"cost_index":540.0}')
+        # Метровые координаты - с точностью до сантиметра
+        self.assertTrue(rows[0]["geometry_wkt"].startswith("POLYGON ((4130000.12 7567000"))
+        self.assertEqual(rows[0]["crs"], "EPSG:3857")
+        self.assertEqual((rows[1]["geometry_wkt"], rows[1]["crs"], rows[1]["other_options"]), ("", "", ""))
+
+    def test_wkb_and_centroid_modes(self):
+        with CSVFeatureWriter(self.path, geometry_mode=CSV_GEOMETRY_WKB) as writer:
+            writer.write(NSPD_FEATURE)
+        self.assertTrue(self._read()[0]["geometry_wkb"].startswith("0103000000"))
+
+        point = {"type": "Feature", "geometry": {"type": "Point", "coordinates": [37.123456789, 55.5]},
+                 "properties": {"kml_name": "P1", "is_valid": True}}
+        with CSVFeatureWriter(self.path, columns=CSV_PLACEMARK_COLUMNS, geometry_mode=CSV_GEOMETRY_CENTROID) as writer:
+            writer.write(point)
+        row = self._read()[0]
+        self.assertEqual((row["kml_name"], row["is_valid"]), ("P1", "True"))
+        self.assertEqual((row["centroid_x"], row["centroid_y"], row["crs"]), ("37.123457", "55.5", "EPSG:4326"))
+
+    def test_placemark_columns_next_to_nspd_options(self):
+        # Участок НСПД после process-kmls: поля placemark дописаны рядом с options
+        processed = dict(NSPD_FEATURE, properties=dict(
+            NSPD_FEATURE["properties"], kml_name="50:03:0060111:367", is_valid=True, calculated_area_sq_units=49.39
+        ))
+        with CSVFeatureWriter(self.path, columns=CSV_PLACEMARK_COLUMNS) as writer:
+            writer.write(processed)
+        row = self._read()[0]
+        self.assertEqual((row["kml_name"], row["is_valid"], row["calculated_area_sq_units"]),
+                         ("50:03:0060111:367", "True", "49.39"))
+        # Колонки НСПД по-прежнему берутся из options
+        with CSVFeatureWriter(self.path) as writer:
+            writer.write(processed)
+        row = self._read()[0]
+        self.assertEqual((row["cad_num"], row["specified_area"]), ("50:03:0060111:367", "350"))
+
+    def test_append_keeps_single_header(self):
+        for append in (False, True):
+            with CSVFeatureWriter(self.path, append=append, delimiter=";") as writer:
+                writer.write(NSPD_FEATURE)
+        with open(self.path, encoding='utf-8-sig') as f:
+            content = f.read()
+        self.assertEqual(content.count("cad_num;"), 1)
+        self.assertEqual(content.count("50:03:0060111:367"), 2)
+        with self.assertRaises(ValueError):
+            CSVFeatureWriter(self.path, geometry_mode="geojson")
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
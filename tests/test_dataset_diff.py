@@ -0,0 +1,86 @@
+import unittest
+import os
+import sys
+import json
+import tempfile
+import shutil
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.dataset_diff import changed_fields, diff_datasets
+from tests.nspd_fixtures import nspd_feature
+
+class _ListWriter:
+    def __init__(self):
+        self.features = []
+
+    def write(self, feature):
+        self.features.append(feature)
+
+class TestDatasetDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        cost = {"cost_value": 100}
+        old = [nspd_feature(i, 4130000.0 + 20 * i, 7567000.0, options=cost) for i in range(1, 7)]
+        old.append(nspd_feature(3, 4130060.0, 7567000.0, options=cost)) # Повтор участка в выгрузке
+        new = [nspd_feature(i, 4130000.0 + 20 * i, 7567000.0, options=cost) for i in (6, 5, 4, 1)]
+        new[1] = nspd_feature(5, 4130100.004, 7567000.0, options=cost) # Сдвиг меньше 1 см - не изменение
+        new[2] = nspd_feature(4, 4130080.0, 7567000.0, options={"cost_value": 250})
+        new[3] = nspd_feature(1, 4130025.0, 7567000.0, options={"cost_value": 0})
+        new.append(nspd_feature(10, 4130200.0, 7567000.0, options=cost))
+        self.old_path = self._write("old.geojson", old)
+        self.new_path = self._write("new.geojson", new)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, name, features):
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f, ensure_ascii=False)
+        return path
+
+    def _changes(self, writer):
+        return sorted((f["id"], f["properties"]["change_type"], f["properties"].get("changed_fields")) for f in writer.features)
+
+    def test_classifies_changes(self):
+        writer = _ListWriter()
+        stats = diff_datasets(self.old_path, self.new_path, writer, workers=1)
+        self.assertEqual(self._changes(writer), [
+            (1, "geometry_changed", ["options.cost_value"]),
+            (2, "removed", None),
+            (3, "removed", None),
+            (4, "attributes_changed", ["options.cost_value"]),
+            (10, "added", None),
+        ])
+        self.assertEqual((stats.old_features, stats.new_features, stats.unchanged, stats.duplicate_keys), (7, 5, 2, 1))
+        self.assertEqual((stats.added, stats.removed, stats.geometry_changed, stats.attributes_changed), (1, 2, 1, 1))
+        # Добавленный и измененный участок - в новой версии
+        changed = next(f for f in writer.features if f["id"] == 4)
+        self.assertEqual(changed["properties"]["options"]["cost_value"], 250)
+
+    def test_spilled_runs_give_same_changes(self):
+        expected = _ListWriter()
+        diff_datasets(self.old_path, self.new_path, expected, workers=1)
+        writer = _ListWriter()
+        stats = diff_datasets(self.old_path, self.new_path, writer, workers=2, run_chars=1)
+        self.assertEqual(writer.features, expected.features)
+        self.assertEqual(stats.added, 1)
+        self.assertEqual(diff_datasets(self.old_path, self.old_path, workers=1).unchanged, 6)
+
+    def test_unreadable_dataset(self):
+        broken = os.path.join(self.test_dir, "broken.geojson")
+        with open(broken, 'w', encoding='utf-8') as f:
+            f.write('{"type": "FeatureCollection", "features": [{"id": 1')
+        with self.assertRaises(IOError):
+            diff_datasets(self.old_path, broken, workers=1)
+
+    def test_changed_fields(self):
+        self.assertEqual(changed_fields({"a": 1, "options": {"x": 1, "y": 2}}, {"a": 1, "b": None, "options": {"x": 2, "y": 2}}),
+                         ["options.x"])
+        self.assertEqual(changed_fields(None, {"label": "x"}), ["label"])
+
+if __name__ == '__main__':
+    unittest.main()
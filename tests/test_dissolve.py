@@ -0,0 +1,50 @@
+import unittest
+import os
+import sys
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from shapely.geometry import Polygon, box
+
+from scripts.dissolve import dissolve_geometries, nspd_option_value
+from scripts.data_structures import NSPDCadastralFeature, NSPDCadastralObjectOptions
+
+class TestDissolveGeometries(unittest.TestCase):
+
+    def setUp(self):
+        # Сетка 10x10 единичных квадратов; левая половина - категория "A", правая - "B"
+        self.geoms = [box(x, y, x + 1, y + 1) for x in range(10) for y in range(10)]
+        self.keys = ["A" if x < 5 else "B" for x in range(10) for y in range(10)]
+
+    def assert_halves(self, result):
+        self.assertEqual(set(result), {"A", "B"})
+        self.assertTrue(result["A"].equals(box(0, 0, 5, 10)))
+        self.assertTrue(result["B"].equals(box(5, 0, 10, 10)))
+
+    def test_inline_with_cascade(self):
+        # Маленькие блоки заставляют пройти несколько уровней каскадного объединения
+        self.assert_halves(dissolve_geometries(self.geoms, self.keys, workers=1, partition_size=7))
+
+    def test_process_pool(self):
+        self.assert_halves(dissolve_geometries(self.geoms, self.keys, workers=2, partition_size=16))
+
+    def test_none_and_invalid_geometries(self):
+        bowtie = Polygon([(20, 0), (22, 2), (22, 0), (20, 2), (20, 0)])
+        result = dissolve_geometries([None, bowtie, box(0, 0, 1, 1)], [None, "C", "D"], workers=1)
+        self.assertEqual(set(result), {"C", "D"})
+        self.assertTrue(result["C"].is_valid)
+        self.assertAlmostEqual(result["C"].area, 2.0)
+
+    def test_nspd_option_value(self):
+        options = NSPDCadastralObjectOptions(land_record_category_type="Земли населенных пунктов",
+                                             other_options={"land_record_subtype": "Землепользование"})
+        feature = NSPDCadastralFeature(options_properties=options)
+        self.assertEqual(nspd_option_value(feature, "land_record_category_type"), "Земли населенных пунктов")
+        self.assertEqual(nspd_option_value(feature, "land_record_subtype"), "Землепользование")
+        self.assertIsNone(nspd_option_value(feature, "missing"))
+        self.assertIsNone(nspd_option_value(NSPDCadastralFeature(), "land_record_category_type"))
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,121 @@
+import unittest
+import os
+import sys
+import tempfile
+import shutil
+import threading
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.feature_batch import FanOutFeatureWriter, FeatureBatch
+from scripts.geojson_io import create_feature_writer, load_feature_collection
+from scripts.sqlite_store import query_sqlite_features
+from tests.nspd_fixtures import nspd_feature
+
+class _FailingWriter:
+    """Писатель, падающий на первом пакете; запоминает, как его завершили."""
+
+    def __init__(self):
+        self.exit_type = None
+
+    def open(self):
+        return self
+
+    def write_batch(self, batch):
+        raise IOError("диск заполнен")
+
+    def close(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.exit_type = exc_type
+
+class TestFeatureBatch(unittest.TestCase):
+
+    def test_shared_values_computed_once(self):
+        batch = FeatureBatch([
+            nspd_feature(1, 4130000.0, 7567000.0),
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [37.1, 56.0]}, "properties": {}},
+            {"type": "Feature", "geometry": None, "properties": {}},
+        ])
+        self.assertEqual(batch.crs_names.tolist(), ["EPSG:3857", "EPSG:4326", "EPSG:4326"])
+        self.assertIs(batch.geometries(), batch.geometries())
+        self.assertIsNone(batch.geometries()[2])
+
+        planar = batch.geometries("EPSG:3857")
+        self.assertIs(planar[0], batch.geometries()[0]) # Уже в нужной CRS - не перепроецируется
+        self.assertAlmostEqual(planar[1].x, 4129953.1, delta=0.1)
+        self.assertEqual(batch.bounds("EPSG:3857")[0].tolist(), [4130000.0, 7567000.0, 4130010.0, 7567010.0])
+        self.assertIsNone(batch.wkb("EPSG:3857")[2])
+        self.assertIs(batch.json_texts(2), batch.json_texts(2))
+        self.assertIn('"coordinates":[37.1,56.0]', batch.json_texts(2)[1])
+
+    def test_concurrent_requests_compute_once(self):
+        batch = FeatureBatch([nspd_feature(i, 4130000.0 + i, 7567000.0) for i in range(200)])
+        calls = []
+        original = batch._parse
+        batch._parse = lambda: calls.append(1) or original()
+        threads = [threading.Thread(target=batch.wkb, args=("EPSG:4326",)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+
+class TestFanOutFeatureWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.features = [nspd_feature(i, 4130000.0 + 20 * i, 7567000.0) for i in range(1, 8)]
+        self.features.append(nspd_feature(8, 37.1, 56.0, crs="EPSG:4326"))
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _writers(self, prefix):
+        return [
+            create_feature_writer(os.path.join(self.test_dir, prefix + ".geojsons"), "geojsonseq"),
+            create_feature_writer(os.path.join(self.test_dir, prefix + ".geojson"), "geojson", indent=None),
+            create_feature_writer(os.path.join(self.test_dir, prefix + ".csv"), "csv", csv_geometry_mode="wkb"),
+            create_feature_writer(os.path.join(self.test_dir, prefix + ".sqlite"), "sqlite"),
+            create_feature_writer(os.path.join(self.test_dir, prefix + ".fgb"), "flatgeobuf", layer="parcels"),
+        ]
+
+    def _read(self, prefix, extension):
+        with open(os.path.join(self.test_dir, prefix + extension), 'rb') as f:
+            return f.read()
+
+    def test_same_output_as_separate_writers(self):
+        for writer in self._writers("single"):
+            with writer:
+                for feature in self.features:
+                    writer.write(feature)
+        for threaded in (False, True):
+            prefix = f"fanout_{threaded}"
+            # Пакет меньше числа features: проверяется и передача по частям
+            with FanOutFeatureWriter(self._writers(prefix), batch_size=3, threaded=threaded) as fanout:
+                for feature in self.features:
+                    fanout.write(feature)
+            self.assertEqual(fanout.count, len(self.features))
+            for extension in (".geojsons", ".geojson", ".csv", ".fgb"):
+                self.assertEqual(self._read(prefix, extension), self._read("single", extension), msg=extension)
+            stored = list(query_sqlite_features(os.path.join(self.test_dir, prefix + ".sqlite")))
+            expected = list(query_sqlite_features(os.path.join(self.test_dir, "single.sqlite")))
+            self.assertEqual(stored, expected)
+        self.assertEqual(len(load_feature_collection(os.path.join(self.test_dir, "fanout_True.fgb"))), 8)
+
+    def test_writer_error_aborts_all(self):
+        for threaded in (False, True):
+            failing = _FailingWriter()
+            geojson = create_feature_writer(os.path.join(self.test_dir, f"aborted_{threaded}.geojson"), "geojson")
+            with self.assertRaises(IOError):
+                with FanOutFeatureWriter([geojson, failing], batch_size=2, threaded=threaded) as fanout:
+                    for feature in self.features:
+                        fanout.write(feature)
+            self.assertIs(failing.exit_type, OSError)
+            # Коллекция не закрыта: незавершенный файл не примут за полный
+            self.assertIsNone(load_feature_collection(os.path.join(self.test_dir, f"aborted_{threaded}.geojson")))
+
+if __name__ == '__main__':
+    unittest.main()
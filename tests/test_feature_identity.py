@@ -0,0 +1,54 @@
+import unittest
+import os
+import sys
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.feature_identity import attributes_hash, feature_content_hash, feature_identity_key, geometry_hash, resolve_incremental_records
+
+class TestFeatureIdentity(unittest.TestCase):
+
+    def test_identity_key_and_content_hash(self):
+        feature = {"type": "Feature", "id": 7, "geometry": {"type": "Point", "coordinates": [37.1, 56.0]},
+                   "properties": {"options": {"cad_num": "50:03:0060111:7"}, "label": "x"}}
+        self.assertEqual(feature_identity_key(feature), "id:7")
+        self.assertEqual(feature_identity_key(dict(feature, id=None)), "cad:50:03:0060111:7")
+        self.assertEqual(feature_identity_key({"properties": {"kml_id": "pm1"}}), "kml:pm1")
+        self.assertTrue(feature_identity_key({"geometry": None, "properties": {}}).startswith("hash:"))
+
+        # Порядок ключей и id не влияют на хэш, содержимое - влияет
+        reordered = {"properties": {"label": "x", "options": {"cad_num": "50:03:0060111:7"}},
+                     "geometry": {"coordinates": [37.1, 56.0], "type": "Point"}, "id": 8}
+        self.assertEqual(feature_content_hash(reordered), feature_content_hash(feature))
+        self.assertNotEqual(feature_content_hash(dict(feature, properties={"label": "y"})), feature_content_hash(feature))
+
+    def test_geometry_hash(self):
+        mercator = {"type": "Point", "coordinates": [4130000.001, 7567000.0], "crs": {"type": "name", "properties": {"name": "EPSG:3857"}}}
+        # Метровая CRS: координаты сравниваются с точностью 1 см
+        self.assertEqual(geometry_hash(mercator), geometry_hash(dict(mercator, coordinates=[4130000.0, 7567000.0])))
+        self.assertNotEqual(geometry_hash(mercator), geometry_hash(dict(mercator, coordinates=[4130000.02, 7567000.0])))
+        self.assertNotEqual(geometry_hash({"type": "Point", "coordinates": [4130000.0, 7567000.0]}), geometry_hash(mercator))
+        self.assertEqual(geometry_hash(None), geometry_hash(None))
+        # Хэш атрибутов не зависит от геометрии и порядка ключей
+        self.assertEqual(attributes_hash({"geometry": mercator, "properties": {"a": 1, "b": 2}}),
+                         attributes_hash({"properties": {"b": 2, "a": 1}}))
+
+    def test_resolve_incremental_records(self):
+        plain = [{"type": "Feature", "id": 1, "properties": {"n": 1}}, {"type": "Feature", "id": 1, "properties": {"n": 1}}]
+        # Без ключей - обычная последовательность, повторы сохраняются
+        self.assertEqual(resolve_incremental_records(plain), plain)
+
+        records = plain[:1] + [
+            {"type": "Feature", "id": 2, "properties": {"n": 2}},
+            {"type": "Feature", "id": 1, "properties": {"n": 10}, "feature_key": "id:1"},
+            {"type": "Feature", "geometry": None, "properties": None, "feature_key": "id:2", "deleted": True},
+            {"type": "Feature", "id": 3, "properties": {"n": 3}, "feature_key": "id:3"},
+        ]
+        self.assertEqual(resolve_incremental_records(records), [
+            {"type": "Feature", "id": 1, "properties": {"n": 10}},
+            {"type": "Feature", "id": 3, "properties": {"n": 3}},
+        ])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+import os
+import sys
+import tempfile
+import shutil
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping, shape
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.flatgeobuf_io import FLATGEOBUF_MAGIC, FlatGeobufFeatureWriter, FlatGeobufReader, read_flatgeobuf
+from scripts.geojson_io import load_feature_collection
+
+NSPD_FEATURE = {
+    "id": 105174077,
+    "type": "Feature",
+    "geometry": {"type": "Polygon", "coordinates": [[[4130000.0, 7567000.0], [4130010.0, 7567000.0],
+                                                     [4130010.0, 7567010.0], [4130000.0, 7567000.0]],
+                                                    [[4130006.0, 7567001.0], [4130009.0, 7567001.0],
+                                                     [4130009.0, 7567004.0], [4130006.0, 7567001.0]]],
+                 "crs": {"type": "name", "properties": {"name": "EPSG:3857"}}},
+    "properties": {"label": "50:03:0060111:367", "systemInfo": {"inserted": "2024-01-01"}, "options": {
+        "cad_num": "50:03:0060111:367", "specified_area": 350, "cost_index": 540.5, "floor": ["1", "2"], "area": None,
+    }},
+}
+
+class TestFlatGeobuf(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, "parcels.fgb")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, features, **kwargs):
+        with FlatGeobufFeatureWriter(self.path, **kwargs) as writer:
+            for feature in features:
+                writer.write(feature)
+        return writer
+
+    def test_nspd_roundtrip(self):
+        self._write([NSPD_FEATURE, {"type": "Feature", "geometry": None, "properties": {"options": {"cad_num": "50:03:0060111:1"}}}])
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(8), FLATGEOBUF_MAGIC)
+        with FlatGeobufReader(self.path) as reader:
+            self.assertEqual((reader.name, reader.crs, reader.features_count, reader.geometry_type), ("parcels", "EPSG:3857", 2, 3))
+            self.assertEqual(reader.envelope, (4130000.0, 7567000.0, 4130010.0, 7567010.0))
+            columns = {name: column_type for name, column_type, _, _ in reader.columns}
+            # id и specified_area - Long, cost_index - Double, floor и systemInfo - JSON
+            self.assertEqual([columns[n] for n in ("id", "specified_area", "cost_index", "cad_num", "floor", "systemInfo")],
+                             [7, 7, 10, 11, 12, 12])
+
+        read = list(read_flatgeobuf(self.path))
+        self.assertEqual(read[0]["id"], NSPD_FEATURE["id"])
+        self.assertEqual(read[0]["geometry"]["crs"], NSPD_FEATURE["geometry"]["crs"])
+        self.assertTrue(shape(read[0]["geometry"]).equals_exact(shape(NSPD_FEATURE["geometry"]), 0))
+        self.assertEqual(read[0]["properties"]["systemInfo"], {"inserted": "2024-01-01"})
+        # Пустые (null) поля не записываются
+        expected_options = {k: v for k, v in NSPD_FEATURE["properties"]["options"].items() if v is not None}
+        self.assertEqual(read[0]["properties"]["options"], expected_options)
+        # Feature без геометрии - в конце файла
+        self.assertIsNone(read[1]["geometry"])
+        self.assertEqual(read[1]["properties"]["options"], {"cad_num": "50:03:0060111:1"})
+        self.assertEqual(len(load_feature_collection(self.path)), 2)
+
+    def test_bbox_query_matches_brute_force(self):
+        rng = np.random.default_rng(0)
+        xy = rng.uniform(0, 1000, (500, 2))
+        geoms = shapely.buffer(shapely.points(xy), rng.uniform(1, 20, 500))
+        features = [{"type": "Feature", "geometry": mapping(g), "properties": {"n": i}} for i, g in enumerate(geoms)]
+        bounds = shapely.bounds(geoms)
+        for node_size in (4, 16, 0):
+            with self.subTest(node_size=node_size):
+                self._write(features, node_size=node_size)
+                for bbox in ((100, 100, 250, 300), (990, 990, 2000, 2000), (-50, -50, -10, -10)):
+                    expected = np.flatnonzero((bounds[:, 0] <= bbox[2]) & (bounds[:, 1] <= bbox[3]) &
+                                              (bounds[:, 2] >= bbox[0]) & (bounds[:, 3] >= bbox[1]))
+                    found = sorted(f["properties"]["n"] for f in read_flatgeobuf(self.path, bbox=bbox))
+                    self.assertEqual(found, expected.tolist())
+
+    def test_geometry_types_and_mixed_columns(self):
+        geoms = [
+            shapely.Point(37.5, 55.7), shapely.LineString([(37, 55), (37.1, 55.1)]),
+            shapely.MultiLineString([[(37, 55), (37.1, 55.1)], [(37.2, 55), (37.3, 55.1)]]),
+            shapely.MultiPoint([(37, 55), (37.4, 55.4)]),
+            shapely.MultiPolygon([shapely.box(37, 55, 37.1, 55.1), shapely.box(37.2, 55, 37.3, 55.1)]),
+            shapely.GeometryCollection([shapely.Point(37, 55), shapely.LineString([(37, 55), (37.5, 55.5)])]),
+        ]
+        # Разнотипные значения одной колонки хранятся как JSON и читаются с исходными типами
+        values = [1, 2.5, 3, "четыре", True, None]
+        self._write([{"type": "Feature", "geometry": mapping(g), "properties": {"n": i, "v": v, "mixed": i if i % 2 else "x"}}
+                     for i, (g, v) in enumerate(zip(geoms, values))])
+        read = sorted(read_flatgeobuf(self.path), key=lambda f: f["properties"]["n"])
+        for feature, geom in zip(read, geoms):
+            self.assertTrue(shape(feature["geometry"]).equals_exact(geom, 0), geom.geom_type)
+            self.assertNotIn("crs", feature["geometry"]) # WGS84 - без члена crs (RFC 7946)
+        self.assertEqual([f["properties"].get("v") for f in read], values)
+        self.assertEqual([f["properties"]["mixed"] for f in read], ["x", 1, "x", 3, "x", 5])
+
+    def test_failed_write_keeps_existing_file(self):
+        self._write([NSPD_FEATURE])
+        with self.assertRaises(RuntimeError):
+            with FlatGeobufFeatureWriter(self.path) as writer:
+                writer.write(NSPD_FEATURE)
+                raise RuntimeError("ошибка источника")
+        self.assertEqual(len(list(read_flatgeobuf(self.path))), 1)
+        self.assertEqual(self._write([]).count, 0)
+        self.assertEqual(list(read_flatgeobuf(self.path)), [])
+        with self.assertRaises(ValueError):
+            FlatGeobufFeatureWriter(self.path, node_size=1)
+        bad_path = os.path.join(self.test_dir, "bad.fgb")
+        with open(bad_path, 'wb') as f:
+            f.write(b"not a flatgeobuf file")
+        with self.assertRaises(ValueError):
+            FlatGeobufReader(bad_path)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,265 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+import shutil
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.geojson_io import (
+    load_feature_collection, load_nspd_features, GeoJSONFeatureWriter, write_geojson_features,
+    GeoJSONSeqWriter, create_feature_writer, read_geojson_seq, is_geojson_seq_path, output_paths_for_formats,
+    read_geojson_features, iter_feature_collection, load_geojson_placemarks,
+    OUTPUT_FORMAT_GEOJSON, OUTPUT_FORMAT_GEOJSONSEQ, OUTPUT_FORMAT_NDJSON, RECORD_SEPARATOR
+)
+from scripts.geojson_stream import legacy_crs_name
+from scripts.geometry_processing import save_geojson_feature_collection
+
+class TestLoadNspdFeatures(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, name, data):
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        return path
+
+    def test_load_nspd_features(self):
+        path = self._write("stage.geojson", {"type": "FeatureCollection", "features": [{
+            "id": 107843234,
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [4130050.27, 7567025.87],
+                         "crs": {"type": "name", "properties": {"name": "EPSG:3857"}}},
+            "properties": {"label": "50:03:0060111:367",
+                           "options": {"cad_num": "50:03:0060111:367", "quarter_cad_number": "50:03:0060111", "cost_index": 1.5}},
+        }]})
+        features = load_nspd_features(path)
+        self.assertEqual(len(features), 1)
+        self.assertEqual(features[0].nspd_id, 107843234)
+        self.assertEqual(features[0].geometry.crs.name, "EPSG:3857")
+        self.assertEqual(features[0].options_properties.quarter_cad_number, "50:03:0060111")
+        self.assertEqual(features[0].options_properties.other_options, {"cost_index": 1.5})
+
+    def test_invalid_inputs(self):
+        self.assertIsNone(load_feature_collection(os.path.join(self.test_dir, "missing.geojson")))
+        self.assertIsNone(load_nspd_features(self._write("point.geojson", {"type": "Point", "coordinates": [0, 0]})))
+        bad_json = os.path.join(self.test_dir, "bad.geojson")
+        with open(bad_json, 'w', encoding='utf-8') as f:
+            f.write("{not json")
+        self.assertIsNone(load_feature_collection(bad_json))
+        self.assertEqual(load_feature_collection(self._write("empty.geojson", {"type": "FeatureCollection", "features": []})), [])
+        truncated = os.path.join(self.test_dir, "truncated.geojson")
+        with open(truncated, 'w', encoding='utf-8') as f:
+            f.write('{"type": "FeatureCollection", "features": [{"type": "Feature", "properties": {}}, {"type": "Fea')
+        self.assertIsNone(load_feature_collection(truncated))
+
+
+class TestStreamingGeoJSONReader(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_legacy_crs_member(self):
+        path = os.path.join(self.test_dir, "legacy.geojson")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "type": "FeatureCollection",
+                "crs": {"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::3857"}},
+                "features": [
+                    {"type": "Feature", "id": 1, "geometry": {"type": "Point", "coordinates": [4130000.0, 7567000.0]},
+                     "properties": {"label": "50:03:0060111:1"}},
+                    # CRS самого feature важнее CRS коллекции
+                    {"type": "Feature", "id": 2, "crs": {"type": "name", "properties": {"name": "urn:ogc:def:crs:OGC:1.3:CRS84"}},
+                     "geometry": {"type": "Point", "coordinates": [37.1, 56.0]}, "properties": {"name": "точка"}},
+                    {"type": "Feature", "id": 3, "geometry": None, "properties": {"name": "пусто"}},
+                ],
+                "name": "после features",
+            }, f, ensure_ascii=False)
+
+        # Маленький буфер: значения разбираются через границы чтения
+        features = list(read_geojson_features(path, chunk_size=5))
+        self.assertEqual([f["id"] for f in features], [1, 2, 3])
+        self.assertEqual(features[0]["geometry"]["crs"], {"type": "name", "properties": {"name": "EPSG:3857"}})
+        self.assertNotIn("crs", features[1]["geometry"])
+        self.assertEqual(load_feature_collection(path), features)
+        self.assertEqual(legacy_crs_name({"type": "link", "properties": {"href": "x"}}), None)
+
+        placemarks, geoms = load_geojson_placemarks(path)
+        self.assertEqual([pm.name for pm in placemarks], ["50:03:0060111:1", "точка", "пусто"])
+        self.assertEqual((placemarks[0].id, placemarks[0].geometry_type, placemarks[2].geometry_type), ("1", "Point", "Unknown"))
+        self.assertAlmostEqual(geoms[0].x, 37.1, delta=0.001) # EPSG:3857 -> WGS84
+        self.assertEqual((geoms[1].x, geoms[1].y), (37.1, 56.0))
+        self.assertIsNone(geoms[2])
+
+    def test_rejects_non_collections(self):
+        for text in ('{"type": "Feature", "properties": {}}', '[1, 2]', '{"type": "FeatureCollection", "features": [1 2]}'):
+            path = os.path.join(self.test_dir, "bad.geojson")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            with self.assertRaises(ValueError, msg=text):
+                list(read_geojson_features(path))
+            # Ленивый вход: ошибка возникает при переборе, а load_feature_collection возвращает None
+            features = iter_feature_collection(path)
+            with self.assertRaises(ValueError, msg=text):
+                next(features)
+            self.assertIsNone(load_feature_collection(path))
+
+
+class TestGeoJSONFeatureWriter(unittest.TestCase):
+
+    FEATURES = [
+        {"type": "Feature", "geometry": {"type": "Point", "coordinates": (37.61, 55.75)},
+         "properties": {"name": "Участок\n1", "tags": [], "options": {}}},
+        {"type": "Feature", "geometry": None, "properties": {"cad_num": "50:03:0060111:367"}},
+    ]
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, "out.geojson")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_byte_compatible_with_save_geojson_feature_collection(self):
+        reference_path = os.path.join(self.test_dir, "reference.geojson")
+        for indent in (2, 4, 0, None):
+            for features in (self.FEATURES, self.FEATURES[:1], []):
+                with self.subTest(indent=indent, count=len(features)):
+                    self.assertTrue(save_geojson_feature_collection(features, reference_path, indent=indent))
+                    # Генератор: писатель не должен требовать список
+                    count = write_geojson_features((f for f in features), self.path, indent=indent)
+                    self.assertEqual(count, len(features))
+                    self.assertEqual(self._read(self.path), self._read(reference_path))
+
+    def test_writer_context_manager(self):
+        with GeoJSONFeatureWriter(self.path, indent=None) as writer:
+            for feature in self.FEATURES:
+                writer.write(feature)
+        self.assertEqual(writer.count, 2)
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(json.load(f)["features"][0]["properties"]["name"], "Участок\n1")
+
+    def test_error_leaves_collection_unclosed(self):
+        with self.assertRaises(RuntimeError):
+            with GeoJSONFeatureWriter(self.path) as writer:
+                writer.write(self.FEATURES[0])
+                raise RuntimeError("обработка прервана")
+        with open(self.path, encoding='utf-8') as f:
+            with self.assertRaises(ValueError):
+                json.load(f)
+
+
+class TestGeoJSONSeq(unittest.TestCase):
+
+    FEATURES = TestGeoJSONFeatureWriter.FEATURES
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_rfc8142_roundtrip_and_append(self):
+        path = os.path.join(self.test_dir, "out.geojsons")
+        with create_feature_writer(path, OUTPUT_FORMAT_GEOJSONSEQ) as writer:
+            writer.write(self.FEATURES[0])
+        with create_feature_writer(path, OUTPUT_FORMAT_GEOJSONSEQ, append=True) as writer:
+            writer.write(self.FEATURES[1])
+        self.assertIsInstance(writer, GeoJSONSeqWriter)
+        with open(path, encoding='utf-8') as f:
+            lines = f.read().split("\n")
+        # Каждая запись: RS + компактный JSON + LF
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[2], "")
+        self.assertTrue(all(line.startswith(RECORD_SEPARATOR) for line in lines[:2]))
+        records = list(read_geojson_seq(path))
+        self.assertEqual([r["properties"] for r in records], [f["properties"] for f in self.FEATURES])
+        self.assertEqual(records[0]["geometry"]["coordinates"], [37.61, 55.75])
+
+    def test_ndjson_and_load_feature_collection(self):
+        path = os.path.join(self.test_dir, "out.geojsonl")
+        self.assertTrue(is_geojson_seq_path(path))
+        self.assertFalse(is_geojson_seq_path("out.geojson"))
+        with create_feature_writer(path, OUTPUT_FORMAT_NDJSON) as writer:
+            for feature in self.FEATURES:
+                writer.write(feature)
+        with open(path, encoding='utf-8') as f:
+            self.assertNotIn(RECORD_SEPARATOR, f.read())
+        self.assertEqual(len(load_feature_collection(path)), 2)
+        self.assertEqual(list(iter_feature_collection(path)), load_feature_collection(path))
+
+    def test_reader_skips_broken_records(self):
+        path = os.path.join(self.test_dir, "broken.geojsons")
+        with open(path, 'w', encoding='utf-8') as f:
+            # Усеченная запись, запись на нескольких строках и две записи в одной строке
+            f.write(RECORD_SEPARATOR + '{"type": "Feature", "prop\n')
+            f.write(RECORD_SEPARATOR + '{"type": "Feature",\n "properties": {"n": 1}}\n')
+            f.write(RECORD_SEPARATOR + '{"type": "Feature", "properties": {"n": 2}}' + RECORD_SEPARATOR + '[1, 2]\n')
+        with self.assertLogs('scripts.geojson_io', level='WARNING'):
+            records = list(read_geojson_seq(path))
+        self.assertEqual([r["properties"]["n"] for r in records], [1, 2])
+
+    def test_incremental_log(self):
+        path = os.path.join(self.test_dir, "parcels.geojsons")
+        features = [
+            {"type": "Feature", "id": i, "geometry": {"type": "Point", "coordinates": [37.0 + i, 55.0]},
+             "properties": {"n": i}}
+            for i in range(1, 4)
+        ]
+        with create_feature_writer(path, OUTPUT_FORMAT_GEOJSONSEQ) as writer:
+            for feature in features:
+                writer.write(feature)
+        size = os.path.getsize(path)
+
+        # Без изменений (координаты отличаются меньше точности округления) файл не растет
+        unchanged = [dict(features[0], geometry={"type": "Point", "coordinates": [38.0000000001, 55.0]})] + features[1:]
+        with create_feature_writer(path, OUTPUT_FORMAT_GEOJSONSEQ, incremental=True) as writer:
+            for feature in unchanged:
+                writer.write(feature)
+        self.assertEqual(writer.stats.unchanged, 3)
+        self.assertEqual(os.path.getsize(path), size)
+
+        changed = dict(features[1], properties={"n": 20})
+        with create_feature_writer(path, OUTPUT_FORMAT_GEOJSONSEQ, incremental=True) as writer:
+            for feature in (features[0], changed):
+                writer.write(feature)
+        stats = writer.stats
+        self.assertEqual((stats.inserted, stats.updated, stats.unchanged, stats.deleted), (0, 1, 1, 1))
+        records = list(read_geojson_seq(path))
+        self.assertEqual(len(records), 5) # Дописаны только изменение и tombstone
+        self.assertEqual(records[4], {"type": "Feature", "geometry": None, "properties": None,
+                                      "feature_key": "id:3", "deleted": True})
+        self.assertEqual([(f["id"], f["properties"]["n"]) for f in load_feature_collection(path)], [(1, 1), (2, 20)])
+        with self.assertRaises(ValueError):
+            create_feature_writer(path, OUTPUT_FORMAT_GEOJSON, incremental=True)
+
+    def test_create_feature_writer_validation(self):
+        path = os.path.join(self.test_dir, "out.geojson")
+        self.assertIsInstance(create_feature_writer(path, OUTPUT_FORMAT_GEOJSON), GeoJSONFeatureWriter)
+        with self.assertRaises(ValueError):
+            create_feature_writer(path, OUTPUT_FORMAT_GEOJSON, append=True)
+        with self.assertRaises(ValueError):
+            create_feature_writer(path, "shapefile")
+
+    def test_output_paths_for_formats(self):
+        self.assertEqual(output_paths_for_formats("out.dat", ["csv"]), ["out.dat"])
+        self.assertEqual(output_paths_for_formats("/tmp/out.geojson", ["geojson", "csv", "sqlite"]),
+                         ["/tmp/out.geojson", "/tmp/out.csv", "/tmp/out.sqlite"])
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -9,7 +9,7 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from scripts.geometry_processing import parse_coordinate_string, kml_placemark_to_shapely, DEFAULT_PRECISION, calculate_area, calculate_length, calculate_perimeter, create_geojson_feature, save_geojson_feature_collection
+from scripts.geometry_processing import parse_coordinate_string, kml_placemark_to_shapely, DEFAULT_PRECISION, calculate_area, calculate_length, calculate_perimeter, create_geojson_feature, save_geojson_feature_collection, calculate_metrics, reproject_geometries, METRIC_MODE_GEODESIC, METRIC_MODE_UTM, METRIC_MODE_ALBERS, select_local_crs, utm_crs_for_lonlat, check_validity, apply_precision, grid_size_for_crs, GEOGRAPHIC_GRID_SIZE, PROJECTED_GRID_SIZE
 from scripts.data_structures import (
     ExtractedPlacemark,
     PointGeom as KmlPoint,
@@ -17,9 +17,11 @@ from scripts.data_structures import (
     LinearRingGeom as KmlLinearRing,
     PolygonGeom as KmlPolygon,
     MultiGeometryGeom as KmlMultiGeometry,
-    SubGeometryData
+    SubGeometryData,
+    ValidityResult
 )
 from shapely.geometry import Point, LineString, LinearRing, Polygon, MultiPoint, MultiLineString, MultiPolygon, GeometryCollection
+from shapely.geometry.polygon import orient
 
 
 class TestParseCoordinateString(unittest.TestCase):
@@ -41,6 +43,9 @@ class TestParseCoordinateString(unittest.TestCase):
     def test_simple_3d(self):
         self.assertCoordsAlmostEqual(parse_coordinate_string("10.1234567,20.7654321,5.0"), [(10.123457, 20.765432, 5.0)])
 
+    def test_no_rounding(self):
+        self.assertEqual(parse_coordinate_string("10.1234567,20.7654321,5.25", precision=None), [(10.1234567, 20.7654321, 5.25)])
+
     def test_multiple_coordinates(self):
         self.assertCoordsAlmostEqual(parse_coordinate_string("10.1,20.2 30.3,40.4,5.5"), [(10.1, 20.2), (30.3, 40.4, 5.5)])
 
@@ -457,6 +462,224 @@ class TestCalculatePerimeter(unittest.TestCase):
         self.assertIsNone(perimeter, "Perimeter of None geometry should be None")
 
 
+class TestReprojectGeometries(unittest.TestCase):
+
+    def test_single_point_to_web_mercator(self):
+        projected = reproject_geometries(Point(1, 0), "EPSG:4326", "EPSG:3857")
+        self.assertIsInstance(projected, Point)
+        self.assertAlmostEqual(projected.x, 111319.49079327357, places=4)
+        self.assertAlmostEqual(projected.y, 0.0, places=4)
+
+    def test_array_keeps_structure_and_none(self):
+        poly_with_hole = Polygon([(0, 0), (2, 0), (2, 2), (0, 2), (0, 0)], [[(0.5, 0.5), (1, 0.5), (1, 1), (0.5, 0.5)]])
+        multi_line = MultiLineString([[(0, 0), (1, 1)], [(2, 2), (3, 3), (4, 4)]])
+        result = reproject_geometries([poly_with_hole, None, multi_line], "EPSG:4326", "EPSG:3857")
+        self.assertEqual(len(result), 3)
+        self.assertIsNone(result[1])
+        self.assertEqual(result[0].geom_type, "Polygon")
+        self.assertEqual(len(result[0].interiors), 1)
+        self.assertEqual(result[2].geom_type, "MultiLineString")
+        self.assertEqual([len(part.coords) for part in result[2].geoms], [2, 3])
+
+    def test_round_trip(self):
+        original = Polygon([(37.5, 55.7), (37.6, 55.7), (37.6, 55.8), (37.5, 55.7)])
+        there = reproject_geometries([original], "EPSG:4326", "EPSG:3857")
+        back = reproject_geometries(there, "EPSG:3857", "EPSG:4326")
+        self.assertTrue(back[0].equals_exact(original, 1e-9))
+
+    def test_z_is_kept(self):
+        polygon_z = Polygon([(37.5, 55.7, 150.0), (37.6, 55.7, 151.5), (37.6, 55.8, 152.0), (37.5, 55.7, 150.0)])
+        result = reproject_geometries([polygon_z, Point(37.5, 55.7)], "EPSG:4326", "EPSG:3857")
+        self.assertTrue(result[0].has_z)
+        self.assertEqual([c[2] for c in result[0].exterior.coords], [150.0, 151.5, 152.0, 150.0])
+        # Геометрии без Z в том же массиве остаются 2D и перепроецируются так же
+        self.assertFalse(result[1].has_z)
+        self.assertAlmostEqual(result[0].exterior.coords[0][0], result[1].x, places=6)
+        self.assertAlmostEqual(result[1].y, 7498924.48, delta=0.01)
+
+    def test_empty_input(self):
+        self.assertEqual(len(reproject_geometries([], "EPSG:4326", "EPSG:3857")), 0)
+        self.assertIsNone(reproject_geometries(None, "EPSG:4326", "EPSG:3857"))
+
+
+class TestApplyPrecision(unittest.TestCase):
+
+    def test_grid_size_depends_on_crs(self):
+        self.assertEqual(grid_size_for_crs("EPSG:4326"), GEOGRAPHIC_GRID_SIZE)
+        self.assertEqual(grid_size_for_crs("EPSG:3857"), PROJECTED_GRID_SIZE)
+
+    def test_geographic_snapping_matches_round(self):
+        coords = [(37.12345649, 55.98765451), (37.2000004, 55.9), (37.3, 55.99999949)]
+        line = apply_precision(LineString(coords), "EPSG:4326")
+        expected = [(round(x, 6), round(y, 6)) for x, y in coords]
+        self.assertEqual(list(line.coords), expected)
+
+    def test_projected_array_keeps_none_and_z(self):
+        geoms = [Point(4157000.123456, 7520000.987654), None, Point(1.234567, 2.345678, 3.456789)]
+        result = apply_precision(geoms, "EPSG:3857")
+        self.assertEqual(len(result), 3)
+        self.assertEqual((result[0].x, result[0].y), (4157000.12, 7520000.99))
+        self.assertIsNone(result[1])
+        self.assertEqual(result[2].z, 3.46)
+        # Без топологических исправлений: невалидная геометрия остается невалидной
+        bowtie = Polygon([(0, 0), (10, 10), (10, 0), (0, 10), (0, 0)])
+        self.assertFalse(apply_precision(bowtie, "EPSG:3857").is_valid)
+
+
+class TestLocalCrsSelection(unittest.TestCase):
+
+    def test_utm_zone_codes(self):
+        codes = utm_crs_for_lonlat([37.6, 30.0, -70.0, float("nan")], [55.7, 59.9, -33.4, 0.0])
+        self.assertEqual(list(codes), ["EPSG:32637", "EPSG:32636", "EPSG:32719", None])
+
+    def test_select_utm_from_web_mercator(self):
+        moscow = reproject_geometries(Point(37.6, 55.7), "EPSG:4326", "EPSG:3857")
+        spb = reproject_geometries(Point(30.3, 59.9), "EPSG:4326", "EPSG:3857")
+        crs = select_local_crs([moscow, None, spb], source_crs_str="EPSG:3857", strategy=METRIC_MODE_UTM)
+        self.assertEqual(list(crs), ["EPSG:32637", None, "EPSG:32636"])
+
+    def test_select_albers_single_crs_for_dataset(self):
+        geoms = [Point(37.0, 55.0), Point(38.0, 56.0)]
+        crs = select_local_crs(geoms, strategy=METRIC_MODE_ALBERS)
+        self.assertEqual(crs[0], crs[1])
+        self.assertIn("+proj=aea", crs[0])
+
+    def test_local_crs_areas_close_to_geodesic(self):
+        parcels = [
+            Polygon([(37.50, 55.70), (37.51, 55.70), (37.51, 55.705), (37.50, 55.70)]),
+            Polygon([(32.90, 55.70), (32.91, 55.70), (32.91, 55.705), (32.90, 55.70)]), # Другая зона UTM
+        ]
+        geodesic = calculate_metrics(parcels, metric_mode=METRIC_MODE_GEODESIC)
+        for mode, tolerance in ((METRIC_MODE_UTM, 1e-3), (METRIC_MODE_ALBERS, 1e-6)):
+            local = calculate_metrics(parcels, metric_mode=mode)
+            for g, l in zip(geodesic, local):
+                self.assertAlmostEqual(l.area, g.area, delta=g.area * tolerance, msg=mode)
+
+
+class TestCalculateMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.poly_wgs84 = Polygon([(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)])
+        self.line_wgs84 = LineString([(0, 0), (1, 0)])
+        self.point = Point(10, 20)
+
+    def test_matches_individual_functions(self):
+        for geom in (self.poly_wgs84, self.line_wgs84, self.point):
+            metrics = calculate_metrics(geom)
+            self.assertAlmostEqual(metrics.area, calculate_area(geom), places=4)
+            self.assertAlmostEqual(metrics.length, calculate_length(geom), places=4)
+            self.assertAlmostEqual(metrics.perimeter, calculate_perimeter(geom), places=4)
+
+    def test_centroid_and_bbox_in_source_crs(self):
+        metrics = calculate_metrics(self.poly_wgs84)
+        self.assertEqual(metrics.centroid, (0.5, 0.5))
+        self.assertEqual(metrics.bbox, (0.0, 0.0, 1.0, 1.0))
+
+    def test_sequence_input_keeps_order(self):
+        results = calculate_metrics([self.line_wgs84, None, self.poly_wgs84])
+        self.assertEqual(len(results), 3)
+        self.assertGreater(results[0].length, 0)
+        self.assertEqual(results[0].area, 0.0)
+        self.assertIsNone(results[1].area)
+        self.assertIsNone(results[1].bbox)
+        self.assertGreater(results[2].area, 0)
+        self.assertEqual(results[2].length, 0.0)
+
+    def test_none_geometry(self):
+        metrics = calculate_metrics(None)
+        self.assertIsNone(metrics.area)
+        self.assertIsNone(metrics.perimeter)
+        self.assertIsNone(metrics.centroid)
+
+    def test_planar_no_projection_geometrycollection(self):
+        gc = GeometryCollection([
+            Polygon([(0, 0), (5, 0), (5, 5), (0, 5), (0, 0)]),
+            LineString([(0, 0), (3, 4)]),
+            Point(1, 1)
+        ])
+        metrics = calculate_metrics(gc, source_crs_str="EPSG:3857", project_to_planar=False)
+        self.assertAlmostEqual(metrics.area, 25.0)
+        self.assertAlmostEqual(metrics.length, 5.0)
+        self.assertAlmostEqual(metrics.perimeter, 20.0)
+
+    def test_geodesic_mode_matches_pyproj_geod(self):
+        from pyproj import Geod
+        geod = Geod(ellps="WGS84")
+        parcel = Polygon([(37.50, 55.70), (37.51, 55.70), (37.51, 55.705), (37.50, 55.705), (37.50, 55.70)],
+                         [[(37.502, 55.701), (37.503, 55.701), (37.503, 55.702), (37.502, 55.701)]])
+        # Geod учитывает направление обхода колец: внешнее - против часовой, дырки - по часовой
+        expected_area, _ = geod.geometry_area_perimeter(orient(parcel))
+        metrics = calculate_metrics(parcel, metric_mode=METRIC_MODE_GEODESIC)
+        self.assertAlmostEqual(metrics.area, abs(expected_area), delta=abs(expected_area) * 1e-6)
+        # Периметр, как и в планарном режиме, включает внутренние кольца
+        hole_length = geod.geometry_length(parcel.interiors[0])
+        self.assertAlmostEqual(metrics.perimeter, geod.geometry_length(parcel.exterior) + hole_length, places=3)
+        self.assertEqual(metrics.length, 0.0)
+
+    def test_geodesic_area_exact_on_large_polygon(self):
+        from pyproj import Geod
+        geod = Geod(ellps="WGS84")
+        # Зона в несколько градусов: приближение через равновеликую проекцию дало бы ошибку ~1e-3
+        zone = Polygon([(30.0, 50.0), (40.0, 50.0), (40.0, 60.0), (30.0, 60.0), (30.0, 50.0)],
+                       [[(33.0, 53.0), (33.0, 56.0), (36.0, 56.0), (36.0, 53.0), (33.0, 53.0)]])
+        expected_area, _ = geod.geometry_area_perimeter(orient(zone))
+        metrics = calculate_metrics(MultiPolygon([zone]), metric_mode=METRIC_MODE_GEODESIC)
+        self.assertAlmostEqual(metrics.area, abs(expected_area), delta=abs(expected_area) * 1e-9)
+
+    def test_geodesic_mode_from_web_mercator(self):
+        line_wgs84 = LineString([(37.5, 55.7), (37.6, 55.75)])
+        line_3857 = reproject_geometries(line_wgs84, "EPSG:4326", "EPSG:3857")
+        from_wgs84 = calculate_metrics(line_wgs84, metric_mode=METRIC_MODE_GEODESIC)
+        from_3857 = calculate_metrics([line_3857], source_crs_str="EPSG:3857", metric_mode=METRIC_MODE_GEODESIC)[0]
+        self.assertAlmostEqual(from_wgs84.length, from_3857.length, places=4)
+        self.assertEqual(from_3857.area, 0.0)
+        # Web Mercator на этой широте завышает длины примерно в 1/cos(55.7)
+        planar = calculate_metrics(line_wgs84)
+        self.assertGreater(planar.length / from_wgs84.length, 1.7)
+
+    def test_unknown_metric_mode(self):
+        with self.assertRaises(ValueError):
+            calculate_metrics(self.point, metric_mode="spherical")
+
+    def test_invalid_polygon_has_no_perimeter(self):
+        bowtie = Polygon([(0, 0), (10, 10), (10, 0), (0, 10), (0, 0)])
+        metrics = calculate_metrics(bowtie, source_crs_str="EPSG:3857", project_to_planar=False)
+        self.assertIsNone(metrics.perimeter)
+        self.assertIsNotNone(metrics.area)
+
+
+class TestCheckValidity(unittest.TestCase):
+
+    def setUp(self):
+        self.bowtie = Polygon([(0, 0), (10, 10), (10, 0), (0, 10), (0, 0)])
+        self.square = Polygon([(0, 0), (1, 0), (1, 1), (0, 1)])
+
+    def test_single_geometry(self):
+        self.assertEqual(check_validity(self.square), ValidityResult(is_valid=True))
+        result = check_validity(self.bowtie)
+        self.assertFalse(result.is_valid)
+        self.assertTrue(result.reason.startswith("Self-intersection"))
+        self.assertIsNone(result.repaired_geometry)
+        self.assertIsNone(check_validity(None))
+
+    def test_sequence_keeps_order_and_none(self):
+        results = check_validity([self.square, None, self.bowtie, Point(0, 0)])
+        self.assertEqual(len(results), 4)
+        self.assertTrue(results[0].is_valid)
+        self.assertIsNone(results[1])
+        self.assertFalse(results[2].is_valid)
+        self.assertTrue(results[3].is_valid)
+        self.assertEqual(check_validity([]), [])
+
+    def test_repair(self):
+        results = check_validity([self.square, self.bowtie], repair=True)
+        self.assertIsNone(results[0].repaired_geometry)
+        repaired = results[1].repaired_geometry
+        self.assertTrue(repaired.is_valid)
+        self.assertEqual(repaired.geom_type, "MultiPolygon")
+        self.assertAlmostEqual(repaired.area, 50.0)
+
+
 class TestCreateGeoJSONFeature(unittest.TestCase):
 
     def test_basic_point_feature(self):
@@ -513,6 +736,24 @@ class TestCreateGeoJSONFeature(unittest.TestCase):
         self.assertNotIn("calculated_length_units", props) # length == 0.0
         self.assertAlmostEqual(props["calculated_perimeter_units"], 45.68)
 
+    def test_precomputed_and_repaired_validity(self):
+        pm = ExtractedPlacemark(name="Bowtie", id="b1", geometry_type="Polygon", geometry_data=None)
+        bowtie = Polygon([(0, 0), (10, 10), (10, 0), (0, 10), (0, 0)])
+        validity = check_validity(bowtie, repair=True)
+
+        feature = create_geojson_feature(pm, bowtie, 50.0, None, 48.28, validity=validity)
+        props = feature["properties"]
+        self.assertEqual(feature["geometry"]["type"], "MultiPolygon")
+        self.assertEqual(props["shapely_geometry_type"], "MultiPolygon")
+        self.assertFalse(props["is_valid"])
+        self.assertEqual(props["validity_reason"], validity.reason)
+        self.assertTrue(props["repaired"])
+
+        # Переданный результат используется как есть, без повторной проверки
+        feature = create_geojson_feature(pm, bowtie, None, None, None, validity=ValidityResult(is_valid=True))
+        self.assertTrue(feature["properties"]["is_valid"])
+        self.assertEqual(feature["geometry"]["type"], "Polygon")
+
     def test_feature_with_none_geometry(self):
         pm = ExtractedPlacemark(name="No Geom PM", id="ng01", geometry_type="Unknown", geometry_data=None)
         feature = create_geojson_feature(pm, None, None, None, None)
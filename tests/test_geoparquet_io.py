@@ -0,0 +1,88 @@
+import unittest
+import os
+import sys
+import tempfile
+import shutil
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.geoparquet_io import (
+    GeoParquetFeatureWriter, geoparquet_available, read_geoparquet_features, read_geoparquet_metadata,
+    read_geoparquet_table, ds, pq
+)
+from scripts.geojson_io import load_feature_collection
+from tests.nspd_fixtures import nspd_feature
+
+def _parcel(feature_id, cad_num, x):
+    """Треугольник с набором options, покрывающим типы колонок GeoParquet."""
+    geometry = {"type": "Polygon", "coordinates": [[[x, 7567000.0], [x + 10, 7567000.0], [x + 10, 7567010.0], [x, 7567000.0]]]}
+    return nspd_feature(feature_id, cad_num=cad_num, quarter=cad_num.rsplit(":", 1)[0], geometry=geometry, options={
+        "specified_area": "350,5", "land_record_category_type": "Земли населенных пунктов", "floor": "2", "cost_index": 540.0,
+    })
+
+@unittest.skipUnless(geoparquet_available(), "pyarrow не установлен")
+class TestGeoParquet(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, "parcels.parquet")
+        self.features = [_parcel(100 + i, f"50:03:006011{i % 2}:{i}", 4130000.0 + 100 * i) for i in range(6)]
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _write(self, features, **kwargs):
+        with GeoParquetFeatureWriter(self.path, **kwargs) as writer:
+            for feature in features:
+                writer.write(feature)
+        return writer
+
+    def test_typed_columns_and_metadata(self):
+        self.assertEqual(self._write(self.features, row_group_size=4).count, 6)
+        parquet_file = pq.ParquetFile(self.path)
+        self.assertEqual(parquet_file.metadata.num_row_groups, 2)
+        schema = parquet_file.schema_arrow
+        self.assertEqual(str(schema.field("specified_area").type), "double")
+        self.assertEqual(str(schema.field("floor").type), "list<element: string>")
+        geo = read_geoparquet_metadata(self.path)
+        column = geo["columns"]["geometry"]
+        self.assertEqual((geo["primary_column"], column["encoding"], column["geometry_types"]), ("geometry", "WKB", ["Polygon"]))
+        self.assertEqual(column["crs"]["id"], {"authority": "EPSG", "code": 3857})
+        self.assertEqual(column["bbox"], [4130000.0, 7567000.0, 4130510.0, 7567010.0])
+
+        table = read_geoparquet_table(self.path, columns=["cad_num", "specified_area"], quarter_cad_number="50:03:0060111")
+        self.assertEqual(table.column_names, ["cad_num", "specified_area"])
+        self.assertEqual(table.column("specified_area").to_pylist(), [350.5] * 3)
+        filtered = read_geoparquet_table(self.path, columns=["cad_num"], filters=ds.field("cad_num") == "50:03:0060110:2")
+        self.assertEqual(filtered.num_rows, 1)
+
+    def test_features_roundtrip_and_bbox(self):
+        # Второй feature в WGS84 перепроецируется в CRS файла (первого feature)
+        mixed = self.features[:1] + [{"id": "x-1", "type": "Feature", "properties": {"options": {"cad_num": "50:03:0060111:99"}},
+                                      "geometry": {"type": "Point", "coordinates": [37.1, 55.7]}}]
+        self._write(mixed)
+        read = list(read_geoparquet_features(self.path))
+        self.assertEqual(read[0]["id"], 100)
+        self.assertEqual(read[0]["geometry"]["crs"]["properties"]["name"], "EPSG:3857")
+        options = read[0]["properties"]["options"]
+        self.assertEqual((options["specified_area"], options["floor"], options["cost_index"]), (350.5, ["2"], 540.0))
+        self.assertEqual(read[0]["properties"]["label"], "50:03:0060110:0")
+        self.assertEqual(read[1]["id"], "x-1")
+        self.assertAlmostEqual(read[1]["geometry"]["coordinates"][0], 4129953.1, delta=1)
+
+        self._write(self.features)
+        hits = list(read_geoparquet_features(self.path, bbox=(4130195.0, 7566990.0, 4130305.0, 7567020.0)))
+        self.assertEqual([f["id"] for f in hits], [102, 103])
+        self.assertEqual(len(load_feature_collection(self.path)), 6)
+
+    def test_error_removes_partial_file(self):
+        with self.assertRaises(RuntimeError):
+            with GeoParquetFeatureWriter(self.path, row_group_size=1) as writer:
+                writer.write(self.features[0])
+                raise RuntimeError("ошибка источника")
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
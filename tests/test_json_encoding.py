@@ -0,0 +1,88 @@
+import unittest
+import json
+import os
+import sys
+
+import numpy as np
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.json_encoding import (
+    JSON_BACKEND_ORJSON, JSON_BACKEND_STDLIB, orjson,
+    available_json_backends, default_json_backend, dumps_json, register_json_encoder,
+    round_feature_coordinates, round_geometry_coordinates
+)
+
+FEATURE = {
+    "type": "Feature",
+    "geometry": {"type": "Polygon", "coordinates": [((37.610000000000006, 55.7512345678), (37.62, 55.76), (37.610000000000006, 55.7512345678))],
+                 "crs": {"type": "name", "properties": {"name": "EPSG:4326"}}},
+    "properties": {"name": "Участок", "area": np.float64(12.5), "index": np.int64(3), "tags": [], "options": {}},
+}
+
+class TestDumpsJson(unittest.TestCase):
+
+    def test_stdlib_compact_and_indented(self):
+        self.assertEqual(dumps_json({"a": [1, 2], "б": "в"}, backend=JSON_BACKEND_STDLIB), '{"a":[1,2],"б":"в"}')
+        self.assertEqual(dumps_json({"a": 1}, indent=2, backend=JSON_BACKEND_STDLIB), '{\n  "a": 1\n}')
+
+    def test_numpy_scalars(self):
+        self.assertEqual(json.loads(dumps_json(FEATURE["properties"]))["area"], 12.5)
+        with self.assertRaises(TypeError):
+            dumps_json({"a": object()})
+
+    @unittest.skipUnless(orjson is not None, "orjson не установлен")
+    def test_orjson_matches_stdlib(self):
+        self.assertEqual(default_json_backend(), JSON_BACKEND_ORJSON)
+        for indent in (None, 2, 4):
+            with self.subTest(indent=indent):
+                self.assertEqual(dumps_json(FEATURE, indent=indent, backend=JSON_BACKEND_ORJSON),
+                                 dumps_json(FEATURE, indent=indent, backend=JSON_BACKEND_STDLIB))
+        # Целые шире 64 бит сериализует стандартная библиотека
+        big = {"id": 2 ** 70, "nested": [-(2 ** 64)]}
+        self.assertEqual(dumps_json(big, backend=JSON_BACKEND_ORJSON), dumps_json(big, backend=JSON_BACKEND_STDLIB))
+        with self.assertRaises(TypeError):
+            dumps_json({"id": 2 ** 70, "a": object()}, backend=JSON_BACKEND_ORJSON)
+        # Задокументированные отличия (dumps_json). Экспоненциальная запись отличается текстом, но не значением
+        values = [1e-7, 1e16, 1.5e-05, 1.2345678901234568e+17, -2.5e-300]
+        orjson_text = dumps_json(values, backend=JSON_BACKEND_ORJSON)
+        stdlib_text = dumps_json(values, backend=JSON_BACKEND_STDLIB)
+        self.assertEqual((orjson_text, stdlib_text), ("[1e-7,1e16,0.000015,1.2345678901234568e17,-2.5e-300]",
+                                                      "[1e-07,1e+16,1.5e-05,1.2345678901234568e+17,-2.5e-300]"))
+        self.assertEqual(json.loads(orjson_text), json.loads(stdlib_text))
+        # NaN и бесконечности: orjson - null, json - NaN/Infinity (вне RFC 8259)
+        non_finite = [float("nan"), float("inf"), -float("inf")]
+        self.assertEqual(dumps_json(non_finite, backend=JSON_BACKEND_ORJSON), "[null,null,null]")
+        self.assertEqual(dumps_json(non_finite, backend=JSON_BACKEND_STDLIB), "[NaN,Infinity,-Infinity]")
+
+    def test_registry(self):
+        self.assertIn(JSON_BACKEND_STDLIB, available_json_backends())
+        with self.assertRaises(ValueError):
+            dumps_json({}, backend="missing")
+        register_json_encoder("upper", lambda obj, indent: json.dumps(obj).upper())
+        self.assertEqual(dumps_json({"a": "b"}, backend="upper"), '{"A": "B"}')
+
+
+class TestRoundCoordinates(unittest.TestCase):
+
+    def test_round_feature_coordinates(self):
+        rounded = round_feature_coordinates(FEATURE, 6)
+        self.assertEqual(rounded["geometry"]["coordinates"][0][0], [37.61, 55.751235])
+        self.assertEqual(rounded["geometry"]["crs"], FEATURE["geometry"]["crs"])
+        self.assertEqual(rounded["properties"], FEATURE["properties"])
+        # Исходный feature не изменяется
+        self.assertEqual(FEATURE["geometry"]["coordinates"][0][0][0], 37.610000000000006)
+        self.assertIs(round_feature_coordinates(FEATURE, None), FEATURE)
+
+    def test_point_mixed_dimensions_and_collections(self):
+        self.assertEqual(round_geometry_coordinates({"type": "Point", "coordinates": [1.23456, 2.0]}, 2)["coordinates"], [1.23, 2.0])
+        line = {"type": "LineString", "coordinates": [[0.123, 0.456, 10.789], [1.111, 2.222]]}
+        self.assertEqual(round_geometry_coordinates(line, 1)["coordinates"], [[0.1, 0.5, 10.8], [1.1, 2.2]])
+        collection = {"type": "GeometryCollection", "geometries": [{"type": "Point", "coordinates": [0.126, 0.0]}]}
+        self.assertEqual(round_geometry_coordinates(collection, 2)["geometries"][0]["coordinates"], [0.13, 0.0])
+        self.assertIsNone(round_geometry_coordinates(None, 2))
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
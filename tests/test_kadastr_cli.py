@@ -2,14 +2,25 @@ import unittest
 from unittest.mock import patch, mock_open, MagicMock, call
 import os
 import sys
+import json
+import csv
+import sqlite3
+import tempfile
+import shutil
 from click.testing import CliRunner
 
 # Добавляем путь к родительской директории для импорта модулей проекта
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from kadastr_cli import cli
-from scripts.data_structures import ExtractedPlacemark, PointGeom
+from scripts.data_structures import ExtractedPlacemark, PointGeom, PolygonGeom, LinearRingGeom, GeometryMetrics, ValidityResult
 from scripts.geometry_processing import DEFAULT_PRECISION # Оставляем только DEFAULT_PRECISION
+from scripts.geojson_io import read_geojson_seq
+from scripts.sqlite_store import query_sqlite_features
+from scripts.csv_export import CSV_PLACEMARK_COLUMNS
+from scripts.geoparquet_io import geoparquet_available, read_geoparquet_table
+from scripts.flatgeobuf_io import FlatGeobufReader
+from scripts.pkk_api_client import parse_nspd_feature
 
 class TestKadastrCli(unittest.TestCase):
 
@@ -19,16 +30,16 @@ class TestKadastrCli(unittest.TestCase):
     @patch('kadastr_cli.load_kml_file')
     @patch('kadastr_cli.extract_placemark_geometries_recursive')
     @patch('kadastr_cli.get_kml_document_name')
+    @patch('kadastr_cli.apply_precision', side_effect=lambda geoms, crs: list(geoms))
     @patch('kadastr_cli.kml_placemark_to_shapely')
-    @patch('kadastr_cli.calculate_area')
-    @patch('kadastr_cli.calculate_length')
-    @patch('kadastr_cli.calculate_perimeter')
+    @patch('kadastr_cli.check_validity', return_value=[ValidityResult(is_valid=True)])
+    @patch('kadastr_cli.calculate_metrics')
     @patch('kadastr_cli.create_geojson_feature')
-    @patch('kadastr_cli.save_geojson_feature_collection')
+    @patch('kadastr_cli.create_feature_writer')
     @patch('kadastr_cli.os.path.exists')
-    def test_process_kmls_single_file_no_output(self, mock_os_path_exists, mock_save_geojson, mock_create_feature, 
-                                               mock_calc_perimeter, mock_calc_length, mock_calc_area, 
-                                               mock_to_shapely, mock_get_doc_name, mock_extract_placemarks, 
+    def test_process_kmls_single_file_no_output(self, mock_os_path_exists, mock_create_writer, mock_create_feature, 
+                                               mock_calc_metrics, mock_check_validity,
+                                               mock_to_shapely, mock_apply_precision, mock_get_doc_name, mock_extract_placemarks, 
                                                mock_load_kml):
         mock_os_path_exists.return_value = True
         mock_kml_root = MagicMock()
@@ -45,9 +56,7 @@ class TestKadastrCli(unittest.TestCase):
         mock_shapely_geom.is_valid = True
         mock_shapely_geom.wkt = "POINT (10 20)"
         mock_to_shapely.return_value = mock_shapely_geom
-        mock_calc_area.return_value = 0.0
-        mock_calc_length.return_value = 0.0
-        mock_calc_perimeter.return_value = 0.0
+        mock_calc_metrics.return_value = [GeometryMetrics(area=0.0, length=0.0, perimeter=0.0)]
         mock_geojson_feature = {"type": "Feature", "properties": {}, "geometry": None}
         mock_create_feature.return_value = mock_geojson_feature
 
@@ -60,13 +69,16 @@ class TestKadastrCli(unittest.TestCase):
         mock_get_doc_name.assert_called_once_with(mock_kml_root)
         self.assertTrue(hasattr(mock_kml_root, 'Document'))
         mock_extract_placemarks.assert_called_once_with(mock_kml_root.Document)
-        mock_to_shapely.assert_called_once_with(placemark_data, precision=DEFAULT_PRECISION)
-        mock_calc_area.assert_called_with(mock_shapely_geom)
-        mock_calc_length.assert_called_with(mock_shapely_geom)
-        mock_calc_perimeter.assert_called_with(mock_shapely_geom)
+        mock_to_shapely.assert_called_once_with(placemark_data, precision=None)
+        mock_apply_precision.assert_called_once_with([mock_shapely_geom], 'EPSG:4326')
+        mock_check_validity.assert_called_once_with([mock_shapely_geom], repair=False)
+        mock_calc_metrics.assert_called_once_with([mock_shapely_geom], metric_mode='planar', valid_mask=[True])
         mock_create_feature.assert_called_once()
         default_output_path = 'test1.geojson'
-        mock_save_geojson.assert_called_once_with([mock_geojson_feature], default_output_path, indent=2)
+        mock_create_writer.assert_called_once_with(default_output_path, output_format='geojson', indent=2, append=False, layer='placemarks',
+                                                   csv_columns=CSV_PLACEMARK_COLUMNS, csv_geometry_mode='wkt')
+        mock_create_writer.return_value.write.assert_called_once_with(mock_geojson_feature)
+        mock_create_writer.return_value.close.assert_called_once()
 
         self.assertIn(f"Processing KML file: {kml_file_path}", result.output)
         self.assertIn("KML Document Name: TestKMLDocName", result.output)
@@ -79,21 +91,21 @@ class TestKadastrCli(unittest.TestCase):
     @patch('kadastr_cli.load_kml_file')
     @patch('kadastr_cli.extract_placemark_geometries_recursive')
     @patch('kadastr_cli.get_kml_document_name')
+    @patch('kadastr_cli.apply_precision', side_effect=lambda geoms, crs: list(geoms))
     @patch('kadastr_cli.kml_placemark_to_shapely')
     @patch('kadastr_cli.create_geojson_feature')
-    @patch('kadastr_cli.save_geojson_feature_collection')
+    @patch('kadastr_cli.create_feature_writer')
     @patch('kadastr_cli.os.path.exists')
-    @patch('kadastr_cli.calculate_area')
-    @patch('kadastr_cli.calculate_length')
-    @patch('kadastr_cli.calculate_perimeter')
+    @patch('kadastr_cli.calculate_metrics')
+    @patch('kadastr_cli.check_validity')
     def test_process_kmls_with_geojson_output(self,
-                                                mock_calc_perimeter,
-                                                mock_calc_length,
-                                                mock_calc_area,
+                                                mock_check_validity,
+                                                mock_calc_metrics,
                                                 mock_os_path_exists,
-                                                mock_save_geojson,
+                                                mock_create_writer,
                                                 mock_create_feature,
                                                 mock_to_shapely,
+                                                mock_apply_precision,
                                                 mock_get_doc_name,
                                                 mock_extract_placemarks,
                                                 mock_load_kml):
@@ -105,12 +117,12 @@ class TestKadastrCli(unittest.TestCase):
         mock_extract_placemarks.return_value = [placemark_data]
         mock_shapely_geom = MagicMock(is_valid=True)
         mock_to_shapely.return_value = mock_shapely_geom
-        mock_calc_area.return_value = 123.45
-        mock_calc_length.return_value = 67.89
-        mock_calc_perimeter.return_value = 101.12
+        mock_calc_metrics.return_value = [GeometryMetrics(area=123.45, length=67.89, perimeter=101.12)]
+        validity = ValidityResult(is_valid=True)
+        mock_check_validity.return_value = [validity]
         mock_geojson_feature = {"type": "Feature"}
         mock_create_feature.return_value = mock_geojson_feature
-        mock_save_geojson.return_value = True
+        mock_create_writer.return_value.count = 1
 
         kml_file_path = 'input.kml'
         output_geojson_path = 'output.geojson'
@@ -120,23 +132,134 @@ class TestKadastrCli(unittest.TestCase):
         self.assertEqual(result.exit_code, 0, msg=f"CLI exited with {result.exit_code}, output: {result.output}")
         self.assertIn(call(kml_file_path), mock_os_path_exists.call_args_list)
         
-        mock_to_shapely.assert_called_with(placemark_data, precision=DEFAULT_PRECISION)
-        mock_calc_area.assert_called_with(mock_shapely_geom)
-        mock_calc_length.assert_called_with(mock_shapely_geom)
-        mock_calc_perimeter.assert_called_with(mock_shapely_geom)
+        mock_to_shapely.assert_called_with(placemark_data, precision=None)
+        mock_calc_metrics.assert_called_once_with([mock_shapely_geom], metric_mode='planar', valid_mask=[True])
         mock_create_feature.assert_called_with(
             placemark_data=placemark_data, 
             shapely_geom=mock_shapely_geom, 
             area=123.45, 
             length=67.89, 
             perimeter=101.12, 
-            precision=DEFAULT_PRECISION
+            precision=DEFAULT_PRECISION,
+            validity=validity
         )
         
         expected_output_path = os.path.abspath(output_geojson_path)
-        mock_save_geojson.assert_called_once_with([mock_geojson_feature], expected_output_path, indent=2)
-        self.assertIn(f"Saving 1 features to GeoJSON: {expected_output_path}", result.output)
-        self.assertIn("GeoJSON successfully saved.", result.output)
+        mock_create_writer.assert_called_once_with(expected_output_path, output_format='geojson', indent=2, append=False, layer='placemarks',
+                                                   csv_columns=CSV_PLACEMARK_COLUMNS, csv_geometry_mode='wkt')
+        mock_create_writer.return_value.open.assert_called_once()
+        mock_create_writer.return_value.write.assert_called_once_with(mock_geojson_feature)
+        self.assertIn(f"Streaming features to geojson: {expected_output_path}", result.output)
+        self.assertIn("Output successfully saved (1 features).", result.output)
+
+    @patch('kadastr_cli.load_kml_file')
+    @patch('kadastr_cli.extract_placemark_geometries_recursive')
+    @patch('kadastr_cli.get_kml_document_name')
+    @patch('kadastr_cli.apply_precision', side_effect=lambda geoms, crs: list(geoms))
+    @patch('kadastr_cli.kml_placemark_to_shapely')
+    @patch('kadastr_cli.check_validity', return_value=[ValidityResult(is_valid=True)])
+    @patch('kadastr_cli.calculate_metrics')
+    @patch('kadastr_cli.create_geojson_feature', return_value={"type": "Feature"})
+    @patch('kadastr_cli.create_feature_writer')
+    @patch('kadastr_cli.os.path.exists', return_value=True)
+    def test_process_kmls_geodesic_metric_mode(self, mock_os_path_exists, mock_create_writer, mock_create_feature, mock_calc_metrics,
+                                               mock_check_validity,
+                                               mock_to_shapely, mock_apply_precision, mock_get_doc_name, mock_extract_placemarks,
+                                               mock_load_kml):
+        mock_get_doc_name.return_value = "Doc"
+        placemark_data = ExtractedPlacemark(name="P1", id="p1", geometry_type="Point", geometry_data=PointGeom(coordinates="0,0"))
+        mock_extract_placemarks.return_value = [placemark_data]
+        mock_shapely_geom = MagicMock(is_valid=True)
+        mock_to_shapely.return_value = mock_shapely_geom
+        mock_calc_metrics.return_value = [GeometryMetrics(area=10.0, length=0.0, perimeter=4.0)]
+
+        result = self.runner.invoke(cli, ['process-kmls', '-k', 'input.kml', '--metric-mode', 'geodesic'])
+
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        mock_calc_metrics.assert_called_once_with([mock_shapely_geom], metric_mode='geodesic', valid_mask=[True])
+        self.assertIn("Area: 10.00 sq. units (geodesic)", result.output)
+
+    @patch('kadastr_cli.load_kml_file')
+    @patch('kadastr_cli.extract_placemark_geometries_recursive')
+    @patch('kadastr_cli.get_kml_document_name', return_value="Doc")
+    @patch('kadastr_cli.os.path.exists', return_value=True)
+    def test_process_kmls_repair_invalid(self, mock_os_path_exists, mock_get_doc_name,
+                                         mock_extract_placemarks, mock_load_kml):
+        # Самопересекающийся полигон ("бабочка") исправляется make_valid в MultiPolygon
+        bowtie = "0,0 0.001,0.001 0.001,0 0,0.001 0,0"
+        placemark_data = ExtractedPlacemark(name="Bowtie", id="b1", geometry_type="Polygon",
+                                            geometry_data=PolygonGeom(outer_boundary=LinearRingGeom(coordinates=bowtie)))
+        mock_extract_placemarks.return_value = [placemark_data]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'out.geojson')
+            result = self.runner.invoke(cli, ['process-kmls', '-k', 'input.kml', '--output-geojson', output_path, '--repair-invalid'])
+            with open(output_path, encoding='utf-8') as f:
+                saved = json.load(f)
+
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assertIn("WARNING: Shapely geometry is not valid! (Self-intersection", result.output)
+        self.assertIn("Repaired with make_valid: MultiPolygon", result.output)
+        self.assertEqual(saved["type"], "FeatureCollection")
+        self.assertEqual(len(saved["features"]), 1)
+        saved_feature = saved["features"][0]
+        self.assertEqual(saved_feature["geometry"]["type"], "MultiPolygon")
+        self.assertFalse(saved_feature["properties"]["is_valid"])
+        self.assertTrue(saved_feature["properties"]["repaired"])
+        self.assertGreater(saved_feature["properties"]["calculated_area_sq_units"], 0)
+        self.assertGreater(saved_feature["properties"]["calculated_perimeter_units"], 0)
+
+    @patch('kadastr_cli.load_kml_file')
+    @patch('kadastr_cli.extract_placemark_geometries_recursive')
+    @patch('kadastr_cli.get_kml_document_name', return_value="Doc")
+    @patch('kadastr_cli.os.path.exists', return_value=True)
+    def test_process_kmls_geojsonseq_append(self, mock_os_path_exists, mock_get_doc_name,
+                                            mock_extract_placemarks, mock_load_kml):
+        mock_extract_placemarks.return_value = [
+            ExtractedPlacemark(name="P1", id="p1", geometry_type="Point", geometry_data=PointGeom(coordinates="37.6,55.7"))
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'out.geojsons')
+            args = ['process-kmls', '-k', 'a.kml', '-k', 'b.kml', '--output-geojson', output_path,
+                    '--output-format', 'geojsonseq', '--append']
+            result = self.runner.invoke(cli, args)
+            records = list(read_geojson_seq(output_path))
+
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assertIn(f"Streaming features to geojsonseq: {output_path}", result.output)
+        self.assertNotIn("GeoJSON (", result.output)
+        # Оба KML дописаны в один файл
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]["geometry"]["coordinates"], [37.6, 55.7])
+
+        result = self.runner.invoke(cli, ['process-kmls', '-k', 'a.kml', '--append'])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn("--append requires", result.output)
+
+    @patch('kadastr_cli.search_cadastral_data_by_text')
+    def test_search_pkk_output_ndjson(self, mock_search):
+        feature = parse_nspd_feature({
+            "id": 1, "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [4130050.2712345, 7567025.8798765],
+                         "crs": {"type": "name", "properties": {"name": "EPSG:3857"}}},
+            "properties": {"options": {"cad_num": "50:03:0060111:367"}},
+        })
+        mock_search.return_value = ([feature], None)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'found.geojsonl')
+            for _ in range(2):
+                result = self.runner.invoke(cli, ['search-pkk', '-q', '50:03:0060111:367', '--no-metrics',
+                                                  '--output', output_path, '--output-format', 'ndjson', '--append'])
+                self.assertEqual(result.exit_code, 0, msg=result.output)
+            with open(output_path, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+
+        self.assertEqual(len(lines), 2)
+        saved = json.loads(lines[0])
+        self.assertEqual(saved["properties"]["options"]["cad_num"], "50:03:0060111:367")
+        # Метровые координаты НСПД округлены до сантиметра
+        self.assertEqual(saved["geometry"]["coordinates"], [4130050.27, 7567025.88])
+        self.assertIn("Сохранено объектов: 1 (ndjson)", result.output)
 
     def test_process_kmls_kml_file_not_found(self):
         kml_file_path = 'nonexistent.kml'
@@ -162,5 +285,311 @@ class TestKadastrCli(unittest.TestCase):
         mock_load_kml.assert_called_once_with(kml_file_path)
         self.assertIn(f"Error: Could not load or parse KML file: {kml_file_path}", result.output)
 
+    def test_process_geojson_input(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            source = os.path.join(tmp_dir, 'parcels.geojson')
+            with open(source, 'w', encoding='utf-8') as f:
+                # Устаревший член crs у коллекции: координаты в EPSG:3857
+                json.dump({"type": "FeatureCollection", "crs": {"type": "name", "properties": {"name": "EPSG:3857"}},
+                           "features": [{"type": "Feature", "id": 7,
+                                         "geometry": {"type": "Polygon", "coordinates": [[[4130000, 7567000], [4130100, 7567000],
+                                                                                          [4130100, 7567100], [4130000, 7567000]]]},
+                                         "properties": {"label": "50:03:0060111:7"}}]}, f)
+            result = self.runner.invoke(cli, ['process-kmls', '-k', source, '--metric-mode', 'utm'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Name: 50:03:0060111:7", result.output)
+            # Вход не перезаписывается: результат - рядом, с суффиксом
+            with open(os.path.join(tmp_dir, 'parcels_processed.geojson'), encoding='utf-8') as f:
+                feature, = json.load(f)["features"]
+        self.assertEqual(feature["id"], 7)
+        self.assertEqual(feature["properties"]["label"], "50:03:0060111:7")
+        self.assertAlmostEqual(feature["geometry"]["coordinates"][0][0][0], 37.100421, places=6) # WGS84
+        # 5000 кв.м в проекции Меркатора ~ 1570 кв.м на местности (широта 56)
+        self.assertAlmostEqual(feature["properties"]["calculated_area_sq_units"], 5000 * 0.5592 ** 2, delta=20)
+
+    def test_overlay_command(self):
+        kml = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '6_7_etap.kml'))
+        parcels = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'От Зеленограда', 'Этап 7.2.geojson'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'overlay.geojson')
+            result = self.runner.invoke(cli, ['overlay', '-k', kml, '-p', parcels, '--buffer', '20',
+                                              '--output-geojson', output_path])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Зона 6 'ось ВСМ'", result.output)
+            self.assertIn("Площадь пересечения:", result.output)
+            with open(output_path, encoding='utf-8') as f:
+                saved = json.load(f)
+        self.assertGreater(len(saved["features"]), 0)
+        self.assertTrue(all(0 < ft["properties"]["parcel_share_pct"] <= 100 for ft in saved["features"]))
+
+    def test_spatial_query_command(self):
+        source = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'От Зеленограда', 'Этап 7.10.geojson'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dataset = os.path.join(tmp_dir, 'Этап 7.10.geojson')
+            shutil.copy(source, dataset)
+            result = self.runner.invoke(cli, ['build-index', '-d', dataset])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertTrue(os.path.exists(dataset + '.hrtree'))
+
+            result = self.runner.invoke(cli, ['spatial-query', '-d', dataset, '--bbox', '36.6', '56.3', '36.62', '56.32'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Этап 7.10.geojson: 50:03:", result.output)
+            self.assertIn("Найдено объектов: 8", result.output)
+
+            result = self.runner.invoke(cli, ['spatial-query', '-d', dataset])
+            self.assertNotEqual(result.exit_code, 0)
+
+    @patch('kadastr_cli.search_cadastral_data_by_text')
+    def test_cad_query_command(self, mock_search):
+        source = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'От Зеленограда', 'Этап 7.10.geojson'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dataset = os.path.join(tmp_dir, 'Этап 7.10.geojson')
+            shutil.copy(source, dataset)
+            result = self.runner.invoke(cli, ['build-index', '-d', dataset])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertTrue(os.path.exists(dataset + '.cadidx'))
+
+            result = self.runner.invoke(cli, ['cad-query', '-d', dataset, '--cad-num', '50:03:0060111:367'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Этап 7.10.geojson: 50:03:0060111:367", result.output)
+            self.assertIn("Найдено объектов: 1", result.output)
+
+            result = self.runner.invoke(cli, ['cad-query', '-d', dataset, '--range', '50:03:0060111:300', '50:03:0060111:399'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Найдено объектов: 15", result.output)
+
+            result = self.runner.invoke(cli, ['cad-query', '-d', dataset, '--prefix', '50:03', '--cad-num', '50:03:0060111:367'])
+            self.assertNotEqual(result.exit_code, 0)
+
+            # Квартал находится локально, без запроса к API
+            result = self.runner.invoke(cli, ['search-pkk', '-q', '50:03:0060111', '--no-metrics', '-l', dataset])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("запрос к API не выполнялся", result.output)
+            self.assertIn("Найдено объектов: 130", result.output)
+            mock_search.assert_not_called()
+
+            mock_search.return_value = ([], None)
+            result = self.runner.invoke(cli, ['search-pkk', '-q', '77:01:0000001:1', '--no-metrics', '-l', dataset])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            mock_search.assert_called_once_with('77:01:0000001:1')
+
+    def test_dissolve_command(self):
+        parcels = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'От Зеленограда', 'Этап 7.2.geojson'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'dissolved.geojson')
+            result = self.runner.invoke(cli, ['dissolve', '-p', parcels, '--workers', '1', '--output-geojson', output_path])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Этап 7.2: участков - 30, групп - 2", result.output)
+            with open(output_path, encoding='utf-8') as f:
+                saved = json.load(f)
+        self.assertEqual(sum(ft["properties"]["parcel_count"] for ft in saved["features"]), 30)
+        self.assertIn("Земли лесного фонда", [ft["properties"]["land_record_category_type"] for ft in saved["features"]])
+
+    def test_qa_topology_command(self):
+        parcels = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'От Зеленограда', 'Этап 7.2.geojson'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'qa.geojson')
+            # Один и тот же файл дважды: дубликаты по кадастровому номеру не считаются перекрытиями
+            result = self.runner.invoke(cli, ['qa-topology', '-p', parcels, '-p', parcels, '--output-geojson', output_path])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Загружено участков: 60, уникальных: 30.", result.output)
+            self.assertIn("Перекрытия:", result.output)
+            with open(output_path, encoding='utf-8') as f:
+                saved = json.load(f)
+        self.assertTrue(all(ft["properties"]["issue_type"] in ("overlap", "gap", "invalid") for ft in saved["features"]))
+
+    def test_export_sqlite_command(self):
+        parcels = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'От Зеленограда', 'Этап 7.2.geojson'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'project.sqlite')
+            result = self.runner.invoke(cli, ['export-sqlite', '-p', parcels, '-o', output_path])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            result = self.runner.invoke(cli, ['export-sqlite', '-p', parcels, '-o', output_path, '--append'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Сохранено участков: 30 в слой 'parcels'", result.output)
+            stored = list(query_sqlite_features(output_path))
+            cad_num = stored[0]["properties"]["options"]["cad_num"]
+            by_cad_num = list(query_sqlite_features(output_path, cad_num=cad_num))
+        self.assertEqual(len(stored), 60)
+        self.assertEqual(len(by_cad_num), 2)
+
+    def test_export_sqlite_incremental(self):
+        stage_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'От Зеленограда'))
+        first, second = (os.path.join(stage_dir, name) for name in ('Этап 7.2.geojson', 'Этап 7.3.geojson'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'project.sqlite')
+            result = self.runner.invoke(cli, ['export-sqlite', '-p', first, '-p', second, '-o', output_path])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            # Этапы пересекаются: повторы участка не считаются отдельными features
+            total = len({f["id"] for f in query_sqlite_features(output_path)})
+            # Второй этап убран из набора: его участки удаляются, остальные не переписываются
+            result = self.runner.invoke(cli, ['export-sqlite', '-p', first, '-o', output_path, '--incremental'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn(f"Добавлено: 0, изменено: 0, без изменений: 30, удалено: {total - 30}", result.output)
+            self.assertEqual(len(list(query_sqlite_features(output_path))), 30)
+            result = self.runner.invoke(cli, ['export-sqlite', '-p', first, '-o', output_path, '--incremental', '--append'])
+            self.assertIn("несовместимы", result.output)
+
+    def test_build_catalog_command(self):
+        source = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'От Зеленограда'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for name in ('Этап 7.10.geojson', 'Этап 7.11.geojson'):
+                shutil.copy(os.path.join(source, name), tmp_dir)
+            output_path = os.path.join(tmp_dir, 'catalog.sqlite')
+            result = self.runner.invoke(cli, ['build-catalog', '-d', tmp_dir, '-o', output_path, '--workers', '1'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Прочитано участков: 1290", result.output)
+            stored = list(query_sqlite_features(output_path))
+        # Соседние этапы пересекаются: общие участки записаны один раз, с обоими этапами
+        self.assertEqual(len(stored), len({f["id"] for f in stored}))
+        self.assertLess(len(stored), 1290)
+        self.assertTrue(any(f["properties"]["stages"] == ["Этап 7.10", "Этап 7.11"] for f in stored))
+
+    @patch('scripts.quarter_harvest.search_cadastral_data_by_text')
+    def test_harvest_quarters_command(self, mock_search):
+        mock_search.return_value = ([parse_nspd_feature({
+            "id": 1, "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [4130050.27, 7567025.88],
+                         "crs": {"type": "name", "properties": {"name": "EPSG:3857"}}},
+            "properties": {"options": {"cad_num": "50:03:0060111:367"}},
+        })], None)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'store.sqlite')
+            result = self.runner.invoke(cli, ['harvest-quarters', '-q', '50:03:0060111', '-o', output_path])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Собрано полностью: 1, участков записано: 1", result.output)
+            result = self.runner.invoke(cli, ['harvest-quarters', '-q', '50:03:0060111', '-o', output_path])
+            self.assertIn("Пропущено (уже собраны): 1", result.output)
+            self.assertEqual(len(list(query_sqlite_features(output_path))), 1)
+        mock_search.assert_called_once_with('50:03:0060111')
+
+        result = self.runner.invoke(cli, ['harvest-quarters', '-o', 'store.sqlite'])
+        self.assertNotEqual(result.exit_code, 0)
+
+    def test_diff_command(self):
+        source = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'От Зеленограда', 'Этап 7.10.geojson'))
+        with open(source, encoding='utf-8') as f:
+            collection = json.load(f)
+        features = collection["features"]
+        features[0]["properties"]["options"]["cost_value"] = 1.5
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            new_path = os.path.join(tmp_dir, 'new.geojson')
+            with open(new_path, 'w', encoding='utf-8') as f:
+                json.dump(dict(collection, features=features[5:] + features[:1]), f, ensure_ascii=False)
+            output_path = os.path.join(tmp_dir, 'changes.geojsonl')
+            result = self.runner.invoke(cli, ['diff', '-a', source, '-b', new_path, '-o', output_path,
+                                              '--output-format', 'ndjson', '--workers', '1'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Удалено: 4", result.output)
+            self.assertIn("Изменены атрибуты: 1", result.output)
+            with open(output_path, encoding='utf-8') as f:
+                changes = [json.loads(line) for line in f]
+        self.assertEqual(len(changes), 5)
+        self.assertEqual(sum(c["properties"]["change_type"] == "attributes_changed" for c in changes), 1)
+
+    def test_export_csv_command(self):
+        parcels = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'От Зеленограда', 'Этап 7.2.geojson'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'parcels.csv')
+            broken = os.path.join(tmp_dir, 'broken.geojson')
+            with open(broken, 'w', encoding='utf-8') as f:
+                f.write('{"type": "FeatureCollection", "features": [')
+            result = self.runner.invoke(cli, ['export-csv', '-p', parcels, '-p', broken, '-o', output_path, '--geometry', 'centroid'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Этап 7.2.geojson: участков - 30", result.output)
+            self.assertIn("broken.geojson: не удалось прочитать файл", result.output)
+            self.assertIn("Выгружено участков: 30", result.output)
+            with open(output_path, encoding='utf-8-sig', newline='') as f:
+                rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 30)
+        self.assertTrue(all(row["cad_num"] and row["centroid_x"] and row["crs"] == "EPSG:3857" for row in rows))
+
+    def test_export_fgb_command(self):
+        parcels = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'От Зеленограда', 'Этап 7.2.geojson'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'parcels.fgb')
+            result = self.runner.invoke(cli, ['export-fgb', '-i', parcels, '-o', output_path, '--layer', 'stage_7_2'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Выгружено объектов: 30", result.output)
+            with FlatGeobufReader(output_path) as reader:
+                self.assertEqual((reader.name, reader.crs, reader.features_count), ('stage_7_2', 'EPSG:3857', 30))
+                features = list(reader.features(reader.envelope))
+        self.assertEqual(len(features), 30)
+        self.assertTrue(all(f["properties"]["options"]["cad_num"] for f in features))
+
+    @unittest.skipUnless(geoparquet_available(), "pyarrow не установлен")
+    def test_export_parquet_command(self):
+        parcels = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'От Зеленограда', 'Этап 7.2.geojson'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'parcels.parquet')
+            result = self.runner.invoke(cli, ['export-parquet', '-p', parcels, '-o', output_path, '--row-group-size', '10'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Выгружено участков: 30", result.output)
+            table = read_geoparquet_table(output_path, columns=['cad_num', 'land_record_category_type'])
+        self.assertEqual(table.num_rows, 30)
+        self.assertTrue(all(table.column('cad_num').to_pylist()))
+
+    @patch('kadastr_cli.search_cadastral_data_by_text')
+    def test_search_pkk_several_output_formats(self, mock_search):
+        raw = {"id": 1, "type": "Feature", "properties": {"options": {"cad_num": "50:03:0060111:1"}},
+               "geometry": {"type": "Point", "coordinates": [4130000.0, 7567000.0],
+                            "crs": {"type": "name", "properties": {"name": "EPSG:3857"}}}}
+        mock_search.return_value = ([parse_nspd_feature(raw)], None)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'found.geojsonl')
+            result = self.runner.invoke(cli, ['search-pkk', '-q', '50:03:0060111:1', '--no-metrics', '--output', output_path,
+                                              '--output-format', 'ndjson', '--output-format', 'csv',
+                                              '--output-format', 'sqlite', '--parallel-output'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn(f"(ndjson) в {output_path}", result.output)
+            records = list(read_geojson_seq(output_path))
+            with open(os.path.join(tmp_dir, 'found.csv'), encoding='utf-8-sig', newline='') as f:
+                rows = list(csv.DictReader(f))
+            stored = list(query_sqlite_features(os.path.join(tmp_dir, 'found.sqlite')))
+        self.assertEqual([r["id"] for r in records], [1])
+        self.assertEqual([row["cad_num"] for row in rows], ["50:03:0060111:1"])
+        self.assertEqual(stored[0]["properties"]["options"]["cad_num"], "50:03:0060111:1")
+
+    def test_build_tiles_command(self):
+        kml = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '6_7_etap.kml'))
+        parcels = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'От Зеленограда', 'Этап 7.2.geojson'))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'map.mbtiles')
+            result = self.runner.invoke(cli, ['build-tiles', '-p', parcels, '-k', kml, '-o', output_path,
+                                              '--min-zoom', '12', '--max-zoom', '14', '-a', 'cad_num'])
+            self.assertEqual(result.exit_code, 0, msg=result.output)
+            self.assertIn("Участков: 30", result.output)
+            connection = sqlite3.connect(output_path)
+            try:
+                zooms = [z for z, in connection.execute("SELECT DISTINCT zoom_level FROM tiles ORDER BY zoom_level")]
+                layer_ids = [layer["id"] for layer in json.loads(
+                    connection.execute("SELECT value FROM metadata WHERE name = 'json'").fetchone()[0])["vector_layers"]]
+            finally:
+                connection.close()
+        self.assertEqual(zooms, [12, 13, 14])
+        self.assertEqual(layer_ids, ["parcels", "zones"])
+
+        result = self.runner.invoke(cli, ['build-tiles', '-o', os.path.join(tmp_dir, 'tiles')])
+        self.assertNotEqual(result.exit_code, 0)
+
+    @patch('kadastr_cli.load_kml_file')
+    @patch('kadastr_cli.extract_placemark_geometries_recursive')
+    @patch('kadastr_cli.get_kml_document_name', return_value="Doc")
+    @patch('kadastr_cli.os.path.exists', return_value=True)
+    def test_process_kmls_sqlite_output(self, mock_os_path_exists, mock_get_doc_name,
+                                        mock_extract_placemarks, mock_load_kml):
+        mock_extract_placemarks.return_value = [
+            ExtractedPlacemark(name="P1", id="p1", geometry_type="Point", geometry_data=PointGeom(coordinates="37.6,55.7"))
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output_path = os.path.join(tmp_dir, 'project.sqlite')
+            result = self.runner.invoke(cli, ['process-kmls', '-k', 'a.kml', '--output-geojson', output_path,
+                                              '--output-format', 'sqlite'])
+            stored = list(query_sqlite_features(output_path, layer='placemarks', bbox=(37, 55, 38, 56)))
+        self.assertEqual(result.exit_code, 0, msg=result.output)
+        self.assertEqual(len(stored), 1)
+        self.assertEqual(stored[0]["properties"]["kml_name"], "P1")
+        self.assertNotIn("crs", stored[0]["geometry"])
+
 if __name__ == '__main__':
     unittest.main(argv=['first-arg-is-ignored'], exit=False) 
\ No newline at end of file
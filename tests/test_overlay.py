@@ -0,0 +1,112 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+import shutil
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from shapely.geometry import LineString, Polygon, box, mapping
+
+from scripts.overlay import load_kml_zones, load_nspd_parcels, buffer_in_metres, overlay_zones_with_parcels, overlay_results_to_features
+from scripts.geometry_processing import METRIC_MODE_PLANAR, reproject_geometries
+from tests.nspd_fixtures import nspd_feature
+
+class TestOverlayZonesWithParcels(unittest.TestCase):
+
+    def setUp(self):
+        # Два смежных участка 100x100 и один удаленный
+        self.parcels = [box(0, 0, 100, 100), box(100, 0, 200, 100), box(500, 500, 600, 600)]
+        self.cad_nums = ["50:01:0000001:1", "50:01:0000001:2", "50:01:0000001:3"]
+
+    def test_polygon_zone_area_and_share(self):
+        zone = box(50, 0, 150, 100) # по половине первых двух участков
+        results = overlay_zones_with_parcels([zone], self.parcels, metric_mode=METRIC_MODE_PLANAR,
+                                             zone_names=["Этап"], parcel_cad_nums=self.cad_nums)
+        self.assertEqual([r.parcel_index for r in results], [0, 1])
+        for result in results:
+            self.assertEqual(result.zone_name, "Этап")
+            self.assertAlmostEqual(result.intersection_area, 5000.0)
+            self.assertAlmostEqual(result.parcel_area, 10000.0)
+            self.assertAlmostEqual(result.parcel_share_pct, 50.0)
+        self.assertEqual(results[1].cad_num, "50:01:0000001:2")
+
+    def test_line_zone_length(self):
+        zone = LineString([(10, 50), (190, 50)])
+        results = overlay_zones_with_parcels([zone], self.parcels, metric_mode=METRIC_MODE_PLANAR)
+        self.assertEqual(len(results), 2)
+        self.assertAlmostEqual(results[0].intersection_length, 90.0)
+        self.assertAlmostEqual(results[1].intersection_length, 90.0)
+        self.assertIsNone(results[0].parcel_share_pct)
+
+    def test_boundary_touch_is_dropped(self):
+        zone = box(200, 0, 300, 100) # касается второго участка только по стороне
+        self.assertEqual(overlay_zones_with_parcels([zone], self.parcels, metric_mode=METRIC_MODE_PLANAR), [])
+
+    def test_invalid_parcel_is_repaired(self):
+        bowtie = Polygon([(0, 0), (100, 100), (100, 0), (0, 100), (0, 0)])
+        results = overlay_zones_with_parcels([box(0, 0, 100, 100)], [bowtie], metric_mode=METRIC_MODE_PLANAR)
+        self.assertEqual(len(results), 1)
+        self.assertAlmostEqual(results[0].parcel_share_pct, 100.0)
+
+    def test_results_to_features(self):
+        results = overlay_zones_with_parcels([box(50, 0, 150, 100)], self.parcels, metric_mode=METRIC_MODE_PLANAR,
+                                             parcel_cad_nums=self.cad_nums)
+        features = overlay_results_to_features(results)
+        self.assertEqual(len(features), 2)
+        props = features[0]["properties"]
+        self.assertEqual(props["cad_num"], "50:01:0000001:1")
+        self.assertEqual(props["parcel_share_pct"], 50.0)
+        self.assertNotIn("zone_name", props)
+        # Геометрия выводится в WGS84
+        self.assertLess(abs(features[0]["geometry"]["coordinates"][0][0][0]), 0.01)
+
+
+class TestOverlayLoadersAndBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_load_nspd_parcels_reprojects_by_geometry_crs(self):
+        mercator = box(4157000, 7540000, 4157100, 7540100)
+        wgs84 = reproject_geometries(mercator, "EPSG:3857", "EPSG:4326")
+        path = os.path.join(self.test_dir, "parcels.geojson")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"type": "FeatureCollection", "features": [
+                nspd_feature(1, cad_num="50:01:0000001:1", geometry=mapping(mercator)),
+                nspd_feature(2, cad_num="50:01:0000001:2", geometry=mapping(wgs84), crs="EPSG:4326"),
+                {"id": 3, "type": "Feature", "geometry": None, "properties": {}},
+            ]}, f)
+
+        features, geoms = load_nspd_parcels([path])
+        self.assertEqual([f.options_properties.cad_num for f in features], ["50:01:0000001:1", "50:01:0000001:2"])
+        self.assertAlmostEqual(geoms[0].area, 10000.0, places=2)
+        self.assertAlmostEqual(geoms[1].area, 10000.0, delta=1.0)
+
+    def test_load_zones_from_geojson(self):
+        zone = box(4157000, 7540000, 4157100, 7540100)
+        path = os.path.join(self.test_dir, "zones.geojson")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"type": "FeatureCollection", "crs": {"type": "name", "properties": {"name": "EPSG:3857"}},
+                       "features": [{"type": "Feature", "geometry": mapping(zone), "properties": {"name": "полоса"}},
+                                    {"type": "Feature", "geometry": None, "properties": {"name": "пусто"}}]}, f)
+        placemarks, geoms = load_kml_zones([path])
+        self.assertEqual([pm.name for pm in placemarks], ["полоса"])
+        self.assertAlmostEqual(geoms[0].area, 10000.0, places=2)
+
+    def test_buffer_in_metres_on_mercator(self):
+        # На широте ~56° метр в EPSG:3857 примерно в 1.79 раза "длиннее" единицы CRS
+        line = LineString([(4157000, 7540000), (4158000, 7540000)])
+        buffered = buffer_in_metres([line], 10.0)[0]
+        width = buffered.bounds[3] - buffered.bounds[1]
+        self.assertGreater(width, 20.0 * 1.7)
+        self.assertLess(width, 20.0 * 1.9)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
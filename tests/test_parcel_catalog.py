@@ -0,0 +1,82 @@
+import unittest
+import os
+import sys
+import json
+import sqlite3
+import tempfile
+import shutil
+from unittest.mock import patch
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.parcel_catalog import build_parcel_catalog, find_stage_files, stage_sort_key
+from scripts.sqlite_store import query_sqlite_features
+from tests.nspd_fixtures import nspd_feature
+
+class TestParcelCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.test_dir, "catalog.sqlite")
+        stages = {
+            "Этап 7.10": [nspd_feature(3, 4130040.0, 7567000.0), nspd_feature(4, 4130060.0, 7567000.0)],
+            "Этап 7.2": [nspd_feature(1, 4130000.0, 7567000.0), nspd_feature(2, 4130020.0, 7567000.0, label="первый"),
+                         nspd_feature(3, 4130040.0, 7567000.0)],
+            # Повтор участка 2 с другими атрибутами и участок 1 с измененной границей
+            "Этап 7.3": [nspd_feature(2, 4130020.004, 7567000.0, label="второй"), nspd_feature(1, 4130500.0, 7567000.0)],
+        }
+        for stage, features in stages.items():
+            with open(os.path.join(self.test_dir, stage + ".geojson"), 'w', encoding='utf-8') as f:
+                json.dump({"type": "FeatureCollection", "features": features}, f, ensure_ascii=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _catalog(self):
+        return {(f["id"], tuple(f["properties"]["stages"])): f for f in query_sqlite_features(self.output)}
+
+    def test_dedupe_and_stage_membership(self):
+        paths = find_stage_files(self.test_dir)
+        self.assertEqual([os.path.basename(p) for p in paths], ["Этап 7.2.geojson", "Этап 7.3.geojson", "Этап 7.10.geojson"])
+        self.assertLess(stage_sort_key("Этап 7.2"), stage_sort_key("Этап 7.10"))
+
+        stats = build_parcel_catalog(paths, self.output, workers=1)
+        self.assertEqual((stats.features_read, stats.parcels, stats.duplicates), (7, 5, 2))
+        catalog = self._catalog()
+        self.assertEqual(sorted(catalog), [
+            (1, ("Этап 7.2",)), (1, ("Этап 7.3",)), (2, ("Этап 7.2", "Этап 7.3")),
+            (3, ("Этап 7.2", "Этап 7.10")), (4, ("Этап 7.10",)),
+        ])
+        # Граница совпадает с точностью 1 см; атрибуты берутся из первого этапа
+        self.assertEqual(catalog[(2, ("Этап 7.2", "Этап 7.3"))]["properties"]["label"], "первый")
+
+        connection = sqlite3.connect(self.output)
+        try:
+            rows = connection.execute(
+                "SELECT p.feature_id FROM parcels_stages s JOIN parcels p ON p.fid = s.fid WHERE s.stage = ? ORDER BY 1",
+                ("Этап 7.10",)
+            ).fetchall()
+        finally:
+            connection.close()
+        self.assertEqual(rows, [(3,), (4,)])
+
+    def test_external_sort_spills_and_merges(self):
+        build_parcel_catalog(find_stage_files(self.test_dir), self.output, workers=1)
+        expected = self._catalog()
+        # Часть на каждый feature и слияние в несколько проходов дают тот же каталог
+        with patch("scripts.parcel_catalog.MAX_MERGE_FANIN", 2):
+            stats = build_parcel_catalog(find_stage_files(self.test_dir), self.output, workers=2, run_chars=1)
+        self.assertEqual(stats.spill_runs, 7)
+        self.assertEqual(self._catalog(), expected)
+
+    def test_broken_stage_is_skipped(self):
+        with open(os.path.join(self.test_dir, "Этап 7.4.geojson"), 'w', encoding='utf-8') as f:
+            f.write('{"type": "FeatureCollection", "features": [{"type": "Feature", "id": 9, "prop')
+        with self.assertLogs('scripts.parcel_catalog', level='ERROR'):
+            stats = build_parcel_catalog(find_stage_files(self.test_dir), self.output, workers=1)
+        self.assertEqual(stats.failed_stages, ["Этап 7.4"])
+        self.assertEqual(stats.parcels, 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+import json
+import os
+import sys
+import sqlite3
+import tempfile
+import shutil
+import threading
+
+from shapely.geometry import box
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.pkk_api_client import parse_nspd_feature
+from scripts.quarter_harvest import find_zone_quarters, harvest_quarters, load_quarter_status
+from scripts.sqlite_store import query_sqlite_features
+from tests.nspd_fixtures import nspd_feature
+
+class _FakeAPI:
+    """Текстовый поиск НСПД по кварталу: ответы задаются словарем, вызовы считаются."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, quarter):
+        with self._lock:
+            self.calls.append(quarter)
+        response = self.responses.get(quarter)
+        if isinstance(response, str):
+            return None, response
+        return [parse_nspd_feature(feature) for feature in response or []], None
+
+class TestQuarterHarvest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.store = os.path.join(self.test_dir, "store.sqlite")
+        local = [
+            nspd_feature(1, 4130000.0, 7567000.0),
+            nspd_feature(2, 4130020.0, 7567000.0),
+            nspd_feature(3, 4130040.0, 7567000.0, cad_num="50:03:0060112:9", quarter="50:03:0060115"),
+            nspd_feature(4, 4131000.0, 7567000.0, cad_num="50:03:0060113:1"), # Вне зоны
+        ]
+        self.dataset = os.path.join(self.test_dir, "Этап.geojson")
+        with open(self.dataset, 'w', encoding='utf-8') as f:
+            json.dump({"type": "FeatureCollection", "features": local}, f, ensure_ascii=False)
+        self.zone = box(4129990.0, 7566990.0, 4130045.0, 7567020.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_find_zone_quarters(self):
+        quarters = find_zone_quarters([self.zone], [self.dataset], "EPSG:3857")
+        self.assertEqual(quarters, {"50:03:0060111": {"50:03:0060111:1", "50:03:0060111:2"},
+                                    "50:03:0060115": {"50:03:0060112:9"}})
+
+    def test_harvest_skips_complete_quarters(self):
+        quarters = find_zone_quarters([self.zone], [self.dataset], "EPSG:3857")
+        quarters["50:03:0060120"] = set()
+        api = _FakeAPI({
+            "50:03:0060111": [
+                nspd_feature(1, 4130000.0, 7567000.0),
+                nspd_feature(2, 4130020.0, 7567000.0),
+                nspd_feature(5, 4130060.0, 7567000.0, cad_num="50:03:0060111:3"),
+                nspd_feature(6, 4130080.0, 7567000.0, cad_num="50:03:0060110:7"), # Соседний квартал в ответе
+            ],
+            # Известный участок квартала отсутствует в ответе
+            "50:03:0060115": [nspd_feature(7, 4130100.0, 7567000.0, cad_num="50:03:0060115:4")],
+            "50:03:0060120": "HTTP 503",
+        })
+        stats = harvest_quarters(quarters, self.store, workers=3, fetch=api)
+        self.assertEqual(stats.complete, ["50:03:0060111"])
+        self.assertEqual(stats.incomplete, ["50:03:0060115"])
+        self.assertEqual(stats.failed, ["50:03:0060120"])
+        self.assertEqual(stats.parcels, 4)
+        self.assertEqual(load_quarter_status(self.store), {"50:03:0060111": True, "50:03:0060115": False})
+
+        # Повторный запуск: полный квартал пропускается, неполный заменяется целиком
+        api.responses["50:03:0060115"] = [nspd_feature(3, 4130040.0, 7567000.0, cad_num="50:03:0060112:9", quarter="50:03:0060115"),
+                                          nspd_feature(7, 4130100.0, 7567000.0, cad_num="50:03:0060115:4")]
+        api.responses["50:03:0060120"] = []
+        api.calls.clear()
+        stats = harvest_quarters(quarters, self.store, fetch=api)
+        self.assertEqual(stats.skipped, ["50:03:0060111"])
+        self.assertEqual(sorted(api.calls), ["50:03:0060115", "50:03:0060120"])
+        self.assertEqual(stats.complete, ["50:03:0060115", "50:03:0060120"])
+        stored = sorted(f["id"] for f in query_sqlite_features(self.store))
+        self.assertEqual(stored, [1, 2, 3, 5, 7])
+
+        connection = sqlite3.connect(self.store)
+        try:
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM rtree_parcels").fetchone()[0], 5)
+        finally:
+            connection.close()
+
+    def test_page_limit_marks_incomplete(self):
+        api = _FakeAPI({"50:03:0060111": [nspd_feature(i, 4130000.0 + 20 * i, 7567000.0) for i in range(3)]})
+        stats = harvest_quarters({"50:03:0060111": set()}, self.store, page_limit=3, fetch=api)
+        self.assertEqual(stats.incomplete, ["50:03:0060111"])
+        stats = harvest_quarters({"50:03:0060111": set()}, self.store, page_limit=3, fetch=api)
+        self.assertEqual((stats.skipped, stats.parcels), ([], 3))
+        self.assertEqual(len(list(query_sqlite_features(self.store))), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import codecs
+import json
+import os
+import sys
+import tempfile
+import shutil
+
+import numpy as np
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.geojson_stream import read_geojson_feature_spans
+from scripts.spatial_index import _hilbert, build_spatial_index, open_spatial_index, query_datasets, sidecar_path
+
+def _square_feature(i, x, y, size=1.0):
+    ring = [[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]
+    return {
+        "id": i,
+        "type": "Feature",
+        "geometry": {"type": "Polygon", "coordinates": [ring],
+                     "crs": {"type": "name", "properties": {"name": "EPSG:3857"}}},
+        "properties": {"label": f"Участок №{i}", "options": {"cad_num": f"50:01:0000001:{i}"}},
+    }
+
+class TestHilbert(unittest.TestCase):
+
+    def test_curve_visits_neighbouring_cells(self):
+        # На сетке 64x64 (шаг 1024) кривая проходит каждую ячейку один раз и только по соседям
+        n, step = 64, 65536 // 64
+        xs, ys = np.meshgrid(np.arange(n), np.arange(n))
+        xs, ys = xs.ravel(), ys.ravel()
+        values = _hilbert(xs * step, ys * step)
+        self.assertEqual(len(np.unique(values)), n * n)
+        order = np.argsort(values)
+        steps = np.abs(np.diff(xs[order])) + np.abs(np.diff(ys[order]))
+        self.assertTrue(np.all(steps == 1))
+
+
+class TestPackedHilbertRTree(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(42)
+        self.origins = rng.uniform(0, 1000, size=(500, 2))
+        features = [_square_feature(i, float(x), float(y)) for i, (x, y) in enumerate(self.origins)]
+        features.append({"id": 500, "type": "Feature", "geometry": None, "properties": {}})
+        self.features = features
+        self.path = os.path.join(self.test_dir, "Этап.geojson")
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f, ensure_ascii=False, indent=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def _brute_force(self, bbox):
+        minx, miny, maxx, maxy = bbox
+        x, y = self.origins[:, 0], self.origins[:, 1]
+        return np.flatnonzero((x <= maxx) & (y <= maxy) & (x + 1 >= minx) & (y + 1 >= miny)).tolist()
+
+    def test_spans_point_at_features(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        bom_path = os.path.join(self.test_dir, "bom.geojson")
+        with open(bom_path, 'wb') as f:
+            f.write(codecs.BOM_UTF8 + data)
+        for path, source in ((self.path, data), (bom_path, codecs.BOM_UTF8 + data)):
+            # Малый буфер: смещения переживают сдвиги буфера чтения
+            spans = list(read_geojson_feature_spans(path, chunk_size=64))
+            self.assertEqual(len(spans), 501)
+            # Смещения в байтах корректны и после кириллицы в свойствах
+            for i in (0, 250, 500):
+                _, offset, length = spans[i]
+                self.assertEqual(json.loads(source[offset:offset + length].decode('utf-8')), self.features[i])
+
+    def test_crs_name_is_normalized_and_not_truncated(self):
+        long_crs = "+proj=merc +a=6378137 +b=6378137 +lat_ts=0 +lon_0=0 +x_0=0 +y_0=0 +k=1 +units=m +no_defs"
+        for crs_member, expected in (({"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::3857"}}, "EPSG:3857"),
+                                     ({"type": "name", "properties": {"name": long_crs}}, long_crs)):
+            features = [dict(feature, geometry={k: v for k, v in feature["geometry"].items() if k != "crs"})
+                        for feature in self.features[:10]]
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({"type": "FeatureCollection", "crs": crs_member, "features": features}, f)
+            build_spatial_index(self.path)
+            index = open_spatial_index(self.path, rebuild=False)
+            self.assertEqual(index.crs, expected)
+            self.assertEqual(index.query((0, 0, 1000, 1000)), list(range(10)))
+
+    def test_query_matches_brute_force(self):
+        index_path = build_spatial_index(self.path)
+        self.assertEqual(index_path, sidecar_path(self.path))
+        index = open_spatial_index(self.path, rebuild=False)
+        self.assertEqual(index.num_features, 501)
+        self.assertEqual(index.num_items, 500)
+        for bbox in [(0, 0, 1000, 1000), (100, 100, 150, 180), (500.5, 500.5, 500.5, 500.5), (-10, -10, -5, -5)]:
+            self.assertEqual(index.query(bbox), self._brute_force(bbox))
+        feature_id = index.query((100, 100, 150, 180))[0]
+        self.assertEqual(index.read_feature(feature_id), self.features[feature_id])
+
+    def test_stale_index_is_rebuilt(self):
+        build_spatial_index(self.path)
+        self.assertFalse(open_spatial_index(self.path, rebuild=False).is_stale())
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({"type": "FeatureCollection", "features": self.features[:10]}, f)
+        self.assertIsNone(open_spatial_index(self.path, rebuild=False))
+        self.assertEqual(open_spatial_index(self.path).num_features, 10)
+
+    def test_query_datasets_reprojects_bbox(self):
+        # Квадрат у (0, 0) в EPSG:3857 виден из WGS84-запроса вокруг (0, 0)
+        hits = list(query_datasets([self.path], (-0.001, -0.001, 0.001, 0.001), bbox_crs="EPSG:4326"))
+        self.assertEqual([f["id"] for _, f in hits], self._brute_force((-111.3, -111.3, 111.3, 111.3)))
+        exact = list(query_datasets([self.path], (500.5, 500.5, 500.5, 500.5), bbox_crs="EPSG:3857", exact=True))
+        self.assertEqual([f["id"] for _, f in exact], self._brute_force((500.5, 500.5, 500.5, 500.5)))
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,146 @@
+import unittest
+import os
+import sys
+import sqlite3
+import tempfile
+import shutil
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.sqlite_store import SQLiteFeatureWriter, query_sqlite_features, feature_cad_fields
+from tests.nspd_fixtures import nspd_feature
+
+class TestSQLiteFeatureWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, "project.sqlite")
+        self.features = [
+            nspd_feature(1, 4130000.0, 7567000.0),
+            nspd_feature(2, 4130100.0, 7567000.0),
+            nspd_feature(3, 4200000.0, 7600000.0, cad_num="69:10:0000021:3", quarter="69:10:0000021"),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_write_and_query(self):
+        # Маленький пакет: запись идет несколькими executemany в одной транзакции
+        with SQLiteFeatureWriter(self.path, batch_size=2) as writer:
+            for feature in self.features:
+                writer.write(feature)
+        self.assertEqual(writer.count, 3)
+
+        quarter = list(query_sqlite_features(self.path, quarter_cad_number="50:03:0060111"))
+        self.assertEqual([f["id"] for f in quarter], [1, 2])
+        self.assertEqual(quarter[0]["properties"], self.features[0]["properties"])
+        self.assertEqual(quarter[0]["geometry"]["crs"]["properties"]["name"], "EPSG:3857")
+        self.assertEqual(quarter[0]["geometry"]["coordinates"][0][0], (4130000.0, 7567000.0))
+
+        in_box = list(query_sqlite_features(self.path, bbox=(4130005, 7567005, 4130050, 7567050)))
+        self.assertEqual([f["id"] for f in in_box], [1])
+        self.assertEqual([f["id"] for f in query_sqlite_features(self.path, cad_num="69:10:0000021:3")], [3])
+
+        connection = sqlite3.connect(self.path)
+        try:
+            self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            self.assertTrue({"idx_parcels_cad_num", "idx_parcels_quarter"} <= indexes)
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM rtree_parcels").fetchone()[0], 3)
+        finally:
+            connection.close()
+
+    def test_append_replace_and_reprojection(self):
+        with SQLiteFeatureWriter(self.path) as writer:
+            writer.write(self.features[0])
+        # Геометрия без "crs" (WGS84) перепроецируется в CRS слоя
+        wgs84_feature = {"type": "Feature", "geometry": {"type": "Point", "coordinates": [37.1, 55.9]},
+                         "properties": {"cad_num": "50:03:0060111:9"}}
+        with SQLiteFeatureWriter(self.path, append=True) as writer:
+            writer.write(wgs84_feature)
+        features = list(query_sqlite_features(self.path, quarter_cad_number="50:03:0060111"))
+        self.assertEqual(len(features), 2)
+        self.assertAlmostEqual(features[1]["geometry"]["coordinates"][0], 4129953.1, delta=1.0)
+
+        with SQLiteFeatureWriter(self.path) as writer:
+            writer.write(self.features[2])
+        self.assertEqual([f["id"] for f in query_sqlite_features(self.path)], [3])
+
+    def test_error_rolls_back(self):
+        with SQLiteFeatureWriter(self.path) as writer:
+            writer.write(self.features[0])
+        with self.assertRaises(RuntimeError):
+            with SQLiteFeatureWriter(self.path) as writer:
+                writer.write(self.features[1])
+                raise RuntimeError("обработка прервана")
+        self.assertEqual([f["id"] for f in query_sqlite_features(self.path)], [1])
+
+    def test_incremental_upsert_and_tombstones(self):
+        with SQLiteFeatureWriter(self.path) as writer:
+            for feature in self.features:
+                writer.write(feature)
+        changed = nspd_feature(2, 4130100.0, 7567050.0)
+        added = nspd_feature(4, 4130300.0, 7567000.0)
+        with SQLiteFeatureWriter(self.path, incremental=True, batch_size=2) as writer:
+            for feature in (self.features[0], changed, added):
+                writer.write(feature)
+        stats = writer.stats
+        self.assertEqual((stats.inserted, stats.updated, stats.unchanged, stats.deleted), (1, 1, 1, 1))
+        stored = list(query_sqlite_features(self.path))
+        self.assertEqual([f["id"] for f in stored], [1, 2, 4])
+        self.assertEqual(stored[1]["geometry"]["coordinates"][0][0], (4130100.0, 7567050.0))
+        self.assertEqual([f["id"] for f in query_sqlite_features(self.path, bbox=(4130100, 7567000, 4130110, 7567010))], [])
+
+        connection = sqlite3.connect(self.path)
+        try:
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM rtree_parcels").fetchone()[0], 3)
+            tombstone = connection.execute("SELECT feature_key, feature_id, cad_num FROM tombstones_parcels").fetchall()
+            self.assertEqual(tombstone, [("id:3", 3, "69:10:0000021:3")])
+        finally:
+            connection.close()
+
+        # Тот же набор еще раз: ничего не записывается; вернувшийся feature снимает tombstone
+        with SQLiteFeatureWriter(self.path, incremental=True) as writer:
+            for feature in (self.features[0], changed, added, self.features[2]):
+                writer.write(feature)
+        self.assertEqual((writer.stats.inserted, writer.stats.unchanged, writer.stats.deleted), (1, 3, 0))
+        self.assertEqual([f["id"] for f in query_sqlite_features(self.path)], [1, 2, 4, 3])
+        connection = sqlite3.connect(self.path)
+        try:
+            self.assertEqual(connection.execute("SELECT COUNT(*) FROM tombstones_parcels").fetchone()[0], 0)
+        finally:
+            connection.close()
+
+    def test_incremental_over_legacy_layer(self):
+        # Слой, записанный до появления колонок feature_key и content_hash
+        connection = sqlite3.connect(self.path)
+        connection.execute(
+            "CREATE TABLE parcels (fid INTEGER PRIMARY KEY, feature_id, cad_num TEXT, quarter_cad_number TEXT, "
+            "geometry_type TEXT, properties TEXT, geometry BLOB)"
+        )
+        connection.execute("INSERT INTO parcels VALUES (1, 1, '50:03:0060111:1', '50:03:0060111', NULL, '{}', NULL)")
+        connection.execute("INSERT INTO parcels VALUES (2, NULL, NULL, NULL, NULL, '{}', NULL)")
+        connection.commit()
+        connection.close()
+        with SQLiteFeatureWriter(self.path, incremental=True) as writer:
+            writer.write(self.features[0])
+        # Строка без хэша обновляется на месте, строка без идентификаторов удаляется
+        self.assertEqual((writer.stats.updated, writer.stats.deleted), (1, 0))
+        stored = list(query_sqlite_features(self.path))
+        self.assertEqual(len(stored), 1)
+        self.assertEqual(stored[0]["properties"], self.features[0]["properties"])
+
+    def test_validation(self):
+        with self.assertRaises(ValueError):
+            SQLiteFeatureWriter(self.path, layer='parcels"; DROP TABLE x; --')
+        with self.assertRaises(ValueError):
+            SQLiteFeatureWriter(self.path, append=True, incremental=True)
+        with self.assertRaises(sqlite3.OperationalError):
+            list(query_sqlite_features(os.path.join(self.test_dir, "missing.sqlite")))
+        self.assertEqual(feature_cad_fields(self.features[0]), ("50:03:0060111:1", "50:03:0060111"))
+        self.assertEqual(feature_cad_fields({"properties": None}), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
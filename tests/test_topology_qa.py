@@ -0,0 +1,134 @@
+import unittest
+from unittest import mock
+import os
+import sys
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from shapely.geometry import Polygon, box
+from shapely import affinity, wkt
+from shapely.errors import GEOSException
+
+from scripts.topology_qa import find_topology_issues, topology_issues_to_features
+
+# Участки задаются в метрах в зоне UTM 37N (район Зеленограда)
+UTM_CRS = "EPSG:32637"
+X0, Y0 = 400000.0, 6200000.0
+
+# Участки из стенда (EPSG:3857), на которых пересчет разрывов падал с
+# "TopologyException: Ring edge missing"; 50:03:0000000:5862 самопересекается
+STAGE_PARCELS = {
+    "50:03:0060180:2456": "POLYGON ((4079090.15 7620267.93, 4079052.49 7620273.54, 4079053.24 7620269.96, "
+        "4079079.74 7620207.55, 4079061.77 7620199.78, 4079090.49 7620124.33, 4079141.53 7620042.7, "
+        "4079198.64 7619978.87, 4079310.35 7619893.01, 4079223.25 7620033.82, 4079188.46 7620081.8, "
+        "4079173.33 7620114.53, 4079146.7 7620157.61, 4079151.97 7620161.14, 4079121.24 7620233.11, "
+        "4079090.15 7620267.93))",
+    "50:03:0000000:5862": "POLYGON ((4079574.82 7619970, 4079372.08 7620308.76, 4079151.97 7620161.14, "
+        "4079154.12 7620156.13, 4079173.3 7620114.59, 4079378.28 7619783.16, 4079434.78 7619829.23, "
+        "4079402.75 7619838.69, 4079327.59 7619879.76, 4079310.35 7619893.01, 4079223.25 7620033.82, "
+        "4079243.29 7620006.2, 4079269.83 7620018.28, 4079309.45 7619983.13, 4079301.49 7619957.83, "
+        "4079352.5 7619922.47, 4079446.43 7619883.07, 4079488.87 7619873.34, 4079516.04 7619895.5, "
+        "4079574.82 7619970))",
+}
+# Углы охвата всего набора стенда: от них зависит выбор зоны UTM и сетка координат
+STAGE_ANCHORS = [
+    box(3918183.71, 7538158.26, 3918193.71, 7538168.26),
+    box(4149672.78, 7759003.35, 4149682.78, 7759013.35),
+]
+
+def _parcel(minx, miny, maxx, maxy):
+    return affinity.translate(box(minx, miny, maxx, maxy), X0, Y0)
+
+class TestFindTopologyIssues(unittest.TestCase):
+
+    def setUp(self):
+        self.parcels = [
+            _parcel(0, 0, 100, 100),     # 0: перекрывается с 1 полосой 10 м
+            _parcel(90, 0, 200, 100),    # 1
+            _parcel(200.5, 0, 300, 100), # 2: разрыв 0.5 м с 1
+            _parcel(300, 0, 400, 100),   # 3: касается 2 по границе - не ошибка
+            _parcel(0, 300, 100, 400),   # 4: далеко от остальных
+            None,
+        ]
+        self.cad_nums = [f"50:03:0000000:{i}" for i in range(len(self.parcels))]
+
+    def test_overlap_and_gap(self):
+        issues = find_topology_issues(self.parcels, crs_str=UTM_CRS, cad_nums=self.cad_nums)
+        by_type = {}
+        for issue in issues:
+            by_type.setdefault(issue.issue_type, []).append(issue)
+        self.assertEqual(set(by_type), {"overlap", "gap"})
+
+        overlap, = by_type["overlap"]
+        self.assertEqual((overlap.index_a, overlap.index_b), (0, 1))
+        self.assertEqual(overlap.cad_num_b, "50:03:0000000:1")
+        self.assertAlmostEqual(overlap.area, 1000.0, delta=2.0)
+        # Геометрия проблемной области возвращается в исходной CRS
+        self.assertAlmostEqual(overlap.geometry.bounds[0], X0 + 90, delta=0.05)
+
+        gap, = by_type["gap"]
+        self.assertEqual((gap.index_a, gap.index_b), (1, 2))
+        self.assertAlmostEqual(gap.distance, 0.5, delta=0.01)
+        self.assertGreater(gap.area, 49.0)
+        self.assertLess(gap.area, 53.0)
+
+    def test_tolerance_and_invalid(self):
+        bowtie = affinity.translate(Polygon([(0, 0), (10, 10), (10, 0), (0, 10), (0, 0)]), X0 + 1000, Y0)
+        issues = find_topology_issues(self.parcels + [bowtie], crs_str=UTM_CRS, gap_tolerance=0.1)
+        types = sorted(issue.issue_type for issue in issues)
+        self.assertEqual(types, ["invalid", "overlap"]) # разрыв 0.5 м больше допуска
+        invalid = [issue for issue in issues if issue.issue_type == "invalid"][0]
+        self.assertEqual(invalid.index_a, 6)
+        self.assertTrue(invalid.reason.startswith("Self-intersection"))
+
+    def test_wedge_between_corner_touching_parcels(self):
+        # Участки касаются в одной точке, между ними клин шириной до 0.5 м
+        wedge_a = _parcel(0, 0, 10, 10)
+        wedge_b = affinity.translate(Polygon([(10, 10), (10.5, 0), (20, 0), (20, 10)]), X0, Y0)
+        # Касание углом под прямым углом и T-стык - обычные границы, не разрывы
+        corner = _parcel(20, 10, 30, 20)
+        t_joint = _parcel(0, 10, 5, 20)
+        issues = find_topology_issues([wedge_a, wedge_b, corner, t_joint], crs_str=UTM_CRS)
+        gap, = issues
+        self.assertEqual((gap.issue_type, gap.index_a, gap.index_b), ("gap", 0, 1))
+        self.assertEqual(gap.distance, 0.0)
+        self.assertAlmostEqual(gap.area, 2.5, delta=0.1) # Треугольник 0.5 x 10 м
+
+    def test_stage_parcels_with_invalid_neighbour(self):
+        geoms = [wkt.loads(text) for text in STAGE_PARCELS.values()] + STAGE_ANCHORS
+        cad_nums = list(STAGE_PARCELS) + [None, None]
+        issues = find_topology_issues(geoms, cad_nums=cad_nums)
+        types = sorted(issue.issue_type for issue in issues)
+        self.assertEqual(types, ["gap", "invalid"])
+        gap = [issue for issue in issues if issue.issue_type == "gap"][0]
+        self.assertEqual((gap.cad_num_a, gap.cad_num_b), tuple(STAGE_PARCELS))
+        self.assertGreater(gap.area, 1.0)
+
+    def test_geos_error_recorded_per_pair(self):
+        with mock.patch("scripts.topology_qa._erode_union", side_effect=GEOSException("TopologyException: test")):
+            issues = find_topology_issues(self.parcels, crs_str=UTM_CRS, cad_nums=self.cad_nums)
+        by_type = {}
+        for issue in issues:
+            by_type.setdefault(issue.issue_type, []).append(issue)
+        # Перекрытия проверяются независимо от разрывов
+        self.assertEqual(len(by_type["overlap"]), 1)
+        self.assertNotIn("gap", by_type)
+        pairs = {(issue.index_a, issue.index_b) for issue in by_type["error"]}
+        self.assertIn((1, 2), pairs)
+        self.assertTrue(all(issue.reason == "TopologyException: test" for issue in by_type["error"]))
+
+    def test_issues_to_features(self):
+        issues = find_topology_issues(self.parcels, crs_str=UTM_CRS, cad_nums=self.cad_nums)
+        features = topology_issues_to_features(issues, crs_str=UTM_CRS)
+        self.assertEqual(len(features), 2)
+        props = features[0]["properties"]
+        self.assertEqual(props["issue_type"], "overlap")
+        self.assertEqual(props["cad_num_a"], "50:03:0000000:0")
+        self.assertNotIn("distance_m", props)
+        lon, lat = features[0]["geometry"]["coordinates"][0][0]
+        self.assertTrue(35 < lon < 40 and 55 < lat < 57)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,203 @@
+import unittest
+import os
+import sys
+import gzip
+import json
+import sqlite3
+import struct
+import tempfile
+import shutil
+
+import numpy as np
+from shapely.geometry import Point, Polygon, box
+
+# Добавляем путь к родительской директории для импорта модулей проекта
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from scripts.data_structures import VectorTileLayer
+from scripts.vector_tiles import (
+    MBTilesWriter, TileDirectoryWriter, _encode_varints, create_tile_writer, features_to_tile_layer,
+    generate_vector_tiles, tile_bounds
+)
+
+def _read_varint(data, pos):
+    result, shift = 0, 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return result, pos
+
+def _read_message(data):
+    # Минимальный разбор protobuf: {номер поля: [значения]}
+    fields, pos = {}, 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = struct.unpack_from("<d", data, pos)[0], pos + 8
+        else:
+            length, pos = _read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        fields.setdefault(number, []).append(value)
+    return fields
+
+def _read_packed(data):
+    values, pos = [], 0
+    while pos < len(data):
+        value, pos = _read_varint(data, pos)
+        values.append(value)
+    return values
+
+def _decode_tile(data):
+    """Разбирает тайл в {имя слоя: [(id, атрибуты, тип, команды)]}."""
+    layers = {}
+    for raw_layer in _read_message(data)[3]:
+        layer = _read_message(raw_layer)
+        keys = [k.decode("utf-8") for k in layer.get(3, [])]
+        values = []
+        for raw_value in layer.get(4, []):
+            value = _read_message(raw_value)
+            if 1 in value:
+                values.append(value[1][0].decode("utf-8"))
+            elif 3 in value:
+                values.append(value[3][0])
+            elif 7 in value:
+                values.append(bool(value[7][0]))
+            else:
+                values.append(value[5][0])
+        features = []
+        for raw_feature in layer.get(2, []):
+            feature = _read_message(raw_feature)
+            tags = _read_packed(feature[2][0]) if 2 in feature else []
+            attributes = {keys[tags[i]]: values[tags[i + 1]] for i in range(0, len(tags), 2)}
+            features.append((feature.get(1, [None])[0], attributes, feature[3][0], _read_packed(feature[4][0])))
+        assert (layer[15][0], layer[5][0]) == (2, 4096) # version, extent
+        layers[layer[1][0].decode("utf-8")] = features
+    return layers
+
+def _decode_rings(commands):
+    # Команды MVT -> список колец/линий в целых координатах тайла
+    rings, x, y, pos = [], 0, 0, 0
+    while pos < len(commands):
+        command, count = commands[pos] & 7, commands[pos] >> 3
+        pos += 1
+        if command == 7:
+            continue
+        if command == 1:
+            rings.append([])
+        for _ in range(count):
+            dx, dy = commands[pos], commands[pos + 1]
+            x += (dx >> 1) ^ -(dx & 1)
+            y += (dy >> 1) ^ -(dy & 1)
+            rings[-1].append((x, y))
+            pos += 2
+    return rings
+
+def _surveyor_area(ring):
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1])) / 2
+
+class TestVectorTiles(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        # Тайл 14/9983/5016 (район Зеленограда) и участок с дыркой в его середине
+        self.minx, self.miny, self.maxx, self.maxy = tile_bounds(14, 9983, 5016)
+        cx, cy = (self.minx + self.maxx) / 2, (self.miny + self.maxy) / 2
+        self.parcel = Polygon(
+            [(cx - 500, cy - 500), (cx + 500, cy - 500), (cx + 500, cy + 500), (cx - 500, cy + 500)],
+            [[(cx - 100, cy - 100), (cx - 100, cy + 100), (cx + 100, cy + 100), (cx + 100, cy - 100)]]
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def test_encode_varints(self):
+        values = np.array([0, 1, 127, 128, 300, 2 ** 40] * 20, dtype=np.uint64)
+        encoded = _encode_varints(values)
+        self.assertEqual(_read_packed(encoded), values.tolist())
+        self.assertEqual(_encode_varints(np.array([300])), b"\xac\x02")
+
+    def test_features_to_tile_layer(self):
+        features = [
+            {"type": "Feature", "id": 105174077, "geometry": {"type": "Point", "coordinates": [37.2, 55.98]},
+             "properties": {"label": "x", "options": {"cad_num": "50:03:0060111:367", "floor": ["1"], "area": None}}},
+            {"type": "Feature", "geometry": None, "properties": {}},
+        ]
+        layer = features_to_tile_layer("parcels", features)
+        self.assertEqual(len(layer.geometries), 1)
+        self.assertAlmostEqual(layer.geometries[0].x, 4141085.06, delta=0.01) # WGS84 -> EPSG:3857
+        self.assertEqual(layer.properties, [{"label": "x", "cad_num": "50:03:0060111:367", "floor": '["1"]'}])
+        self.assertEqual(layer.feature_ids, [105174077])
+        self.assertEqual(features_to_tile_layer("parcels", features, ["cad_num"]).properties, [{"cad_num": "50:03:0060111:367"}])
+
+    def test_directory_pyramid(self):
+        layer = VectorTileLayer("parcels", np.array([self.parcel], dtype=object),
+                                [{"cad_num": "50:03:0060111:367", "area": 350, "cost": 540.5, "forest": True}], [42])
+        output_dir = os.path.join(self.test_dir, "tiles")
+        with create_tile_writer(output_dir) as writer:
+            self.assertIsInstance(writer, TileDirectoryWriter)
+            counts = generate_vector_tiles([layer], writer, min_zoom=12, max_zoom=14)
+        self.assertEqual(counts, {12: 1, 13: 1, 14: 1})
+
+        with open(os.path.join(output_dir, "14", "9983", "5016.pbf"), "rb") as f:
+            tile = _decode_tile(f.read())
+        (feature_id, attributes, geom_type, commands), = tile["parcels"]
+        self.assertEqual(feature_id, 42)
+        self.assertEqual(attributes, {"cad_num": "50:03:0060111:367", "area": 350, "cost": 540.5, "forest": True})
+        self.assertEqual(geom_type, 3)
+        exterior, hole = _decode_rings(commands)
+        # Сторона тайла 14 уровня ~2446 м: 1000 м участка ~1675 единиц
+        self.assertAlmostEqual(max(x for x, _ in exterior) - min(x for x, _ in exterior), 1675, delta=2)
+        self.assertGreater(_surveyor_area(exterior), 0)
+        self.assertLess(_surveyor_area(hole), 0)
+
+        with open(os.path.join(output_dir, "metadata.json"), encoding="utf-8") as f:
+            metadata = json.load(f)
+        self.assertEqual(metadata["json"]["vector_layers"][0]["fields"],
+                         {"cad_num": "String", "area": "Number", "cost": "Number", "forest": "Boolean"})
+
+    def test_mbtiles_clip_and_small_features(self):
+        # Линия через несколько тайлов, крошечный участок и точка
+        line_y = (self.miny + self.maxy) / 2
+        geoms = np.array([
+            box(self.minx - 3000, line_y, self.maxx + 3000, line_y + 1).boundary,
+            box(self.minx + 10, self.miny + 10, self.minx + 12, self.miny + 12),
+            Point(self.minx + 50, self.maxy - 50),
+        ], dtype=object)
+        layer = VectorTileLayer("zones", geoms, [{"name": "ось"}, {"name": "мелкий"}, {"name": "точка"}])
+        output_path = os.path.join(self.test_dir, "tiles.mbtiles")
+        with create_tile_writer(output_path) as writer:
+            self.assertIsInstance(writer, MBTilesWriter)
+            counts = generate_vector_tiles([layer], writer, min_zoom=13, max_zoom=14)
+        # Линия длиннее двух тайлов в каждую сторону, остальные задевают соседей запасом buffer
+        self.assertEqual(counts[14], 7)
+
+        connection = sqlite3.connect(output_path)
+        try:
+            metadata = dict(connection.execute("SELECT name, value FROM metadata"))
+            row = connection.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = 14 AND tile_column = 9983 AND tile_row = ?",
+                ((1 << 14) - 1 - 5016,) # Строки MBTiles нумеруются снизу (TMS)
+            ).fetchone()
+            z13 = [_decode_tile(gzip.decompress(data)) for data, in connection.execute("SELECT tile_data FROM tiles WHERE zoom_level = 13")]
+        finally:
+            connection.close()
+        self.assertEqual((metadata["format"], metadata["minzoom"], metadata["maxzoom"]), ("pbf", "13", "14"))
+        self.assertEqual(json.loads(metadata["json"])["vector_layers"][0]["id"], "zones")
+
+        features = _decode_tile(gzip.decompress(row[0]))["zones"]
+        self.assertEqual(sorted(f[1]["name"] for f in features), ["мелкий", "ось", "точка"])
+        for _, _, _, commands in features:
+            for x, y in (point for ring in _decode_rings(commands) for point in ring):
+                self.assertTrue(-64 <= x <= 4096 + 64 and -64 <= y <= 4096 + 64)
+        # Ниже максимального уровня крошечный участок отбрасывается, точка остается
+        names = {f[1]["name"] for tile in z13 for f in tile["zones"]}
+        self.assertEqual(names, {"ось", "точка"})
+
+if __name__ == '__main__':
+    unittest.main()